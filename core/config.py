@@ -1,6 +1,7 @@
 """
 Конфигурация приложения - внешний файл
 """
+import copy
 import os
 import json
 import sys
@@ -27,14 +28,55 @@ DEFAULT_CONFIG = {
         "port": int(os.getenv('DB_PORT', 5432)),
         "dbname": os.getenv('DB_NAME', 'tariffs_db'),
         "user": os.getenv('DB_USER', 'postgres'),
-        "password": os.getenv('DB_PASSWORD', '3461')
+        "password": os.getenv('DB_PASSWORD', '3461'),
+        # Хранилище: "postgresql" (центральный сервер) или "sqlite" (локальный файл)
+        "backend": os.getenv('DB_BACKEND', 'postgresql'),
+        # Путь к файлу SQLite (пусто - ~/.tariff_app/tariffs.db)
+        "sqlite_path": os.getenv('DB_SQLITE_PATH', ''),
+        # Переходить на локальную SQLite, если PostgreSQL недоступен
+        "offline_fallback": False,
+        # Читать из локального кэша и синхронизировать с сервером только изменения
+        "local_cache": os.getenv('DB_LOCAL_CACHE', '').lower() in ('1', 'true', 'yes'),
+        # Путь к файлу кэша (пусто - ~/.tariff_app/cache.db)
+        "cache_path": os.getenv('DB_CACHE_PATH', ''),
+        # Период фоновой синхронизации кэша, секунды
+        "sync_interval_sec": int(os.getenv('DB_SYNC_INTERVAL', 60))
     },
-    "theme": os.getenv('THEME', 'light')
+    "theme": os.getenv('THEME', 'light'),
+    "performance": {
+        # Сколько строк за раз забирает серверный (именованный) курсор
+        "itersize": int(os.getenv('DB_ITERSIZE', 2000)),
+        # Ограничение памяти истории отмены в редакторе маршрута, байт
+        "history_max_bytes": 2 * 1024 * 1024,
+        # Журнал правок редактора маршрута сбрасывается на диск не чаще, секунды
+        "journal_fsync_interval_sec": 1.0,
+        # Режим профилирования: "sampling" (flame graph) или "cprofile"
+        "profiler_mode": "sampling",
+        # Период пульса цикла событий и порог зависания интерфейса, мс
+        "heartbeat_ms": 50,
+        "stall_threshold_ms": 200,
+        # Память под посчитанные матрицы тарифов маршрутов, МБ
+        "fare_cache_mb": 128,
+        # Объём кэша выгруженных документов (~/.tariff_app/cache), МБ; 0 - отключён
+        "export_cache_mb": 256
+    },
+    "logging": {
+        # Общий уровень и уровень вывода в консоль
+        "level": os.getenv('LOG_LEVEL', 'INFO'),
+        "console_level": "INFO",
+        # Уровни отдельных подсистем (имя логгера - уровень)
+        "levels": {
+            "core.database": "INFO",
+            "core.sync": "INFO",
+            "ui": "INFO"
+        }
+    }
 }
 
 def load_config():
     """Загрузка конфигурации из JSON файла"""
-    config = DEFAULT_CONFIG.copy()
+    # Вложенные словари копируются: значения из файла не должны попасть в умолчания
+    config = copy.deepcopy(DEFAULT_CONFIG)
     
     if CONFIG_FILE.exists():
         try:
@@ -48,6 +90,14 @@ def load_config():
                             config['database'][key] = file_config['database'][key]
                 if 'theme' in file_config and not os.getenv('THEME'):
                     config['theme'] = file_config['theme']
+                if 'performance' in file_config:
+                    config['performance'].update(file_config['performance'])
+                if 'logging' in file_config:
+                    levels = file_config['logging'].get('levels', {})
+                    config['logging'].update(file_config['logging'])
+                    config['logging']['levels'] = {**DEFAULT_CONFIG['logging']['levels'], **levels}
+                    if os.getenv('LOG_LEVEL'):
+                        config['logging']['level'] = os.getenv('LOG_LEVEL')
         except Exception as e:
             print(f"Ошибка загрузки config.json: {e}")
     
@@ -57,14 +107,10 @@ def save_config(config):
     """Сохранение конфигурации в JSON файл"""
     # Не сохраняем значения из .env, чтобы не перезаписывать их
     save_data = {
-        "database": {
-            "host": config["database"]["host"],
-            "port": config["database"]["port"],
-            "dbname": config["database"]["dbname"],
-            "user": config["database"]["user"],
-            "password": config["database"]["password"]
-        },
-        "theme": config["theme"]
+        "database": dict(config["database"]),
+        "theme": config["theme"],
+        "performance": config.get("performance", DEFAULT_CONFIG["performance"]),
+        "logging": config.get("logging", DEFAULT_CONFIG["logging"])
     }
     with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
         json.dump(save_data, f, ensure_ascii=False, indent=4)
@@ -75,6 +121,12 @@ CONFIG = load_config()
 # Настройки базы данных
 DB_CONFIG = CONFIG["database"]
 
+# Настройки производительности
+PERFORMANCE_CONFIG = CONFIG["performance"]
+
+# Настройки логирования
+LOGGING_CONFIG = CONFIG["logging"]
+
 # Цветовые темы
 DARK_THEME = {
     "window_bg": "#19171b",
@@ -2,50 +2,167 @@
 database.py
 Модуль работы с базой данных для тарифных сеток
 """
-import math
+import csv
+import io
+import uuid
+from datetime import date
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import List, Dict, Optional, Tuple, Union
+from psycopg2.extensions import TRANSACTION_STATUS_INTRANS
+from psycopg2.extras import RealDictCursor, NamedTupleCursor, execute_values
+from typing import Any, List, Dict, Optional, Tuple, Union, Iterator, Iterable
 import logging
 from decimal import Decimal
 from contextlib import contextmanager  # Добавьте эту строку
-from core.config import DB_CONFIG
+from core.config import DB_CONFIG, PERFORMANCE_CONFIG
+from core import fare_engine, migrations
+from models import RouteSequence, TariffUpdate, SORT_KEY_GAP, sort_key_between
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Наибольшее расстояние пункта при импорте (как ValidationUtils.validate_distance)
+MAX_IMPORT_DISTANCE_KM = 9999.99
+
+# 2^32: масштаб для точного перевода float8 в numeric (см. _sql_exact_hundredths)
+_FLOAT_SCALE = 4294967296
+_FLOAT_UNIT = _FLOAT_SCALE * _FLOAT_SCALE
+
+
+def _sql_exact_hundredths(expr: str) -> str:
+    """
+    SQL: точное значение float8 * 100 как целое numeric, умноженное на 2^64.
+
+    Приведение float8::numeric оставляет 15 значащих цифр и теряет, по какую
+    сторону от половины копейки лежит число (2.52 * 375 = 945.0000000000001).
+    Поэтому x раскладывается на целые x * 2^32 и дробь * 2^32 (оба точны в
+    float8 для 2^-12 <= x < 2^21).
+    """
+    scaled = f"({expr} * {_FLOAT_SCALE})"
+    return (f"((floor({scaled})::bigint::numeric * {_FLOAT_SCALE}"
+            f" + (({scaled} - floor({scaled})) * {_FLOAT_SCALE})::bigint) * 100)")
+
+
+def _sql_round_hundredths(column: str) -> str:
+    """SQL: копейки из _sql_exact_hundredths с округлением к чётному, как round(round(x, 2) * 100)"""
+    quotient, twice_rest = f"div({column}, {_FLOAT_UNIT})", f"2 * mod({column}, {_FLOAT_UNIT})"
+    return (f"(CASE WHEN {twice_rest} > {_FLOAT_UNIT} THEN {quotient} + 1 "
+            f"WHEN {twice_rest} < {_FLOAT_UNIT} THEN {quotient} "
+            f"ELSE {quotient} + mod({quotient}, 2) END)")
+
+
+class _CopyRows:
+    """Файл CSV для COPY ... FROM STDIN: строки формируются по мере чтения"""
+    
+    def __init__(self, rows: Iterable[tuple]) -> None:
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n')
+    
+    def read(self, size: int = -1) -> str:
+        for row in self._rows:
+            self._writer.writerow(row)
+            if 0 <= size <= self._buffer.tell():
+                break
+        data = self._buffer.getvalue()
+        rest = data[size:] if size >= 0 else ''
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._buffer.write(rest)
+        return data[:len(data) - len(rest)]
+
+
 class DatabaseError(Exception):
     """Пользовательское исключение для ошибок работы с БД"""
     pass
 
+class SchemaVersionError(DatabaseError):
+    """Схема сервера старее клиента: не применены миграции (tools.migrate)"""
+    pass
+
+class ConcurrencyError(DatabaseError):
+    """Строки изменены другим пользователем после чтения (конфликт row_version)"""
+    
+    def __init__(self, message: str, conflict_ids: Iterable[int] = ()):
+        super().__init__(message)
+        self.conflict_ids = list(conflict_ids)
+
 class Database:
     """Класс для работы с базой данных PostgreSQL"""
     
-    def __init__(self) -> None:
+    backend = 'postgresql'
+    
+    def __init__(self, dsn: Optional[str] = None, check_schema: bool = True) -> None:
         """
         Инициализация подключения к базе данных.
         
+        Args:
+            dsn: Строка подключения (None - настройки из config.json)
+            check_schema: Проверить, что на сервере применены все миграции
+        
         Raises:
             DatabaseError: При ошибке подключения к БД
+            SchemaVersionError: Если схема сервера устарела
         """
+        self._dsn = dsn
+        self._check_schema_on_connect = check_schema
+        # Без схемы представлений старых клиентов (см. migrations.LEGACY_SCHEMA)
+        search_path = f"-c search_path={migrations.CLIENT_SEARCH_PATH}"
         try:
-            self.conn = psycopg2.connect(
-                host=DB_CONFIG["host"],
-                port=DB_CONFIG["port"],
-                dbname=DB_CONFIG["dbname"],
-                user=DB_CONFIG["user"],
-                password=DB_CONFIG["password"],
-                client_encoding='UTF8'
-            )
+            if dsn:
+                self.conn = psycopg2.connect(dsn, client_encoding='UTF8', options=search_path)
+            else:
+                self.conn = psycopg2.connect(
+                    host=DB_CONFIG["host"],
+                    port=DB_CONFIG["port"],
+                    dbname=DB_CONFIG["dbname"],
+                    user=DB_CONFIG["user"],
+                    password=DB_CONFIG["password"],
+                    client_encoding='UTF8',
+                    options=search_path
+                )
             self.conn.autocommit = False
+            self._batch_depth = 0
             logger.info("Подключение к БД установлено")
         except Exception as e:
             raise DatabaseError(f"Не удалось подключиться к БД: {e}")
+        
+        if check_schema:
+            try:
+                self._check_schema()
+            except DatabaseError:
+                self.conn.close()
+                raise
+    
+    def _check_schema(self) -> None:
+        """Проверить версию схемы (DDL клиент не выполняет - только tools.migrate)"""
+        try:
+            pending = migrations.pending_postgres_migrations(self.conn)
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Не удалось проверить версию схемы БД: {e}")
+        if pending:
+            raise SchemaVersionError(
+                f"Схема базы данных устарела: не применены миграции {', '.join(map(str, pending))}.\n"
+                "Администратору БД нужно выполнить: python -m tools.migrate"
+            )
+    
+    def apply_migrations(self) -> List[int]:
+        """
+        Применить недостающие миграции схемы (нужны права на DDL).
+        
+        Returns:
+            list: Номера применённых версий
+        """
+        self._ensure_connection()
+        try:
+            return migrations.apply_postgres_migrations(self.conn)
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Не удалось применить миграции схемы: {e}")
     
     def _ensure_connection(self) -> None:
         """Проверка и восстановление подключения при необходимости"""
         if not hasattr(self, 'conn') or self.conn.closed:
-            self.__init__()
+            self.__init__(getattr(self, '_dsn', None), getattr(self, '_check_schema_on_connect', True))
     
     def close(self) -> None:
         """Закрыть соединение с базой данных"""
@@ -63,20 +180,95 @@ class Database:
             self.conn.rollback()
             raise
     
+    @contextmanager
+    def batch(self):
+        """
+        Выполнить несколько операций одной транзакцией.
+        
+        Внутри блока методы записи не фиксируют изменения по отдельности:
+        commit выполняется один раз при выходе, при ошибке откатывается весь блок.
+        Блоки могут быть вложенными.
+        """
+        self._ensure_connection()
+        self._batch_depth += 1
+        try:
+            yield self
+        except Exception:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.conn.rollback()
+            raise
+        self._batch_depth -= 1
+        if self._batch_depth == 0:
+            self.conn.commit()
+    
+    def _commit(self) -> None:
+        """Зафиксировать транзакцию, если не идёт пакетная операция"""
+        if not self._batch_depth:
+            self.conn.commit()
+    
     @contextmanager
     def cursor(self):
         """Контекстный менеджер для курсора"""
         cursor = self.conn.cursor(cursor_factory=RealDictCursor)
         try:
             yield cursor
-            self.conn.commit()
+            self._commit()
         except Exception:
             self.conn.rollback()
             raise
         finally:
             cursor.close()
     
+    def _iter_query(self, query: str, params: tuple = (),
+                    itersize: Optional[int] = None) -> Iterator[tuple]:
+        """
+        Потоковое чтение результата запроса через серверный (именованный) курсор.
+        
+        Строки забираются с сервера пачками по itersize и отдаются как
+        компактные namedtuple, без материализации всего списка в памяти.
+        Курсор живёт внутри транзакции, поэтому во время перебора нельзя
+        вызывать методы, выполняющие commit.
+        
+        Args:
+            query: SQL-запрос
+            params: Параметры запроса
+            itersize: Размер пачки (по умолчанию из config.json)
+            
+        Yields:
+            namedtuple: Строка результата
+        """
+        self._ensure_connection()
+        cur = self.conn.cursor(
+            name=f"tariff_iter_{uuid.uuid4().hex}",
+            cursor_factory=NamedTupleCursor
+        )
+        cur.itersize = itersize or PERFORMANCE_CONFIG.get('itersize', 2000)
+        try:
+            cur.execute(query, params)
+            for row in cur:
+                yield row
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка потокового чтения: {e}")
+        finally:
+            if not cur.closed:
+                cur.close()
+            # Завершаем читающую транзакцию, в том числе при досрочном выходе
+            if (not self.conn.closed and not self._batch_depth and
+                    self.conn.get_transaction_status() == TRANSACTION_STATUS_INTRANS):
+                self.conn.commit()
+    
     # === Пункты ===
+    def iter_points(self, itersize: Optional[int] = None) -> Iterator[tuple]:
+        """
+        Потоковый перебор всех пунктов.
+        
+        Yields:
+            namedtuple: (id, name)
+        """
+        return self._iter_query("SELECT id, name FROM points ORDER BY name", itersize=itersize)
+    
     def get_all_points(self) -> List[Dict[str, Union[int, str]]]:
         """
         Получить список всех пунктов.
@@ -130,8 +322,8 @@ class Database:
                     (clean_name,)
                 )
                 point_id = cur.fetchone()[0]
-                self.conn.commit()
-                logger.info(f"Добавлен пункт: {clean_name} (ID={point_id})")
+                self._commit()
+                logger.debug("Добавлен пункт: %s (ID=%s)", clean_name, point_id)
                 return point_id
                 
         except psycopg2.IntegrityError as e:
@@ -147,7 +339,7 @@ class Database:
         try:
             with self.conn.cursor() as cur:
                 cur.execute("UPDATE points SET name = %s WHERE id = %s", (name.strip(), point_id))
-                self.conn.commit()
+                self._commit()
                 return cur.rowcount > 0
         except psycopg2.IntegrityError:
             self.conn.rollback()
@@ -165,7 +357,7 @@ class Database:
                 if cur.fetchone()[0] > 0:
                     raise DatabaseError("Нельзя удалить пункт: он используется в маршрутах")
                 cur.execute("DELETE FROM points WHERE id = %s", (point_id,))
-                self.conn.commit()
+                self._commit()
                 return cur.rowcount > 0
         except Exception as e:
             self.conn.rollback()
@@ -184,18 +376,28 @@ class Database:
         self._ensure_connection()
         try:
             with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT r.*, COUNT(rs.id) as points_count
-                    FROM routes r
-                    LEFT JOIN route_sequence rs ON r.id = rs.route_id
-                    GROUP BY r.id
-                    ORDER BY r.route_number
-                """)
+                # Число пунктов и параметры тарифа поддерживаются триггерами
+                cur.execute("SELECT * FROM routes ORDER BY route_number")
                 return cur.fetchall()
         except Exception as e:
             logger.error(f"Ошибка при получении маршрутов: {e}")
             return []
     
+    def iter_routes(self, itersize: Optional[int] = None) -> Iterator[tuple]:
+        """
+        Потоковый перебор всех маршрутов.
+        
+        Yields:
+            namedtuple: (id, route_number, route_name, points_count, total_distance_km,
+                         cost_per_km, rounding, baggage_percent)
+        """
+        return self._iter_query("""
+            SELECT id, route_number, route_name, points_count, total_distance_km,
+                   cost_per_km, rounding, baggage_percent
+            FROM routes
+            ORDER BY route_number
+        """, itersize=itersize)
+    
     def add_route(self, route_number: str, route_name: str) -> int:
         """Добавить маршрут"""
         self._ensure_connection()
@@ -204,7 +406,7 @@ class Database:
                 cur.execute("INSERT INTO routes (route_number, route_name) VALUES (%s, %s) RETURNING id",
                            (route_number.strip(), route_name.strip()))
                 route_id = cur.fetchone()[0]
-                self.conn.commit()
+                self._commit()
                 return route_id
         except psycopg2.IntegrityError:
             self.conn.rollback()
@@ -219,7 +421,7 @@ class Database:
         try:
             with self.conn.cursor() as cur:
                 cur.execute("DELETE FROM routes WHERE id = %s", (route_id,))
-                self.conn.commit()
+                self._commit()
                 return cur.rowcount > 0
         except Exception as e:
             self.conn.rollback()
@@ -239,7 +441,7 @@ class Database:
             with self.conn.cursor() as cur:
                 cur.execute("UPDATE routes SET route_number = %s, route_name = %s WHERE id = %s",
                            (route_number.strip(), route_name.strip(), route_id))
-                self.conn.commit()
+                self._commit()
                 return cur.rowcount > 0
         except psycopg2.IntegrityError:
             self.conn.rollback()
@@ -254,30 +456,466 @@ class Database:
         self._ensure_connection()
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("""
-                SELECT rs.*, p.name as point_name
+                SELECT rs.id, rs.route_id, rs.point_id, rs.distance_km, rs.rounding,
+                       rs.cost_per_km, rs.baggage_percent, rs.sort_key, rs.row_version,
+                       p.name as point_name,
+                       ROW_NUMBER() OVER (ORDER BY rs.sort_key, rs.id) AS sequence_number
                 FROM route_sequence rs
                 JOIN points p ON rs.point_id = p.id
                 WHERE rs.route_id = %s
-                ORDER BY rs.sequence_number
+                ORDER BY rs.sort_key, rs.id
             """, (route_id,))
             return cur.fetchall()
     
+    def get_route_sequence_model(self, route_id: int, as_of: Optional[date] = None) -> RouteSequence:
+        """Получить последовательность пунктов маршрута в компактном виде (на дату as_of)"""
+        if as_of is not None:
+            return RouteSequence.from_rows(self.iter_route_sequences([route_id], as_of=as_of),
+                                           route_id)
+        return RouteSequence.from_rows(self.get_route_sequence(route_id), route_id)
+    
+    def iter_route_sequences(self, route_ids: Optional[Iterable[int]] = None,
+                             itersize: Optional[int] = None,
+                             as_of: Optional[date] = None) -> Iterator[tuple]:
+        """
+        Потоковый перебор пунктов нескольких (или всех) маршрутов.
+        
+        Строки упорядочены по маршруту и порядковому номеру, поэтому
+        потребитель может группировать их по route_id за один проход.
+        
+        Args:
+            route_ids: ID маршрутов (None - все маршруты)
+            itersize: Размер пачки
+            as_of: Дата, на которую нужны пункты и тарифы (None - текущие);
+                   версии ищутся по GiST-индексу периодов действия
+            
+        Yields:
+            namedtuple: (id, route_id, point_id, point_name, sequence_number,
+                         distance_km, rounding, cost_per_km, baggage_percent)
+        """
+        if as_of is not None:
+            # Пункт мог быть удалён позже: имя берётся по ID, если он ещё есть
+            query = """
+                SELECT rs.route_sequence_id AS id, rs.route_id, rs.point_id,
+                       COALESCE(p.name, '#' || rs.point_id) AS point_name,
+                       ROW_NUMBER() OVER (PARTITION BY rs.route_id
+                                          ORDER BY rs.sort_key, rs.route_sequence_id)
+                           AS sequence_number,
+                       rs.distance_km, rs.rounding, rs.cost_per_km, rs.baggage_percent
+                FROM route_sequence_versions rs
+                LEFT JOIN points p ON rs.point_id = p.id
+                WHERE rs.valid @> %s::date
+            """
+            params: tuple = (as_of,)
+            if route_ids is not None:
+                query += " AND rs.route_id = ANY(%s)"
+                params += (list(route_ids),)
+            query += " ORDER BY rs.route_id, rs.sort_key, rs.route_sequence_id"
+            return self._iter_query(query, params, itersize)
+        
+        query = """
+            SELECT rs.id, rs.route_id, rs.point_id, p.name AS point_name,
+                   ROW_NUMBER() OVER (PARTITION BY rs.route_id
+                                      ORDER BY rs.sort_key, rs.id) AS sequence_number,
+                   rs.distance_km, rs.rounding, rs.cost_per_km, rs.baggage_percent
+            FROM route_sequence rs
+            JOIN points p ON rs.point_id = p.id
+        """
+        params = ()
+        if route_ids is not None:
+            query += " WHERE rs.route_id = ANY(%s)"
+            params = (list(route_ids),)
+        query += " ORDER BY rs.route_id, rs.sort_key, rs.id"
+        return self._iter_query(query, params, itersize)
+    
+    def get_tariff_dates(self, route_id: int) -> List[date]:
+        """Даты, с которых менялись пункты или тариф маршрута (по возрастанию)"""
+        self._ensure_connection()
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT lower(valid) FROM route_sequence_versions
+                WHERE route_id = %s AND NOT lower_inf(valid)
+                UNION
+                SELECT upper(valid) FROM route_sequence_versions
+                WHERE route_id = %s AND NOT upper_inf(valid)
+                ORDER BY 1
+            """, (route_id, route_id))
+            return [row[0] for row in cur.fetchall()]
+    
+    def get_tariff_versions(self, as_of: Optional[date] = None) -> Dict[int, date]:
+        """
+        Версия тарифа каждого маршрута на дату as_of (None - сегодня): день
+        последнего изменения не позже этой даты. Маршруты без истории
+        изменений в результат не входят.
+        """
+        self._ensure_connection()
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT route_id, MAX(day) FROM (
+                    SELECT route_id, lower(valid) AS day FROM route_sequence_versions
+                    WHERE NOT lower_inf(valid)
+                    UNION ALL
+                    SELECT route_id, upper(valid) FROM route_sequence_versions
+                    WHERE NOT upper_inf(valid)
+                ) AS changes
+                WHERE day <= %s
+                GROUP BY route_id
+            """, (as_of or date.today(),))
+            return dict(cur.fetchall())
+    
+    def copy_fares_csv(self, out, route_ids: Optional[Iterable[int]] = None,
+                       round_up: bool = False, as_of: Optional[date] = None) -> int:
+        """
+        Выгрузить тарифы всех пар остановок маршрутов в CSV через COPY TO STDOUT.
+        
+        Тарифы считаются на сервере в float8 теми же операциями, что и в
+        fare_engine (round() в PostgreSQL и Python округляет к чётному), поэтому
+        совпадают с опубликованными до копейки; строки идут в out потоком без
+        разбора в Python. Порядок и формат совпадают с core.fare_export
+        (разделитель ';', без заголовка).
+        
+        Args:
+            out: Файл, открытый на запись в режиме 'wb'
+            route_ids: ID маршрутов (None - вся сеть)
+            round_up: Округление тарифов вверх
+            as_of: Дата, на которую нужны тарифы (None - текущие)
+            
+        Returns:
+            int: Количество выгруженных пар
+        """
+        if as_of is not None:
+            source = """
+                FROM route_sequence_versions rs
+                LEFT JOIN points p ON rs.point_id = p.id
+                WHERE rs.valid @> %(as_of)s::date
+            """
+            name, row_id = "COALESCE(p.name, '#' || rs.point_id)", "rs.route_sequence_id"
+        else:
+            source = """
+                FROM route_sequence rs
+                JOIN points p ON rs.point_id = p.id
+                WHERE TRUE
+            """
+            name, row_id = "p.name", "rs.id"
+        if route_ids is not None:
+            source += " AND rs.route_id = ANY(%(route_ids)s)"
+        # Как fare_engine: сумма кратна округлению (если задано), затем округляется до копеек
+        snapped = {column: f"ceil({column} / step)" if round_up else f"round({column} / step)"
+                   for column in ('passenger', 'baggage')}
+        child_factor = fare_engine.CHILD_FARE_PERCENT / 100
+        query = f"""
+            COPY (
+                WITH stops AS (
+                    SELECT rs.route_id, {name} AS point_name, rs.distance_km AS km,
+                           ROW_NUMBER() OVER w AS position,
+                           FIRST_VALUE(COALESCE(rs.cost_per_km, 0)::float8) OVER w AS cost,
+                           FIRST_VALUE(COALESCE(rs.rounding, 0)::float8) OVER w AS step,
+                           FIRST_VALUE(COALESCE(rs.baggage_percent, 0)::float8) OVER w
+                               AS baggage_percent
+                    {source}
+                    WINDOW w AS (PARTITION BY rs.route_id ORDER BY rs.sort_key, {row_id})
+                ),
+                pairs AS (
+                    SELECT a.route_id, b.position, a.position AS from_position,
+                           a.point_name AS from_name, b.point_name AS to_name,
+                           b.km - a.km AS km, b.km::float8 - a.km::float8 AS distance,
+                           a.cost, a.step, a.baggage_percent
+                    FROM stops a
+                    JOIN stops b ON b.route_id = a.route_id AND b.position > a.position
+                ),
+                amounts AS (
+                    SELECT route_id, position, from_position, from_name, to_name, km, step,
+                           CASE WHEN distance > 0 AND cost > 0
+                                THEN distance * cost ELSE 0 END AS passenger,
+                           CASE WHEN distance > 0 AND cost > 0 AND baggage_percent > 0
+                                THEN cost * (baggage_percent / 100) * distance
+                                ELSE 0 END AS baggage
+                    FROM pairs
+                ),
+                exact AS (
+                    SELECT route_id, position, from_position, from_name, to_name, km,
+                           {_sql_exact_hundredths('passenger')} AS passenger,
+                           {_sql_exact_hundredths('baggage')} AS baggage
+                    FROM (
+                        SELECT route_id, position, from_position, from_name, to_name, km,
+                               CASE WHEN step > 0 THEN {snapped['passenger']} * step
+                                    ELSE passenger END AS passenger,
+                               CASE WHEN step > 0 THEN {snapped['baggage']} * step
+                                    ELSE baggage END AS baggage
+                        FROM amounts
+                    ) rounded
+                ),
+                kopecks AS (
+                    SELECT route_id, position, from_position, from_name, to_name, km,
+                           {_sql_round_hundredths('passenger')} AS passenger,
+                           {_sql_round_hundredths('baggage')} AS baggage
+                    FROM exact
+                )
+                SELECT r.route_number, k.from_name, k.to_name, round(k.km, 3)::numeric(14, 3),
+                       (k.passenger / 100)::numeric(14, 2),
+                       (round(k.passenger::float8 / 100 * {child_factor} * 100)::numeric / 100)::numeric(14, 2),
+                       (k.baggage / 100)::numeric(14, 2)
+                FROM kopecks k
+                JOIN routes r ON r.id = k.route_id
+                ORDER BY k.route_id, k.position, k.from_position
+            ) TO STDOUT WITH (FORMAT csv, DELIMITER ';')
+        """
+        self._ensure_connection()
+        try:
+            with self.conn.cursor() as cur:
+                # COPY не принимает параметры: значения подставляются на клиенте
+                cur.copy_expert(cur.mogrify(query, {
+                    'as_of': as_of,
+                    'route_ids': list(route_ids) if route_ids is not None else None,
+                }), out)
+                rows = cur.rowcount
+            self._commit()
+            return rows
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка выгрузки тарифов: {e}")
+    
     def add_point_to_route(self, route_id: int, point_id: int, distance_km: float = 0.0,
                           rounding: float = 0.0, cost_per_km: float = 10.0, 
-                          baggage_percent: float = 0.0):
-        """Добавить пункт в конец маршрута"""
+                          baggage_percent: float = 0.0) -> int:
+        """Добавить пункт в конец маршрута, вернуть ID записи"""
         self._ensure_connection()
         try:
             with self.conn.cursor() as cur:
-                cur.execute("SELECT COALESCE(MAX(sequence_number), 0) + 1 FROM route_sequence WHERE route_id = %s", (route_id,))
-                next_seq = cur.fetchone()[0]
+                cur.execute("SELECT MAX(sort_key) FROM route_sequence WHERE route_id = %s", (route_id,))
+                sort_key = sort_key_between(cur.fetchone()[0], None)
                 
                 cur.execute("""
                     INSERT INTO route_sequence 
-                    (route_id, point_id, sequence_number, distance_km, rounding, cost_per_km, baggage_percent)
+                    (route_id, point_id, sort_key, distance_km, rounding, cost_per_km, baggage_percent)
                     VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (route_id, point_id, next_seq, distance_km, rounding, cost_per_km, baggage_percent))
-                self.conn.commit()
+                    RETURNING id
+                """, (route_id, point_id, sort_key, distance_km, rounding, cost_per_km, baggage_percent))
+                seq_id = cur.fetchone()[0]
+                self._commit()
+                return seq_id
+        except psycopg2.IntegrityError as e:
+            self.conn.rollback()
+            if "unique constraint" in str(e):
+                raise DatabaseError("Этот пункт уже добавлен в маршрут")
+            raise DatabaseError(f"Ошибка добавления пункта: {e}")
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка добавления пункта: {e}")
+    
+    def copy_route_points(self, route_id: int, source, columns: int, name_column: int,
+                          distance_column: int, params: Dict[str, float], delimiter: str = ';',
+                          skip_names: Iterable[str] = ()) -> Tuple[int, int, List[str]]:
+        """
+        Импорт пунктов в конец маршрута: COPY названий и расстояний во
+        временную таблицу и проверки запросами над всем набором строк в
+        одной транзакции.
+        
+        Правила те же, что у построчного импорта: строки без названия или с
+        нулевым/нечисловым расстоянием пропускаются, неизвестные пункты
+        создаются, расстояние больше MAX_IMPORT_DISTANCE_KM и повтор пункта
+        в маршруте - ошибки строки (остальные строки импортируются). Строки
+        с другим числом столбцов разбираются в Python и тоже становятся
+        ошибками строки, а не прерывают COPY.
+        
+        Args:
+            route_id: ID маршрута
+            source: Текстовый файл CSV, прочитанный до первой строки данных
+            columns: Число столбцов в файле
+            name_column: Номер столбца с названием пункта (с 0)
+            distance_column: Номер столбца с расстоянием (с 0)
+            params: rounding, cost_per_km, baggage_percent новых пунктов
+            delimiter: Разделитель CSV
+            skip_names: Названия-заголовки, строки с которыми пропускаются
+        
+        Returns:
+            Tuple[int, int, List[str]]: Строк в файле, добавлено пунктов,
+                                        ошибки строк по порядку
+        """
+        values = {
+            'route_id': route_id,
+            'skip_names': [skip_name.lower() for skip_name in skip_names],
+            'max_distance': MAX_IMPORT_DISTANCE_KM,
+            'gap': SORT_KEY_GAP,
+            'rounding': params['rounding'],
+            'cost_per_km': params['cost_per_km'],
+            'baggage_percent': params['baggage_percent'],
+        }
+        rows = 0
+        bad_rows: List[Tuple[int, str]] = []
+        
+        def staged_rows() -> Iterator[tuple]:
+            # Номер строки файла - с учётом заголовка; пустые строки пропускаются
+            nonlocal rows
+            for row_num, fields in enumerate(csv.reader(source, delimiter=delimiter), 2):
+                if not fields:
+                    continue
+                rows += 1
+                if len(fields) != columns:
+                    bad_rows.append((row_num, f"Строка {row_num}: неверное число столбцов "
+                                              f"({len(fields)} вместо {columns})"))
+                    continue
+                yield row_num, fields[name_column], fields[distance_column]
+        
+        self._ensure_connection()
+        try:
+            with self.conn.cursor() as cur:
+                # Временные таблицы не пишутся в WAL и видны только этому подключению
+                cur.execute("""
+                    CREATE TEMP TABLE import_staging (line BIGINT, name TEXT, distance TEXT)
+                        ON COMMIT DROP;
+                    CREATE TEMP TABLE import_errors (row_num BIGINT, message TEXT) ON COMMIT DROP;
+                """)
+                cur.copy_expert("COPY import_staging (line, name, distance) FROM STDIN (FORMAT csv)",
+                                _CopyRows(staged_rows()))
+                if bad_rows:
+                    execute_values(cur, "INSERT INTO import_errors (row_num, message) VALUES %s",
+                                   bad_rows)
+        
+                # Нормализация пробелов и запятой в расстоянии
+                cur.execute("""
+                    CREATE TEMP TABLE import_rows ON COMMIT DROP AS
+                    SELECT line AS row_num, name,
+                           CASE WHEN distance ~ '^[+-]?([0-9]+[.]?[0-9]*|[.][0-9]+)([eE][+-]?[0-9]+)?$'
+                                THEN distance::numeric END AS distance,
+                           NULL::integer AS point_id
+                    FROM (
+                        SELECT s.line,
+                               btrim(regexp_replace(s.name, '\\s+', ' ', 'g')) AS name,
+                               replace(btrim(regexp_replace(s.distance, '\\s+', ' ', 'g')), ',', '.')
+                                   AS distance
+                        FROM import_staging s
+                        WHERE s.name <> '' AND s.distance <> ''
+                    ) AS raw;
+
+                    DELETE FROM import_rows
+                    WHERE name = '' OR lower(name) = ANY(%(skip_names)s)
+                       OR distance IS NULL OR distance <= 0;
+
+                    INSERT INTO import_errors (row_num, message)
+                    SELECT row_num, format('Строка %%s: ''%%s'' - Расстояние не может превышать %%s км',
+                                           row_num, name, %(max_distance)s)
+                    FROM import_rows WHERE distance > %(max_distance)s;
+                    DELETE FROM import_rows WHERE distance > %(max_distance)s;
+                """, values)
+        
+                # Пункты сопоставляются без учёта регистра, неизвестные создаются
+                cur.execute("""
+                    INSERT INTO points (name)
+                    SELECT DISTINCT ON (lower(r.name)) r.name
+                    FROM import_rows r
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM points p WHERE lower(btrim(p.name)) = lower(r.name)
+                    )
+                    ORDER BY lower(r.name), r.row_num
+                    ON CONFLICT DO NOTHING;
+
+                    UPDATE import_rows r SET point_id = p.id
+                    FROM (
+                        SELECT lower(btrim(name)) AS name, MIN(id) AS id FROM points GROUP BY 1
+                    ) AS p
+                    WHERE p.name = lower(r.name);
+
+                    INSERT INTO import_errors (row_num, message)
+                    SELECT row_num, format('Строка %%s: не удалось создать пункт ''%%s''', row_num, name)
+                    FROM import_rows WHERE point_id IS NULL;
+
+                    -- Пункт уже в маршруте или повторяется в файле (остаётся первая строка)
+                    INSERT INTO import_errors (row_num, message)
+                    SELECT r.row_num, format('Строка %%s: Этот пункт уже добавлен в маршрут', r.row_num)
+                    FROM (
+                        SELECT row_num, point_id,
+                               ROW_NUMBER() OVER (PARTITION BY point_id ORDER BY row_num) AS occurrence
+                        FROM import_rows WHERE point_id IS NOT NULL
+                    ) AS r
+                    WHERE r.occurrence > 1 OR EXISTS (
+                        SELECT 1 FROM route_sequence rs
+                        WHERE rs.route_id = %(route_id)s AND rs.point_id = r.point_id
+                    );
+
+                    DELETE FROM import_rows r USING import_errors e WHERE e.row_num = r.row_num;
+                """, values)
+        
+                # Ключи порядка после последнего пункта, как sort_key_between(max, None)
+                cur.execute("""
+                    INSERT INTO route_sequence
+                    (route_id, point_id, sort_key, distance_km, rounding, cost_per_km, baggage_percent)
+                    SELECT %(route_id)s, r.point_id,
+                           COALESCE((SELECT MAX(sort_key) FROM route_sequence
+                                     WHERE route_id = %(route_id)s), 0)
+                               + ROW_NUMBER() OVER (ORDER BY r.row_num) * %(gap)s,
+                           r.distance, %(rounding)s, %(cost_per_km)s, %(baggage_percent)s
+                    FROM import_rows r
+                    ORDER BY r.row_num
+                """, values)
+                imported = cur.rowcount
+        
+                cur.execute("SELECT message FROM import_errors ORDER BY row_num")
+                errors = [row[0] for row in cur.fetchall()]
+                # В пакетной операции транзакция продолжается - таблицы удаляются сразу
+                cur.execute("DROP TABLE import_staging, import_rows, import_errors")
+            self._commit()
+            return rows, imported, errors
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка импорта пунктов: {e}")
+
+    def _neighbor_sort_keys(self, cur, route_id: int, position: int,
+                            exclude_id: Optional[int] = None) -> Tuple[Optional[int], Optional[int]]:
+        """Ключи пунктов, между которыми окажется пункт на позиции position (с 1)"""
+        if position <= 1:
+            cur.execute("""
+                SELECT MIN(sort_key) FROM route_sequence WHERE route_id = %s AND id <> %s
+            """, (route_id, exclude_id or 0))
+            return None, cur.fetchone()[0]
+        cur.execute("""
+            SELECT sort_key FROM route_sequence
+            WHERE route_id = %s AND id <> %s
+            ORDER BY sort_key, id
+            LIMIT 2 OFFSET %s
+        """, (route_id, exclude_id or 0, position - 2))
+        keys = [row[0] for row in cur.fetchall()]
+        if not keys:
+            # Позиция за концом маршрута - вставка в конец
+            cur.execute("""
+                SELECT MAX(sort_key) FROM route_sequence WHERE route_id = %s AND id <> %s
+            """, (route_id, exclude_id or 0))
+            return cur.fetchone()[0], None
+        return keys[0], keys[1] if len(keys) > 1 else None
+    
+    def _sort_key_at(self, cur, route_id: int, position: int,
+                     exclude_id: Optional[int] = None) -> int:
+        """Свободный ключ для позиции position; при нехватке места маршрут перебалансируется"""
+        sort_key = sort_key_between(*self._neighbor_sort_keys(cur, route_id, position, exclude_id))
+        if sort_key is None:
+            self._rebalance(cur, route_id)
+            sort_key = sort_key_between(*self._neighbor_sort_keys(cur, route_id, position,
+                                                                  exclude_id))
+            if sort_key is None:
+                raise DatabaseError(f"Маршрут {route_id}: нет свободного ключа порядка")
+        return sort_key
+    
+    def insert_point_at(self, route_id: int, position: int, point_id: int,
+                        distance_km: float = 0.0, rounding: float = 0.0,
+                        cost_per_km: float = 10.0, baggage_percent: float = 0.0) -> int:
+        """
+        Вставить пункт в маршрут на позицию position (с 1), вернуть ID записи.
+        
+        Остальные пункты маршрута не изменяются.
+        """
+        self._ensure_connection()
+        try:
+            with self.conn.cursor() as cur:
+                sort_key = self._sort_key_at(cur, route_id, position)
+                cur.execute("""
+                    INSERT INTO route_sequence 
+                    (route_id, point_id, sort_key, distance_km, rounding, cost_per_km, baggage_percent)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id
+                """, (route_id, point_id, sort_key, distance_km, rounding, cost_per_km, baggage_percent))
+                seq_id = cur.fetchone()[0]
+                self._commit()
+                return seq_id
         except psycopg2.IntegrityError as e:
             self.conn.rollback()
             if "unique constraint" in str(e):
@@ -298,134 +936,244 @@ class Database:
                     SET distance_km = %s, rounding = %s, cost_per_km = %s, baggage_percent = %s
                     WHERE id = %s
                 """, (distance_km, rounding, cost_per_km, baggage_percent, seq_id))
-                self.conn.commit()
+                self._commit()
                 return cur.rowcount > 0
         except Exception as e:
             self.conn.rollback()
             raise DatabaseError(f"Ошибка обновления пункта: {e}")
     
+    def update_route_points(self, changes: List[Tuple]) -> int:
+        """
+        Обновить параметры нескольких пунктов маршрута одним запросом.
+        
+        Args:
+            changes: Кортежи (seq_id, distance_km, rounding, cost_per_km,
+                     baggage_percent, row_version); row_version - версия строки
+                     на момент чтения, None - без проверки
+                     
+        Returns:
+            int: Количество обновлённых строк
+            
+        Raises:
+            ConcurrencyError: Если часть строк изменена или удалена после чтения;
+                              в этом случае не обновляется ни одна строка
+        """
+        if not changes:
+            return 0
+        self._ensure_connection()
+        try:
+            with self.conn.cursor() as cur:
+                updated = execute_values(cur, """
+                    UPDATE route_sequence AS rs
+                    SET distance_km = v.distance_km, rounding = v.rounding,
+                        cost_per_km = v.cost_per_km, baggage_percent = v.baggage_percent
+                    FROM (VALUES %s) AS v(id, distance_km, rounding, cost_per_km,
+                                           baggage_percent, row_version)
+                    WHERE rs.id = v.id
+                      AND (v.row_version IS NULL OR rs.row_version = v.row_version)
+                    RETURNING rs.id
+                """, changes,
+                    template="(%s::int, %s::numeric, %s::numeric, %s::numeric, %s::numeric, %s::bigint)",
+                    page_size=len(changes), fetch=True)
+                if len(updated) != len(changes):
+                    conflict_ids = {change[0] for change in changes} - {row[0] for row in updated}
+                    self.conn.rollback()
+                    raise ConcurrencyError(
+                        "Пункты маршрута изменены другим пользователем", sorted(conflict_ids))
+                self._commit()
+                return len(updated)
+        except ConcurrencyError:
+            raise
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка обновления пунктов: {e}")
+    
+    def _route_filter_sql(self, route_ids: Optional[Iterable[int]], search: Optional[str],
+                          min_cost_per_km: Optional[float],
+                          max_cost_per_km: Optional[float]) -> Tuple[str, tuple]:
+        """Условие отбора маршрутов (по таблице routes r) и его параметры"""
+        conditions = ["TRUE"]
+        params: List[Any] = []
+        if route_ids is not None:
+            conditions.append("r.id = ANY(%s)")
+            params.append(list(route_ids))
+        if search:
+            conditions.append("(r.route_number ILIKE %s OR r.route_name ILIKE %s)")
+            params += [f"%{search}%", f"%{search}%"]
+        if min_cost_per_km is not None:
+            conditions.append("r.cost_per_km >= %s")
+            params.append(min_cost_per_km)
+        if max_cost_per_km is not None:
+            conditions.append("r.cost_per_km <= %s")
+            params.append(max_cost_per_km)
+        return " AND ".join(conditions), tuple(params)
+    
+    def update_tariff_parameters(self, cost_per_km: Optional[float] = None,
+                                 baggage_percent: Optional[float] = None,
+                                 rounding: Optional[float] = None,
+                                 route_ids: Optional[Iterable[int]] = None,
+                                 search: Optional[str] = None,
+                                 min_cost_per_km: Optional[float] = None,
+                                 max_cost_per_km: Optional[float] = None) -> TariffUpdate:
+        """
+        Записать параметры тарифа во все пункты отобранных маршрутов одним запросом.
+        
+        Args:
+            cost_per_km, baggage_percent, rounding: Новые значения (None - не менять)
+            route_ids: ID маршрутов (None - без ограничения)
+            search: Подстрока номера или названия маршрута
+            min_cost_per_km, max_cost_per_km: Диапазон текущей стоимости км маршрута
+            
+        Returns:
+            TariffUpdate: Сколько маршрутов и пунктов отобрано и сколько пунктов изменено
+        """
+        where, filter_params = self._route_filter_sql(route_ids, search, min_cost_per_km,
+                                                      max_cost_per_km)
+        values = (cost_per_km, baggage_percent, rounding)
+        self._ensure_connection()
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT COUNT(DISTINCT r.id), COUNT(rs.id)
+                    FROM routes r LEFT JOIN route_sequence rs ON rs.route_id = r.id
+                    WHERE {where}
+                """, filter_params)
+                routes_matched, rows_matched = cur.fetchone()
+                updated = []
+                if any(value is not None for value in values):
+                    # Строки, где значения уже совпадают, не трогаем: не растут версии
+                    cur.execute(f"""
+                        UPDATE route_sequence rs
+                        SET cost_per_km = COALESCE(%s, rs.cost_per_km),
+                            baggage_percent = COALESCE(%s, rs.baggage_percent),
+                            rounding = COALESCE(%s, rs.rounding)
+                        FROM routes r
+                        WHERE rs.route_id = r.id AND {where}
+                          AND (rs.cost_per_km IS DISTINCT FROM COALESCE(%s, rs.cost_per_km)
+                               OR rs.baggage_percent IS DISTINCT FROM COALESCE(%s, rs.baggage_percent)
+                               OR rs.rounding IS DISTINCT FROM COALESCE(%s, rs.rounding))
+                        RETURNING rs.route_id
+                    """, values + filter_params + values)
+                    updated = [row[0] for row in cur.fetchall()]
+                self._commit()
+                return TariffUpdate(routes_matched, rows_matched, len(updated),
+                                    sorted(set(updated)))
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка изменения тарифа: {e}")
+    
     def remove_point_from_route(self, route_sequence_id: int):
         """Удалить пункт из маршрута"""
         self._ensure_connection()
         try:
             with self.conn.cursor() as cur:
-                cur.execute("SELECT route_id, sequence_number FROM route_sequence WHERE id = %s", (route_sequence_id,))
-                route_id, seq_num = cur.fetchone()
-                
+                # Порядок остальных пунктов задан ключами и не меняется
                 cur.execute("DELETE FROM route_sequence WHERE id = %s", (route_sequence_id,))
-                cur.execute("""
-                    UPDATE route_sequence 
-                    SET sequence_number = sequence_number - 1 
-                    WHERE route_id = %s AND sequence_number > %s
-                """, (route_id, seq_num))
-                self.conn.commit()
+                self._commit()
         except Exception as e:
             self.conn.rollback()
             raise DatabaseError(f"Ошибка удаления пункта: {e}")
     
+    # === Синхронизация ===
+    def get_changes_since(self, watermark: Optional[str] = None) -> Dict[str, list]:
+        """
+        Строки, изменённые после отметки watermark, и журнал удалений.
+        
+        Отметка - xmin снимка сервера: все транзакции с меньшим номером к
+        началу выгрузки завершены и видны в ней. Строки незавершённых
+        транзакций (номер >= xmin) выгрузятся следующим запросом, сколько бы
+        ни длилась транзакция; строки между xmin и концом выгрузки могут
+        прийти повторно, их запись в кэш идемпотентна.
+        
+        Args:
+            watermark: Отметка предыдущего запроса (xid8 текстом), None - полная выгрузка
+            
+        Returns:
+            dict: points, routes, route_sequence - списки кортежей в порядке
+                  колонок core.sync.SYNC_COLUMNS; deleted - (table_name, row_id);
+                  watermark - отметка для следующего запроса
+        """
+        self._ensure_connection()
+        condition, params = ("", ()) if watermark is None else (" WHERE updated_xid >= %s::xid8",
+                                                                (watermark,))
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text")
+                changes: Dict[str, list] = {'watermark': cur.fetchone()[0]}
+                
+                cur.execute("SELECT id, name, row_version FROM points" + condition, params)
+                changes['points'] = cur.fetchall()
+                cur.execute("""
+                    SELECT id, route_number, route_name, points_count, total_distance_km::float8,
+                           cost_per_km::float8, rounding::float8, baggage_percent::float8,
+                           row_version
+                    FROM routes""" + condition, params)
+                changes['routes'] = cur.fetchall()
+                cur.execute("""
+                    SELECT id, route_id, point_id, sort_key, distance_km::float8,
+                           rounding::float8, cost_per_km::float8, baggage_percent::float8,
+                           row_version
+                    FROM route_sequence""" + condition, params)
+                changes['route_sequence'] = cur.fetchall()
+                
+                if watermark is None:
+                    changes['deleted'] = []
+                else:
+                    cur.execute("""
+                        SELECT table_name, row_id FROM deleted_rows
+                        WHERE deleted_xid >= %s::xid8 ORDER BY id
+                    """, (watermark,))
+                    changes['deleted'] = cur.fetchall()
+            self._commit()
+            return changes
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка получения изменений: {e}")
+    
+    def data_version(self) -> tuple:
+        """
+        Отметка состояния данных: меняется при любой вставке, изменении или
+        удалении пунктов и маршрутов (любым клиентом). Используется кэшами,
+        построенными по всей сети.
+        """
+        self._ensure_connection()
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    SELECT (SELECT MAX(updated_at) FROM points),
+                           (SELECT MAX(updated_at) FROM routes),
+                           (SELECT MAX(updated_at) FROM route_sequence),
+                           (SELECT MAX(id) FROM deleted_rows)
+                """)
+                version = cur.fetchone()
+            self._commit()
+            return version
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка проверки версии данных: {e}")
+    
     # === Расчёт тарифов ===
     def calculate_tariffs(self, distance: float, cost_per_km: float, 
                         baggage_percent: float, rounding: float = 0.0, 
                         round_up: bool = False) -> Dict[str, float]:
-        """Расчёт тарифов с выбором типа округления"""
-        try:
-            # Безопасное преобразование в float
-            distance = float(distance) if distance is not None else 0
-            cost_per_km = float(cost_per_km) if cost_per_km is not None else 0
-            baggage_percent = float(baggage_percent) if baggage_percent is not None else 0
-            rounding = float(rounding) if rounding is not None else 0
-        except (TypeError, ValueError):
-            return {'passenger': 0.0, 'baggage': 0.0}
-        
-        # Валидация входных данных
-        if distance <= 0 or cost_per_km <= 0:
-            return {'passenger': 0.0, 'baggage': 0.0}
-        
-        # Тариф пассажирский = расстояние × стоимость за км
-        passenger = distance * cost_per_km
-        
-        # Применяем округление ТОЛЬКО если rounding > 0
-        if rounding > 0:
-            if round_up:
-                # Округление в большую сторону
-                passenger = math.ceil(passenger / rounding) * rounding
-            else:
-                # Обычное округление до ближайшего целого
-                passenger = round(passenger / rounding) * rounding
-        
-        # Тариф багаж
-        if baggage_percent > 0:
-            baggage = (cost_per_km * (baggage_percent / 100)) * distance
-            if rounding > 0:
-                if round_up:
-                    baggage = math.ceil(baggage / rounding) * rounding
-                else:
-                    baggage = round(baggage / rounding) * rounding
-        else:
-            baggage = 0.0
-        
-        return {
-            'passenger': round(passenger, 2),
-            'baggage': round(baggage, 2)
-        }
+        """Расчёт тарифов с выбором типа округления (см. core.fare_engine)"""
+        return fare_engine.calculate_tariffs(distance, cost_per_km, baggage_percent,
+                                             rounding, round_up)
 
     def update_route_sequence_number(self, seq_id: int, new_number: int):
-        """Обновить порядковый номер пункта в маршруте"""
+        """Переместить пункт на позицию new_number (с 1), изменяется одна запись"""
         self._ensure_connection()
         try:
             with self.conn.cursor() as cur:
-                # Сначала получаем текущий номер и route_id
-                cur.execute("SELECT sequence_number, route_id FROM route_sequence WHERE id = %s", (seq_id,))
+                cur.execute("SELECT route_id FROM route_sequence WHERE id = %s", (seq_id,))
                 result = cur.fetchone()
                 if not result:
                     return False
                 
-                old_number, route_id = result
-                
-                if old_number == new_number:
-                    return True
-                
-                # Получаем максимальный номер для временных значений
-                cur.execute("SELECT MAX(sequence_number) FROM route_sequence WHERE route_id = %s", (route_id,))
-                max_seq = cur.fetchone()[0] or 0
-                temp_base = max_seq + 100
-                
-                # Сначала перемещаем целевую запись во временное место
-                temp_number = temp_base + 1
-                cur.execute("""
-                    UPDATE route_sequence 
-                    SET sequence_number = %s 
-                    WHERE id = %s
-                """, (temp_number, seq_id))
-                
-                # Сдвигаем остальные записи
-                if new_number > old_number:
-                    # Перемещение вниз: сдвигаем записи между old+1 и new вверх
-                    cur.execute("""
-                        UPDATE route_sequence 
-                        SET sequence_number = sequence_number - 1 
-                        WHERE route_id = %s 
-                        AND sequence_number > %s 
-                        AND sequence_number <= %s
-                    """, (route_id, old_number, new_number))
-                else:
-                    # Перемещение вверх: сдвигаем записи между new и old-1 вниз
-                    cur.execute("""
-                        UPDATE route_sequence 
-                        SET sequence_number = sequence_number + 1 
-                        WHERE route_id = %s 
-                        AND sequence_number >= %s 
-                        AND sequence_number < %s
-                    """, (route_id, new_number, old_number))
-                
-                # Возвращаем целевую запись на нужное место
-                cur.execute("""
-                    UPDATE route_sequence 
-                    SET sequence_number = %s 
-                    WHERE id = %s
-                """, (new_number, seq_id))
-                
-                self.conn.commit()
+                sort_key = self._sort_key_at(cur, result[0], new_number, exclude_id=seq_id)
+                cur.execute("UPDATE route_sequence SET sort_key = %s WHERE id = %s",
+                            (sort_key, seq_id))
+                self._commit()
                 return True
                 
         except Exception as e:
@@ -440,33 +1188,100 @@ class Database:
         self._ensure_connection()
         try:
             with self.conn.cursor() as cur:
-                # Получаем максимальный sequence_number для этого маршрута
-                cur.execute("SELECT MAX(sequence_number) FROM route_sequence WHERE route_id = %s", (route_id,))
-                max_seq = cur.fetchone()[0] or 0
-                
-                # Используем временные номера в допустимом диапазоне (начиная с max_seq + 100)
-                temp_base = max_seq + 100
-                
-                # Сначала присваиваем временные номера в правильном порядке
-                for new_position, seq_id in enumerate(new_order):
-                    temp_number = temp_base + new_position + 1
-                    cur.execute("""
-                        UPDATE route_sequence 
-                        SET sequence_number = %s 
-                        WHERE id = %s AND route_id = %s
-                    """, (temp_number, seq_id, route_id))
-                
-                # Затем устанавливаем правильные номера (1, 2, 3...)
-                for new_position, seq_id in enumerate(new_order):
-                    cur.execute("""
-                        UPDATE route_sequence 
-                        SET sequence_number = %s 
-                        WHERE id = %s AND route_id = %s
-                    """, (new_position + 1, seq_id, route_id))
-                
-                self.conn.commit()
+                # Новые ключи с равным шагом - одним запросом
+                execute_values(cur, """
+                    UPDATE route_sequence AS rs
+                    SET sort_key = v.sort_key
+                    FROM (VALUES %s) AS v(id, route_id, sort_key)
+                    WHERE rs.id = v.id AND rs.route_id = v.route_id
+                      AND rs.sort_key <> v.sort_key
+                """, [(seq_id, route_id, (position + 1) * SORT_KEY_GAP)
+                      for position, seq_id in enumerate(new_order)],
+                    template="(%s::int, %s::int, %s::bigint)",
+                    page_size=max(len(new_order), 1))
+                self._commit()
                 return True
                 
         except Exception as e:
             self.conn.rollback()
-            raise DatabaseError(f"Ошибка переупорядочивания маршрута: {e}")
\ No newline at end of file
+            raise DatabaseError(f"Ошибка переупорядочивания маршрута: {e}")
+    
+    def _rebalance(self, cur, route_id: int) -> int:
+        """Разложить ключи маршрута с равным шагом SORT_KEY_GAP, сохранив порядок"""
+        cur.execute("""
+            UPDATE route_sequence AS rs
+            SET sort_key = o.position * %s
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (ORDER BY sort_key, id) AS position
+                FROM route_sequence WHERE route_id = %s
+            ) AS o
+            WHERE rs.id = o.id AND rs.sort_key <> o.position * %s
+        """, (SORT_KEY_GAP, route_id, SORT_KEY_GAP))
+        logger.info(f"Маршрут {route_id}: ключи порядка перебалансированы ({cur.rowcount} строк)")
+        return cur.rowcount
+    
+    def rebalance_route(self, route_id: int) -> int:
+        """Перебалансировать ключи порядка пунктов маршрута, вернуть число изменённых строк"""
+        self._ensure_connection()
+        try:
+            with self.conn.cursor() as cur:
+                count = self._rebalance(cur, route_id)
+                self._commit()
+                return count
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка перебалансировки маршрута: {e}")
+    
+    def get_crowded_routes(self, min_gap: int = 2) -> List[int]:
+        """ID маршрутов, где между соседними ключами порядка осталось меньше min_gap"""
+        self._ensure_connection()
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT DISTINCT route_id FROM (
+                    SELECT route_id,
+                           sort_key - LAG(sort_key) OVER (PARTITION BY route_id
+                                                          ORDER BY sort_key, id) AS gap
+                    FROM route_sequence
+                ) AS gaps
+                WHERE gap < %s
+            """, (min_gap,))
+            routes = [row[0] for row in cur.fetchall()]
+        self._commit()
+        return routes
+
+
+def create_database():
+    """
+    Создать хранилище, выбранное в config.json (database.backend).
+    
+    Returns:
+        Database, SQLiteDatabase или SyncedDatabase с одинаковым набором методов
+        
+    Raises:
+        DatabaseError: Если хранилище недоступно
+    """
+    if DB_CONFIG.get('backend', 'postgresql') == 'sqlite':
+        from core.sqlite_database import SQLiteDatabase
+        return SQLiteDatabase()
+    
+    if DB_CONFIG.get('local_cache'):
+        from core.sync import SyncedDatabase
+        try:
+            remote = Database()
+        except SchemaVersionError:
+            raise
+        except DatabaseError as e:
+            logger.warning(f"PostgreSQL недоступен, работа с локальным кэшем: {e}")
+            remote = None
+        return SyncedDatabase(remote, remote_factory=Database)
+    
+    try:
+        return Database()
+    except SchemaVersionError:
+        raise
+    except DatabaseError as e:
+        if not DB_CONFIG.get('offline_fallback'):
+            raise
+        logger.warning(f"PostgreSQL недоступен, переход на локальную БД: {e}")
+        from core.sqlite_database import SQLiteDatabase
+        return SQLiteDatabase()
@@ -0,0 +1,127 @@
+"""
+fare_cache.py
+Кэш посчитанных тарифов в памяти процесса
+
+Хранит матрицы тарифов маршрутов (fare_engine.fare_matrix_kopecks) с
+вытеснением давно не использованных по объёму памяти и граф сети для
+поиска поездок. Матрица проверяется по отпечатку расстояний и параметров
+тарифа, граф - по отметке состояния данных БД (data_version), поэтому
+правка в обход кэша, изменения других клиентов и синхронизации не вернут
+устаревшие данные;
+после массовых изменений вызывающий код сбрасывает затронутые маршруты
+через invalidate().
+
+Тарифы на прошедшую дату (as_of) не меняются, поэтому invalidate() их не
+трогает: старые версии вытесняются только по объёму.
+"""
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from core import fare_engine
+from core.config import PERFORMANCE_CONFIG
+from models import RouteSequence
+
+
+def _is_past(as_of: Optional[date], today: date) -> bool:
+    return as_of is not None and as_of < today
+
+
+def _signature(sequence: RouteSequence) -> Tuple:
+    return (hash(sequence.distances.tobytes()), sequence.cost_per_km,
+            sequence.baggage_percent, sequence.rounding)
+
+
+class FareCache:
+    """Матрицы тарифов по маршрутам и графы сети"""
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._matrices: 'OrderedDict[Tuple[int, bool, Optional[date]], Tuple[Tuple, array]]' = \
+            OrderedDict()
+        # (round_up, as_of) -> (отметка данных БД, граф)
+        self._networks: Dict[Tuple[bool, Optional[date]], Tuple[Any, object]] = {}
+        self._lock = threading.Lock()
+
+    def matrix(self, sequence: RouteSequence, round_up: bool = False,
+               as_of: Optional[date] = None) -> array:
+        """
+        Матрица тарифов маршрута в копейках (см. fare_engine.fare_matrix_kopecks).
+
+        as_of - дата, на которую прочитана sequence (None - текущая версия).
+        Матрица маршрута без ID (ещё не сохранённого) не кэшируется.
+        """
+        if sequence.route_id is None:
+            return fare_engine.fare_matrix_kopecks(sequence, round_up)
+        key = (sequence.route_id, round_up, as_of)
+        signature = _signature(sequence)
+        with self._lock:
+            entry = self._matrices.get(key)
+            if entry is not None and entry[0] == signature:
+                self._matrices.move_to_end(key)
+                return entry[1]
+        matrix = fare_engine.fare_matrix_kopecks(sequence, round_up)
+        size = len(matrix) * matrix.itemsize
+        if size > self.max_bytes:
+            return matrix
+        with self._lock:
+            self._drop(key)
+            self._matrices[key] = (signature, matrix)
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                self._drop(next(iter(self._matrices)))
+        return matrix
+
+    def network(self, db, round_up: bool = False, as_of: Optional[date] = None):
+        """
+        Граф сети для поиска поездок на дату as_of.
+
+        Граф строится заново, если данные БД изменились с прошлого построения;
+        графы на прошедшие даты не перестраиваются.
+        """
+        from core.network_fares import FareNetwork
+        key = (round_up, as_of)
+        version = None if _is_past(as_of, date.today()) else db.data_version()
+        with self._lock:
+            entry = self._networks.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        network = FareNetwork.from_database(db, round_up, as_of=as_of)
+        with self._lock:
+            self._networks[key] = (version, network)
+        return network
+
+    def invalidate(self, route_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        Сбросить текущие матрицы маршрутов (None - все) и графы сети.
+
+        Матрицы и графы на прошедшие даты остаются: изменение маршрута
+        сегодня не меняет его прошлых версий.
+
+        Returns:
+            int: Количество сброшенных матриц
+        """
+        today = date.today()
+        if route_ids is not None:
+            route_ids = set(route_ids)
+        with self._lock:
+            for network_key in [network_key for network_key in self._networks
+                                if not _is_past(network_key[1], today)]:
+                del self._networks[network_key]
+            matrix_keys = [matrix_key for matrix_key in self._matrices
+                           if (route_ids is None or matrix_key[0] in route_ids)
+                           and not _is_past(matrix_key[2], today)]
+            for matrix_key in matrix_keys:
+                self._drop(matrix_key)
+            return len(matrix_keys)
+
+    def _drop(self, key: Tuple[int, bool, Optional[date]]) -> None:
+        entry = self._matrices.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= len(entry[1]) * entry[1].itemsize
+
+
+fare_cache = FareCache(int(PERFORMANCE_CONFIG.get('fare_cache_mb', 128)) * 1024 * 1024)
@@ -0,0 +1,243 @@
+"""
+fare_columnar.py
+Колоночная выгрузка тарифов сети для аналитики (Parquet и Arrow IPC)
+
+Строка - пара остановок маршрута (from_point раньше to_point):
+    route_id int32, from_point, to_point - название пункта,
+    distance float64 (км), passenger, child, benefit, baggage int32
+    (копейки), version date32 - день последнего изменения тарифа
+    маршрута на дату выгрузки (NULL - изменений не было)
+
+Тарифы берутся из fare_engine.fare_matrix_kopecks (через fare_cache):
+столбцы вырезаются из матрицы срезами массивов и передаются в Arrow без
+копирования и без объектов Python на каждую пару; названия и расстояния
+пар считаются в Arrow по номерам остановок. Строки пишутся группами
+(row group в Parquet, пакет в Arrow) по мере расчёта маршрутов; маршрут
+целиком попадает в одну группу. Названия пунктов по умолчанию хранятся
+словарём, общим для всего файла. Файл Arrow читается через memory map
+без копирования (pyarrow.ipc.open_file(pyarrow.memory_map(...))).
+
+pyarrow - необязательная зависимость: без него выгрузка недоступна
+(is_available() возвращает False).
+"""
+import os
+import time
+from array import array
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+from core import fare_engine
+from core.fare_cache import fare_cache
+from models import RouteSequence
+
+# Примерный размер группы строк
+ROW_GROUP_ROWS = 1_000_000
+
+# Формат по расширению файла
+FORMATS = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}
+
+
+@dataclass
+class ColumnarExportResult:
+    """Итог выгрузки"""
+    pairs: int
+    row_groups: int
+    size_bytes: int
+    elapsed_sec: float
+
+
+def is_available() -> bool:
+    """Установлен ли pyarrow"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def fare_schema(pa, dictionary_names: bool = True, metadata: Optional[Dict[str, str]] = None):
+    """Схема Arrow выгрузки"""
+    name_type = pa.dictionary(pa.int32(), pa.string()) if dictionary_names else pa.string()
+    kopecks = {'unit': 'kopecks'}
+    return pa.schema([
+        pa.field('route_id', pa.int32(), nullable=False),
+        pa.field('from_point', name_type, nullable=False),
+        pa.field('to_point', name_type, nullable=False),
+        pa.field('distance', pa.float64(), nullable=False, metadata={'unit': 'km'}),
+        pa.field('passenger', pa.int32(), nullable=False, metadata=kopecks),
+        pa.field('child', pa.int32(), nullable=False, metadata=kopecks),
+        pa.field('benefit', pa.int32(), nullable=False, metadata=kopecks),
+        pa.field('baggage', pa.int32(), nullable=False, metadata=kopecks),
+        pa.field('version', pa.date32()),
+    ], metadata=metadata)
+
+
+class _Batch:
+    """
+    Столбцы накапливаемой группы строк (массивы array без объектов на пару).
+
+    Для пар хранятся только номера остановок в группе; названия и
+    расстояния пар получаются в to_record_batch выборкой (take) и
+    вычитанием в Arrow.
+    """
+
+    def __init__(self) -> None:
+        self.route_ids = array('i')
+        # Остановки маршрутов группы: код названия и расстояние от начала маршрута
+        self.stop_codes = array('i')
+        self.stop_distances = array('d')
+        # Остановки пары (номера в stop_codes и stop_distances)
+        self.from_stops = array('i')
+        self.to_stops = array('i')
+        self.passenger = array('i')
+        self.child = array('i')
+        self.baggage = array('i')
+        # Номер маршрута в группе для каждой строки и версии маршрутов группы
+        self.route_slots = array('i')
+        self.versions: List[Optional[date]] = []
+
+    def __len__(self) -> int:
+        return len(self.route_ids)
+
+    def add_route(self, sequence: RouteSequence, codes: Dict[int, int], fares: array,
+                  version: Optional[date]) -> None:
+        if sequence.route_id is None:
+            raise ValueError("Маршрут без ID нельзя выгрузить")
+        first = len(self.stop_codes)
+        stops = array('i', range(first, first + len(sequence.point_ids)))
+        self.stop_codes.extend(array('i', [codes[point_id] for point_id in sequence.point_ids]))
+        self.stop_distances.extend(sequence.distances)
+        pairs = len(fares) // 3
+        for i in range(1, len(stops)):
+            self.from_stops.extend(stops[:i])
+            self.to_stops.extend(array('i', [stops[i]]) * i)
+        self.passenger.extend(fares[0::3])
+        self.child.extend(fares[1::3])
+        self.baggage.extend(fares[2::3])
+        self.route_ids.extend(array('i', [sequence.route_id]) * pairs)
+        self.route_slots.extend(array('i', [len(self.versions)]) * pairs)
+        self.versions.append(version)
+
+    def to_record_batch(self, pa, schema, dictionary):
+        import pyarrow.compute as pc
+
+        def column(values: array, arrow_type):
+            return pa.Array.from_buffers(arrow_type, len(values), [None, pa.py_buffer(values)])
+
+        from_stops = column(self.from_stops, pa.int32())
+        to_stops = column(self.to_stops, pa.int32())
+        stop_codes = column(self.stop_codes, pa.int32())
+        stop_distances = column(self.stop_distances, pa.float64())
+
+        def names(stops):
+            indices = stop_codes.take(stops)
+            if pa.types.is_dictionary(schema.field('from_point').type):
+                return pa.DictionaryArray.from_arrays(indices, dictionary)
+            return dictionary.take(indices)
+
+        passenger = column(self.passenger, pa.int32())
+        child = column(self.child, pa.int32())
+        if fare_engine.BENEFIT_FARE_PERCENT == fare_engine.CHILD_FARE_PERCENT:
+            benefit = child
+        else:
+            # Как детский тариф в fare_engine: от суммы в рублях
+            factor = fare_engine.BENEFIT_FARE_PERCENT / 100
+            rubles = pc.multiply(pc.divide(pc.cast(passenger, pa.float64()), 100.0), factor)
+            benefit = pc.cast(pc.round(pc.multiply(rubles, 100.0), round_mode='half_to_even'),
+                              pa.int32())
+
+        versions = pa.array(self.versions, pa.date32()).take(column(self.route_slots, pa.int32()))
+        return pa.RecordBatch.from_arrays([
+            column(self.route_ids, pa.int32()),
+            names(from_stops),
+            names(to_stops),
+            pc.subtract(stop_distances.take(to_stops), stop_distances.take(from_stops)),
+            passenger,
+            child,
+            benefit,
+            column(self.baggage, pa.int32()),
+            versions,
+        ], schema=schema)
+
+
+def export_fares_columnar(db, filename: str, route_ids: Optional[Iterable[int]] = None,
+                          round_up: bool = False, as_of: Optional[date] = None,
+                          dictionary_names: bool = True,
+                          row_group_rows: int = ROW_GROUP_ROWS) -> ColumnarExportResult:
+    """
+    Выгрузить тарифы пар остановок маршрутов в Parquet или Arrow (по расширению).
+
+    Args:
+        db: Database, SQLiteDatabase или SyncedDatabase
+        filename: Путь к файлу (.parquet, .arrow, .feather)
+        route_ids: ID маршрутов (None - вся сеть)
+        round_up: Округление тарифов вверх
+        as_of: Дата, на которую нужны тарифы (None - текущие)
+        dictionary_names: Хранить названия пунктов словарём
+        row_group_rows: Примерный размер группы строк
+
+    Raises:
+        RuntimeError: Если pyarrow не установлен
+        ValueError: Если расширение файла не .parquet/.arrow/.feather
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError("Для выгрузки в Parquet/Arrow установите пакет pyarrow")
+    file_format = FORMATS.get(os.path.splitext(filename)[1].lower())
+    if file_format is None:
+        raise ValueError(f"Неизвестный формат файла: {filename}")
+
+    started = time.perf_counter()
+    sequences = list(RouteSequence.group_rows(db.iter_route_sequences(route_ids, as_of=as_of)))
+    versions = db.get_tariff_versions(as_of)
+    # Словарь названий - общий для всех групп (формат файла Arrow не допускает замены)
+    codes: Dict[int, int] = {}
+    names: List[str] = []
+    for sequence in sequences:
+        for point_id, name in zip(sequence.point_ids, sequence.point_names):
+            if point_id not in codes:
+                codes[point_id] = len(names)
+                names.append(name)
+    dictionary = pa.array(names, pa.string())
+    schema = fare_schema(pa, dictionary_names, {
+        'round_up': 'true' if round_up else 'false',
+        'as_of': (as_of or date.today()).isoformat(),
+    })
+
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(
+            filename, schema,
+            use_dictionary=['from_point', 'to_point'] if dictionary_names else False)
+
+        def write(record_batch):
+            writer.write_table(pa.Table.from_batches([record_batch]),
+                               row_group_size=record_batch.num_rows)
+    else:
+        sink = pa.OSFile(filename, 'wb')
+        writer = pa.ipc.new_file(sink, schema)
+        write = writer.write_batch
+
+    pairs = row_groups = 0
+    try:
+        batch = _Batch()
+        for sequence in sequences:
+            batch.add_route(sequence, codes, fare_cache.matrix(sequence, round_up, as_of),
+                            versions.get(sequence.route_id))
+            if len(batch) >= row_group_rows:
+                write(batch.to_record_batch(pa, schema, dictionary))
+                pairs += len(batch)
+                row_groups += 1
+                batch = _Batch()
+        if len(batch):
+            write(batch.to_record_batch(pa, schema, dictionary))
+            pairs += len(batch)
+            row_groups += 1
+    finally:
+        writer.close()
+        if file_format == 'arrow':
+            sink.close()
+    return ColumnarExportResult(pairs, row_groups, os.path.getsize(filename),
+                                time.perf_counter() - started)
@@ -0,0 +1,175 @@
+"""
+Расчёт тарифов: стоимость проезда и провоза багажа между пунктами маршрута
+"""
+import math
+from array import array
+from itertools import chain
+from typing import Dict, Iterator, List, Tuple
+
+from models import RouteSequence
+
+# Детский тариф - процент от пассажирского
+CHILD_FARE_PERCENT = 50.0
+# Льготный тариф - процент от пассажирского
+BENEFIT_FARE_PERCENT = 50.0
+
+
+def _round_fare(value: float, rounding: float, round_up: bool) -> float:
+    """Округление суммы до кратного rounding"""
+    if rounding > 0:
+        if round_up:
+            # Округление в большую сторону
+            return math.ceil(value / rounding) * rounding
+        # Обычное округление до ближайшего целого
+        return round(value / rounding) * rounding
+    return value
+
+
+def calculate_tariffs(distance: float, cost_per_km: float,
+                      baggage_percent: float, rounding: float = 0.0,
+                      round_up: bool = False) -> Dict[str, float]:
+    """Расчёт тарифов с выбором типа округления"""
+    try:
+        # Безопасное преобразование в float
+        distance = float(distance) if distance is not None else 0
+        cost_per_km = float(cost_per_km) if cost_per_km is not None else 0
+        baggage_percent = float(baggage_percent) if baggage_percent is not None else 0
+        rounding = float(rounding) if rounding is not None else 0
+    except (TypeError, ValueError):
+        return {'passenger': 0.0, 'baggage': 0.0}
+
+    # Валидация входных данных
+    if distance <= 0 or cost_per_km <= 0:
+        return {'passenger': 0.0, 'baggage': 0.0}
+
+    # Тариф пассажирский = расстояние × стоимость за км
+    # Округление применяется ТОЛЬКО если rounding > 0
+    passenger = _round_fare(distance * cost_per_km, rounding, round_up)
+
+    # Тариф багаж
+    if baggage_percent > 0:
+        baggage = _round_fare((cost_per_km * (baggage_percent / 100)) * distance,
+                              rounding, round_up)
+    else:
+        baggage = 0.0
+
+    return {
+        'passenger': round(passenger, 2),
+        'baggage': round(baggage, 2)
+    }
+
+
+def stop_fares(sequence: RouteSequence, round_up: bool = False) -> List[Dict[str, float]]:
+    """Тарифы от начального пункта до каждого пункта маршрута"""
+    cost, baggage, rounding = sequence.cost_per_km, sequence.baggage_percent, sequence.rounding
+    return [calculate_tariffs(distance, cost, baggage, rounding, round_up)
+            for distance in sequence.distances]
+
+
+def iter_fare_matrix(sequence: RouteSequence,
+                     round_up: bool = False) -> Iterator[Tuple[int, int, float, float, float]]:
+    """
+    Перебор нижнетреугольной матрицы тарифов маршрута.
+
+    Параметры тарифа берутся из первого пункта маршрута.
+
+    Yields:
+        tuple: (i, j, пассажирский, детский, багаж) для всех пар j < i
+    """
+    cost, baggage, rounding = sequence.cost_per_km, sequence.baggage_percent, sequence.rounding
+    distances = sequence.distances
+    child_factor = CHILD_FARE_PERCENT / 100
+    for i in range(1, len(distances)):
+        to_distance = distances[i]
+        for j in range(i):
+            tariffs = calculate_tariffs(to_distance - distances[j], cost, baggage,
+                                        rounding, round_up)
+            passenger = tariffs['passenger']
+            yield i, j, passenger, passenger * child_factor, tariffs['baggage']
+
+
+def fare_matrix(sequence: RouteSequence,
+                round_up: bool = False) -> List[List[Tuple[float, float, float]]]:
+    """
+    Нижнетреугольная матрица тарифов маршрута.
+
+    Returns:
+        list: Строка i содержит i кортежей (пассажирский, детский, багаж)
+              для проезда из пунктов 0..i-1 в пункт i; строка 0 пустая.
+    """
+    matrix: List[List[Tuple[float, float, float]]] = [[] for _ in range(len(sequence))]
+    for i, _, passenger, child, baggage in iter_fare_matrix(sequence, round_up):
+        matrix[i].append((passenger, child, baggage))
+    return matrix
+
+
+def _round_fares(values: List[float], rounding: float, round_up: bool) -> List[float]:
+    """_round_fare и округление до копеек для списка сумм"""
+    if rounding > 0:
+        if round_up:
+            return [round(math.ceil(value / rounding) * rounding, 2) for value in values]
+        return [round(round(value / rounding) * rounding, 2) for value in values]
+    return [round(value, 2) for value in values]
+
+
+def fare_matrix_kopecks(sequence: RouteSequence, round_up: bool = False) -> array:
+    """
+    Нижнетреугольная матрица тарифов в целых копейках одним массивом.
+
+    Значения совпадают с iter_fare_matrix, но строка матрицы считается
+    целиком списковыми выражениями без вызова calculate_tariffs на каждую
+    пару: для публикации сети это основной объём работы.
+
+    Returns:
+        array('i'): Тройки (пассажирский, детский, багаж) для пар (i, j), j < i,
+                    в порядке i = 1..n-1, j = 0..i-1; пара (i, j) начинается
+                    с индекса 3 * (i * (i - 1) // 2 + j)
+    """
+    cost = float(sequence.cost_per_km or 0)
+    baggage_percent = float(sequence.baggage_percent or 0)
+    rounding = float(sequence.rounding or 0)
+    baggage_rate = cost * (baggage_percent / 100)
+    child_factor = CHILD_FARE_PERCENT / 100
+    distances = sequence.distances
+    result = array('i')
+    if cost <= 0:
+        stops = len(distances)
+        return array('i', bytes(4 * 3 * (stops * (stops - 1) // 2)))
+
+    for i in range(1, len(distances)):
+        to_distance = distances[i]
+        row = [to_distance - distances[j] for j in range(i)]
+        passenger = _round_fares([distance * cost for distance in row], rounding, round_up)
+        if baggage_percent > 0:
+            baggage = _round_fares([baggage_rate * distance for distance in row], rounding,
+                                   round_up)
+        else:
+            baggage = [0.0] * i
+        if min(row) <= 0:
+            # Нулевое и отрицательное расстояние - нулевой тариф, как в calculate_tariffs
+            passenger = [value if distance > 0 else 0.0 for value, distance in zip(passenger, row)]
+            baggage = [value if distance > 0 else 0.0 for value, distance in zip(baggage, row)]
+        result.extend(chain.from_iterable(zip(
+            [round(value * 100) for value in passenger],
+            [round(value * child_factor * 100) for value in passenger],
+            [round(value * 100) for value in baggage],
+        )))
+    return result
+
+
+def passenger_kopecks(distances, cost_per_km: float, rounding: float,
+                      round_up: bool = False) -> array:
+    """Только пассажирские тарифы пар (копейки) в порядке fare_matrix_kopecks"""
+    cost = float(cost_per_km or 0)
+    rounding = float(rounding or 0)
+    result = array('i')
+    if cost <= 0:
+        stops = len(distances)
+        return array('i', bytes(4 * (stops * (stops - 1) // 2)))
+    for i in range(1, len(distances)):
+        to_distance = distances[i]
+        row = [to_distance - distances[j] for j in range(i)]
+        passenger = _round_fares([distance * cost for distance in row], rounding, round_up)
+        result.extend([round(value * 100) if distance > 0 else 0
+                       for value, distance in zip(passenger, row)])
+    return result
@@ -0,0 +1,81 @@
+"""
+fare_export.py
+Выгрузка тарифов всех пар остановок сети или списка маршрутов в CSV
+
+С PostgreSQL тарифы считаются на сервере и идут в файл потоком
+COPY ... TO STDOUT (Database.copy_fares_csv) без строк в Python.
+Для SQLite и локального кэша синхронизации матрицы считаются через
+fare_engine (fare_cache) и пишутся маршрут за маршрутом.
+
+Формат обоих путей одинаков: UTF-8 с BOM, разделитель ';', строки
+по маршрутам, внутри маршрута - по пункту назначения, затем отправления.
+"""
+import csv
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Iterable, Optional
+
+from core.fare_cache import fare_cache
+from models import RouteSequence
+
+FARE_CSV_HEADERS = ["Маршрут", "Откуда", "Куда", "Расстояние (км)",
+                    "Пассажирский (₽)", "Детский (₽)", "Багаж (₽)"]
+
+
+@dataclass
+class FareExportResult:
+    """Итог выгрузки"""
+    pairs: int
+    elapsed_sec: float
+    # True - тарифы посчитаны на сервере и переданы через COPY
+    server_side: bool
+
+
+def export_fares_csv(db, filename: str, route_ids: Optional[Iterable[int]] = None,
+                     round_up: bool = False, as_of: Optional[date] = None) -> FareExportResult:
+    """
+    Выгрузить тарифы пар остановок маршрутов в CSV.
+
+    Args:
+        db: Database, SQLiteDatabase или SyncedDatabase
+        filename: Путь к файлу
+        route_ids: ID маршрутов (None - вся сеть)
+        round_up: Округление тарифов вверх
+        as_of: Дата, на которую нужны тарифы (None - текущие)
+    """
+    started = time.perf_counter()
+    if route_ids is not None:
+        route_ids = list(route_ids)
+    server_side = db.backend == 'postgresql'
+    if server_side:
+        with open(filename, 'wb') as out:
+            out.write((';'.join(FARE_CSV_HEADERS) + '\n').encode('utf-8-sig'))
+            pairs = db.copy_fares_csv(out, route_ids, round_up, as_of)
+    else:
+        with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f, delimiter=';', lineterminator='\n')
+            writer.writerow(FARE_CSV_HEADERS)
+            pairs = _write_fares(db, writer, route_ids, round_up, as_of)
+    return FareExportResult(pairs, time.perf_counter() - started, server_side)
+
+
+def _write_fares(db, writer, route_ids, round_up, as_of) -> int:
+    """Тарифы через fare_engine: матрица маршрута считается (или берётся из кэша) целиком"""
+    numbers = {row[0]: row[1] for row in db.iter_routes()}
+    pairs = 0
+    for sequence in RouteSequence.group_rows(db.iter_route_sequences(route_ids, as_of=as_of)):
+        number = numbers.get(sequence.route_id, sequence.route_id)
+        names, distances = sequence.point_names, sequence.distances
+        fares = fare_cache.matrix(sequence, round_up, as_of)
+        # Тройка пары (i, j) начинается с 3 * (i * (i - 1) / 2 + j)
+        start = 0
+        for i in range(1, len(sequence)):
+            writer.writerows(
+                (number, names[j], names[i], f"{distances[i] - distances[j]:.3f}",
+                 f"{fares[k] / 100:.2f}", f"{fares[k + 1] / 100:.2f}", f"{fares[k + 2] / 100:.2f}")
+                for j, k in zip(range(i), range(start, start + 3 * i, 3))
+            )
+            start += 3 * i
+        pairs += start // 3
+    return pairs
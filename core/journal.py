@@ -0,0 +1,156 @@
+"""
+journal.py
+Журнал несохранённых правок редактора маршрута (write-ahead log)
+
+Каждая правка ячейки дописывается строкой JSON в файл
+~/.tariff_app/journal/route_<id>.jsonl. Запись выполняет фоновый поток:
+интерфейс только кладёт правку в очередь. Поток сбрасывает данные на диск
+(fsync) не чаще одного раза за интервал, поэтому серия быстрых правок
+обходится одним fsync.
+
+После аварийного завершения журнал читается при следующем открытии
+маршрута (replay). Когда правки сохранены в БД, журнал очищается (compact).
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_DIR = Path.home() / '.tariff_app' / 'journal'
+
+# Интервал между fsync по умолчанию, секунды
+DEFAULT_FSYNC_INTERVAL = 1.0
+
+# Команды фонового потока
+_APPEND, _COMPACT, _SYNC, _CLOSE = range(4)
+
+
+class RouteJournal:
+    """Журнал правок одного маршрута с фоновой записью"""
+
+    def __init__(self, route_id: int, directory: Optional[Union[str, Path]] = None,
+                 fsync_interval: float = DEFAULT_FSYNC_INTERVAL) -> None:
+        """
+        Args:
+            route_id: ID маршрута
+            directory: Папка журналов (по умолчанию ~/.tariff_app/journal)
+            fsync_interval: Не чаще чем раз в столько секунд данные сбрасываются на диск
+        """
+        self.route_id = route_id
+        self.fsync_interval = fsync_interval
+        journal_dir = Path(directory) if directory else DEFAULT_JOURNAL_DIR
+        journal_dir.mkdir(parents=True, exist_ok=True)
+        self.path = journal_dir / f'route_{route_id}.jsonl'
+        self._queue: "queue.Queue[Tuple[int, Any]]" = queue.Queue()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._run, name=f"journal-{route_id}", daemon=True)
+        self._thread.start()
+
+    def replay(self) -> List[Dict[str, Any]]:
+        """
+        Прочитать правки, оставшиеся в журнале.
+
+        Для каждой ячейки возвращается последнее значение. Оборванная
+        последняя строка (сбой во время записи) пропускается.
+
+        Returns:
+            list: Словари seq_id, col, value в порядке записи
+        """
+        self.sync()
+        cells: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                    key = (int(record['seq_id']), int(record['col']))
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f"Журнал {self.path.name}: пропущена строка {line_number}")
+                    continue
+                cells.pop(key, None)
+                cells[key] = record
+        return list(cells.values())
+
+    def append(self, seq_id: int, col: int, value: str) -> None:
+        """Записать правку ячейки (не блокирует вызывающий поток)"""
+        record = {'seq_id': seq_id, 'col': col, 'value': value, 'ts': time.time()}
+        self._queue.put((_APPEND, record))
+
+    def compact(self) -> None:
+        """Очистить журнал после сохранения правок в БД"""
+        self._queue.put((_COMPACT, None))
+
+    def sync(self, timeout: Optional[float] = None) -> bool:
+        """
+        Дождаться записи всех правок на диск.
+
+        Returns:
+            bool: True, если запись завершилась за timeout
+        """
+        if not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put((_SYNC, done))
+        return done.wait(timeout)
+
+    def close(self, compact: bool = False) -> None:
+        """Дописать очередь и остановить фоновый поток"""
+        if not self._thread.is_alive():
+            return
+        if compact:
+            self.compact()
+        self._queue.put((_CLOSE, None))
+        self._thread.join()
+
+    def _run(self) -> None:
+        """Цикл фонового потока: запись строк и пакетный fsync"""
+        dirty = False
+        last_fsync = time.monotonic()
+        running = True
+        while running:
+            timeout = None
+            if dirty:
+                timeout = max(0.0, last_fsync + self.fsync_interval - time.monotonic())
+            try:
+                commands = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                commands = []
+            # Забираем всё, что накопилось, чтобы записать одной пачкой
+            while True:
+                try:
+                    commands.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            waiters = []
+            try:
+                for command, payload in commands:
+                    if command == _APPEND:
+                        self._file.write(json.dumps(payload, ensure_ascii=False) + '\n')
+                        dirty = True
+                    elif command == _COMPACT:
+                        self._file.truncate(0)
+                        self._file.seek(0)
+                        dirty = True
+                    elif command == _SYNC:
+                        waiters.append(payload)
+                    elif command == _CLOSE:
+                        running = False
+
+                if dirty and (waiters or not running or
+                              time.monotonic() - last_fsync >= self.fsync_interval):
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    dirty = False
+                    last_fsync = time.monotonic()
+            except OSError as e:
+                logger.error(f"Журнал {self.path.name}: ошибка записи: {e}")
+            finally:
+                for waiter in waiters:
+                    waiter.set()
+        self._file.close()
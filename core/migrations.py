@@ -0,0 +1,799 @@
+"""
+Миграции схемы базы данных
+
+Каждая миграция - (версия, описание, SQL). Применённые версии PostgreSQL
+хранит в таблице schema_migrations, SQLite - в PRAGMA user_version.
+
+Общий сервер PostgreSQL обновляет администратор (python -m tools.migrate,
+нужны права на DDL); клиенты при подключении только проверяют версию
+схемы (pending_postgres_migrations). Параллельные запуски миграций
+сериализуются через advisory-блокировку. Локальная SQLite обновляется
+при открытии.
+"""
+import logging
+from typing import List, Tuple
+
+from models import SORT_KEY_GAP
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки на время применения миграций
+MIGRATION_LOCK_KEY = 7_200_412
+
+Migration = Tuple[int, str, str]
+
+# Схема с представлением route_sequence для клиентов предыдущей версии
+# (миграция 6): она первая в search_path базы по умолчанию, а клиенты этой
+# версии подключаются с CLIENT_SEARCH_PATH и работают с таблицей напрямую
+LEGACY_SCHEMA = 'tariff_legacy'
+CLIENT_SEARCH_PATH = '"$user",public'
+
+POSTGRES_MIGRATIONS: List[Migration] = [
+    (1, "Отслеживание изменений для синхронизации", """
+        -- updated_xid - транзакция, записавшая строку (PostgreSQL 13+). Клиенты
+        -- забирают изменения по ней, а не по updated_at: время записи строки не
+        -- говорит, когда транзакция зафиксирована (см. Database.get_changes_since)
+        ALTER TABLE points
+            ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+            ADD COLUMN IF NOT EXISTS updated_xid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+            ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT 1;
+        ALTER TABLE routes
+            ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+            ADD COLUMN IF NOT EXISTS updated_xid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+            ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT 1;
+        ALTER TABLE route_sequence
+            ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+            ADD COLUMN IF NOT EXISTS updated_xid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+            ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT 1;
+
+        CREATE INDEX IF NOT EXISTS idx_points_updated_xid ON points (updated_xid);
+        CREATE INDEX IF NOT EXISTS idx_routes_updated_xid ON routes (updated_xid);
+        CREATE INDEX IF NOT EXISTS idx_route_sequence_updated_xid ON route_sequence (updated_xid);
+
+        -- Журнал удалений: удалённые строки нельзя найти по updated_xid
+        CREATE TABLE IF NOT EXISTS deleted_rows (
+            id BIGSERIAL PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            deleted_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+            deleted_xid XID8 NOT NULL DEFAULT pg_current_xact_id()
+        );
+        CREATE INDEX IF NOT EXISTS idx_deleted_rows_deleted_xid ON deleted_rows (deleted_xid);
+
+        CREATE OR REPLACE FUNCTION tariff_touch_row() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := clock_timestamp();
+            NEW.updated_xid := pg_current_xact_id();
+            IF TG_OP = 'UPDATE' THEN
+                NEW.row_version := OLD.row_version + 1;
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION tariff_log_delete() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO deleted_rows (table_name, row_id) VALUES (TG_TABLE_NAME, OLD.id);
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS points_touch ON points;
+        CREATE TRIGGER points_touch BEFORE INSERT OR UPDATE ON points
+            FOR EACH ROW EXECUTE PROCEDURE tariff_touch_row();
+        DROP TRIGGER IF EXISTS routes_touch ON routes;
+        CREATE TRIGGER routes_touch BEFORE INSERT OR UPDATE ON routes
+            FOR EACH ROW EXECUTE PROCEDURE tariff_touch_row();
+        DROP TRIGGER IF EXISTS route_sequence_touch ON route_sequence;
+        CREATE TRIGGER route_sequence_touch BEFORE INSERT OR UPDATE ON route_sequence
+            FOR EACH ROW EXECUTE PROCEDURE tariff_touch_row();
+
+        DROP TRIGGER IF EXISTS points_log_delete ON points;
+        CREATE TRIGGER points_log_delete AFTER DELETE ON points
+            FOR EACH ROW EXECUTE PROCEDURE tariff_log_delete();
+        DROP TRIGGER IF EXISTS routes_log_delete ON routes;
+        CREATE TRIGGER routes_log_delete AFTER DELETE ON routes
+            FOR EACH ROW EXECUTE PROCEDURE tariff_log_delete();
+        DROP TRIGGER IF EXISTS route_sequence_log_delete ON route_sequence;
+        CREATE TRIGGER route_sequence_log_delete AFTER DELETE ON route_sequence
+            FOR EACH ROW EXECUTE PROCEDURE tariff_log_delete();
+    """),
+    (2, "Порядок пунктов по ключам с промежутками", f"""
+        ALTER TABLE route_sequence ADD COLUMN IF NOT EXISTS sort_key BIGINT;
+        UPDATE route_sequence SET sort_key = sequence_number::bigint * {SORT_KEY_GAP};
+        ALTER TABLE route_sequence ALTER COLUMN sort_key SET NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_route_sequence_sort_key
+            ON route_sequence (route_id, sort_key);
+
+        -- Новые клиенты вычисляют номер пункта при чтении (ROW_NUMBER по sort_key).
+        -- sequence_number остаётся для клиентов предыдущей версии: триггеры держат
+        -- его равным позиции пункта (1..n без повторов), а перестановки номеров
+        -- старыми клиентами переносят на ключи. Колонка и триггеры удаляются
+        -- отдельной миграцией в следующем выпуске, когда старых клиентов не останется.
+        ALTER TABLE route_sequence ALTER COLUMN sequence_number DROP NOT NULL;
+
+        -- Перенумерация одним UPDATE временно дублирует номера: уникальность
+        -- (route_id, sequence_number) проверяется в конце оператора
+        DO $$
+        DECLARE
+            constraint_name TEXT;
+        BEGIN
+            FOR constraint_name IN
+                SELECT c.conname FROM pg_constraint c
+                WHERE c.conrelid = 'route_sequence'::regclass AND c.contype = 'u'
+                  AND ARRAY(SELECT a.attname::text FROM pg_attribute a
+                            WHERE a.attrelid = c.conrelid AND a.attnum = ANY (c.conkey)
+                            ORDER BY a.attname) = ARRAY['route_id', 'sequence_number']
+            LOOP
+                EXECUTE format('ALTER TABLE route_sequence DROP CONSTRAINT %I', constraint_name);
+            END LOOP;
+        END
+        $$;
+
+        -- Номер = позиция пункта по ключу порядка
+        CREATE OR REPLACE FUNCTION tariff_renumber_routes(route_ids INTEGER[]) RETURNS void AS $$
+            UPDATE route_sequence AS rs
+            SET sequence_number = p.position
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY route_id ORDER BY sort_key, id)::int
+                           AS position
+                FROM route_sequence WHERE route_id = ANY (route_ids)
+            ) AS p
+            WHERE rs.id = p.id AND rs.sequence_number IS DISTINCT FROM p.position;
+        $$ LANGUAGE sql;
+
+        -- Порядок, заданный старым клиентом номерами: те же ключи маршрута
+        -- раздаются пунктам в порядке номеров, промежутки между ключами сохраняются
+        CREATE OR REPLACE FUNCTION tariff_follow_sequence_numbers(route_ids INTEGER[])
+        RETURNS void AS $$
+            UPDATE route_sequence AS rs
+            SET sort_key = k.sort_key
+            FROM (
+                SELECT numbered.id, keys.sort_key
+                FROM (SELECT id, route_id,
+                             ROW_NUMBER() OVER (PARTITION BY route_id
+                                                ORDER BY sequence_number, sort_key, id) AS position
+                      FROM route_sequence WHERE route_id = ANY (route_ids)) AS numbered
+                JOIN (SELECT route_id, sort_key,
+                             ROW_NUMBER() OVER (PARTITION BY route_id ORDER BY sort_key, id)
+                                 AS position
+                      FROM route_sequence WHERE route_id = ANY (route_ids)) AS keys
+                    USING (route_id, position)
+            ) AS k
+            WHERE rs.id = k.id AND rs.sort_key <> k.sort_key;
+        $$ LANGUAGE sql;
+
+        -- Старый клиент добавляет пункт в конец без ключа
+        CREATE OR REPLACE FUNCTION tariff_sequence_number_compat() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.sort_key IS NULL THEN
+                NEW.sort_key := COALESCE((SELECT MAX(sort_key) FROM route_sequence
+                                          WHERE route_id = NEW.route_id), 0) + {SORT_KEY_GAP};
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+
+        -- Триггеры уровня оператора; изменения из самих триггеров (глубина > 1)
+        -- не обрабатываются повторно
+        CREATE OR REPLACE FUNCTION tariff_sequence_numbers_after_insert() RETURNS trigger AS $$
+        BEGIN
+            IF pg_trigger_depth() = 1 THEN
+                PERFORM tariff_renumber_routes(ARRAY(SELECT DISTINCT route_id FROM new_rows));
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION tariff_sequence_numbers_after_update() RETURNS trigger AS $$
+        BEGIN
+            IF pg_trigger_depth() > 1 THEN
+                RETURN NULL;
+            END IF;
+            -- Старый клиент меняет только номера (в том числе временными номерами
+            -- в несколько операторов): номера не трогаем, ключи следуют за ними
+            PERFORM tariff_follow_sequence_numbers(ARRAY(
+                SELECT n.route_id FROM new_rows n JOIN old_rows o ON o.id = n.id
+                GROUP BY n.route_id
+                HAVING NOT bool_or(n.sort_key <> o.sort_key OR n.route_id <> o.route_id)
+                   AND bool_or(n.sequence_number IS DISTINCT FROM o.sequence_number)));
+            -- Новый клиент меняет ключи: номера пересчитываются по позициям
+            PERFORM tariff_renumber_routes(ARRAY(
+                SELECT n.route_id FROM new_rows n JOIN old_rows o ON o.id = n.id
+                WHERE n.sort_key <> o.sort_key OR n.route_id <> o.route_id
+                UNION
+                SELECT o.route_id FROM new_rows n JOIN old_rows o ON o.id = n.id
+                WHERE n.route_id <> o.route_id));
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        -- После удаления номера сжимаются при фиксации: старый клиент сам сдвигает
+        -- номера следующим оператором той же транзакции
+        CREATE OR REPLACE FUNCTION tariff_sequence_numbers_after_delete() RETURNS trigger AS $$
+        BEGIN
+            PERFORM tariff_renumber_routes(ARRAY[OLD.route_id]);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS route_sequence_number_compat ON route_sequence;
+        CREATE TRIGGER route_sequence_number_compat BEFORE INSERT ON route_sequence
+            FOR EACH ROW EXECUTE PROCEDURE tariff_sequence_number_compat();
+        DROP TRIGGER IF EXISTS route_sequence_numbers_insert ON route_sequence;
+        CREATE TRIGGER route_sequence_numbers_insert AFTER INSERT ON route_sequence
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE tariff_sequence_numbers_after_insert();
+        DROP TRIGGER IF EXISTS route_sequence_numbers_update ON route_sequence;
+        CREATE TRIGGER route_sequence_numbers_update AFTER UPDATE ON route_sequence
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE tariff_sequence_numbers_after_update();
+        DROP TRIGGER IF EXISTS route_sequence_numbers_delete ON route_sequence;
+        CREATE CONSTRAINT TRIGGER route_sequence_numbers_delete AFTER DELETE ON route_sequence
+            DEFERRABLE INITIALLY DEFERRED
+            FOR EACH ROW EXECUTE PROCEDURE tariff_sequence_numbers_after_delete();
+
+        SELECT tariff_renumber_routes(ARRAY(SELECT id FROM routes));
+        ALTER TABLE route_sequence ADD CONSTRAINT route_sequence_number_unique
+            UNIQUE (route_id, sequence_number) DEFERRABLE INITIALLY IMMEDIATE;
+    """),
+    (3, "Агрегаты маршрута в таблице routes", """
+        ALTER TABLE routes
+            ADD COLUMN IF NOT EXISTS points_count INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS total_distance_km NUMERIC NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS cost_per_km NUMERIC NOT NULL DEFAULT 10,
+            ADD COLUMN IF NOT EXISTS rounding NUMERIC NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS baggage_percent NUMERIC NOT NULL DEFAULT 0;
+
+        -- Пересчёт агрегатов: число пунктов, расстояние до последнего пункта
+        -- и параметры тарифа первого пункта
+        CREATE OR REPLACE FUNCTION tariff_update_route_stats(route_ids INTEGER[]) RETURNS void AS $$
+            UPDATE routes AS r
+            SET points_count = s.points_count,
+                total_distance_km = s.total_distance_km,
+                cost_per_km = s.cost_per_km,
+                rounding = s.rounding,
+                baggage_percent = s.baggage_percent
+            FROM (
+                SELECT ids.id,
+                       COUNT(rs.id)::int AS points_count,
+                       COALESCE((array_agg(rs.distance_km
+                                           ORDER BY rs.sort_key DESC, rs.id DESC))[1], 0)
+                           AS total_distance_km,
+                       COALESCE((array_agg(rs.cost_per_km ORDER BY rs.sort_key, rs.id))[1], 10)
+                           AS cost_per_km,
+                       COALESCE((array_agg(rs.rounding ORDER BY rs.sort_key, rs.id))[1], 0)
+                           AS rounding,
+                       COALESCE((array_agg(rs.baggage_percent ORDER BY rs.sort_key, rs.id))[1], 0)
+                           AS baggage_percent
+                FROM unnest(route_ids) AS ids(id)
+                LEFT JOIN route_sequence rs ON rs.route_id = ids.id
+                GROUP BY ids.id
+            ) AS s
+            WHERE r.id = s.id
+              AND (r.points_count, r.total_distance_km, r.cost_per_km, r.rounding,
+                   r.baggage_percent)
+                  IS DISTINCT FROM
+                  (s.points_count, s.total_distance_km, s.cost_per_km, s.rounding,
+                   s.baggage_percent);
+        $$ LANGUAGE sql;
+
+        -- Триггеры уровня оператора: пачка из N строк пересчитывает маршрут один раз
+        CREATE OR REPLACE FUNCTION tariff_refresh_route_stats() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM tariff_update_route_stats(ARRAY(SELECT DISTINCT route_id FROM new_rows));
+            ELSIF TG_OP = 'UPDATE' THEN
+                PERFORM tariff_update_route_stats(ARRAY(
+                    SELECT route_id FROM new_rows UNION SELECT route_id FROM old_rows));
+            ELSE
+                PERFORM tariff_update_route_stats(ARRAY(SELECT DISTINCT route_id FROM old_rows));
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS route_sequence_stats_insert ON route_sequence;
+        CREATE TRIGGER route_sequence_stats_insert AFTER INSERT ON route_sequence
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE tariff_refresh_route_stats();
+        DROP TRIGGER IF EXISTS route_sequence_stats_update ON route_sequence;
+        CREATE TRIGGER route_sequence_stats_update AFTER UPDATE ON route_sequence
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE tariff_refresh_route_stats();
+        DROP TRIGGER IF EXISTS route_sequence_stats_delete ON route_sequence;
+        CREATE TRIGGER route_sequence_stats_delete AFTER DELETE ON route_sequence
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE tariff_refresh_route_stats();
+
+        SELECT tariff_update_route_stats(ARRAY(SELECT id FROM routes));
+    """),
+    (4, "Версии тарифа с периодами действия", """
+        -- btree_gist: равенство по route_id в одном GiST-индексе с диапазоном дат
+        CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+        CREATE TABLE IF NOT EXISTS route_sequence_versions (
+            id BIGSERIAL PRIMARY KEY,
+            route_sequence_id INTEGER NOT NULL,
+            route_id INTEGER NOT NULL,
+            point_id INTEGER NOT NULL,
+            sort_key BIGINT NOT NULL,
+            distance_km NUMERIC NOT NULL,
+            rounding NUMERIC NOT NULL,
+            cost_per_km NUMERIC NOT NULL,
+            baggage_percent NUMERIC NOT NULL,
+            valid DATERANGE NOT NULL,
+            -- У строки маршрута на любую дату не больше одной версии
+            EXCLUDE USING gist (route_sequence_id WITH =, valid WITH &&)
+        );
+        CREATE INDEX IF NOT EXISTS idx_route_sequence_versions_valid
+            ON route_sequence_versions USING gist (route_id, valid);
+
+        -- Изменение строки закрывает открытую версию текущей датой и открывает
+        -- новую; повторные правки в течение дня заменяют сегодняшнюю версию
+        CREATE OR REPLACE FUNCTION tariff_version_row() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                DELETE FROM route_sequence_versions
+                WHERE route_sequence_id = OLD.id AND upper_inf(valid)
+                  AND lower(valid) = current_date;
+                UPDATE route_sequence_versions SET valid = daterange(lower(valid), current_date)
+                WHERE route_sequence_id = OLD.id AND upper_inf(valid);
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO route_sequence_versions
+                    (route_sequence_id, route_id, point_id, sort_key, distance_km, rounding,
+                     cost_per_km, baggage_percent, valid)
+                VALUES (NEW.id, NEW.route_id, NEW.point_id, NEW.sort_key, NEW.distance_km,
+                        NEW.rounding, NEW.cost_per_km, NEW.baggage_percent,
+                        daterange(current_date, NULL));
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS route_sequence_version_insert ON route_sequence;
+        CREATE TRIGGER route_sequence_version_insert AFTER INSERT ON route_sequence
+            FOR EACH ROW EXECUTE PROCEDURE tariff_version_row();
+        DROP TRIGGER IF EXISTS route_sequence_version_update ON route_sequence;
+        CREATE TRIGGER route_sequence_version_update AFTER UPDATE ON route_sequence
+            FOR EACH ROW
+            WHEN ((OLD.route_id, OLD.point_id, OLD.sort_key, OLD.distance_km, OLD.rounding,
+                   OLD.cost_per_km, OLD.baggage_percent)
+                  IS DISTINCT FROM
+                  (NEW.route_id, NEW.point_id, NEW.sort_key, NEW.distance_km, NEW.rounding,
+                   NEW.cost_per_km, NEW.baggage_percent))
+            EXECUTE PROCEDURE tariff_version_row();
+        DROP TRIGGER IF EXISTS route_sequence_version_delete ON route_sequence;
+        CREATE TRIGGER route_sequence_version_delete AFTER DELETE ON route_sequence
+            FOR EACH ROW EXECUTE PROCEDURE tariff_version_row();
+
+        -- Текущие значения действуют без ограничения в прошлое: истории до миграции нет
+        INSERT INTO route_sequence_versions
+            (route_sequence_id, route_id, point_id, sort_key, distance_km, rounding,
+             cost_per_km, baggage_percent, valid)
+        SELECT id, route_id, point_id, sort_key, distance_km, rounding, cost_per_km,
+               baggage_percent, daterange(NULL, NULL)
+        FROM route_sequence;
+    """),
+    (5, "Номер пункта для старых клиентов без новой версии строки", """
+        -- Перенумерация после вставки или удаления меняет sequence_number у всех
+        -- пунктов маршрута. Номер нужен только старым клиентам: такое изменение не
+        -- должно поднимать row_version (ложный ConcurrencyError у правок соседних
+        -- пунктов) и updated_xid (повторная выгрузка всего маршрута клиентами кэша)
+        DROP TRIGGER IF EXISTS route_sequence_touch ON route_sequence;
+        CREATE TRIGGER route_sequence_touch BEFORE INSERT ON route_sequence
+            FOR EACH ROW EXECUTE PROCEDURE tariff_touch_row();
+        DROP TRIGGER IF EXISTS route_sequence_touch_update ON route_sequence;
+        CREATE TRIGGER route_sequence_touch_update BEFORE UPDATE ON route_sequence
+            FOR EACH ROW
+            WHEN ((to_jsonb(OLD) - 'sequence_number') IS DISTINCT FROM
+                  (to_jsonb(NEW) - 'sequence_number'))
+            EXECUTE PROCEDURE tariff_touch_row();
+    """),
+    (6, "Номер пункта для старых клиентов вычисляется при чтении", f"""
+        -- Триггеры миграции 2 перенумеровывали маршрут при каждой вставке и
+        -- удалении. Теперь запись нового клиента меняет одну строку, а номер
+        -- видят только старые клиенты - через представление в {LEGACY_SCHEMA}.
+        -- В таблице sequence_number - черновик перестановки старого клиента:
+        -- номера, заданные им в транзакции, переносятся на ключи при фиксации.
+        DROP TRIGGER IF EXISTS route_sequence_number_compat ON route_sequence;
+        DROP TRIGGER IF EXISTS route_sequence_numbers_insert ON route_sequence;
+        DROP TRIGGER IF EXISTS route_sequence_numbers_update ON route_sequence;
+        DROP TRIGGER IF EXISTS route_sequence_numbers_delete ON route_sequence;
+        DROP FUNCTION IF EXISTS tariff_sequence_number_compat();
+        DROP FUNCTION IF EXISTS tariff_sequence_numbers_after_insert();
+        DROP FUNCTION IF EXISTS tariff_sequence_numbers_after_update();
+        DROP FUNCTION IF EXISTS tariff_sequence_numbers_after_delete();
+        DROP FUNCTION IF EXISTS tariff_renumber_routes(INTEGER[]);
+        DROP FUNCTION IF EXISTS tariff_follow_sequence_numbers(INTEGER[]);
+        ALTER TABLE route_sequence DROP CONSTRAINT IF EXISTS route_sequence_number_unique;
+        UPDATE route_sequence SET sequence_number = NULL WHERE sequence_number IS NOT NULL;
+
+        -- Функции ниже выполняются и в сеансах старых клиентов, где имя
+        -- route_sequence означает представление: путь поиска - как при миграции
+        ALTER FUNCTION tariff_update_route_stats(INTEGER[]) SET search_path FROM CURRENT;
+
+        -- Агрегаты пересчитывает оператор верхнего уровня; изменения из
+        -- триггеров (представление старых клиентов, перенос номеров на ключи,
+        -- каскадное удаление маршрута) пересчитывают маршрут сами
+        CREATE OR REPLACE FUNCTION tariff_refresh_route_stats() RETURNS trigger AS $$
+        BEGIN
+            IF pg_trigger_depth() > 1 THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'INSERT' THEN
+                PERFORM tariff_update_route_stats(ARRAY(SELECT DISTINCT route_id FROM new_rows));
+            ELSIF TG_OP = 'UPDATE' THEN
+                PERFORM tariff_update_route_stats(ARRAY(
+                    SELECT route_id FROM new_rows UNION SELECT route_id FROM old_rows));
+            ELSE
+                PERFORM tariff_update_route_stats(ARRAY(SELECT DISTINCT route_id FROM old_rows));
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        -- Номер = черновик старого клиента или позиция пункта по ключу
+        -- (подсчёт по индексу (route_id, sort_key), без сортировки всей таблицы)
+        CREATE SCHEMA IF NOT EXISTS {LEGACY_SCHEMA};
+        CREATE OR REPLACE VIEW {LEGACY_SCHEMA}.route_sequence AS
+            SELECT rs.id, rs.route_id, rs.point_id,
+                   COALESCE(rs.sequence_number,
+                            (SELECT COUNT(*) FROM route_sequence AS prior
+                             WHERE prior.route_id = rs.route_id
+                               AND prior.sort_key <= rs.sort_key
+                               AND (prior.sort_key < rs.sort_key OR prior.id <= rs.id))::int)
+                       AS sequence_number,
+                   rs.distance_km, rs.rounding, rs.cost_per_km, rs.baggage_percent
+            FROM route_sequence AS rs;
+
+        -- Старый клиент добавляет пункт только в конец маршрута
+        CREATE OR REPLACE FUNCTION tariff_legacy_insert() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO route_sequence
+                (route_id, point_id, sort_key, distance_km, rounding, cost_per_km,
+                 baggage_percent)
+            VALUES (NEW.route_id, NEW.point_id,
+                    COALESCE((SELECT MAX(sort_key) FROM route_sequence
+                              WHERE route_id = NEW.route_id), 0) + {SORT_KEY_GAP},
+                    COALESCE(NEW.distance_km, 0), COALESCE(NEW.rounding, 0),
+                    COALESCE(NEW.cost_per_km, 10), COALESCE(NEW.baggage_percent, 0))
+            RETURNING id INTO NEW.id;
+            PERFORM tariff_update_route_stats(ARRAY[NEW.route_id]);
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql SET search_path FROM CURRENT;
+
+        -- Изменённый номер записывается черновиком, порядок не меняется до фиксации
+        CREATE OR REPLACE FUNCTION tariff_legacy_update() RETURNS trigger AS $$
+        BEGIN
+            UPDATE route_sequence
+            SET route_id = NEW.route_id, point_id = NEW.point_id,
+                distance_km = NEW.distance_km, rounding = NEW.rounding,
+                cost_per_km = NEW.cost_per_km, baggage_percent = NEW.baggage_percent,
+                sequence_number = CASE WHEN NEW.sequence_number IS DISTINCT FROM OLD.sequence_number
+                                       THEN NEW.sequence_number ELSE sequence_number END
+            WHERE id = OLD.id;
+            IF NOT FOUND THEN
+                RETURN NULL;
+            END IF;
+            PERFORM tariff_update_route_stats(ARRAY(
+                SELECT DISTINCT unnest(ARRAY[OLD.route_id, NEW.route_id])));
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql SET search_path FROM CURRENT;
+
+        CREATE OR REPLACE FUNCTION tariff_legacy_delete() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM route_sequence WHERE id = OLD.id;
+            IF NOT FOUND THEN
+                RETURN NULL;
+            END IF;
+            PERFORM tariff_update_route_stats(ARRAY[OLD.route_id]);
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql SET search_path FROM CURRENT;
+
+        DROP TRIGGER IF EXISTS route_sequence_insert ON {LEGACY_SCHEMA}.route_sequence;
+        CREATE TRIGGER route_sequence_insert INSTEAD OF INSERT ON {LEGACY_SCHEMA}.route_sequence
+            FOR EACH ROW EXECUTE PROCEDURE tariff_legacy_insert();
+        DROP TRIGGER IF EXISTS route_sequence_update ON {LEGACY_SCHEMA}.route_sequence;
+        CREATE TRIGGER route_sequence_update INSTEAD OF UPDATE ON {LEGACY_SCHEMA}.route_sequence
+            FOR EACH ROW EXECUTE PROCEDURE tariff_legacy_update();
+        DROP TRIGGER IF EXISTS route_sequence_delete ON {LEGACY_SCHEMA}.route_sequence;
+        CREATE TRIGGER route_sequence_delete INSTEAD OF DELETE ON {LEGACY_SCHEMA}.route_sequence
+            FOR EACH ROW EXECUTE PROCEDURE tariff_legacy_delete();
+
+        -- При фиксации пункты маршрута встают по номерам черновика (у строк
+        -- без черновика - по текущей позиции, при равенстве - по ключу):
+        -- ключи маршрута раздаются в новом порядке, черновик очищается.
+        -- Срабатывает на каждую строку черновика, работу делает первая.
+        CREATE OR REPLACE FUNCTION tariff_apply_legacy_numbers() RETURNS trigger AS $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM route_sequence
+                           WHERE route_id = NEW.route_id AND sequence_number IS NOT NULL) THEN
+                RETURN NULL;
+            END IF;
+            UPDATE route_sequence AS rs
+            SET sort_key = k.sort_key
+            FROM (
+                SELECT wanted.id, keys.sort_key
+                FROM (SELECT id, ROW_NUMBER() OVER (ORDER BY COALESCE(sequence_number, position),
+                                                             sort_key, id) AS position
+                      FROM (SELECT id, sort_key, sequence_number,
+                                   ROW_NUMBER() OVER (ORDER BY sort_key, id) AS position
+                            FROM route_sequence WHERE route_id = NEW.route_id) AS current_order
+                     ) AS wanted
+                JOIN (SELECT sort_key, ROW_NUMBER() OVER (ORDER BY sort_key, id) AS position
+                      FROM route_sequence WHERE route_id = NEW.route_id) AS keys
+                    USING (position)
+            ) AS k
+            WHERE rs.id = k.id AND rs.sort_key <> k.sort_key;
+            UPDATE route_sequence SET sequence_number = NULL
+            WHERE route_id = NEW.route_id AND sequence_number IS NOT NULL;
+            PERFORM tariff_update_route_stats(ARRAY[NEW.route_id]);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql SET search_path FROM CURRENT;
+
+        DROP TRIGGER IF EXISTS route_sequence_legacy_numbers ON route_sequence;
+        CREATE CONSTRAINT TRIGGER route_sequence_legacy_numbers
+            AFTER UPDATE OF sequence_number ON route_sequence
+            DEFERRABLE INITIALLY DEFERRED
+            FOR EACH ROW WHEN (NEW.sequence_number IS NOT NULL)
+            EXECUTE PROCEDURE tariff_apply_legacy_numbers();
+
+        -- Старые клиенты подключаются с путём поиска базы по умолчанию и
+        -- видят представление вместо таблицы (нужны права владельца базы)
+        DO $$
+        BEGIN
+            EXECUTE format('ALTER DATABASE %I SET search_path = %s',
+                           current_database(), '{LEGACY_SCHEMA},{CLIENT_SEARCH_PATH}');
+        END
+        $$;
+    """),
+]
+
+
+def _sqlite_touch_trigger(table: str) -> str:
+    """Триггер версии строки: растёт, только если UPDATE не задал её явно"""
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_touch AFTER UPDATE ON {table}
+            WHEN NEW.row_version = OLD.row_version
+        BEGIN
+            UPDATE {table} SET row_version = OLD.row_version + 1,
+                               updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now')
+            WHERE id = NEW.id;
+        END;"""
+
+
+def _sqlite_route_stats(route_id: str) -> str:
+    """SET-часть пересчёта агрегатов маршрута route_id для триггеров SQLite"""
+    first = f"FROM route_sequence WHERE route_id = {route_id} ORDER BY sort_key, id LIMIT 1"
+    return f"""
+        points_count = (SELECT COUNT(*) FROM route_sequence WHERE route_id = {route_id}),
+        total_distance_km = COALESCE((SELECT distance_km FROM route_sequence
+                                      WHERE route_id = {route_id}
+                                      ORDER BY sort_key DESC, id DESC LIMIT 1), 0),
+        cost_per_km = COALESCE((SELECT cost_per_km {first}), 10),
+        rounding = COALESCE((SELECT rounding {first}), 0),
+        baggage_percent = COALESCE((SELECT baggage_percent {first}), 0)"""
+
+
+# Дата изменения в триггерах версий - по местному времени
+_SQLITE_TODAY = "date('now', 'localtime')"
+
+
+def _sqlite_close_version() -> str:
+    """Закрыть открытую версию строки OLD (сегодняшняя версия удаляется)"""
+    return f"""
+            DELETE FROM route_sequence_versions
+            WHERE route_sequence_id = OLD.id AND valid_to IS NULL AND valid_from = {_SQLITE_TODAY};
+            UPDATE route_sequence_versions SET valid_to = {_SQLITE_TODAY}
+            WHERE route_sequence_id = OLD.id AND valid_to IS NULL;"""
+
+
+def _sqlite_open_version() -> str:
+    """Открыть версию строки NEW с текущей даты"""
+    return f"""
+            INSERT INTO route_sequence_versions
+                (route_sequence_id, route_id, point_id, sort_key, distance_km, rounding,
+                 cost_per_km, baggage_percent, valid_from, valid_to)
+            VALUES (NEW.id, NEW.route_id, NEW.point_id, NEW.sort_key, NEW.distance_km,
+                    NEW.rounding, NEW.cost_per_km, NEW.baggage_percent, {_SQLITE_TODAY}, NULL);"""
+
+
+SQLITE_MIGRATIONS: List[Migration] = [
+    (1, "Версии строк", f"""
+        ALTER TABLE points ADD COLUMN row_version INTEGER NOT NULL DEFAULT 1;
+        ALTER TABLE points ADD COLUMN updated_at TEXT;
+        ALTER TABLE routes ADD COLUMN row_version INTEGER NOT NULL DEFAULT 1;
+        ALTER TABLE routes ADD COLUMN updated_at TEXT;
+        ALTER TABLE route_sequence ADD COLUMN row_version INTEGER NOT NULL DEFAULT 1;
+        ALTER TABLE route_sequence ADD COLUMN updated_at TEXT;
+
+        -- Версия растёт, только если UPDATE не задал её явно (зеркалирование сервера)
+        {_sqlite_touch_trigger('points')}
+        {_sqlite_touch_trigger('routes')}
+        {_sqlite_touch_trigger('route_sequence')}
+    """),
+    (2, "Порядок пунктов по ключам с промежутками", f"""
+        -- ALTER TABLE ... DROP COLUMN есть только в SQLite 3.35+: таблица
+        -- пересобирается без sequence_number (порядок колонок - как после
+        -- ADD COLUMN sort_key и удаления колонки)
+        CREATE TABLE route_sequence_rebuilt (
+            id INTEGER PRIMARY KEY,
+            route_id INTEGER NOT NULL REFERENCES routes(id) ON DELETE CASCADE,
+            point_id INTEGER NOT NULL REFERENCES points(id),
+            distance_km REAL NOT NULL DEFAULT 0,
+            rounding REAL NOT NULL DEFAULT 0,
+            cost_per_km REAL NOT NULL DEFAULT 10,
+            baggage_percent REAL NOT NULL DEFAULT 0,
+            row_version INTEGER NOT NULL DEFAULT 1,
+            updated_at TEXT,
+            sort_key INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (route_id, point_id)
+        );
+        INSERT INTO route_sequence_rebuilt
+            (id, route_id, point_id, distance_km, rounding, cost_per_km, baggage_percent,
+             row_version, updated_at, sort_key)
+        SELECT id, route_id, point_id, distance_km, rounding, cost_per_km, baggage_percent,
+               row_version, updated_at, sequence_number * {SORT_KEY_GAP}
+        FROM route_sequence;
+        DROP TABLE route_sequence;
+        ALTER TABLE route_sequence_rebuilt RENAME TO route_sequence;
+
+        CREATE INDEX IF NOT EXISTS idx_route_sequence_point ON route_sequence (point_id);
+        CREATE INDEX IF NOT EXISTS idx_route_sequence_sort_key
+            ON route_sequence (route_id, sort_key);
+        {_sqlite_touch_trigger('route_sequence')}
+    """),
+    (3, "Агрегаты маршрута в таблице routes", f"""
+        ALTER TABLE routes ADD COLUMN points_count INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE routes ADD COLUMN total_distance_km REAL NOT NULL DEFAULT 0;
+        ALTER TABLE routes ADD COLUMN cost_per_km REAL NOT NULL DEFAULT 10;
+        ALTER TABLE routes ADD COLUMN rounding REAL NOT NULL DEFAULT 0;
+        ALTER TABLE routes ADD COLUMN baggage_percent REAL NOT NULL DEFAULT 0;
+
+        CREATE TRIGGER IF NOT EXISTS route_sequence_stats_insert AFTER INSERT ON route_sequence
+        BEGIN
+            UPDATE routes SET {_sqlite_route_stats('NEW.route_id')} WHERE id = NEW.route_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS route_sequence_stats_delete AFTER DELETE ON route_sequence
+        BEGIN
+            UPDATE routes SET {_sqlite_route_stats('OLD.route_id')} WHERE id = OLD.route_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS route_sequence_stats_update
+            AFTER UPDATE OF route_id, sort_key, distance_km, rounding, cost_per_km, baggage_percent
+            ON route_sequence
+        BEGIN
+            UPDATE routes SET {_sqlite_route_stats('NEW.route_id')} WHERE id = NEW.route_id;
+            UPDATE routes SET {_sqlite_route_stats('OLD.route_id')}
+            WHERE id = OLD.route_id AND OLD.route_id <> NEW.route_id;
+        END;
+
+        UPDATE routes SET {_sqlite_route_stats('routes.id')};
+    """),
+    (4, "Версии тарифа с периодами действия", f"""
+        -- Период [valid_from, valid_to) в датах ISO, NULL - без границы
+        CREATE TABLE IF NOT EXISTS route_sequence_versions (
+            id INTEGER PRIMARY KEY,
+            route_sequence_id INTEGER NOT NULL,
+            route_id INTEGER NOT NULL,
+            point_id INTEGER NOT NULL,
+            sort_key INTEGER NOT NULL,
+            distance_km REAL NOT NULL,
+            rounding REAL NOT NULL,
+            cost_per_km REAL NOT NULL,
+            baggage_percent REAL NOT NULL,
+            valid_from TEXT,
+            valid_to TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_route_sequence_versions_valid
+            ON route_sequence_versions (route_id, valid_from, valid_to);
+        CREATE INDEX IF NOT EXISTS idx_route_sequence_versions_row
+            ON route_sequence_versions (route_sequence_id, valid_to);
+
+        CREATE TRIGGER IF NOT EXISTS route_sequence_version_insert AFTER INSERT ON route_sequence
+        BEGIN
+            {_sqlite_open_version()}
+        END;
+        CREATE TRIGGER IF NOT EXISTS route_sequence_version_update
+            AFTER UPDATE OF route_id, point_id, sort_key, distance_km, rounding, cost_per_km,
+                            baggage_percent
+            ON route_sequence
+            WHEN (OLD.route_id, OLD.point_id, OLD.sort_key, OLD.distance_km, OLD.rounding,
+                  OLD.cost_per_km, OLD.baggage_percent)
+                 IS NOT
+                 (NEW.route_id, NEW.point_id, NEW.sort_key, NEW.distance_km, NEW.rounding,
+                  NEW.cost_per_km, NEW.baggage_percent)
+        BEGIN
+            {_sqlite_close_version()}
+            {_sqlite_open_version()}
+        END;
+        CREATE TRIGGER IF NOT EXISTS route_sequence_version_delete AFTER DELETE ON route_sequence
+        BEGIN
+            {_sqlite_close_version()}
+        END;
+
+        INSERT INTO route_sequence_versions
+            (route_sequence_id, route_id, point_id, sort_key, distance_km, rounding,
+             cost_per_km, baggage_percent, valid_from, valid_to)
+        SELECT id, route_id, point_id, sort_key, distance_km, rounding, cost_per_km,
+               baggage_percent, NULL, NULL
+        FROM route_sequence;
+    """),
+]
+
+
+def pending_postgres_migrations(conn) -> List[int]:
+    """
+    Версии миграций PostgreSQL, ещё не применённых на сервере (только чтение).
+
+    Returns:
+        list: Номера недостающих версий (пустой - схема актуальна)
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        applied = set()
+        if cur.fetchone()[0]:
+            cur.execute("SELECT version FROM schema_migrations")
+            applied = {row[0] for row in cur.fetchall()}
+    conn.rollback()
+    return [version for version, _, _ in POSTGRES_MIGRATIONS if version not in applied]
+
+
+def apply_postgres_migrations(conn) -> List[int]:
+    """
+    Применить недостающие миграции PostgreSQL.
+
+    Returns:
+        list: Номера применённых версий
+    """
+    applied_now = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        cur.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cur.fetchall()}
+        for version, description, sql in POSTGRES_MIGRATIONS:
+            if version in applied:
+                continue
+            cur.execute(sql)
+            cur.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                        (version, description))
+            applied_now.append(version)
+            logger.info(f"Применена миграция {version}: {description}")
+    conn.commit()
+    return applied_now
+
+
+def apply_sqlite_migrations(conn) -> List[int]:
+    """
+    Применить недостающие миграции SQLite (версия в PRAGMA user_version).
+
+    Returns:
+        list: Номера применённых версий
+    """
+    applied_now = []
+    current = conn.execute("PRAGMA user_version").fetchone()
+    current = current[0] if isinstance(current, tuple) else next(iter(current.values()))
+    for version, description, sql in SQLITE_MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            conn.executescript(f"BEGIN; {sql} PRAGMA user_version = {int(version)}; COMMIT;")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        applied_now.append(version)
+        logger.info(f"Применена миграция локальной БД {version}: {description}")
+    return applied_now
@@ -0,0 +1,251 @@
+"""
+network_fares.py
+Поездки по сети маршрутов с пересадками в общих пунктах
+
+Граф хранится в компактных массивах (CSR: смещения, соседи, веса).
+Вершины - пункты и остановки маршрутов: посадка ведёт из пункта в
+остановку маршрута, высадка - обратно, перегоны соединяют соседние
+остановки одного маршрута в обе стороны. Так пересадка - это проход
+через вершину пункта, а участок пути между двумя пунктами - поездка
+по одному маршруту.
+
+Дешёвый путь ищется по линейной стоимости (расстояние × стоимость км
+маршрута); тариф найденной поездки считается по каждому участку с
+округлением, как в таблице стоимости маршрута.
+"""
+import heapq
+import math
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.fare_engine import calculate_tariffs
+from models import RouteSequence
+
+BY_FARE = 'fare'
+BY_DISTANCE = 'distance'
+WEIGHTS = (BY_FARE, BY_DISTANCE)
+
+# Вес посадки: из путей равной стоимости выбирается путь с меньшим числом пересадок
+BOARDING_WEIGHT = 1e-9
+
+_UNREACHED = math.inf
+
+
+@dataclass
+class Leg:
+    """Участок поездки по одному маршруту"""
+    route_id: int
+    from_point: int
+    to_point: int
+    distance_km: float
+    passenger: float
+    baggage: float
+
+
+@dataclass
+class Journey:
+    """Поездка из пункта в пункт"""
+    legs: List[Leg] = field(default_factory=list)
+
+    @property
+    def distance_km(self) -> float:
+        return round(sum(leg.distance_km for leg in self.legs), 3)
+
+    @property
+    def passenger(self) -> float:
+        return round(sum(leg.passenger for leg in self.legs), 2)
+
+    @property
+    def baggage(self) -> float:
+        return round(sum(leg.baggage for leg in self.legs), 2)
+
+    @property
+    def transfers(self) -> int:
+        return max(len(self.legs) - 1, 0)
+
+
+class FareNetwork:
+    """Граф сети и поиск поездок (Дейкстра с кэшем результатов по пункту отправления)"""
+
+    def __init__(self, sequences: Iterable[RouteSequence], round_up: bool = False,
+                 cache_size: int = 64) -> None:
+        """
+        Args:
+            sequences: Последовательности всех маршрутов
+            round_up: Округление тарифов вверх
+            cache_size: Сколько деревьев кратчайших путей держать в кэше
+        """
+        self.round_up = round_up
+        self.cache_size = cache_size
+        self.point_ids = array('q')
+        self._point_nodes: Dict[int, int] = {}
+        # Параметры тарифа маршрута: стоимость км, % багажа, округление
+        self._tariffs: Dict[int, Tuple[float, float, float]] = {}
+        stops: List[Tuple[int, int, float, int]] = []   # (маршрут, пункт, км от начала, позиция)
+        for sequence in sequences:
+            route_id = sequence.route_id
+            if route_id is None:
+                raise ValueError("Маршрут без ID нельзя включить в сеть")
+            self._tariffs[route_id] = (sequence.cost_per_km, sequence.baggage_percent,
+                                       sequence.rounding)
+            for position, (point_id, distance) in enumerate(zip(sequence.point_ids,
+                                                                sequence.distances)):
+                if point_id not in self._point_nodes:
+                    self._point_nodes[point_id] = len(self.point_ids)
+                    self.point_ids.append(point_id)
+                stops.append((route_id, point_id, distance, position))
+        self._build(stops)
+        self._trees: 'OrderedDict[Tuple[str, int], Tuple[array, array]]' = OrderedDict()
+        self._tables: Dict[str, Dict[int, array]] = {weight: {} for weight in WEIGHTS}
+
+    @classmethod
+    def from_database(cls, db, round_up: bool = False, cache_size: int = 64,
+                      as_of: Optional[date] = None) -> 'FareNetwork':
+        """Построить граф по всем маршрутам БД (Database или SQLiteDatabase) на дату as_of"""
+        return cls(RouteSequence.group_rows(db.iter_route_sequences(as_of=as_of)),
+                   round_up, cache_size)
+
+    def _build(self, stops: List[Tuple[int, int, float, int]]) -> None:
+        """Разложить рёбра графа по массивам CSR"""
+        point_count = len(self.point_ids)
+        self.node_count = point_count + len(stops)
+        # Для вершин-остановок: маршрут, пункт и километраж
+        self._stop_routes = array('q', (stop[0] for stop in stops))
+        self._stop_points = array('q', (stop[1] for stop in stops))
+        self._stop_km = array('d', (stop[2] for stop in stops))
+
+        edges: List[List[Tuple[int, float, float]]] = [[] for _ in range(self.node_count)]
+        for index, (route_id, point_id, distance, position) in enumerate(stops):
+            node = point_count + index
+            point_node = self._point_nodes[point_id]
+            edges[point_node].append((node, BOARDING_WEIGHT, BOARDING_WEIGHT))
+            edges[node].append((point_node, 0.0, 0.0))
+            if position:
+                previous = node - 1
+                km = abs(distance - self._stop_km[index - 1])
+                fare = km * self._tariffs[route_id][0]
+                edges[node].append((previous, km, fare))
+                edges[previous].append((node, km, fare))
+
+        self._offsets = array('l', [0])
+        self._targets = array('l')
+        self._weights = {BY_DISTANCE: array('d'), BY_FARE: array('d')}
+        for node_edges in edges:
+            for target, km, fare in node_edges:
+                self._targets.append(target)
+                self._weights[BY_DISTANCE].append(km)
+                self._weights[BY_FARE].append(fare)
+            self._offsets.append(len(self._targets))
+
+    def _shortest_tree(self, source: int, by: str) -> Tuple[array, array]:
+        """Расстояния и предки всех вершин от вершины-пункта source"""
+        key = (by, source)
+        tree = self._trees.get(key)
+        if tree is not None:
+            self._trees.move_to_end(key)
+            return tree
+
+        offsets, targets, weights = self._offsets, self._targets, self._weights[by]
+        dist = array('d', [_UNREACHED]) * self.node_count
+        pred = array('l', [-1]) * self.node_count
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        pop, push = heapq.heappop, heapq.heappush
+        while heap:
+            current, node = pop(heap)
+            if current > dist[node]:
+                continue
+            for edge in range(offsets[node], offsets[node + 1]):
+                target = targets[edge]
+                candidate = current + weights[edge]
+                if candidate < dist[target]:
+                    dist[target] = candidate
+                    pred[target] = node
+                    push(heap, (candidate, target))
+
+        self._trees[key] = (dist, pred)
+        if len(self._trees) > self.cache_size:
+            self._trees.popitem(last=False)
+        return dist, pred
+
+    def _node(self, point_id: int) -> int:
+        try:
+            return self._point_nodes[point_id]
+        except KeyError:
+            raise KeyError(f"Пункт {point_id} не входит ни в один маршрут") from None
+
+    def precompute(self, by: str = BY_FARE, point_ids: Optional[Iterable[int]] = None) -> None:
+        """
+        Заранее посчитать веса путей между пунктами.
+
+        Для каждого пункта отправления хранится array с весами до всех
+        пунктов сети (8 байт на пару), после чего cost() - два обращения
+        по индексу. Без point_ids считаются все пары.
+        """
+        point_count = len(self.point_ids)
+        table = self._tables[by]
+        for point_id in (self.point_ids if point_ids is None else point_ids):
+            source = self._node(point_id)
+            if source not in table:
+                dist, _ = self._shortest_tree(source, by)
+                table[source] = dist[:point_count]
+
+    def cost(self, from_point: int, to_point: int, by: str = BY_FARE) -> Optional[float]:
+        """
+        Вес кратчайшего пути: км для BY_DISTANCE, линейная стоимость для BY_FARE.
+
+        Returns:
+            float или None, если пункт недостижим
+        """
+        source, target = self._node(from_point), self._node(to_point)
+        row = self._tables[by].get(source)
+        value = row[target] if row is not None else self._shortest_tree(source, by)[0][target]
+        return None if value == _UNREACHED else round(value, 6)
+
+    def journey(self, from_point: int, to_point: int, by: str = BY_FARE) -> Optional[Journey]:
+        """
+        Лучшая поездка между пунктами с пересадками.
+
+        Args:
+            from_point: ID пункта отправления
+            to_point: ID пункта назначения
+            by: BY_FARE - самая дешёвая, BY_DISTANCE - самая короткая
+
+        Returns:
+            Journey или None, если пункт назначения недостижим
+        """
+        source, target = self._node(from_point), self._node(to_point)
+        dist, pred = self._shortest_tree(source, by)
+        if dist[target] == _UNREACHED:
+            return None
+
+        # Путь от конца к началу; вершины-пункты делят его на участки
+        path = [target]
+        while path[-1] != source:
+            path.append(pred[path[-1]])
+        path.reverse()
+
+        point_count = len(self.point_ids)
+        journey = Journey()
+        first_stop: Optional[int] = None
+        last_stop = 0
+        for node in path:
+            if node >= point_count:
+                last_stop = node - point_count
+                if first_stop is None:
+                    first_stop = last_stop
+            elif first_stop is not None:
+                journey.legs.append(self._leg(first_stop, last_stop))
+                first_stop = None
+        return journey
+
+    def _leg(self, first_stop: int, last_stop: int) -> Leg:
+        route_id = self._stop_routes[first_stop]
+        distance = round(abs(self._stop_km[last_stop] - self._stop_km[first_stop]), 3)
+        cost, baggage_percent, rounding = self._tariffs[route_id]
+        tariffs = calculate_tariffs(distance, cost, baggage_percent, rounding, self.round_up)
+        return Leg(route_id, self._stop_points[first_stop], self._stop_points[last_stop],
+                   distance, tariffs['passenger'], tariffs['baggage'])
@@ -0,0 +1,79 @@
+"""
+point_import.py
+Быстрый импорт пунктов маршрута из CSV/Excel в PostgreSQL
+
+Столбцы названия и расстояния передаются на сервер через COPY ... FROM
+STDIN во временную таблицу (строки с неверным числом столбцов отсеиваются
+при чтении файла); нормализация названий, сопоставление и создание пунктов,
+проверка расстояний и ключи порядка выполняются запросами над всем набором
+строк в одной транзакции (Database.copy_route_points). Строки Excel переводятся
+в CSV в памяти и идут тем же путём.
+
+Ошибки строк имеют тот же вид, что и при построчном импорте диалога
+маршрута (ExportImportMixin._process_import_row).
+"""
+import csv
+import io
+import time
+from dataclasses import dataclass
+from typing import Dict, List, TextIO
+
+NAME_COLUMN = 'Пункт назначения'
+DISTANCE_COLUMN = 'Расстояние (км)'
+
+# Строки-заголовки внутри данных (например, при склейке файлов) пропускаются
+SKIP_NAMES = ('пункт назначения', 'название пункта', 'point name')
+
+
+@dataclass
+class PointImportResult:
+    """Итог импорта"""
+    rows: int
+    imported: int
+    errors: List[str]
+    elapsed_sec: float
+
+
+def _check_columns(columns) -> None:
+    missing = [column for column in (NAME_COLUMN, DISTANCE_COLUMN) if column not in columns]
+    if missing:
+        raise ValueError(f"В файле нет столбцов: {', '.join(missing)}")
+
+
+def import_points_csv(db, route_id: int, source: TextIO, params: Dict[str, float],
+                      delimiter: str = ';') -> PointImportResult:
+    """
+    Импортировать пункты в конец маршрута из CSV с заголовком.
+
+    Args:
+        db: Database (PostgreSQL)
+        route_id: ID маршрута
+        source: Текстовый файл CSV (открытый с encoding='utf-8-sig')
+        params: rounding, cost_per_km, baggage_percent новых пунктов
+        delimiter: Разделитель CSV
+
+    Raises:
+        ValueError: Если в заголовке нет столбцов названия и расстояния
+    """
+    started = time.perf_counter()
+    header = next(csv.reader([source.readline()], delimiter=delimiter), [])
+    columns = [column.strip() for column in header]
+    _check_columns(columns)
+    rows, imported, errors = db.copy_route_points(
+        route_id, source, len(columns), columns.index(NAME_COLUMN),
+        columns.index(DISTANCE_COLUMN), params, delimiter, SKIP_NAMES
+    )
+    return PointImportResult(rows, imported, errors, time.perf_counter() - started)
+
+
+def import_points_rows(db, route_id: int, rows: List[Dict[str, str]],
+                       params: Dict[str, float]) -> PointImportResult:
+    """Импортировать пункты из строк-словарей (ImportService.import_from_excel)"""
+    if rows:
+        _check_columns(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';', lineterminator='\n')
+    writer.writerow([NAME_COLUMN, DISTANCE_COLUMN])
+    writer.writerows((row.get(NAME_COLUMN, ''), row.get(DISTANCE_COLUMN, '')) for row in rows)
+    buffer.seek(0)
+    return import_points_csv(db, route_id, buffer, params)
@@ -0,0 +1,750 @@
+"""
+sqlite_database.py
+Встроенное хранилище SQLite с тем же интерфейсом, что и Database
+
+Используется для автономной работы без центрального PostgreSQL,
+а также как быстрая локальная замена сервера в тестах и бенчмарках.
+"""
+import sqlite3
+import logging
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from typing import Any, List, Dict, Optional, Tuple, Union, Iterator, Iterable
+
+from core.config import DB_CONFIG, PERFORMANCE_CONFIG
+from core.database import ConcurrencyError, DatabaseError
+from core import fare_engine, migrations
+from models import RouteSequence, TariffUpdate, SORT_KEY_GAP, sort_key_between
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SQLITE_PATH = Path.home() / '.tariff_app' / 'tariffs.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS routes (
+    id INTEGER PRIMARY KEY,
+    route_number TEXT NOT NULL UNIQUE,
+    route_name TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS route_sequence (
+    id INTEGER PRIMARY KEY,
+    route_id INTEGER NOT NULL REFERENCES routes(id) ON DELETE CASCADE,
+    point_id INTEGER NOT NULL REFERENCES points(id),
+    sequence_number INTEGER NOT NULL,
+    distance_km REAL NOT NULL DEFAULT 0,
+    rounding REAL NOT NULL DEFAULT 0,
+    cost_per_km REAL NOT NULL DEFAULT 10,
+    baggage_percent REAL NOT NULL DEFAULT 0,
+    UNIQUE (route_id, point_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_route_sequence_point
+    ON route_sequence (point_id);
+"""
+
+# Прагмы для быстрой записи пачками и параллельного чтения (WAL)
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -64000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 5000",
+)
+
+
+def _dict_factory(cursor: sqlite3.Cursor, row: tuple) -> Dict:
+    """Строки в виде словарей, как RealDictCursor"""
+    return {description[0]: value for description, value in zip(cursor.description, row)}
+
+
+def _inserted_id(cursor: sqlite3.Cursor) -> int:
+    """ID строки, вставленной последним INSERT курсора"""
+    assert cursor.lastrowid is not None
+    return cursor.lastrowid
+
+
+def _lower(value: Optional[str]) -> Optional[str]:
+    """Приведение к нижнему регистру с поддержкой кириллицы (LOWER в SQLite - только ASCII)"""
+    return value.lower() if value is not None else None
+
+
+class SQLiteDatabase:
+    """Класс для работы со встроенной базой данных SQLite"""
+
+    backend = 'sqlite'
+
+    def __init__(self, path: Optional[Union[str, Path]] = None) -> None:
+        """
+        Открытие (и при необходимости создание) файла базы данных.
+
+        Args:
+            path: Путь к файлу БД; ':memory:' - база в памяти.
+                  По умолчанию sqlite_path из config.json или ~/.tariff_app/tariffs.db
+
+        Raises:
+            DatabaseError: При ошибке открытия БД
+        """
+        if path is None:
+            path = DB_CONFIG.get('sqlite_path') or DEFAULT_SQLITE_PATH
+        self.path = str(path)
+        try:
+            if self.path != ':memory:':
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.row_factory = _dict_factory
+            self.conn.create_function("py_lower", 1, _lower, deterministic=True)
+            for pragma in PRAGMAS:
+                self.conn.execute(pragma)
+            self.conn.executescript(SCHEMA)
+            self.conn.commit()
+            migrations.apply_sqlite_migrations(self.conn)
+            self._batch_depth = 0
+            self.closed = False
+            logger.info(f"Открыта локальная БД SQLite: {self.path}")
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Не удалось открыть локальную БД: {e}")
+
+    def _ensure_connection(self) -> None:
+        """Проверка и восстановление подключения при необходимости"""
+        if not hasattr(self, 'conn') or self.closed:
+            SQLiteDatabase.__init__(self, self.path)
+
+    def close(self) -> None:
+        """Закрыть соединение с базой данных"""
+        if hasattr(self, 'conn') and not self.closed:
+            self.conn.close()
+            self.closed = True
+            logger.info("Локальная БД закрыта")
+
+    @contextmanager
+    def transaction(self):
+        """Контекстный менеджер для транзакций"""
+        try:
+            yield self.conn
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @contextmanager
+    def batch(self):
+        """
+        Выполнить несколько операций одной транзакцией.
+
+        Внутри блока методы записи не фиксируют изменения по отдельности:
+        commit выполняется один раз при выходе, при ошибке откатывается весь блок.
+        Блоки могут быть вложенными.
+        """
+        self._ensure_connection()
+        self._batch_depth += 1
+        try:
+            yield self
+        except Exception:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.conn.rollback()
+            raise
+        self._batch_depth -= 1
+        if self._batch_depth == 0:
+            self.conn.commit()
+
+    def _commit(self) -> None:
+        """Зафиксировать транзакцию, если не идёт пакетная операция"""
+        if not self._batch_depth:
+            self.conn.commit()
+
+    @contextmanager
+    def cursor(self):
+        """Контекстный менеджер для курсора"""
+        cursor = self.conn.cursor()
+        try:
+            yield cursor
+            self._commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _iter_query(self, query: str, params: tuple = (),
+                    itersize: Optional[int] = None) -> Iterator[tuple]:
+        """Потоковое чтение результата запроса пачками по itersize строк"""
+        self._ensure_connection()
+        cur = self.conn.cursor()
+        cur.row_factory = None
+        try:
+            cur.execute(query, params)
+            # Поля - колонки запроса, известные только при выполнении
+            record = namedtuple('Record', [d[0] for d in cur.description])  # type: ignore[misc]
+            size = itersize or PERFORMANCE_CONFIG.get('itersize', 2000)
+            while True:
+                rows = cur.fetchmany(size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield record._make(row)
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Ошибка потокового чтения: {e}")
+        finally:
+            cur.close()
+
+    # === Пункты ===
+    def iter_points(self, itersize: Optional[int] = None) -> Iterator[tuple]:
+        """Потоковый перебор всех пунктов: (id, name)"""
+        return self._iter_query("SELECT id, name FROM points ORDER BY name", itersize=itersize)
+
+    def get_all_points(self) -> List[Dict[str, Union[int, str]]]:
+        """Получить список всех пунктов"""
+        self._ensure_connection()
+        try:
+            return self.conn.execute("SELECT id, name FROM points ORDER BY name").fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении пунктов: {e}")
+            return []
+
+    def add_point(self, name: str) -> int:
+        """Добавить новый пункт назначения"""
+        clean_name = name.strip()
+        if not clean_name:
+            raise DatabaseError("Название пункта не может быть пустым")
+
+        self._ensure_connection()
+        try:
+            existing = self.conn.execute(
+                "SELECT id, name FROM points WHERE py_lower(TRIM(name)) = py_lower(?)",
+                (clean_name,)
+            ).fetchone()
+            if existing:
+                raise DatabaseError(
+                    f"Пункт '{clean_name}' уже существует в базе (ID={existing['id']})"
+                )
+            cur = self.conn.execute("INSERT INTO points (name) VALUES (?)", (clean_name,))
+            self._commit()
+            point_id = _inserted_id(cur)
+            logger.debug("Добавлен пункт: %s (ID=%s)", clean_name, point_id)
+            return point_id
+        except DatabaseError:
+            self.conn.rollback()
+            raise
+        except sqlite3.IntegrityError as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка уникальности: {e}")
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка добавления пункта: {e}")
+
+    def update_point(self, point_id: int, name: str) -> bool:
+        """Обновить пункт"""
+        self._ensure_connection()
+        try:
+            cur = self.conn.execute("UPDATE points SET name = ? WHERE id = ?",
+                                    (name.strip(), point_id))
+            self._commit()
+            return cur.rowcount > 0
+        except sqlite3.IntegrityError:
+            self.conn.rollback()
+            raise DatabaseError(f"Пункт '{name}' уже существует")
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка обновления пункта: {e}")
+
+    def delete_point(self, point_id: int) -> bool:
+        """Удалить пункт"""
+        self._ensure_connection()
+        try:
+            used = self.conn.execute(
+                "SELECT COUNT(*) AS cnt FROM route_sequence WHERE point_id = ?", (point_id,)
+            ).fetchone()['cnt']
+            if used > 0:
+                raise DatabaseError("Нельзя удалить пункт: он используется в маршрутах")
+            cur = self.conn.execute("DELETE FROM points WHERE id = ?", (point_id,))
+            self._commit()
+            return cur.rowcount > 0
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка удаления пункта: {e}")
+
+    def search_points(self, query: str) -> List[Dict]:
+        """Поиск пунктов"""
+        self._ensure_connection()
+        return self.conn.execute(
+            "SELECT id, name FROM points WHERE instr(py_lower(name), py_lower(?)) > 0 "
+            "ORDER BY name", (query,)
+        ).fetchall()
+
+    # === Маршруты ===
+    def iter_routes(self, itersize: Optional[int] = None) -> Iterator[tuple]:
+        """Потоковый перебор всех маршрутов с агрегатами (см. Database.iter_routes)"""
+        return self._iter_query("""
+            SELECT id, route_number, route_name, points_count, total_distance_km,
+                   cost_per_km, rounding, baggage_percent
+            FROM routes
+            ORDER BY route_number
+        """, itersize=itersize)
+
+    def get_all_routes(self) -> List[Dict]:
+        """Получить все маршруты"""
+        self._ensure_connection()
+        try:
+            # Число пунктов и параметры тарифа поддерживаются триггерами
+            return self.conn.execute("SELECT * FROM routes ORDER BY route_number").fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка при получении маршрутов: {e}")
+            return []
+
+    def add_route(self, route_number: str, route_name: str) -> int:
+        """Добавить маршрут"""
+        self._ensure_connection()
+        try:
+            cur = self.conn.execute(
+                "INSERT INTO routes (route_number, route_name) VALUES (?, ?)",
+                (route_number.strip(), route_name.strip())
+            )
+            self._commit()
+            return _inserted_id(cur)
+        except sqlite3.IntegrityError:
+            self.conn.rollback()
+            raise DatabaseError(f"Маршрут с номером '{route_number}' уже существует")
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка добавления маршрута: {e}")
+
+    def delete_route(self, route_id: int) -> bool:
+        """Удалить маршрут"""
+        self._ensure_connection()
+        try:
+            cur = self.conn.execute("DELETE FROM routes WHERE id = ?", (route_id,))
+            self._commit()
+            return cur.rowcount > 0
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка удаления маршрута: {e}")
+
+    def get_route_by_id(self, route_id: int) -> Optional[Dict]:
+        """Получить маршрут по ID"""
+        self._ensure_connection()
+        return self.conn.execute("SELECT * FROM routes WHERE id = ?", (route_id,)).fetchone()
+
+    def update_route(self, route_id: int, route_number: str, route_name: str) -> bool:
+        """Обновить маршрут"""
+        self._ensure_connection()
+        try:
+            cur = self.conn.execute(
+                "UPDATE routes SET route_number = ?, route_name = ? WHERE id = ?",
+                (route_number.strip(), route_name.strip(), route_id)
+            )
+            self._commit()
+            return cur.rowcount > 0
+        except sqlite3.IntegrityError:
+            self.conn.rollback()
+            raise DatabaseError(f"Маршрут с номером '{route_number}' уже существует")
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка обновления маршрута: {e}")
+
+    # === Последовательность пунктов ===
+    def get_route_sequence(self, route_id: int) -> List[Dict]:
+        """Получить последовательность пунктов маршрута"""
+        self._ensure_connection()
+        return self.conn.execute("""
+            SELECT rs.*, p.name as point_name,
+                   ROW_NUMBER() OVER (ORDER BY rs.sort_key, rs.id) AS sequence_number
+            FROM route_sequence rs
+            JOIN points p ON rs.point_id = p.id
+            WHERE rs.route_id = ?
+            ORDER BY rs.sort_key, rs.id
+        """, (route_id,)).fetchall()
+
+    def get_route_sequence_model(self, route_id: int,
+                                 as_of: Optional[date] = None) -> RouteSequence:
+        """Получить последовательность пунктов маршрута в компактном виде (на дату as_of)"""
+        if as_of is not None:
+            return RouteSequence.from_rows(self.iter_route_sequences([route_id], as_of=as_of),
+                                           route_id)
+        return RouteSequence.from_rows(self.get_route_sequence(route_id), route_id)
+
+    def iter_route_sequences(self, route_ids: Optional[Iterable[int]] = None,
+                             itersize: Optional[int] = None,
+                             as_of: Optional[date] = None) -> Iterator[tuple]:
+        """Потоковый перебор пунктов нескольких (или всех) маршрутов (на дату as_of)"""
+        if as_of is not None:
+            day = as_of.isoformat()
+            query = """
+                SELECT rs.route_sequence_id AS id, rs.route_id, rs.point_id,
+                       COALESCE(p.name, '#' || rs.point_id) AS point_name,
+                       ROW_NUMBER() OVER (PARTITION BY rs.route_id
+                                          ORDER BY rs.sort_key, rs.route_sequence_id)
+                           AS sequence_number,
+                       rs.distance_km, rs.rounding, rs.cost_per_km, rs.baggage_percent
+                FROM route_sequence_versions rs
+                LEFT JOIN points p ON rs.point_id = p.id
+                WHERE (rs.valid_from IS NULL OR rs.valid_from <= ?)
+                  AND (rs.valid_to IS NULL OR rs.valid_to > ?)
+            """
+            params: tuple = (day, day)
+            if route_ids is not None:
+                route_ids = tuple(route_ids)
+                query += f" AND rs.route_id IN ({', '.join('?' * len(route_ids)) or 'NULL'})"
+                params += route_ids
+            query += " ORDER BY rs.route_id, rs.sort_key, rs.route_sequence_id"
+            return self._iter_query(query, params, itersize)
+
+        query = """
+            SELECT rs.id, rs.route_id, rs.point_id, p.name AS point_name,
+                   ROW_NUMBER() OVER (PARTITION BY rs.route_id
+                                      ORDER BY rs.sort_key, rs.id) AS sequence_number,
+                   rs.distance_km, rs.rounding, rs.cost_per_km, rs.baggage_percent
+            FROM route_sequence rs
+            JOIN points p ON rs.point_id = p.id
+        """
+        params = ()
+        if route_ids is not None:
+            params = tuple(route_ids)
+            query += f" WHERE rs.route_id IN ({', '.join('?' * len(params)) or 'NULL'})"
+        query += " ORDER BY rs.route_id, rs.sort_key, rs.id"
+        return self._iter_query(query, params, itersize)
+
+    def get_tariff_dates(self, route_id: int) -> List[date]:
+        """Даты, с которых менялись пункты или тариф маршрута (по возрастанию)"""
+        self._ensure_connection()
+        rows = self.conn.execute("""
+            SELECT valid_from AS day FROM route_sequence_versions
+            WHERE route_id = ? AND valid_from IS NOT NULL
+            UNION
+            SELECT valid_to FROM route_sequence_versions
+            WHERE route_id = ? AND valid_to IS NOT NULL
+            ORDER BY 1
+        """, (route_id, route_id)).fetchall()
+        return [date.fromisoformat(row['day']) for row in rows]
+
+    def get_tariff_versions(self, as_of: Optional[date] = None) -> Dict[int, date]:
+        """Версия тарифа маршрутов на дату: день последнего изменения (см. Database)"""
+        self._ensure_connection()
+        rows = self.conn.execute("""
+            SELECT route_id, MAX(day) AS day FROM (
+                SELECT route_id, valid_from AS day FROM route_sequence_versions
+                WHERE valid_from IS NOT NULL
+                UNION ALL
+                SELECT route_id, valid_to FROM route_sequence_versions
+                WHERE valid_to IS NOT NULL
+            )
+            WHERE day <= ?
+            GROUP BY route_id
+        """, ((as_of or date.today()).isoformat(),)).fetchall()
+        return {row['route_id']: date.fromisoformat(row['day']) for row in rows}
+
+    def add_point_to_route(self, route_id: int, point_id: int, distance_km: float = 0.0,
+                           rounding: float = 0.0, cost_per_km: float = 10.0,
+                           baggage_percent: float = 0.0) -> int:
+        """Добавить пункт в конец маршрута, возвращает ID записи"""
+        self._ensure_connection()
+        try:
+            last_key = self.conn.execute(
+                "SELECT MAX(sort_key) AS last_key FROM route_sequence WHERE route_id = ?",
+                (route_id,)
+            ).fetchone()['last_key']
+            cur = self.conn.execute("""
+                INSERT INTO route_sequence
+                (route_id, point_id, sort_key, distance_km, rounding, cost_per_km, baggage_percent)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (route_id, point_id, sort_key_between(last_key, None), distance_km, rounding,
+                  cost_per_km, baggage_percent))
+            self._commit()
+            return _inserted_id(cur)
+        except sqlite3.IntegrityError as e:
+            self.conn.rollback()
+            if "UNIQUE constraint" in str(e):
+                raise DatabaseError("Этот пункт уже добавлен в маршрут")
+            raise DatabaseError(f"Ошибка добавления пункта: {e}")
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка добавления пункта: {e}")
+
+    def _neighbor_sort_keys(
+            self, route_id: int, position: int,
+            exclude_id: Optional[int] = None) -> Tuple[Optional[int], Optional[int]]:
+        """Ключи пунктов, между которыми окажется пункт на позиции position (с 1)"""
+        params = (route_id, exclude_id or 0)
+        if position <= 1:
+            return None, self.conn.execute(
+                "SELECT MIN(sort_key) AS k FROM route_sequence WHERE route_id = ? AND id <> ?",
+                params
+            ).fetchone()['k']
+        keys = [row['sort_key'] for row in self.conn.execute("""
+            SELECT sort_key FROM route_sequence
+            WHERE route_id = ? AND id <> ?
+            ORDER BY sort_key, id
+            LIMIT 2 OFFSET ?
+        """, params + (position - 2,))]
+        if not keys:
+            # Позиция за концом маршрута - вставка в конец
+            return self.conn.execute(
+                "SELECT MAX(sort_key) AS k FROM route_sequence WHERE route_id = ? AND id <> ?",
+                params
+            ).fetchone()['k'], None
+        return keys[0], keys[1] if len(keys) > 1 else None
+
+    def _sort_key_at(self, route_id: int, position: int, exclude_id: Optional[int] = None) -> int:
+        """Свободный ключ для позиции position; при нехватке места маршрут перебалансируется"""
+        sort_key = sort_key_between(*self._neighbor_sort_keys(route_id, position, exclude_id))
+        if sort_key is None:
+            self._rebalance(route_id)
+            sort_key = sort_key_between(*self._neighbor_sort_keys(route_id, position, exclude_id))
+            if sort_key is None:
+                raise DatabaseError(f"Маршрут {route_id}: нет свободного ключа порядка")
+        return sort_key
+
+    def insert_point_at(self, route_id: int, position: int, point_id: int,
+                        distance_km: float = 0.0, rounding: float = 0.0,
+                        cost_per_km: float = 10.0, baggage_percent: float = 0.0) -> int:
+        """
+        Вставить пункт в маршрут на позицию position (с 1), вернуть ID записи.
+
+        Остальные пункты маршрута не изменяются.
+        """
+        self._ensure_connection()
+        try:
+            cur = self.conn.execute("""
+                INSERT INTO route_sequence
+                (route_id, point_id, sort_key, distance_km, rounding, cost_per_km, baggage_percent)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (route_id, point_id, self._sort_key_at(route_id, position), distance_km,
+                  rounding, cost_per_km, baggage_percent))
+            self._commit()
+            return _inserted_id(cur)
+        except sqlite3.IntegrityError as e:
+            self.conn.rollback()
+            if "UNIQUE constraint" in str(e):
+                raise DatabaseError("Этот пункт уже добавлен в маршрут")
+            raise DatabaseError(f"Ошибка добавления пункта: {e}")
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка добавления пункта: {e}")
+
+    def update_route_point(self, seq_id: int, distance_km: float, rounding: float,
+                           cost_per_km: float, baggage_percent: float):
+        """Обновить параметры пункта маршрута"""
+        self._ensure_connection()
+        try:
+            cur = self.conn.execute("""
+                UPDATE route_sequence
+                SET distance_km = ?, rounding = ?, cost_per_km = ?, baggage_percent = ?
+                WHERE id = ?
+            """, (distance_km, rounding, cost_per_km, baggage_percent, seq_id))
+            self._commit()
+            return cur.rowcount > 0
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка обновления пункта: {e}")
+
+    def update_route_points(self, changes: List[Tuple]) -> int:
+        """
+        Обновить параметры нескольких пунктов маршрута одной транзакцией.
+
+        Args:
+            changes: Кортежи (seq_id, distance_km, rounding, cost_per_km,
+                     baggage_percent, row_version); row_version None - без проверки
+
+        Raises:
+            ConcurrencyError: Если часть строк изменена или удалена после чтения
+        """
+        if not changes:
+            return 0
+        self._ensure_connection()
+        try:
+            conflict_ids = []
+            for seq_id, distance_km, rounding, cost_per_km, baggage_percent, row_version in changes:
+                cur = self.conn.execute("""
+                    UPDATE route_sequence
+                    SET distance_km = ?, rounding = ?, cost_per_km = ?, baggage_percent = ?
+                    WHERE id = ? AND (? IS NULL OR row_version = ?)
+                """, (distance_km, rounding, cost_per_km, baggage_percent, seq_id,
+                      row_version, row_version))
+                if cur.rowcount == 0:
+                    conflict_ids.append(seq_id)
+            if conflict_ids:
+                self.conn.rollback()
+                raise ConcurrencyError("Пункты маршрута изменены другим пользователем",
+                                       conflict_ids)
+            self._commit()
+            return len(changes)
+        except ConcurrencyError:
+            raise
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка обновления пунктов: {e}")
+
+    def _route_filter_sql(self, route_ids: Optional[Iterable[int]], search: Optional[str],
+                          min_cost_per_km: Optional[float],
+                          max_cost_per_km: Optional[float]) -> Tuple[str, tuple]:
+        """Условие отбора маршрутов (по таблице routes r) и его параметры"""
+        conditions = ["1"]
+        params: List[Any] = []
+        if route_ids is not None:
+            route_ids = tuple(route_ids)
+            conditions.append(f"r.id IN ({', '.join('?' * len(route_ids)) or 'NULL'})")
+            params += route_ids
+        if search:
+            conditions.append("(instr(py_lower(r.route_number), py_lower(?)) > 0 "
+                              "OR instr(py_lower(r.route_name), py_lower(?)) > 0)")
+            params += [search, search]
+        if min_cost_per_km is not None:
+            conditions.append("r.cost_per_km >= ?")
+            params.append(min_cost_per_km)
+        if max_cost_per_km is not None:
+            conditions.append("r.cost_per_km <= ?")
+            params.append(max_cost_per_km)
+        return " AND ".join(conditions), tuple(params)
+
+    def update_tariff_parameters(self, cost_per_km: Optional[float] = None,
+                                 baggage_percent: Optional[float] = None,
+                                 rounding: Optional[float] = None,
+                                 route_ids: Optional[Iterable[int]] = None,
+                                 search: Optional[str] = None,
+                                 min_cost_per_km: Optional[float] = None,
+                                 max_cost_per_km: Optional[float] = None) -> TariffUpdate:
+        """Записать параметры тарифа во все пункты отобранных маршрутов одним запросом"""
+        where, filter_params = self._route_filter_sql(route_ids, search, min_cost_per_km,
+                                                      max_cost_per_km)
+        values = (cost_per_km, baggage_percent, rounding)
+        self._ensure_connection()
+        try:
+            counts = self.conn.execute(f"""
+                SELECT COUNT(DISTINCT r.id) AS routes, COUNT(rs.id) AS points
+                FROM routes r LEFT JOIN route_sequence rs ON rs.route_id = r.id
+                WHERE {where}
+            """, filter_params).fetchone()
+            route_ids, rows_updated = [], 0
+            if any(value is not None for value in values):
+                # Без UPDATE ... RETURNING (нужна SQLite 3.35+): изменяемые маршруты
+                # выбираются до UPDATE по тому же условию
+                changed = f"""
+                    route_id IN (SELECT r.id FROM routes r WHERE {where})
+                    AND (cost_per_km IS NOT COALESCE(?, cost_per_km)
+                         OR baggage_percent IS NOT COALESCE(?, baggage_percent)
+                         OR rounding IS NOT COALESCE(?, rounding))
+                """
+                route_ids = [row['route_id'] for row in self.conn.execute(
+                    f"SELECT DISTINCT route_id FROM route_sequence WHERE {changed} "
+                    f"ORDER BY route_id", filter_params + values
+                ).fetchall()]
+                rows_updated = self.conn.execute(f"""
+                    UPDATE route_sequence
+                    SET cost_per_km = COALESCE(?, cost_per_km),
+                        baggage_percent = COALESCE(?, baggage_percent),
+                        rounding = COALESCE(?, rounding)
+                    WHERE {changed}
+                """, values + filter_params + values).rowcount
+            self._commit()
+            return TariffUpdate(counts['routes'], counts['points'], rows_updated, route_ids)
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка изменения тарифа: {e}")
+
+    def remove_point_from_route(self, route_sequence_id: int):
+        """Удалить пункт из маршрута"""
+        self._ensure_connection()
+        try:
+            # Порядок остальных пунктов задан ключами и не меняется
+            self.conn.execute("DELETE FROM route_sequence WHERE id = ?", (route_sequence_id,))
+            self._commit()
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка удаления пункта: {e}")
+
+    # === Расчёт тарифов ===
+    def calculate_tariffs(self, distance: float, cost_per_km: float,
+                          baggage_percent: float, rounding: float = 0.0,
+                          round_up: bool = False) -> Dict[str, float]:
+        """Расчёт тарифов с выбором типа округления (см. core.fare_engine)"""
+        return fare_engine.calculate_tariffs(distance, cost_per_km, baggage_percent,
+                                             rounding, round_up)
+
+    def update_route_sequence_number(self, seq_id: int, new_number: int):
+        """Переместить пункт на позицию new_number (с 1), изменяется одна запись"""
+        self._ensure_connection()
+        try:
+            row = self.conn.execute(
+                "SELECT route_id FROM route_sequence WHERE id = ?", (seq_id,)
+            ).fetchone()
+            if not row:
+                return False
+            sort_key = self._sort_key_at(row['route_id'], new_number, exclude_id=seq_id)
+            self.conn.execute("UPDATE route_sequence SET sort_key = ? WHERE id = ?",
+                              (sort_key, seq_id))
+            self._commit()
+            return True
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка обновления порядка пункта: {e}")
+
+    def reorder_route_sequence(self, route_id: int, new_order: List[int]):
+        """
+        Переупорядочить пункты маршрута
+        new_order - список ID записей в новом порядке
+        """
+        self._ensure_connection()
+        try:
+            self.conn.executemany(
+                "UPDATE route_sequence SET sort_key = ? WHERE id = ? AND route_id = ?",
+                [((position + 1) * SORT_KEY_GAP, seq_id, route_id)
+                 for position, seq_id in enumerate(new_order)]
+            )
+            self._commit()
+            return True
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка переупорядочивания маршрута: {e}")
+
+    def _rebalance(self, route_id: int) -> int:
+        """Разложить ключи маршрута с равным шагом SORT_KEY_GAP, сохранив порядок"""
+        rows = self.conn.execute(
+            "SELECT id, sort_key FROM route_sequence WHERE route_id = ? ORDER BY sort_key, id",
+            (route_id,)
+        ).fetchall()
+        changes = [((position + 1) * SORT_KEY_GAP, row['id']) for position, row in enumerate(rows)
+                   if row['sort_key'] != (position + 1) * SORT_KEY_GAP]
+        self.conn.executemany("UPDATE route_sequence SET sort_key = ? WHERE id = ?", changes)
+        logger.info(f"Маршрут {route_id}: ключи порядка перебалансированы ({len(changes)} строк)")
+        return len(changes)
+
+    def rebalance_route(self, route_id: int) -> int:
+        """Перебалансировать ключи порядка пунктов маршрута, вернуть число изменённых строк"""
+        self._ensure_connection()
+        try:
+            count = self._rebalance(route_id)
+            self._commit()
+            return count
+        except Exception as e:
+            self.conn.rollback()
+            raise DatabaseError(f"Ошибка перебалансировки маршрута: {e}")
+
+    def data_version(self) -> tuple:
+        """Отметка состояния данных: изменения этого подключения и других (см. Database)"""
+        self._ensure_connection()
+        row = self.conn.execute("PRAGMA data_version").fetchone()
+        return self.conn.total_changes, row['data_version']
+
+    def get_crowded_routes(self, min_gap: int = 2) -> List[int]:
+        """ID маршрутов, где между соседними ключами порядка осталось меньше min_gap"""
+        self._ensure_connection()
+        rows = self.conn.execute("""
+            SELECT DISTINCT route_id FROM (
+                SELECT route_id,
+                       sort_key - LAG(sort_key) OVER (PARTITION BY route_id
+                                                      ORDER BY sort_key, id) AS gap
+                FROM route_sequence
+            )
+            WHERE gap < ?
+        """, (min_gap,)).fetchall()
+        return [row['route_id'] for row in rows]
@@ -0,0 +1,579 @@
+"""
+sync.py
+Синхронизация локального кэша SQLite с центральным PostgreSQL
+
+Чтение выполняется из локального файла ~/.tariff_app/cache.db, с сервера
+забираются только строки, изменённые после последней отметки (watermark),
+и журнал удалений. Локальные изменения сразу применяются к кэшу и ставятся
+в очередь; очередь отправляется на сервер пачкой в одной транзакции.
+
+Новые записи до отправки получают в кэше отрицательные временные ID.
+После отправки строки кэша и ссылки на них получают настоящие ID сервера.
+
+Сетевой обмен (SyncEngine.exchange) не обращается к кэшу и может идти
+в отдельном потоке (ui.sync_worker); его результат применяется к кэшу
+в потоке приложения (SyncEngine.apply).
+"""
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.config import DB_CONFIG
+from core.database import DatabaseError
+from core.sqlite_database import SQLiteDatabase
+from models import RouteSequence, TariffUpdate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path.home() / '.tariff_app' / 'cache.db'
+
+# Отметка изменений сервера в sync_state (Database.get_changes_since). Прежние
+# отметки по времени хранились под ключом 'watermark' и не используются:
+# после обновления кэш один раз загружается полностью
+WATERMARK_STATE = 'watermark_xid'
+
+# Колонки синхронизируемых таблиц (порядок как в Database.get_changes_since)
+SYNC_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    'points': ('id', 'name', 'row_version'),
+    'routes': ('id', 'route_number', 'route_name', 'points_count', 'total_distance_km',
+               'cost_per_km', 'rounding', 'baggage_percent', 'row_version'),
+    'route_sequence': ('id', 'route_id', 'point_id', 'sort_key', 'distance_km',
+                       'rounding', 'cost_per_km', 'baggage_percent', 'row_version'),
+}
+
+# Операции записи и таблица, в которую операция вставляет строку
+WRITE_OPERATIONS: Dict[str, Optional[str]] = {
+    'add_point': 'points',
+    'update_point': None,
+    'delete_point': None,
+    'add_route': 'routes',
+    'update_route': None,
+    'delete_route': None,
+    'add_point_to_route': 'route_sequence',
+    'insert_point_at': 'route_sequence',
+    'update_route_point': None,
+    'update_route_points': None,
+    'update_tariff_parameters': None,
+    'remove_point_from_route': None,
+    'update_route_sequence_number': None,
+    'reorder_route_sequence': None,
+    'rebalance_route': None,
+}
+
+# Ссылки между синхронизируемыми таблицами: (таблица, колонка) -> таблица ID
+SYNC_REFERENCES: Dict[Tuple[str, str], str] = {
+    ('route_sequence', 'route_id'): 'routes',
+    ('route_sequence', 'point_id'): 'points',
+}
+
+SYNC_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS sync_queue (
+    id INTEGER PRIMARY KEY,
+    operation TEXT NOT NULL,
+    args TEXT NOT NULL,
+    temp_id INTEGER,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Операции, которые сервер отклонил (конфликт, нарушение уникальности)
+CREATE TABLE IF NOT EXISTS sync_rejected (
+    id INTEGER PRIMARY KEY,
+    operation TEXT NOT NULL,
+    args TEXT NOT NULL,
+    error TEXT NOT NULL,
+    rejected_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+def _map_ids(value: Any, id_map: Dict[int, int]) -> Any:
+    """Заменить временные (отрицательные) ID в аргументах операции на ID сервера"""
+    if isinstance(value, list):
+        return [_map_ids(item, id_map) for item in value]
+    if isinstance(value, int) and not isinstance(value, bool) and value < 0:
+        try:
+            return id_map[value]
+        except KeyError:
+            raise DatabaseError("Связанная запись не была создана на сервере") from None
+    return value
+
+
+def _map_known_ids(value: Any, id_map: Dict[int, int]) -> Any:
+    """Заменить известные временные ID, остальные оставить (ещё не отправлены)"""
+    if isinstance(value, list):
+        return [_map_known_ids(item, id_map) for item in value]
+    if isinstance(value, int) and not isinstance(value, bool):
+        return id_map.get(value, value)
+    return value
+
+
+@dataclass
+class SyncExchange:
+    """Результат обмена с сервером, который ещё нужно применить к кэшу"""
+    since: Optional[str] = None
+    online: bool = False
+    # Последняя отправленная операция очереди (None - очередь не отправлялась)
+    last_op_id: Optional[int] = None
+    pushed: int = 0
+    rejected: List[Tuple[Dict[str, Any], str]] = field(default_factory=list)
+    # Временный ID -> ID сервера и таблица строки
+    id_map: Dict[int, int] = field(default_factory=dict)
+    temp_tables: Dict[int, str] = field(default_factory=dict)
+    # Изменения сервера (Database.get_changes_since)
+    changes: Optional[Dict[str, Any]] = None
+
+
+class SyncEngine:
+    """Отправка очереди локальных изменений и получение изменений сервера"""
+
+    def __init__(self, local: SQLiteDatabase, remote=None,
+                 remote_factory: Optional[Callable[[], Any]] = None) -> None:
+        """
+        Args:
+            local: Локальный кэш
+            remote: Подключение к серверу (None - нет связи)
+            remote_factory: Функция повторного подключения к серверу
+        """
+        self.local = local
+        self.remote = remote
+        self.remote_factory = remote_factory
+        # Подключение к серверу используется и потоком синхронизации
+        self.remote_lock = threading.RLock()
+        self.local.conn.executescript(SYNC_SCHEMA)
+
+    # === Состояние ===
+    def get_state(self, key: str) -> Optional[str]:
+        """Получить значение из sync_state"""
+        row = self.local.conn.execute("SELECT value FROM sync_state WHERE key = ?",
+                                      (key,)).fetchone()
+        return row['value'] if row else None
+
+    def _set_state(self, key: str, value: str) -> None:
+        self.local.conn.execute(
+            "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def pending_count(self) -> int:
+        """Количество неотправленных операций"""
+        return self.local.conn.execute("SELECT COUNT(*) AS cnt FROM sync_queue").fetchone()['cnt']
+
+    def is_online(self) -> bool:
+        """Есть ли рабочее подключение к серверу (при необходимости переподключается)"""
+        if self.remote is not None and not getattr(self.remote.conn, 'closed', False):
+            return True
+        if self.remote_factory is None:
+            return False
+        try:
+            self.remote = self.remote_factory()
+            return True
+        except DatabaseError as e:
+            logger.debug(f"Сервер недоступен: {e}")
+            self.remote = None
+            return False
+
+    # === Очередь ===
+    def enqueue(self, operation: str, args: List[Any], temp_id: Optional[int] = None) -> None:
+        """Поставить операцию в очередь (фиксируется вместе с локальной записью)"""
+        self.local.conn.execute(
+            "INSERT INTO sync_queue (operation, args, temp_id) VALUES (?, ?, ?)",
+            (operation, json.dumps(args, ensure_ascii=False), temp_id)
+        )
+
+    def _replay(self, operation: str, args: List[Any], temp_id: Optional[int],
+                id_map: Dict[int, int]) -> None:
+        """Выполнить операцию из очереди на сервере"""
+        result = getattr(self.remote, operation)(*_map_ids(args, id_map))
+        if temp_id is not None:
+            id_map[temp_id] = result
+
+    # === Обмен с сервером ===
+    def prepare(self) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Снимок очереди и отметка для обмена (читает кэш - в его потоке).
+
+        Returns:
+            tuple: Операции очереди и отметка, с которой нужны изменения сервера
+        """
+        ops = [dict(op) for op in self.local.conn.execute(
+            "SELECT id, operation, args, temp_id FROM sync_queue ORDER BY id"
+        ).fetchall()]
+        since = self.get_state(WATERMARK_STATE)
+        self.local.conn.commit()
+        return ops, since
+
+    def exchange(self, ops: List[Dict[str, Any]], since: Optional[str]) -> SyncExchange:
+        """
+        Сетевая часть синхронизации: отправить операции и получить изменения.
+
+        Кэш не читается и не изменяется, поэтому обмен можно выполнять в
+        отдельном потоке; результат применяет apply в потоке кэша.
+
+        Вся очередь выполняется одной транзакцией. Если сервер отклоняет
+        пачку, операции повторяются по одной: принятые фиксируются,
+        отклонённые возвращаются в SyncExchange.rejected. Если среди них есть
+        правка или удаление существующей строки, изменения сервера
+        выгружаются полностью.
+        """
+        exchange = SyncExchange(since=since)
+        with self.remote_lock:
+            if not self.is_online():
+                return exchange
+            exchange.online = True
+            if ops:
+                if not self._push(ops, exchange):
+                    return exchange
+                exchange.last_op_id = ops[-1]['id']
+                if any(WRITE_OPERATIONS[op['operation']] is None for op, _ in exchange.rejected):
+                    # Отменить отклонённую правку в кэше может только полная выгрузка:
+                    # строку, которую сервер не менял, выгрузка по отметке не вернёт
+                    exchange.since = None
+            exchange.changes = self.remote.get_changes_since(exchange.since)
+        return exchange
+
+    def _push(self, ops: List[Dict[str, Any]], exchange: SyncExchange) -> bool:
+        """Отправить операции; False - связь потеряна, очередь остаётся как есть"""
+        try:
+            id_map: Dict[int, int] = {}
+            with self.remote.batch():
+                for op in ops:
+                    self._replay(op['operation'], json.loads(op['args']), op['temp_id'], id_map)
+        except DatabaseError as e:
+            if not self.is_online():
+                logger.warning(f"Связь с сервером потеряна, очередь сохранена: {e}")
+                return False
+            logger.warning(f"Сервер отклонил пачку изменений, повтор по одной: {e}")
+            id_map = {}
+            for op in ops:
+                try:
+                    with self.remote.batch():
+                        self._replay(op['operation'], json.loads(op['args']),
+                                     op['temp_id'], id_map)
+                except DatabaseError as op_error:
+                    if getattr(self.remote.conn, 'closed', False):
+                        logger.warning("Связь с сервером потеряна, очередь сохранена")
+                        return False
+                    exchange.rejected.append((op, str(op_error)))
+        exchange.id_map = id_map
+        for op in ops:
+            table = WRITE_OPERATIONS[op['operation']]
+            if table is not None and op['temp_id'] is not None:
+                exchange.temp_tables[op['temp_id']] = table
+        exchange.pushed = len(ops) - len(exchange.rejected)
+        return True
+
+    def apply(self, exchange: SyncExchange) -> Dict[str, Any]:
+        """
+        Применить результат обмена к кэшу.
+
+        Отправленные операции удаляются из очереди, созданные ими строки
+        получают ID сервера. Операции, поставленные в очередь во время
+        обмена, остаются в ней (временные ID в их аргументах заменяются);
+        изменения сервера применяются, только если очередь пуста.
+
+        Returns:
+            dict: online, pushed, rejected, pulled
+        """
+        result = {'online': exchange.online, 'pushed': exchange.pushed,
+                  'rejected': len(exchange.rejected), 'pulled': 0}
+        if exchange.last_op_id is not None:
+            self._apply_push(exchange)
+            for op, error in exchange.rejected:
+                logger.error(f"Операция {op['operation']} отклонена сервером: {error}")
+        if exchange.changes is not None and self.pending_count() == 0:
+            result['pulled'] = self._apply_changes(exchange.changes, exchange.since)
+        return result
+
+    def _apply_push(self, exchange: SyncExchange) -> None:
+        conn = self.local.conn
+        conn.commit()
+        # Строки меняют ID раньше ссылок на них
+        conn.execute("PRAGMA foreign_keys = OFF")
+        try:
+            with self.local.batch():
+                conn.executemany(
+                    "INSERT INTO sync_rejected (operation, args, error) VALUES (?, ?, ?)",
+                    [(op['operation'], op['args'], error) for op, error in exchange.rejected]
+                )
+                conn.execute("DELETE FROM sync_queue WHERE id <= ?", (exchange.last_op_id,))
+                if exchange.since is None:
+                    # Выгрузка ниже может не примениться (очередь не пуста):
+                    # следующий обмен тоже начнётся с полной выгрузки
+                    conn.execute("DELETE FROM sync_state WHERE key = ?", (WATERMARK_STATE,))
+                # Строки отклонённых операций вернутся из сервера, если он их знает
+                for op, _ in exchange.rejected:
+                    table = WRITE_OPERATIONS[op['operation']]
+                    if table is not None and op['temp_id'] is not None:
+                        conn.execute(f"DELETE FROM {table} WHERE id = ?", (op['temp_id'],))
+                for temp_id, server_id in exchange.id_map.items():
+                    table = exchange.temp_tables[temp_id]
+                    conn.execute(f"UPDATE {table} SET id = ? WHERE id = ?", (server_id, temp_id))
+                    for (child, column), parent in SYNC_REFERENCES.items():
+                        if parent == table:
+                            conn.execute(f"UPDATE {child} SET {column} = ? WHERE {column} = ?",
+                                         (server_id, temp_id))
+                # Операции, поставленные во время обмена, могут ссылаться на отправленные строки
+                if exchange.id_map:
+                    for op in conn.execute("SELECT id, args FROM sync_queue").fetchall():
+                        mapped = json.dumps(_map_known_ids(json.loads(op['args']), exchange.id_map),
+                                            ensure_ascii=False)
+                        if mapped != op['args']:
+                            conn.execute("UPDATE sync_queue SET args = ? WHERE id = ?",
+                                         (mapped, op['id']))
+        finally:
+            conn.execute("PRAGMA foreign_keys = ON")
+
+    def _apply_changes(self, changes: Dict[str, Any], since: Optional[str]) -> int:
+        """Записать изменения сервера в кэш; количество строк и удалений"""
+        conn = self.local.conn
+        conn.commit()
+        # Строки приходят в порядке таблиц, а не зависимостей
+        conn.execute("PRAGMA foreign_keys = OFF")
+        try:
+            with self.local.batch():
+                count = 0
+                for table, columns in SYNC_COLUMNS.items():
+                    if since is None:
+                        # Полная выгрузка заменяет всё, кроме неотправленных строк
+                        conn.execute(f"DELETE FROM {table} WHERE id > 0")
+                    rows = [tuple(row) for row in changes[table]]
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+                        f"VALUES ({', '.join('?' * len(columns))})", rows
+                    )
+                    count += len(rows)
+                for table, row_id in changes['deleted']:
+                    if table in SYNC_COLUMNS:
+                        conn.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+                count += len(changes['deleted'])
+                self._set_state(WATERMARK_STATE, changes['watermark'])
+        finally:
+            conn.execute("PRAGMA foreign_keys = ON")
+        return count
+
+    def sync(self) -> Dict[str, Any]:
+        """
+        Отправить очередь и получить изменения сервера (в потоке кэша).
+
+        Returns:
+            dict: online, pushed, rejected, pulled
+        """
+        return self.apply(self.exchange(*self.prepare()))
+
+
+class SyncedDatabase:
+    """
+    Хранилище с локальным кэшем: тот же интерфейс, что у Database.
+
+    Методы чтения обслуживаются локальной SQLite, методы записи изменяют
+    кэш и ставят операцию в очередь синхронизации. Историю тарифов (чтение
+    на дату, даты и версии тарифа) кэш не синхронизирует - версии в нём
+    проставлены локальными триггерами в день получения строк, - поэтому
+    эти запросы выполняет сервер.
+    """
+
+    backend = 'synced'
+
+    def __init__(self, remote=None, remote_factory: Optional[Callable[[], Any]] = None,
+                 path: Optional[str] = None) -> None:
+        """
+        Args:
+            remote: Подключение к серверу (None - начать без связи)
+            remote_factory: Функция повторного подключения к серверу
+            path: Файл кэша (по умолчанию cache_path из config.json
+                  или ~/.tariff_app/cache.db)
+        """
+        self.local = SQLiteDatabase(path or DB_CONFIG.get('cache_path') or DEFAULT_CACHE_PATH)
+        self.engine = SyncEngine(self.local, remote, remote_factory)
+        # Счётчик изменений данных кэша (data_version): служебные записи
+        # синхронизации (отметка, очередь) его не меняют
+        self._data_changes = 0
+        if remote is not None:
+            try:
+                self.sync()
+            except DatabaseError as e:
+                logger.warning(f"Начальная синхронизация не выполнена: {e}")
+
+    def __getattr__(self, name: str) -> Any:
+        # Чтение и вспомогательные методы - из локального кэша
+        if name in WRITE_OPERATIONS:
+            raise AttributeError(name)
+        return getattr(self.local, name)
+
+    def sync(self) -> Dict[str, Any]:
+        """Синхронизировать кэш с сервером в текущем потоке (см. SyncEngine.sync)"""
+        started = time.perf_counter()
+        return self.apply_sync(self.engine.exchange(*self.engine.prepare()), started)
+
+    def prepare_sync(self) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Снимок очереди для обмена в другом потоке (см. SyncEngine.prepare)"""
+        return self.engine.prepare()
+
+    def exchange(self, ops: List[Dict[str, Any]], since: Optional[str]) -> SyncExchange:
+        """Сетевая часть синхронизации, без обращения к кэшу (см. SyncEngine.exchange)"""
+        return self.engine.exchange(ops, since)
+
+    def apply_sync(self, exchange: SyncExchange, started: Optional[float] = None) -> Dict[str, Any]:
+        """Применить результат обмена к кэшу (в потоке кэша)"""
+        result = self.engine.apply(exchange)
+        if result['pushed'] or result['pulled'] or result['rejected']:
+            self._data_changes += 1
+        if result['pushed'] or result['pulled']:
+            extra = {'pushed': result['pushed'], 'pulled': result['pulled'],
+                     'rejected': result['rejected']}
+            if started is not None:
+                extra['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            logger.info(f"Синхронизация: отправлено {result['pushed']}, "
+                        f"получено {result['pulled']}, отклонено {result['rejected']}", extra=extra)
+        return result
+
+    def data_version(self) -> int:
+        """Отметка состояния данных кэша: меняется при записи и применении синхронизации"""
+        return self._data_changes
+
+    def close(self) -> None:
+        """Закрыть кэш и подключение к серверу"""
+        self.local.close()
+        with self.engine.remote_lock:
+            if self.engine.remote is not None:
+                self.engine.remote.close()
+
+    # === История тарифов (с сервера) ===
+    def _read_remote(self, name: str, *args: Any) -> Any:
+        with self.engine.remote_lock:
+            if not self.engine.is_online():
+                raise DatabaseError("История тарифов недоступна без связи с сервером")
+            result = getattr(self.engine.remote, name)(*args)
+            # Потоковый курсор дочитывается, пока подключение не занято синхронизацией
+            return iter(list(result)) if name == 'iter_route_sequences' else result
+
+    def get_route_sequence_model(self, route_id: int,
+                                 as_of: Optional[date] = None) -> RouteSequence:
+        """Последовательность пунктов маршрута (на дату as_of - с сервера)"""
+        if as_of is None:
+            return self.local.get_route_sequence_model(route_id)
+        return self._read_remote('get_route_sequence_model', route_id, as_of)
+
+    def iter_route_sequences(self, route_ids: Optional[Iterable[int]] = None,
+                             itersize: Optional[int] = None,
+                             as_of: Optional[date] = None) -> Iterator[tuple]:
+        """Перебор пунктов маршрутов (на дату as_of - с сервера)"""
+        if as_of is None:
+            return self.local.iter_route_sequences(route_ids, itersize)
+        return self._read_remote('iter_route_sequences', route_ids, itersize, as_of)
+
+    def get_tariff_dates(self, route_id: int) -> List[date]:
+        """Даты изменений тарифа маршрута (с сервера)"""
+        return self._read_remote('get_tariff_dates', route_id)
+
+    def get_tariff_versions(self, as_of: Optional[date] = None) -> Dict[int, date]:
+        """Версии тарифа маршрутов на дату (с сервера)"""
+        return self._read_remote('get_tariff_versions', as_of)
+
+    def _next_temp_id(self, table: str) -> int:
+        row = self.local.conn.execute(f"SELECT MIN(id) AS min_id FROM {table}").fetchone()
+        return min(row['min_id'] or 0, 0) - 1
+
+    def _write(self, operation: str, *args: Any) -> Any:
+        """Применить операцию к кэшу и поставить её в очередь одной транзакцией"""
+        table = WRITE_OPERATIONS[operation]
+        with self.local.batch():
+            result = getattr(self.local, operation)(*args)
+            temp_id = None
+            if table is not None:
+                temp_id = self._next_temp_id(table)
+                self.local.conn.execute(f"UPDATE {table} SET id = ? WHERE id = ?",
+                                        (temp_id, result))
+                result = temp_id
+            self.engine.enqueue(operation, list(args), temp_id)
+        self._data_changes += 1
+        return result
+
+    # === Запись ===
+    def add_point(self, name: str) -> int:
+        """Добавить новый пункт назначения"""
+        return self._write('add_point', name)
+
+    def update_point(self, point_id: int, name: str) -> bool:
+        """Обновить пункт"""
+        return self._write('update_point', point_id, name)
+
+    def delete_point(self, point_id: int) -> bool:
+        """Удалить пункт"""
+        return self._write('delete_point', point_id)
+
+    def add_route(self, route_number: str, route_name: str) -> int:
+        """Добавить маршрут"""
+        return self._write('add_route', route_number, route_name)
+
+    def update_route(self, route_id: int, route_number: str, route_name: str) -> bool:
+        """Обновить маршрут"""
+        return self._write('update_route', route_id, route_number, route_name)
+
+    def delete_route(self, route_id: int) -> bool:
+        """Удалить маршрут"""
+        return self._write('delete_route', route_id)
+
+    def add_point_to_route(self, route_id: int, point_id: int, distance_km: float = 0.0,
+                           rounding: float = 0.0, cost_per_km: float = 10.0,
+                           baggage_percent: float = 0.0) -> int:
+        """Добавить пункт в конец маршрута, вернуть ID записи"""
+        return self._write('add_point_to_route', route_id, point_id, float(distance_km),
+                           float(rounding), float(cost_per_km), float(baggage_percent))
+
+    def insert_point_at(self, route_id: int, position: int, point_id: int,
+                        distance_km: float = 0.0, rounding: float = 0.0,
+                        cost_per_km: float = 10.0, baggage_percent: float = 0.0) -> int:
+        """Вставить пункт в маршрут на позицию position (с 1), вернуть ID записи"""
+        return self._write('insert_point_at', route_id, position, point_id, float(distance_km),
+                           float(rounding), float(cost_per_km), float(baggage_percent))
+
+    def update_route_point(self, seq_id: int, distance_km: float, rounding: float,
+                           cost_per_km: float, baggage_percent: float):
+        """Обновить параметры пункта маршрута"""
+        return self._write('update_route_point', seq_id, float(distance_km), float(rounding),
+                           float(cost_per_km), float(baggage_percent))
+
+    def update_route_points(self, changes: List[Tuple]) -> int:
+        """Обновить параметры нескольких пунктов маршрута одной транзакцией"""
+        return self._write('update_route_points', [list(change) for change in changes])
+
+    def update_tariff_parameters(self, cost_per_km: Optional[float] = None,
+                                 baggage_percent: Optional[float] = None,
+                                 rounding: Optional[float] = None,
+                                 route_ids: Optional[Iterable[int]] = None,
+                                 search: Optional[str] = None,
+                                 min_cost_per_km: Optional[float] = None,
+                                 max_cost_per_km: Optional[float] = None) -> TariffUpdate:
+        """Записать параметры тарифа во все пункты отобранных маршрутов одним запросом"""
+        values = [None if value is None else float(value)
+                  for value in (cost_per_km, baggage_percent, rounding)]
+        costs = [None if value is None else float(value)
+                 for value in (min_cost_per_km, max_cost_per_km)]
+        return self._write('update_tariff_parameters', *values,
+                           None if route_ids is None else list(route_ids), search, *costs)
+
+    def remove_point_from_route(self, route_sequence_id: int):
+        """Удалить пункт из маршрута"""
+        return self._write('remove_point_from_route', route_sequence_id)
+
+    def update_route_sequence_number(self, seq_id: int, new_number: int):
+        """Обновить порядковый номер пункта в маршруте"""
+        return self._write('update_route_sequence_number', seq_id, new_number)
+
+    def reorder_route_sequence(self, route_id: int, new_order: List[int]):
+        """Переупорядочить пункты маршрута"""
+        return self._write('reorder_route_sequence', route_id, list(new_order))
+
+    def rebalance_route(self, route_id: int) -> int:
+        """Перебалансировать ключи порядка пунктов маршрута"""
+        return self._write('rebalance_route', route_id)
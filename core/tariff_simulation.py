@@ -0,0 +1,410 @@
+"""
+tariff_simulation.py
+Моделирование изменения тарифа по всей сети маршрутов
+
+Расстояния всех маршрутов читаются из БД один раз, затем для каждой
+пары остановок считаются тарифы по текущим параметрам маршрута и по
+предлагаемым. С установленным NumPy вся сеть считается одним проходом
+по массивам пар; без него - построчно через fare_engine.passenger_kopecks.
+
+Отчёт сравнивает выручку: сумму тарифов пар с весами (число поездок
+по паре, если известно; иначе каждая пара весит 1).
+"""
+import csv
+import heapq
+import math
+import time
+from array import array
+from dataclasses import dataclass, field
+from types import ModuleType
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.fare_cache import fare_cache
+from core.fare_engine import passenger_kopecks
+from models import RouteSequence, TariffUpdate
+
+# Вес пары: (route_id, point_id отправления, point_id назначения) -> число поездок
+PairWeights = Dict[Tuple[int, int, int], float]
+
+
+@dataclass
+class TariffPolicy:
+    """Предлагаемые параметры тарифа; None - оставить параметр маршрута как есть"""
+    cost_per_km: Optional[float] = None
+    baggage_percent: Optional[float] = None
+    rounding: Optional[float] = None
+    round_up: bool = False
+
+    def apply(self, cost_per_km: float, baggage_percent: float,
+              rounding: float) -> Tuple[float, float, float]:
+        return (cost_per_km if self.cost_per_km is None else self.cost_per_km,
+                baggage_percent if self.baggage_percent is None else self.baggage_percent,
+                rounding if self.rounding is None else self.rounding)
+
+
+@dataclass
+class RouteDiff:
+    """Итог по маршруту (суммы в рублях)"""
+    route_id: int
+    route_number: str
+    pairs: int
+    old_revenue: float
+    new_revenue: float
+    max_increase: float
+    max_decrease: float
+
+    @property
+    def delta(self) -> float:
+        return round(self.new_revenue - self.old_revenue, 2)
+
+    @property
+    def delta_percent(self) -> float:
+        return self.delta / self.old_revenue * 100 if self.old_revenue else 0.0
+
+
+@dataclass
+class PairDiff:
+    """Изменение тарифа одной пары (рубли)"""
+    route_id: int
+    from_point: str
+    to_point: str
+    distance_km: float
+    old_fare: float
+    new_fare: float
+    weight: float
+
+    @property
+    def delta(self) -> float:
+        return round(self.new_fare - self.old_fare, 2)
+
+
+@dataclass
+class SimulationReport:
+    """Результат моделирования"""
+    policy: TariffPolicy
+    routes: List[RouteDiff] = field(default_factory=list)
+    top_pairs: List[PairDiff] = field(default_factory=list)
+    vectorized: bool = False
+    elapsed_sec: float = 0.0
+
+    @property
+    def pairs(self) -> int:
+        return sum(route.pairs for route in self.routes)
+
+    @property
+    def old_revenue(self) -> float:
+        return round(sum(route.old_revenue for route in self.routes), 2)
+
+    @property
+    def new_revenue(self) -> float:
+        return round(sum(route.new_revenue for route in self.routes), 2)
+
+    @property
+    def delta(self) -> float:
+        return round(self.new_revenue - self.old_revenue, 2)
+
+    @property
+    def delta_percent(self) -> float:
+        return self.delta / self.old_revenue * 100 if self.old_revenue else 0.0
+
+    def write_csv(self, filename: str) -> None:
+        """Сохранить итоги по маршрутам и крупнейшие изменения пар"""
+        with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(["Маршрут", "Пар", "Выручка до", "Выручка после", "Изменение",
+                             "Изменение, %", "Макс. рост", "Макс. снижение"])
+            for route in self.routes:
+                writer.writerow([route.route_number, route.pairs, f"{route.old_revenue:.2f}",
+                                 f"{route.new_revenue:.2f}", f"{route.delta:.2f}",
+                                 f"{route.delta_percent:.2f}", f"{route.max_increase:.2f}",
+                                 f"{route.max_decrease:.2f}"])
+            writer.writerow(["Итого", self.pairs, f"{self.old_revenue:.2f}",
+                             f"{self.new_revenue:.2f}", f"{self.delta:.2f}",
+                             f"{self.delta_percent:.2f}", "", ""])
+            writer.writerow([])
+            writer.writerow(["Маршрут", "Откуда", "Куда", "Км", "Тариф до", "Тариф после",
+                             "Изменение", "Вес"])
+            numbers = {route.route_id: route.route_number for route in self.routes}
+            for pair in self.top_pairs:
+                writer.writerow([numbers.get(pair.route_id, pair.route_id), pair.from_point,
+                                 pair.to_point, f"{pair.distance_km:.1f}", f"{pair.old_fare:.2f}",
+                                 f"{pair.new_fare:.2f}", f"{pair.delta:.2f}", pair.weight])
+
+
+def _fares_python(sequences: List[RouteSequence], policy: TariffPolicy,
+                  current_round_up: bool) -> List[Tuple[array, array]]:
+    """Пассажирские тарифы пар (копейки) по маршрутам: (текущие, новые)"""
+    result = []
+    for sequence in sequences:
+        cost, _, rounding = params = (sequence.cost_per_km, sequence.baggage_percent,
+                                      sequence.rounding)
+        new_cost, _, new_rounding = policy.apply(*params)
+        result.append((passenger_kopecks(sequence.distances, cost, rounding, current_round_up),
+                       passenger_kopecks(sequence.distances, new_cost, new_rounding,
+                                         policy.round_up)))
+    return result
+
+
+def _kopecks(np, fares):
+    """
+    round(round(fare, 2) * 100) для массива сумм, как в core.fare_engine.
+
+    round(fare, 2) в Python округляет точное десятичное значение числа, а
+    np.round(fare, 2) - произведение fare * 100 со своей погрешностью, и на
+    половине копейки они расходятся. Такие суммы считаются round() Python.
+    """
+    cents = fares * 100
+    result = np.round(cents)
+    near_half = np.abs(cents - np.floor(cents) - 0.5) < 1e-6
+    for index in np.flatnonzero(near_half):
+        result[index] = round(round(float(fares[index]), 2) * 100)
+    return result
+
+
+def _fares_numpy(np, sequences: List[RouteSequence], policy: TariffPolicy,
+                 current_round_up: bool):
+    """
+    То же одним проходом по массивам всех пар сети.
+
+    Returns:
+        tuple: Текущие и новые тарифы всех пар подряд и границы маршрутов
+               в них (bounds[k]:bounds[k + 1] - пары маршрута k)
+    """
+    distances, counts = [], []
+    for sequence in sequences:
+        stops = np.frombuffer(sequence.distances, dtype=np.float64)
+        i, j = np.tril_indices(len(stops), -1)
+        distances.append(stops[i] - stops[j])
+        counts.append(len(i))
+    distances = np.concatenate(distances) if distances else np.zeros(0)
+    counts = np.array(counts, dtype=np.int64)
+
+    def per_pair(values):
+        return np.repeat(np.asarray(values, dtype=np.float64), counts)
+
+    def passenger_kopecks(cost, rounding, round_up):
+        fare = distances * cost
+        step = np.where(rounding > 0, rounding, 1.0)
+        rounded = (np.ceil(fare / step) if round_up else np.round(fare / step)) * step
+        kopecks = _kopecks(np, np.where(rounding > 0, rounded, fare))
+        return np.where((distances > 0) & (cost > 0), kopecks, 0).astype(np.int64)
+
+    old_params = [(s.cost_per_km, s.baggage_percent, s.rounding) for s in sequences]
+    new_params = [policy.apply(*params) for params in old_params]
+    old = passenger_kopecks(per_pair([p[0] for p in old_params]),
+                            per_pair([p[2] for p in old_params]), current_round_up)
+    new = passenger_kopecks(per_pair([p[0] for p in new_params]),
+                            per_pair([p[2] for p in new_params]), policy.round_up)
+    return old, new, np.concatenate(([0], np.cumsum(counts)))
+
+
+# Пара в списке крупнейших изменений:
+# (изменение с учётом веса, индекс маршрута, номер пары, тариф до, тариф после, вес)
+PairCandidate = Tuple[float, int, int, int, int, float]
+
+
+def _summarize_python(sequences: List[RouteSequence], fares: List[Tuple[array, array]],
+                      weights: Optional[PairWeights],
+                      top: int) -> Tuple[List[Tuple[int, float, float, int, int]],
+                                         List[PairCandidate]]:
+    """Итоги маршрутов (пар, выручка до и после, макс. рост и снижение) и крупнейшие пары"""
+    totals: List[Tuple[int, float, float, int, int]] = []
+    candidates: List[PairCandidate] = []
+    for index, (sequence, (old, new)) in enumerate(zip(sequences, fares)):
+        pair_weights = _pair_weights(sequence, weights) if weights else [1.0] * len(old)
+        deltas = [b - a for a, b in zip(old, new)]
+        totals.append((len(old), sum(a * w for a, w in zip(old, pair_weights)),
+                       sum(b * w for b, w in zip(new, pair_weights)),
+                       max(max(deltas, default=0), 0), min(min(deltas, default=0), 0)))
+        candidates = heapq.nlargest(top, candidates + [
+            (abs(delta) * weight, index, k, old[k], new[k], weight)
+            for k, (delta, weight) in enumerate(zip(deltas, pair_weights)) if delta
+        ])
+    return totals, candidates
+
+
+def _summarize_numpy(np, sequences: List[RouteSequence], fares, weights: Optional[PairWeights],
+                     top: int) -> Tuple[List[Tuple[int, float, float, int, int]],
+                                        List[PairCandidate]]:
+    """То же по массивам пар сети: суммы по маршрутам через reduceat, отбор через argpartition"""
+    old, new, bounds = fares
+    pair_weights = _weight_array(np, sequences, weights, bounds)
+    deltas = new - old
+    counts = np.diff(bounds)
+    # reduceat не умеет пустые отрезки: маршруты без пар получают нули
+    nonempty = counts > 0
+    starts = bounds[:-1][nonempty]
+
+    def per_route(ufunc, values):
+        result = np.zeros(len(sequences), dtype=values.dtype)
+        if starts.size:
+            result[nonempty] = ufunc.reduceat(values, starts)
+        return result
+
+    totals = list(zip(counts.tolist(),
+                      per_route(np.add, old * pair_weights).tolist(),
+                      per_route(np.add, new * pair_weights).tolist(),
+                      np.maximum(per_route(np.maximum, deltas), 0).tolist(),
+                      np.minimum(per_route(np.minimum, deltas), 0).tolist()))
+
+    scores = np.abs(deltas) * pair_weights
+    chosen = np.flatnonzero(deltas)
+    if top <= 0:
+        chosen = chosen[:0]
+    elif chosen.size > top:
+        # Порог - top-е по величине изменение; равные ему пары упорядочиваются ниже
+        part = np.argpartition(scores[chosen], chosen.size - top)[chosen.size - top:]
+        chosen = chosen[scores[chosen] >= scores[chosen][part].min()]
+    # По убыванию изменения, при равенстве - как heapq.nlargest по кортежам кандидатов
+    chosen = chosen[np.lexsort((chosen, scores[chosen]))[::-1][:top]]
+    routes = np.searchsorted(bounds, chosen, side='right') - 1
+    candidates = list(zip(scores[chosen].tolist(), routes.tolist(),
+                          (chosen - bounds[routes]).tolist(), old[chosen].tolist(),
+                          new[chosen].tolist(), pair_weights[chosen].tolist()))
+    return totals, candidates
+
+
+def simulate_policy(db, policy: TariffPolicy, route_ids: Optional[Iterable[int]] = None,
+                    weights: Optional[PairWeights] = None, current_round_up: bool = False,
+                    top: int = 100) -> SimulationReport:
+    """
+    Рассчитать последствия предлагаемого тарифа для сети без изменения БД.
+
+    Args:
+        db: Database или SQLiteDatabase
+        policy: Предлагаемые параметры
+        route_ids: Маршруты (None - все)
+        weights: Число поездок по парам; пары без веса весят 1
+        current_round_up: Способ округления, которым считаются текущие тарифы
+        top: Сколько пар с наибольшим изменением включить в отчёт
+
+    Returns:
+        SimulationReport: Итоги по маршрутам и крупнейшие изменения пар
+    """
+    started = time.perf_counter()
+    numbers = {row[0]: row[1] for row in db.iter_routes()}
+    sequences = list(RouteSequence.group_rows(db.iter_route_sequences(route_ids)))
+    report = simulate_sequences(sequences, numbers, policy, weights, current_round_up, top)
+    report.elapsed_sec = time.perf_counter() - started
+    return report
+
+
+def simulate_sequences(sequences: List[RouteSequence], route_numbers: Dict[int, str],
+                       policy: TariffPolicy, weights: Optional[PairWeights] = None,
+                       current_round_up: bool = False, top: int = 100) -> SimulationReport:
+    """
+    То же по прочитанным маршрутам (к БД не обращается, можно вызывать
+    из рабочего потока - см. ui.simulation_worker).
+    """
+    started = time.perf_counter()
+    np = _numpy()
+    if np is not None:
+        totals, candidates = _summarize_numpy(
+            np, sequences, _fares_numpy(np, sequences, policy, current_round_up), weights, top)
+    else:
+        totals, candidates = _summarize_python(
+            sequences, _fares_python(sequences, policy, current_round_up), weights, top)
+
+    report = SimulationReport(policy, vectorized=np is not None)
+    for sequence, (pairs, old_sum, new_sum, increase, decrease) in zip(sequences, totals):
+        route_id = _route_id(sequence)
+        report.routes.append(RouteDiff(
+            route_id, route_numbers.get(route_id, str(route_id)), pairs,
+            round(old_sum / 100, 2), round(new_sum / 100, 2), increase / 100, decrease / 100,
+        ))
+    for _, index, pair, old_fare, new_fare, weight in candidates:
+        sequence = sequences[index]
+        i, j = _pair_position(pair)
+        report.top_pairs.append(PairDiff(
+            _route_id(sequence), sequence.point_names[j], sequence.point_names[i],
+            round(sequence.distances[i] - sequence.distances[j], 3),
+            old_fare / 100, new_fare / 100, weight,
+        ))
+    report.elapsed_sec = time.perf_counter() - started
+    return report
+
+
+def _numpy() -> Optional[ModuleType]:
+    """Модуль numpy или None, если он не установлен (расчёт на чистом Python)"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _route_id(sequence: RouteSequence) -> int:
+    """ID маршрута последовательности (group_rows берёт его из строк БД)"""
+    if sequence.route_id is None:
+        raise ValueError("Последовательность пунктов без ID маршрута")
+    return sequence.route_id
+
+
+def _pair_weight_keys(sequence: RouteSequence, i: int,
+                      j: int) -> Tuple[Tuple[int, int, int], Tuple[int, int, int]]:
+    """Ключи веса пары (i, j): в направлении маршрута и обратный"""
+    route_id, point_ids = _route_id(sequence), sequence.point_ids
+    return (route_id, point_ids[j], point_ids[i]), (route_id, point_ids[i], point_ids[j])
+
+
+def _pair_weights(sequence: RouteSequence, weights: PairWeights) -> List[float]:
+    """Веса пар маршрута в нижнетреугольном порядке"""
+    result = []
+    for i in range(1, len(sequence.point_ids)):
+        for j in range(i):
+            forward, backward = _pair_weight_keys(sequence, i, j)
+            weight = weights.get(forward)
+            if weight is None:
+                weight = weights.get(backward, 1.0)
+            result.append(weight)
+    return result
+
+
+def _weight_array(np, sequences: List[RouteSequence], weights: Optional[PairWeights], bounds):
+    """Веса всех пар сети; проход только по заданным весам, а не по парам"""
+    result = np.ones(int(bounds[-1]), dtype=np.float64)
+    if not weights:
+        return result
+    routes = {sequence.route_id: index for index, sequence in enumerate(sequences)}
+    positions: Dict[int, Dict[int, int]] = {}
+    for key, weight in weights.items():
+        route_id, from_id, to_id = key
+        index = routes.get(route_id)
+        if index is None:
+            continue
+        if index not in positions:
+            positions[index] = {point_id: position for position, point_id
+                                in enumerate(sequences[index].point_ids)}
+        j, i = positions[index].get(from_id), positions[index].get(to_id)
+        if i is None or j is None or i == j:
+            continue
+        if i < j:
+            # Обратное направление - только если нет веса в направлении маршрута
+            i, j = j, i
+            if _pair_weight_keys(sequences[index], i, j)[0] in weights:
+                continue
+        result[bounds[index] + i * (i - 1) // 2 + j] = weight
+    return result
+
+
+def _pair_position(pair: int) -> Tuple[int, int]:
+    """Позиции (i, j) пары по её номеру в нижнетреугольном порядке"""
+    i = (1 + math.isqrt(8 * pair + 1)) // 2
+    return i, pair - i * (i - 1) // 2
+
+
+def apply_policy(db, policy: TariffPolicy,
+                 route_ids: Optional[Iterable[int]] = None) -> TariffUpdate:
+    """
+    Записать параметры тарифа в маршруты одним UPDATE.
+
+    Округление вверх - настройка расчёта, а не данные маршрута, поэтому
+    policy.round_up в БД не сохраняется.
+
+    Returns:
+        TariffUpdate: Итог изменения (см. Database.update_tariff_parameters)
+    """
+    result = db.update_tariff_parameters(policy.cost_per_km, policy.baggage_percent,
+                                         policy.rounding, route_ids)
+    fare_cache.invalidate(result.route_ids)
+    return result
@@ -0,0 +1,89 @@
+"""
+unit_of_work.py
+Отложенная запись правок последовательности маршрута
+
+Правки строк копятся в памяти и сохраняются одним пакетным UPDATE
+в одной транзакции: либо сохраняются все строки, либо ни одна.
+Каждая строка проверяется по row_version, прочитанной вместе с маршрутом.
+"""
+import logging
+import time
+from typing import Dict, Tuple
+
+from models import RouteSequence
+
+logger = logging.getLogger(__name__)
+
+# Изменения меньше этого порога не считаются правкой (ввод в таблице - 2 знака)
+CHANGE_EPSILON = 0.01
+
+
+class RouteEditUnit:
+    """Набор несохранённых правок пунктов одного маршрута"""
+
+    def __init__(self, db, sequence: RouteSequence) -> None:
+        """
+        Args:
+            db: Хранилище (Database, SQLiteDatabase, SyncedDatabase)
+            sequence: Последовательность в том виде, в каком её прочитали из БД
+        """
+        self.db = db
+        self.sequence = sequence
+        self._dirty: Dict[int, Tuple[float, float, float, float]] = {}
+        self.last_flush_ms = 0.0
+
+    def register(self, index: int, distance_km: float, rounding: float,
+                 cost_per_km: float, baggage_percent: float) -> bool:
+        """
+        Запомнить новые значения пункта с позицией index.
+
+        Returns:
+            bool: True, если значения отличаются от прочитанных из БД
+        """
+        seq = self.sequence
+        original = (seq.distances[index], seq.roundings[index],
+                    seq.costs[index], seq.baggage_percents[index])
+        values = (float(distance_km), float(rounding), float(cost_per_km), float(baggage_percent))
+        if all(abs(new - old) <= CHANGE_EPSILON for new, old in zip(values, original)):
+            self._dirty.pop(index, None)
+            return False
+        self._dirty[index] = values
+        return True
+
+    def __len__(self) -> int:
+        return len(self._dirty)
+
+    def __bool__(self) -> bool:
+        return bool(self._dirty)
+
+    def clear(self) -> None:
+        """Отбросить несохранённые правки"""
+        self._dirty.clear()
+
+    def flush(self) -> Dict[str, float]:
+        """
+        Сохранить все правки одним запросом.
+
+        Returns:
+            dict: rows - сохранено строк, elapsed_ms - время записи
+
+        Raises:
+            ConcurrencyError: Строки изменены другим пользователем (ничего не сохранено)
+            DatabaseError: При ошибке записи (ничего не сохранено)
+        """
+        if not self._dirty:
+            return {'rows': 0, 'elapsed_ms': 0.0}
+        seq = self.sequence
+        changes = [
+            (seq.ids[index], *values, seq.row_versions[index] or None)
+            for index, values in sorted(self._dirty.items())
+        ]
+        started = time.perf_counter()
+        rows = self.db.update_route_points(changes)
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        self._dirty.clear()
+        logger.info(f"Маршрут {seq.route_id}: сохранено строк {rows} "
+                    f"за {self.last_flush_ms:.1f} мс",
+                    extra={'route_id': seq.route_id, 'rows': rows,
+                           'elapsed_ms': round(self.last_flush_ms, 3)})
+        return {'rows': rows, 'elapsed_ms': self.last_flush_ms}
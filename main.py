@@ -3,6 +3,7 @@
 """
 import sys
 import os
+import argparse
 from pathlib import Path
 from PyQt5.QtWidgets import QApplication, QMessageBox, QPushButton
 from PyQt5.QtGui import QFontDatabase, QFont, QIcon
@@ -11,8 +12,10 @@ from PyQt5.QtGui import QFontDatabase, QFont, QIcon
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # Импортируем из папки core
-from core.database import Database, DatabaseError
+from core.database import create_database, DatabaseError, SchemaVersionError
 from ui.main_window import MainWindow
+from utils.logger import setup_logging
+from utils.profiler import ProfileSession, MODES
 
 
 def setup_font(app):
@@ -36,8 +39,24 @@ def setup_font(app):
     app.setFont(QFont("Arial" if sys.platform == "win32" else "Sans", 10))
     return False
 
+def parse_args(argv):
+    """Разбор ключей командной строки; остальные аргументы передаются Qt"""
+    parser = argparse.ArgumentParser(description="Система формирования тарифов")
+    parser.add_argument(
+        '--profile', nargs='?', const='sampling', choices=MODES,
+        help="Профилировать работу от запуска до выхода (по умолчанию sampling)"
+    )
+    return parser.parse_known_args(argv[1:])
+
+
 def main():
-    app = QApplication(sys.argv)
+    args, qt_args = parse_args(sys.argv)
+    setup_logging()
+    profile_session = None
+    if args.profile:
+        profile_session = ProfileSession(args.profile)
+        profile_session.start()
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setApplicationName("TariffApp")
     app.setApplicationVersion("1.0")
     
@@ -51,13 +70,18 @@ def main():
     
     # Подключение к БД
     try:
-        db = Database()
+        db = create_database()
+    except SchemaVersionError as e:
+        QMessageBox.critical(None, "Схема базы данных устарела", str(e))
+        return 1
     except DatabaseError as e:
         QMessageBox.critical(
             None, 
             "Ошибка подключения к БД", 
             f"Не удалось подключиться к базе данных:\n{e}\n\n"
-            "Проверьте:\n• Запущен ли PostgreSQL\n• Правильность настроек в config.py\n• Наличие БД tariffs_db"
+            "Проверьте:\n• Запущен ли PostgreSQL\n• Правильность настроек в config.json\n• Наличие БД tariffs_db\n\n"
+            "Для автономной работы укажите \"backend\": \"sqlite\" или\n"
+            "\"offline_fallback\": true в разделе database файла config.json"
         )
         return 1
     except Exception as e:
@@ -65,8 +89,9 @@ def main():
         return 1
     
     # Запуск главного окна
+    window = None
     try:
-        window = MainWindow(db)
+        window = MainWindow(db, profile_session=profile_session)
         window.show()
         exit_code = app.exec_()
         db.close()
@@ -75,6 +100,13 @@ def main():
         QMessageBox.critical(None, "Критическая ошибка", f"Ошибка запуска приложения: {e}")
         db.close()
         return 1
+    finally:
+        # Сеанс мог быть перезапущен кнопкой на панели инструментов
+        if window is not None:
+            profile_session = window.profile_session
+        if profile_session and profile_session.is_running:
+            # Путь к профилю пишется в лог: в оконной сборке sys.stdout нет
+            profile_session.stop()
 
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,306 @@
+"""
+Компактная доменная модель: пункты, маршруты, остановки маршрута
+
+Объекты используют __slots__, а последовательность маршрута хранит
+числовые данные в колонках array, а не в списке словарей. Для совместимости
+с кодом, который работает со строками БД, объекты поддерживают доступ
+по ключу: stop['distance_km'], point['name'].
+"""
+from array import array
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+
+# Шаг ключей порядка пунктов (sort_key): между соседями остаётся место для вставки
+SORT_KEY_GAP = 1024
+
+
+def sort_key_between(prev_key: Optional[int], next_key: Optional[int]) -> Optional[int]:
+    """
+    Ключ порядка для пункта между соседями с ключами prev_key и next_key.
+
+    Returns:
+        int или None, если между соседями не осталось места
+        (маршрут нужно перебалансировать)
+    """
+    if prev_key is None:
+        return SORT_KEY_GAP if next_key is None else next_key - SORT_KEY_GAP
+    if next_key is None:
+        return prev_key + SORT_KEY_GAP
+    if next_key - prev_key < 2:
+        return None
+    return (prev_key + next_key) // 2
+
+
+def _field(row: Any, name: str) -> Any:
+    """Получить поле строки БД: словарь (RealDictRow) или namedtuple"""
+    if isinstance(row, dict):
+        return row[name]
+    return getattr(row, name)
+
+
+class _SlotRecord:
+    """Базовый класс записей со __slots__ и доступом по ключу"""
+    __slots__: Tuple[str, ...] = ()
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def keys(self) -> Sequence[str]:
+        return self.__slots__
+
+    def as_dict(self) -> dict:
+        """Преобразовать в словарь"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other: Any) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, n) == getattr(other, n) for n in self.__slots__)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{n}={getattr(self, n)!r}" for n in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Point(_SlotRecord):
+    """Пункт назначения"""
+    __slots__ = ('id', 'name')
+
+    def __init__(self, id: int, name: str):
+        self.id = id
+        self.name = name
+
+    @classmethod
+    def from_row(cls, row: Any) -> 'Point':
+        """Создать из строки БД"""
+        return cls(_field(row, 'id'), _field(row, 'name'))
+
+
+class Route(_SlotRecord):
+    """Маршрут с агрегатами последовательности (число пунктов, расстояние, тариф)"""
+    __slots__ = ('id', 'route_number', 'route_name', 'points_count', 'total_distance_km',
+                 'cost_per_km', 'rounding', 'baggage_percent')
+
+    def __init__(self, id: int, route_number: str, route_name: str, points_count: int = 0,
+                 total_distance_km: float = 0.0, cost_per_km: float = 10.0,
+                 rounding: float = 0.0, baggage_percent: float = 0.0):
+        self.id = id
+        self.route_number = route_number
+        self.route_name = route_name
+        self.points_count = points_count
+        self.total_distance_km = total_distance_km
+        self.cost_per_km = cost_per_km
+        self.rounding = rounding
+        self.baggage_percent = baggage_percent
+
+    @classmethod
+    def from_row(cls, row: Any) -> 'Route':
+        """Создать из строки БД (агрегаты необязательны)"""
+        get = row.get if isinstance(row, dict) else \
+            (lambda name, default: getattr(row, name, default))
+        return cls(_field(row, 'id'), _field(row, 'route_number'), _field(row, 'route_name'),
+                   get('points_count', 0) or 0, float(get('total_distance_km', 0.0) or 0.0),
+                   float(get('cost_per_km', 10.0) or 0.0), float(get('rounding', 0.0) or 0.0),
+                   float(get('baggage_percent', 0.0) or 0.0))
+
+
+class TariffUpdate(_SlotRecord):
+    """Итог массового изменения параметров тарифа"""
+    __slots__ = ('routes_matched', 'rows_matched', 'rows_updated', 'route_ids')
+
+    def __init__(self, routes_matched: int = 0, rows_matched: int = 0, rows_updated: int = 0,
+                 route_ids: Optional[List[int]] = None):
+        self.routes_matched = routes_matched
+        # Пунктов в отобранных маршрутах до изменения и изменённых пунктов
+        self.rows_matched = rows_matched
+        self.rows_updated = rows_updated
+        # Маршруты, в которых что-то изменилось
+        self.route_ids = route_ids or []
+
+
+class RouteStop(_SlotRecord):
+    """Пункт в последовательности маршрута"""
+    __slots__ = ('id', 'route_id', 'point_id', 'point_name', 'sequence_number',
+                 'distance_km', 'rounding', 'cost_per_km', 'baggage_percent')
+
+    def __init__(self, id: Optional[int], route_id: Optional[int], point_id: int,
+                 point_name: str, sequence_number: int, distance_km: float,
+                 rounding: float = 0.0, cost_per_km: float = 10.0,
+                 baggage_percent: float = 0.0):
+        self.id = id
+        self.route_id = route_id
+        self.point_id = point_id
+        self.point_name = point_name
+        self.sequence_number = sequence_number
+        self.distance_km = distance_km
+        self.rounding = rounding
+        self.cost_per_km = cost_per_km
+        self.baggage_percent = baggage_percent
+
+    @classmethod
+    def from_row(cls, row: Any) -> 'RouteStop':
+        """Создать из строки БД"""
+        return cls(
+            _field(row, 'id'), _field(row, 'route_id'), _field(row, 'point_id'),
+            _field(row, 'point_name'), _field(row, 'sequence_number'),
+            float(_field(row, 'distance_km')), float(_field(row, 'rounding')),
+            float(_field(row, 'cost_per_km')), float(_field(row, 'baggage_percent'))
+        )
+
+
+class RouteSequence:
+    """
+    Последовательность пунктов маршрута в колоночном виде.
+
+    Идентификаторы и числовые параметры лежат в array, названия пунктов -
+    в одном списке. Элементы при индексации собираются в RouteStop на лету,
+    поэтому последовательность можно передавать туда, где раньше ожидался
+    список строк БД.
+    """
+    __slots__ = ('route_id', 'ids', 'point_ids', 'point_names', 'sequence_numbers',
+                 'distances', 'roundings', 'costs', 'baggage_percents', 'row_versions')
+
+    def __init__(self, route_id: Optional[int] = None):
+        self.route_id = route_id
+        self.ids = array('q')
+        self.point_ids = array('q')
+        self.point_names: List[str] = []
+        self.sequence_numbers = array('l')
+        self.distances = array('d')
+        self.roundings = array('d')
+        self.costs = array('d')
+        self.baggage_percents = array('d')
+        # Версия строки для проверки конфликтов при сохранении (0 - неизвестна)
+        self.row_versions = array('q')
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Any], route_id: Optional[int] = None) -> 'RouteSequence':
+        """
+        Собрать последовательность из строк БД (словарей или namedtuple).
+
+        Строки читаются один раз, значения сразу раскладываются по колонкам
+        без промежуточных словарей.
+        """
+        seq = cls(route_id)
+        for row in rows:
+            if isinstance(row, dict):
+                row_id, point_id, name, number, distance, rounding, cost, baggage = (
+                    row['id'], row['point_id'], row['point_name'], row['sequence_number'],
+                    row['distance_km'], row['rounding'], row['cost_per_km'],
+                    row['baggage_percent']
+                )
+                version = row.get('row_version') or 0
+                if seq.route_id is None:
+                    seq.route_id = row.get('route_id')
+            else:
+                row_id, point_id, name, number, distance, rounding, cost, baggage = (
+                    row.id, row.point_id, row.point_name, row.sequence_number,
+                    row.distance_km, row.rounding, row.cost_per_km, row.baggage_percent
+                )
+                version = getattr(row, 'row_version', 0) or 0
+                if seq.route_id is None:
+                    seq.route_id = getattr(row, 'route_id', None)
+            seq.append(row_id, point_id, name, number, distance, rounding, cost, baggage,
+                       version)
+        return seq
+
+    @classmethod
+    def group_rows(cls, rows: Iterable[Any]) -> Iterator['RouteSequence']:
+        """
+        Разбить поток строк нескольких маршрутов (упорядоченный по route_id,
+        как в Database.iter_route_sequences) на последовательности.
+        """
+        current: Optional[RouteSequence] = None
+        for row in rows:
+            route_id = _field(row, 'route_id')
+            if current is None or current.route_id != route_id:
+                if current is not None:
+                    yield current
+                current = cls(route_id)
+            current.append(
+                _field(row, 'id'), _field(row, 'point_id'), _field(row, 'point_name'),
+                _field(row, 'sequence_number'), _field(row, 'distance_km'),
+                _field(row, 'rounding'), _field(row, 'cost_per_km'),
+                _field(row, 'baggage_percent')
+            )
+        if current is not None:
+            yield current
+
+    def append(self, id: Optional[int], point_id: int, point_name: str, sequence_number: int,
+               distance_km: Union[float, Any], rounding: Union[float, Any] = 0.0,
+               cost_per_km: Union[float, Any] = 10.0,
+               baggage_percent: Union[float, Any] = 0.0, row_version: int = 0) -> None:
+        """Добавить пункт в конец последовательности"""
+        self.ids.append(id if id is not None else 0)
+        self.point_ids.append(point_id)
+        self.point_names.append(point_name)
+        self.sequence_numbers.append(sequence_number)
+        self.distances.append(float(distance_km))
+        self.roundings.append(float(rounding))
+        self.costs.append(float(cost_per_km))
+        self.baggage_percents.append(float(baggage_percent))
+        self.row_versions.append(row_version)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __bool__(self) -> bool:
+        return len(self.ids) > 0
+
+    def __getitem__(self, index: int) -> RouteStop:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("RouteSequence index out of range")
+        return RouteStop(
+            self.ids[index] or None, self.route_id, self.point_ids[index],
+            self.point_names[index], self.sequence_numbers[index],
+            self.distances[index], self.roundings[index], self.costs[index],
+            self.baggage_percents[index]
+        )
+
+    def __iter__(self) -> Iterator[RouteStop]:
+        for index in range(len(self)):
+            yield self[index]
+
+    # Параметры тарифа маршрута берутся из первого пункта
+    @property
+    def cost_per_km(self) -> float:
+        return self.costs[0] if self.costs else 10.0
+
+    @property
+    def rounding(self) -> float:
+        return self.roundings[0] if self.roundings else 0.0
+
+    @property
+    def baggage_percent(self) -> float:
+        return self.baggage_percents[0] if self.baggage_percents else 0.0
+
+    def index_of(self, seq_id: int) -> int:
+        """Позиция пункта по ID записи route_sequence (-1 если нет)"""
+        try:
+            return self.ids.index(seq_id)
+        except ValueError:
+            return -1
+
+    def as_numpy(self):
+        """
+        Колонки в виде массивов NumPy без копирования (через буфер array).
+
+        Raises:
+            ImportError: Если NumPy не установлен
+        """
+        import numpy as np
+        return {
+            'ids': np.frombuffer(self.ids, dtype=np.int64),
+            'distances': np.frombuffer(self.distances, dtype=np.float64),
+            'roundings': np.frombuffer(self.roundings, dtype=np.float64),
+            'costs': np.frombuffer(self.costs, dtype=np.float64),
+            'baggage_percents': np.frombuffer(self.baggage_percents, dtype=np.float64),
+        }
@@ -0,0 +1,99 @@
+"""
+Данные для бенчмарков: синтетическая сеть в SQLite или локальном PostgreSQL
+
+Размер сети задаётся переменными окружения BENCH_POINTS, BENCH_ROUTES
+(по умолчанию 10000 пунктов и 200 маршрутов по 5-400 остановок).
+BENCH_BACKEND=postgresql использует тестовую БД из BENCH_DSN (в имени БД
+должна быть пометка test, bench или load: бенчмарки меняют порядок пунктов);
+пустая БД заполняется генератором, заполненная используется как есть.
+"""
+import csv
+import os
+
+import pytest
+
+from tools.datagen import NetworkSpec, generate_network
+from tools.load_test import is_test_database
+from utils.export_cache import export_cache
+
+IMPORT_ROWS = 5000
+
+
+@pytest.fixture(autouse=True)
+def no_export_cache(tmp_path, monkeypatch):
+    """Замеры выгрузки - без кэша документов (пустой каталог, запись отключена)"""
+    monkeypatch.setattr(export_cache, 'directory', tmp_path / "export_cache")
+    monkeypatch.setattr(export_cache, 'max_bytes', 0)
+
+
+@pytest.fixture(scope="session")
+def network_spec():
+    return NetworkSpec(points=int(os.getenv('BENCH_POINTS', 10000)),
+                       routes=int(os.getenv('BENCH_ROUTES', 200)))
+
+
+@pytest.fixture(scope="session")
+def network_db(tmp_path_factory, network_spec):
+    if os.getenv('BENCH_BACKEND') == 'postgresql':
+        from core.database import Database
+        dsn = os.getenv('BENCH_DSN')
+        if not dsn or not is_test_database(dsn):
+            pytest.fail("BENCH_BACKEND=postgresql: задайте в BENCH_DSN строку подключения "
+                        "к тестовой БД (в имени test, bench или load) - бенчмарки меняют данные")
+        db = Database(dsn)
+        if not db.get_all_points():
+            generate_network(db, network_spec)
+    else:
+        from core.sqlite_database import SQLiteDatabase
+        db = SQLiteDatabase(tmp_path_factory.mktemp("bench") / "network.db")
+        generate_network(db, network_spec)
+    yield db
+    db.close()
+
+
+@pytest.fixture(scope="session")
+def routes_by_size(network_db):
+    """Маршруты по убыванию числа остановок"""
+    return sorted(network_db.get_all_routes(), key=lambda route: route['points_count'],
+                  reverse=True)
+
+
+@pytest.fixture(scope="session")
+def longest_route(network_db, routes_by_size):
+    return network_db.get_route_sequence_model(routes_by_size[0]['id'])
+
+
+@pytest.fixture(scope="session")
+def printable_route(network_db, routes_by_size):
+    """Маршрут, таблица стоимости которого помещается на лист (до 25 пунктов)"""
+    route = next(r for r in routes_by_size if r['points_count'] <= 25)
+    return network_db.get_route_sequence_model(route['id'])
+
+
+@pytest.fixture(scope="session")
+def import_rows(network_db):
+    names = [point['name'] for point in network_db.get_all_points()[:IMPORT_ROWS]]
+    return [(name, f"{10 + index * 0.5:.1f}") for index, name in enumerate(names)]
+
+
+@pytest.fixture(scope="session")
+def import_csv(tmp_path_factory, import_rows):
+    path = tmp_path_factory.mktemp("import") / "points.csv"
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['Пункт назначения', 'Расстояние (км)'])
+        writer.writerows(import_rows)
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def import_xlsx(tmp_path_factory, import_rows):
+    from openpyxl import Workbook
+    path = tmp_path_factory.mktemp("import") / "points.xlsx"
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['Пункт назначения', 'Расстояние (км)'])
+    for row in import_rows:
+        ws.append(list(row))
+    wb.save(path)
+    return str(path)
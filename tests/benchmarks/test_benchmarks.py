@@ -0,0 +1,101 @@
+"""
+Бенчмарки расчёта тарифов, экспорта, импорта и запросов к БД
+
+Запуск и сохранение базовой линии (файлы хранятся в репозитории):
+    pytest tests/benchmarks --benchmark-storage=tests/benchmarks/baselines --benchmark-save=baseline
+
+Сравнение с базовой линией, падение при замедлении медианы более чем на 10%:
+    pytest tests/benchmarks --benchmark-storage=tests/benchmarks/baselines \\
+        --benchmark-compare --benchmark-compare-fail=median:10%
+
+pytest-benchmark ищет базовую линию в каталоге своей платформы и версии
+Python. Сохранённая линия (baselines/Linux-CPython-3.9-64bit) снята на
+Python 3.9.18, как у сборки, из чистой копии репозитория (commit_info в
+файле) на виртуальной машине Linux x86_64 с одним ядром Intel Xeon
+2.1 ГГц, с сетью по умолчанию (10000 пунктов, 200 маршрутов). Сравнивать
+с ней имеет смысл на той же машине; на другой сначала сохраните свою.
+"""
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from core import fare_engine  # noqa: E402
+from ui.services import ImportService  # noqa: E402
+from utils.export_cache import export_cache  # noqa: E402
+from utils.exporter import TariffExporter  # noqa: E402
+
+GRID_INFO = {
+    'grid_number': "S1", 'grid_name': "Бенчмарк", 'passenger_tariff': 3.5,
+    'child_discount_percent': 50, 'benefit_discount_percent': 50,
+}
+
+
+class TestFareBenchmarks:
+    def test_calculate_tariffs(self, benchmark):
+        distances = [index * 0.7 for index in range(10000)]
+
+        def run():
+            for distance in distances:
+                fare_engine.calculate_tariffs(distance, 3.5, 15.0, 1.0, False)
+
+        benchmark(run)
+
+    def test_fare_matrix_longest_route(self, benchmark, longest_route):
+        matrix = benchmark(fare_engine.fare_matrix, longest_route)
+        assert len(matrix) == len(longest_route)
+
+    def test_tariffs_data_longest_route(self, benchmark, longest_route):
+        benchmark(TariffExporter.build_tariffs_data, longest_route)
+
+
+class TestExportBenchmarks:
+    def test_export_pdf(self, benchmark, printable_route, tmp_path):
+        filename = str(tmp_path / "table.pdf")
+        benchmark(TariffExporter.export_tariff_table, GRID_INFO, printable_route, {}, None,
+                  filename)
+
+    def test_export_xlsx(self, benchmark, printable_route, tmp_path):
+        filename = str(tmp_path / "table.xlsx")
+        benchmark(TariffExporter.export_tariff_excel, GRID_INFO, printable_route, {}, None,
+                  filename)
+
+    def test_export_pdf_cached(self, benchmark, printable_route, tmp_path, monkeypatch):
+        """Повторная выгрузка неизменённого маршрута из кэша"""
+        monkeypatch.setattr(export_cache, 'max_bytes', 64 * 1024 * 1024)
+        filename = str(tmp_path / "table.pdf")
+        TariffExporter.export_tariff_table(GRID_INFO, printable_route, {}, None, filename)
+        benchmark(TariffExporter.export_tariff_table, GRID_INFO, printable_route, {}, None,
+                  filename)
+
+
+class TestImportBenchmarks:
+    def test_import_csv(self, benchmark, import_csv, import_rows):
+        rows = benchmark(ImportService.import_from_csv, import_csv,
+                         ImportService.detect_delimiter(import_csv))
+        assert len(rows) == len(import_rows)
+
+    def test_import_xlsx(self, benchmark, import_xlsx, import_rows):
+        rows = benchmark(ImportService.import_from_excel, import_xlsx)
+        assert len(rows) == len(import_rows)
+
+
+class TestDatabaseBenchmarks:
+    def test_route_sequence_read(self, benchmark, network_db, routes_by_size):
+        benchmark(network_db.get_route_sequence_model, routes_by_size[0]['id'])
+
+    def test_reorder_longest_route(self, benchmark, network_db, routes_by_size):
+        route_id = routes_by_size[0]['id']
+        ids = list(network_db.get_route_sequence_model(route_id).ids)
+
+        def reverse():
+            ids.reverse()
+            network_db.reorder_route_sequence(route_id, ids)
+
+        benchmark(reverse)
+
+    def test_search_points(self, benchmark, network_db):
+        result = benchmark(network_db.search_points, "ово")
+        assert result
+
+    def test_routes_list(self, benchmark, network_db):
+        benchmark(network_db.get_all_routes)
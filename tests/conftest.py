@@ -0,0 +1,118 @@
+"""
+Общие фикстуры тестов
+
+Тесты с настоящим PostgreSQL запускаются, если в TARIFF_TEST_DSN задана
+строка подключения к отдельной тестовой БД (в имени БД должно быть
+"test": фикстура очищает таблицы). Без переменной они пропускаются.
+
+db - пустая локальная БД SQLite, route - маршрут из трёх пунктов в ней.
+
+network_db - локальная БД с сетью tools.datagen по спецификации
+network_spec. Другую сеть модуль задаёт своей фикстурой network_spec или
+параметризацией: @pytest.mark.parametrize("network_spec", [NetworkSpec(...)]).
+"""
+import os
+
+import pytest
+
+from core.sqlite_database import SQLiteDatabase
+from tools.datagen import NetworkSpec, generate_network
+
+TEST_DSN_VARIABLE = 'TARIFF_TEST_DSN'
+
+# Исходная схема сервера (до core.migrations)
+BASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS routes (
+    id SERIAL PRIMARY KEY,
+    route_number TEXT NOT NULL UNIQUE,
+    route_name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS route_sequence (
+    id SERIAL PRIMARY KEY,
+    route_id INTEGER NOT NULL REFERENCES routes(id) ON DELETE CASCADE,
+    point_id INTEGER NOT NULL REFERENCES points(id),
+    sequence_number INTEGER NOT NULL,
+    distance_km NUMERIC NOT NULL DEFAULT 0,
+    rounding NUMERIC NOT NULL DEFAULT 0,
+    cost_per_km NUMERIC NOT NULL DEFAULT 10,
+    baggage_percent NUMERIC NOT NULL DEFAULT 0,
+    UNIQUE (route_id, point_id),
+    UNIQUE (route_id, sequence_number)
+);
+"""
+
+
+@pytest.fixture(scope="session")
+def pg_dsn():
+    dsn = os.getenv(TEST_DSN_VARIABLE)
+    if not dsn:
+        pytest.skip(f"{TEST_DSN_VARIABLE} не задана: нет тестового PostgreSQL")
+    from psycopg2.extensions import parse_dsn
+    if 'test' not in parse_dsn(dsn).get('dbname', ''):
+        pytest.fail(f"{TEST_DSN_VARIABLE}: в имени БД нет 'test', таблицы не будут очищены")
+
+    from core.database import Database, DatabaseError
+    try:
+        admin = Database(dsn, check_schema=False)
+    except DatabaseError as e:
+        pytest.skip(str(e))
+    try:
+        with admin.conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('points') IS NULL")
+            if cur.fetchone()[0]:
+                cur.execute(BASE_SCHEMA)
+        admin.conn.commit()
+        admin.apply_migrations()
+    except DatabaseError as e:
+        pytest.skip(f"Схема тестовой БД не обновлена: {e}")
+    finally:
+        admin.close()
+    return dsn
+
+
+@pytest.fixture
+def pg_db(pg_dsn):
+    """Database на пустой тестовой БД PostgreSQL"""
+    from core.database import Database
+    db = Database(pg_dsn)
+    with db.conn.cursor() as cur:
+        cur.execute("TRUNCATE points, routes, route_sequence, route_sequence_versions, "
+                    "deleted_rows RESTART IDENTITY CASCADE")
+    db.conn.commit()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Фикстура с пустой локальной БД во временном каталоге"""
+    database = SQLiteDatabase(tmp_path / "tariffs.db")
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def route(db):
+    """Маршрут из трёх пунктов"""
+    route_id = db.add_route("101", "Курган — Варгаши")
+    for name, distance in [("Курган", 0.0), ("Варгаши", 45.0), ("Мокроусово", 120.0)]:
+        db.add_point_to_route(route_id, db.add_point(name), distance, 1.0, 3.5, 10.0)
+    return route_id
+
+
+@pytest.fixture
+def network_spec():
+    return NetworkSpec(points=200, routes=6, min_stops=2, max_stops=30, seed=3)
+
+
+@pytest.fixture
+def network_db(tmp_path, network_spec):
+    """SQLiteDatabase со сгенерированной сетью network_spec"""
+    database = SQLiteDatabase(str(tmp_path / "network.db"))
+    generate_network(database, network_spec)
+    yield database
+    database.close()
@@ -0,0 +1,27 @@
+"""
+Тесты загрузки конфигурации
+"""
+import copy
+import json
+
+from core import config
+
+
+def test_load_config_keeps_defaults(tmp_path, monkeypatch):
+    """Значения из config.json не меняют DEFAULT_CONFIG"""
+    defaults = copy.deepcopy(config.DEFAULT_CONFIG)
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({
+        'database': {'sync_interval_sec': 5},
+        'performance': {'fare_cache_mb': 16},
+        'logging': {'console_level': 'DEBUG', 'levels': {'core.sync': 'DEBUG'}},
+    }), encoding='utf-8')
+    monkeypatch.setattr(config, 'CONFIG_FILE', path)
+
+    loaded = config.load_config()
+    assert loaded['performance']['fare_cache_mb'] == 16
+    assert loaded['logging']['levels']['core.sync'] == 'DEBUG'
+    assert config.DEFAULT_CONFIG == defaults
+
+    path.write_text("{}", encoding='utf-8')
+    assert config.load_config() == defaults
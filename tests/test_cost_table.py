@@ -0,0 +1,117 @@
+"""
+Тесты таблицы стоимости: ленивая модель матрицы, потоковая запись текста
+и разбиение на страницы
+"""
+import io
+from collections import namedtuple
+
+from PyQt5.QtCore import Qt
+
+from core import fare_engine
+from models import RouteSequence
+from ui import cost_table_dialog
+from ui.cost_table_dialog import CostMatrixModel
+from utils import cost_tiles
+from utils.cost_tiles import CostTableTiles, FareGridTiles, paginate
+from utils.export_cache import export_cache
+from utils.exporter import TariffExporter
+
+Row = namedtuple('Row', 'id route_id point_id point_name sequence_number '
+                        'distance_km rounding cost_per_km baggage_percent')
+
+
+def make_sequence(count):
+    return RouteSequence.from_rows([
+        Row(i + 1, 1, i + 1, f"Пункт {i}", i + 1, i * 7.5, 1.0, 3.2, 20.0)
+        for i in range(count)
+    ])
+
+
+class TestCostMatrixModel:
+    def test_cells_below_diagonal(self):
+        sequence = make_sequence(5)
+        model = CostMatrixModel(sequence)
+        tariffs = fare_engine.calculate_tariffs(22.5, 3.2, 20.0, 1.0)
+        assert model.cell(3, 0) == (tariffs['passenger'], tariffs['passenger'] / 2,
+                                    tariffs['baggage'])
+        assert model.data(model.index(0, 3)) == ""
+        assert model.headerData(2, Qt.Horizontal) == "Пункт 2"
+
+    def test_blocks_computed_on_demand_and_bounded(self, monkeypatch):
+        monkeypatch.setattr(cost_table_dialog, 'BLOCK_SIZE', 4)
+        monkeypatch.setattr(cost_table_dialog, 'MAX_BLOCKS', 2)
+        model = CostMatrixModel(make_sequence(20))
+        model.cell(1, 0)
+        model.cell(3, 2)
+        assert model.blocks_computed == 1
+        model.cell(9, 5)
+        model.cell(19, 0)
+        assert model.blocks_computed == 3 and len(model._blocks) == 2
+        # Вытесненный блок считается заново
+        model.cell(1, 0)
+        assert model.blocks_computed == 4
+
+
+class TestCostTableText:
+    def test_rows_per_stop(self):
+        out = io.StringIO()
+        TariffExporter.write_cost_table_text(out, make_sequence(3), "12", "Курган — Варгаши")
+        lines = out.getvalue().splitlines()
+        assert lines[2].startswith("в автобусе общего типа по маршруту 12 — Курган — Варгаши")
+        assert lines[5] == "Пункт 0"
+        # Остановка 2: три строки по двум пунктам отправления и название с отступом
+        assert lines[11:14] == ["  48.00   24.00", "  24.00   12.00", "  10.00    5.00"]
+        assert lines[14] == " " * 16 + "Пункт 2"
+        assert lines[-1] == "Руководитель АТП __________"
+
+
+class TestPagination:
+    def test_tiles_cover_matrix(self):
+        tiles = paginate(7, 3, 4)
+        assert [(t.rows, t.columns) for t in tiles[:3]] == [
+            (range(0, 3), range(0, 4)), (range(3, 6), range(0, 4)), (range(6, 7), range(0, 4))]
+        assert len(tiles) == 6
+        assert sum(len(t.rows) * len(t.columns) for t in tiles) == 49
+
+    def test_lower_triangle_skips_empty_tiles(self):
+        tiles = paginate(8, 2, 2, lower_triangle=True)
+        assert all(t.columns.start < t.rows.stop - 1 for t in tiles)
+        # Все ячейки ниже диагонали попадают ровно на одну страницу
+        cells = [(r, c) for t in tiles for r in t.rows for c in t.columns if c < r]
+        assert sorted(cells) == [(r, c) for r in range(8) for c in range(r)]
+
+    def test_tile_texts_cached(self, monkeypatch):
+        monkeypatch.setattr(cost_tiles, 'tile_cache', cost_tiles.TileCache())
+        tiles = CostTableTiles(make_sequence(6))
+        tile = tiles.paginate(3, 3)[-1]
+        cells = tiles.cells(tile)
+        assert (tile.rows, tile.columns) == (range(3, 6), range(3, 6))
+        assert cells[0][0] == ""
+        expected = CostMatrixModel(make_sequence(6)).cell(5, 4)
+        assert cells[2][1] == "{:.2f}\n{:.2f}\n{:.2f}".format(*expected)
+        # Другое окно того же маршрута получает готовые тексты
+        assert CostTableTiles(make_sequence(6)).cells(tile) is cells
+
+    def test_grid_tiles_match_tariffs_data(self, monkeypatch):
+        """Ячейки PDF из кэша плиток совпадают с полной таблицей build_tariffs_data"""
+        monkeypatch.setattr(cost_tiles, 'tile_cache', cost_tiles.TileCache())
+        sequence = make_sequence(9)
+        tariffs_data = TariffExporter.build_tariffs_data(sequence, round_up=True)
+        tiles = FareGridTiles(sequence, round_up=True)
+        pages = tiles.paginate(4, 4)
+        assert len(pages) == 9
+        for tile in pages:
+            assert tiles.cells(tile) == [[TariffExporter._cell_text(tariffs_data[i][j + 1])
+                                          for j in tile.columns] for i in tile.rows]
+        # Тексты таблицы стоимости и сетки хранятся под разными ключами
+        assert CostTableTiles(sequence, round_up=True).cells(pages[0]) != tiles.cells(pages[0])
+
+    def test_pdf_pages(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(export_cache, 'directory', tmp_path / 'cache')
+        grid_info = {'grid_number': '1', 'grid_name': 'Тест', 'passenger_tariff': 3.2,
+                     'child_discount_percent': 50, 'benefit_discount_percent': 50}
+        filename = str(tmp_path / 'table.pdf')
+        TariffExporter.export_tariff_table(grid_info, make_sequence(25), {}, None, filename)
+        # 25 пунктов: 2 полосы строк x 3 полосы столбцов
+        with open(filename, 'rb') as f:
+            assert f.read().count(b'/Type /Page\n') == 6
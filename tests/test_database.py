@@ -1,23 +1,42 @@
 """
 Тесты для модуля database.py
 """
+import csv
+import io
+import random
+
+import psycopg2
 import pytest
-from unittest.mock import Mock, patch
-from database import Database, DatabaseError
+from unittest.mock import MagicMock, patch
+from core.database import Database, DatabaseError, SchemaVersionError
+from core.fare_export import _write_fares
+from models import SORT_KEY_GAP
 
 class TestDatabase:
     @pytest.fixture
     def db(self):
         """Фикстура для создания экземпляра Database"""
-        with patch('psycopg2.connect') as mock_connect:
-            mock_conn = Mock()
+        with patch('psycopg2.connect') as mock_connect, \
+                patch('core.migrations.pending_postgres_migrations', return_value=[]):
+            mock_conn = MagicMock()
+            mock_conn.closed = 0
             mock_connect.return_value = mock_conn
             db = Database()
             yield db
     
+    def test_outdated_schema_refuses_connection(self):
+        """Клиент не выполняет DDL и не работает со схемой без миграций"""
+        with patch('psycopg2.connect') as mock_connect, \
+                patch('core.migrations.pending_postgres_migrations', return_value=[3, 4]), \
+                patch('core.migrations.apply_postgres_migrations') as apply:
+            with pytest.raises(SchemaVersionError, match="tools.migrate"):
+                Database()
+            mock_connect.return_value.close.assert_called_once()
+            apply.assert_not_called()
+    
     def test_get_all_points_success(self, db):
         """Тест успешного получения всех пунктов"""
-        mock_cursor = Mock()
+        mock_cursor = MagicMock()
         mock_cursor.fetchall.return_value = [
             {'id': 1, 'name': 'Курган'},
             {'id': 2, 'name': 'Варгаши'}
@@ -30,7 +49,7 @@ class TestDatabase:
     
     def test_get_all_points_empty(self, db):
         """Тест получения пустого списка пунктов"""
-        mock_cursor = Mock()
+        mock_cursor = MagicMock()
         mock_cursor.fetchall.return_value = []
         
         with patch.object(db.conn, 'cursor', return_value=mock_cursor):
@@ -39,7 +58,8 @@ class TestDatabase:
     
     def test_add_point_duplicate(self, db):
         """Тест добавления дубликата пункта"""
-        mock_cursor = Mock()
+        mock_cursor = MagicMock()
+        mock_cursor.__enter__.return_value = mock_cursor
         mock_cursor.fetchone.side_effect = [(1, 'Курган'), None]
         
         with patch.object(db.conn, 'cursor', return_value=mock_cursor):
@@ -57,4 +77,255 @@ class TestDatabase:
         )
         
         assert result['passenger'] == 1000.0  # 100 * 10
-        assert result['baggage'] == 500.0  # 100 * 10 * 0.5
\ No newline at end of file
+        assert result['baggage'] == 500.0  # 100 * 10 * 0.5
+    
+    def test_copy_fares_csv_streams_from_server(self, db):
+        """Тарифы выгружаются одним COPY TO STDOUT с подставленными параметрами"""
+        mock_cursor = MagicMock()
+        mock_cursor.__enter__.return_value = mock_cursor
+        mock_cursor.mogrify.side_effect = lambda query, params: query.encode()
+        mock_cursor.rowcount = 42
+        out = MagicMock()
+        
+        with patch.object(db.conn, 'cursor', return_value=mock_cursor):
+            assert db.copy_fares_csv(out, [3, 5], round_up=True) == 42
+        
+        query, params = mock_cursor.mogrify.call_args[0]
+        assert "TO STDOUT" in query and "ceil(passenger / step)" in query
+        assert params['route_ids'] == [3, 5]
+        mock_cursor.copy_expert.assert_called_once_with(query.encode(), out)
+    
+    def test_copy_route_points_imports_in_one_transaction(self, db):
+        """Файл идёт через COPY во временную таблицу, ошибки строк читаются из import_errors"""
+        mock_cursor = MagicMock()
+        mock_cursor.__enter__.return_value = mock_cursor
+        mock_cursor.fetchall.return_value = [("Строка 4: Этот пункт уже добавлен в маршрут",)]
+        mock_cursor.rowcount = 2
+        copied = []
+        mock_cursor.copy_expert.side_effect = lambda query, file: copied.append(file.read())
+        source = io.StringIO('1,Курган,0\n2,"Варгаши, центр",45\n\n3,Шадринск\n4,Курган,90\n')
+        params = {'rounding': 0.0, 'cost_per_km': 2.5, 'baggage_percent': 0.0}
+        
+        with patch.object(db.conn, 'cursor', return_value=mock_cursor), \
+                patch('core.database.execute_values') as insert_errors:
+            rows, imported, errors = db.copy_route_points(7, source, 3, 1, 2, params, ',')
+        
+        assert (rows, imported) == (4, 2)
+        assert errors == ["Строка 4: Этот пункт уже добавлен в маршрут"]
+        assert "COPY import_staging (line, name, distance)" in mock_cursor.copy_expert.call_args[0][0]
+        # Строка с другим числом столбцов не попадает в COPY, а становится ошибкой строки
+        assert copied == ['2,Курган,0\n3,"Варгаши, центр",45\n6,Курган,90\n']
+        assert insert_errors.call_args[0][2] == [(5, "Строка 5: неверное число столбцов (2 вместо 3)")]
+        assert mock_cursor.execute.call_args[0][0].startswith("DROP TABLE import_staging")
+        db.conn.commit.assert_called()
+
+
+class TestDatabasePostgres:
+    """Запросы на настоящем PostgreSQL (TARIFF_TEST_DSN, см. conftest)"""
+
+    @pytest.mark.parametrize("round_up", [False, True])
+    def test_copy_fares_csv_matches_fare_engine(self, pg_db, round_up):
+        """Тарифы, посчитанные сервером в COPY, совпадают с fare_engine до копейки"""
+        rng = random.Random(46)
+        point_ids = [pg_db.add_point(f"Пункт {index}") for index in range(40)]
+        for number, rounding in enumerate([0.0, 0.5, 1.0, 5.0, 10.0], 101):
+            route_id = pg_db.add_route(str(number), f"Маршрут {number}")
+            cost_per_km = rng.choice([2.52, 3.33, 1.75, 4.1, 10.0])
+            baggage_percent = rng.choice([0.0, 10.0, 15.0, 33.0])
+            distance = 0.0
+            for point_id in rng.sample(point_ids, 12):
+                pg_db.add_point_to_route(route_id, point_id, round(distance, 2), rounding,
+                                         cost_per_km, baggage_percent)
+                distance += rng.uniform(0.5, 40.0)
+
+        out = io.BytesIO()
+        pairs = pg_db.copy_fares_csv(out, round_up=round_up)
+        expected = io.StringIO()
+        assert _write_fares(pg_db, csv.writer(expected, delimiter=';', lineterminator='\n'),
+                            None, round_up, None) == pairs == 5 * 66
+        assert out.getvalue().decode().splitlines() == expected.getvalue().splitlines()
+
+    def test_changes_since_include_late_commit(self, pg_db, pg_dsn):
+        """Строки транзакции, зафиксированной после выгрузки, приходят следующей выгрузкой"""
+        pg_db.add_point("Курган")
+        first = pg_db.get_changes_since(None)
+        assert [row[1] for row in first['points']] == ["Курган"]
+
+        writer = Database(pg_dsn)
+        try:
+            with writer.conn.cursor() as cur:
+                cur.execute("INSERT INTO points (name) VALUES ('Варгаши')")
+                cur.execute("DELETE FROM points WHERE name = 'Курган'")
+            # Транзакция ещё открыта: её строки не видны, отметка их не перешагивает
+            second = pg_db.get_changes_since(first['watermark'])
+            assert second['points'] == [] and second['deleted'] == []
+            writer.conn.commit()
+        finally:
+            writer.close()
+
+        third = pg_db.get_changes_since(second['watermark'])
+        assert [row[1] for row in third['points']] == ["Варгаши"]
+        assert [table for table, _ in third['deleted']] == ["points"]
+
+    def test_sequence_number_follows_order_for_older_clients(self, pg_db, pg_dsn):
+        """Старый клиент видит номер = позиции пункта и переставляет пункты номерами"""
+        route_id = pg_db.add_route("101", "Курган — Шадринск")
+        names = ["Курган", "Варгаши", "Мишкино", "Шадринск"]
+        ids = {}
+        for distance, name in enumerate(names):
+            ids[name] = pg_db.add_point_to_route(route_id, pg_db.add_point(name), distance * 10.0,
+                                                 1.0, 2.5, 0.0)
+        # Клиент предыдущей версии: путь поиска базы по умолчанию
+        old = psycopg2.connect(pg_dsn)
+
+        def order():
+            with old.cursor() as cur:
+                cur.execute("SELECT p.name, rs.sequence_number FROM route_sequence rs "
+                            "JOIN points p ON p.id = rs.point_id "
+                            "WHERE rs.route_id = %s ORDER BY rs.sequence_number", (route_id,))
+                rows = cur.fetchall()
+            old.commit()
+            assert [row[1] for row in rows] == list(range(1, len(rows) + 1))
+            return [row[0] for row in rows]
+
+        def keys():
+            with pg_db.conn.cursor() as cur:
+                cur.execute("SELECT sort_key, sequence_number FROM route_sequence "
+                            "WHERE route_id = %s ORDER BY sort_key, id", (route_id,))
+                rows = cur.fetchall()
+            pg_db.conn.commit()
+            # Номер в таблице - только черновик незафиксированной перестановки
+            assert all(row[1] is None for row in rows)
+            return [row[0] for row in rows]
+
+        try:
+            # Новый клиент: вставка между ключами соседей
+            pg_db.insert_point_at(route_id, 2, pg_db.add_point("Лебяжье"), 5.0, 1.0, 2.5, 0.0)
+            assert order() == ["Курган", "Лебяжье", "Варгаши", "Мишкино", "Шадринск"]
+
+            with old.cursor() as cur:
+                # Старый клиент: перестановка через временные номера (reorder_route_sequence)
+                cur.execute("SELECT id FROM route_sequence WHERE route_id = %s "
+                            "ORDER BY sequence_number", (route_id,))
+                new_order = [row[0] for row in cur.fetchall()]
+                new_order[2], new_order[3] = new_order[3], new_order[2]
+                for position, seq_id in enumerate(new_order, 105):
+                    cur.execute("UPDATE route_sequence SET sequence_number = %s WHERE id = %s",
+                                (position, seq_id))
+                for position, seq_id in enumerate(new_order, 1):
+                    cur.execute("UPDATE route_sequence SET sequence_number = %s WHERE id = %s",
+                                (position, seq_id))
+            old.commit()
+            assert order() == ["Курган", "Лебяжье", "Мишкино", "Варгаши", "Шадринск"]
+            # Ключи переставлены, а не заменены на номер * шаг
+            sort_keys = keys()
+            assert sorted(sort_keys) == sort_keys
+            assert len(set(key % SORT_KEY_GAP for key in sort_keys)) > 1
+
+            with old.cursor() as cur:
+                # Старый клиент: перемещение через временный номер (update_route_sequence_number)
+                cur.execute("UPDATE route_sequence SET sequence_number = 106 WHERE id = %s",
+                            (ids["Шадринск"],))
+                cur.execute("UPDATE route_sequence SET sequence_number = sequence_number + 1 "
+                            "WHERE route_id = %s AND sequence_number >= 2 "
+                            "AND sequence_number < 5", (route_id,))
+                cur.execute("UPDATE route_sequence SET sequence_number = 2 WHERE id = %s",
+                            (ids["Шадринск"],))
+            old.commit()
+            assert order() == ["Курган", "Шадринск", "Лебяжье", "Мишкино", "Варгаши"]
+            keys()
+
+            last_point_id = pg_db.add_point("Далматово")
+            with old.cursor() as cur:
+                # Старый клиент: удаление со сдвигом номеров (remove_point_from_route)
+                cur.execute("DELETE FROM route_sequence WHERE id = %s", (ids["Мишкино"],))
+                cur.execute("UPDATE route_sequence SET sequence_number = sequence_number - 1 "
+                            "WHERE route_id = %s AND sequence_number > 4", (route_id,))
+                # и добавление в конец по номеру
+                cur.execute("INSERT INTO route_sequence (route_id, point_id, sequence_number, "
+                            "distance_km, rounding, cost_per_km, baggage_percent) "
+                            "VALUES (%s, %s, 5, 70.0, 1.0, 2.5, 0.0)", (route_id, last_point_id))
+            old.commit()
+            assert order() == ["Курган", "Шадринск", "Лебяжье", "Варгаши", "Далматово"]
+            keys()
+            route = next(row for row in pg_db.get_all_routes() if row['id'] == route_id)
+            assert route['points_count'] == 5
+
+            pg_db.remove_point_from_route(ids["Курган"])
+            assert order() == ["Шадринск", "Лебяжье", "Варгаши", "Далматово"]
+        finally:
+            old.close()
+
+    def test_new_client_writes_change_one_row(self, pg_db):
+        """Вставка, перемещение и удаление не меняют соседние пункты маршрута"""
+        route_id = pg_db.add_route("101", "Курган — Шадринск")
+        for distance in range(50):
+            pg_db.add_point_to_route(route_id, pg_db.add_point(f"Пункт {distance}"),
+                                     distance * 2.0, 1.0, 2.5, 0.0)
+
+        def rows():
+            with pg_db.conn.cursor() as cur:
+                cur.execute("SELECT id, sequence_number, sort_key, row_version, "
+                            "updated_xid::text FROM route_sequence WHERE route_id = %s",
+                            (route_id,))
+                result = cur.fetchall()
+            pg_db.conn.commit()
+            return {row[0]: row[1:] for row in result}
+
+        point_id = pg_db.add_point("Курган")
+        before = rows()
+        watermark = pg_db.get_changes_since(None)['watermark']
+        first_id = pg_db.insert_point_at(route_id, 1, point_id, 0.0, 1.0, 2.5, 0.0)
+        after = rows()
+        assert after.pop(first_id)[0] is None
+        assert after == before
+        # Клиенты кэша забирают только вставленный пункт
+        changes = pg_db.get_changes_since(watermark)
+        assert [row[0] for row in changes['route_sequence']] == [first_id]
+
+        moved_id = min(before)
+        pg_db.update_route_sequence_number(moved_id, 30)
+        after = rows()
+        after.pop(first_id)
+        assert after.pop(moved_id)[1] != before.pop(moved_id)[1]
+        assert after == before
+        changes = pg_db.get_changes_since(changes['watermark'])
+        assert [row[0] for row in changes['route_sequence']] == [moved_id]
+
+        pg_db.remove_point_from_route(first_id)
+        assert rows().keys() == before.keys() | {moved_id}
+        changes = pg_db.get_changes_since(changes['watermark'])
+        assert changes['route_sequence'] == []
+        assert changes['deleted'] == [("route_sequence", first_id)]
+
+    def test_copy_route_points_reports_bad_rows(self, pg_db):
+        """Строки с другим числом столбцов и ошибочные строки не прерывают импорт"""
+        route_id = pg_db.add_route("101", "Курган — Шадринск")
+        pg_db.add_point_to_route(route_id, pg_db.add_point("Курган"), 0.0, 1.0, 2.5, 0.0)
+        source = io.StringIO(
+            "1;Варгаши;45,5\n"
+            "2;Мишкино\n"
+            "\n"
+            "3;  Шадринск  центр ;120\n"
+            "4;Курган;10\n"
+            "5;Далёкий;10000\n"
+            "6;Пункт назначения;Расстояние (км)\n"
+            "7;Шумиха;90;лишний\n"
+            "8;варгаши;50\n"
+        )
+        params = {'rounding': 1.0, 'cost_per_km': 2.5, 'baggage_percent': 10.0}
+
+        rows, imported, errors = pg_db.copy_route_points(
+            route_id, source, 3, 1, 2, params, ';', ['пункт назначения'])
+
+        assert (rows, imported) == (8, 2)
+        assert errors == [
+            "Строка 3: неверное число столбцов (2 вместо 3)",
+            "Строка 6: Этот пункт уже добавлен в маршрут",
+            "Строка 7: 'Далёкий' - Расстояние не может превышать 9999.99 км",
+            "Строка 9: неверное число столбцов (4 вместо 3)",
+            "Строка 10: Этот пункт уже добавлен в маршрут",
+        ]
+        sequence = pg_db.get_route_sequence(route_id)
+        assert [(row['point_name'], float(row['distance_km'])) for row in sequence] == \
+            [("Курган", 0.0), ("Варгаши", 45.5), ("Шадринск центр", 120.0)]
@@ -0,0 +1,55 @@
+"""
+Тесты кэша выгруженных документов
+"""
+import os
+
+from models import RouteSequence
+from utils import exporter
+from utils.export_cache import ExportCache
+
+GRID_INFO = {
+    'grid_number': "101", 'grid_name': "Курган — Варгаши", 'passenger_tariff': 3.5,
+    'child_discount_percent': 50, 'benefit_discount_percent': 50,
+}
+
+
+def _route(cost_per_km=3.5):
+    sequence = RouteSequence(1)
+    for position, (name, distance) in enumerate([("Курган", 0.0), ("Варгаши", 45.0),
+                                                 ("Мокроусово", 120.0)]):
+        sequence.append(position + 1, position + 1, name, position + 1, distance, 1.0,
+                        cost_per_km, 10.0)
+    return sequence
+
+
+class TestExportCache:
+    def test_key_depends_on_route_content(self):
+        assert ExportCache.key('pdf', _route()) == ExportCache.key('pdf', _route())
+        assert ExportCache.key('pdf', _route()) != ExportCache.key('pdf', _route(4.0))
+        assert ExportCache.key('pdf', _route()) != ExportCache.key('xlsx', _route())
+        assert ExportCache.key('ab', 'c') != ExportCache.key('a', 'bc')
+
+    def test_eviction_by_size(self, tmp_path):
+        cache = ExportCache(tmp_path / "cache", max_bytes=3500)
+        for index in range(3):
+            document = tmp_path / f"doc{index}"
+            document.write_bytes(b'x' * 1000)
+            cache.store(f"k{index}", str(document))
+            # Разные отметки доступа без ожидания
+            os.utime(cache.directory / f"k{index}", (index, index))
+        cache.fetch("k0", str(tmp_path / "copy"))
+        cache.store("k3", str(tmp_path / "doc0"))
+        assert sorted(os.listdir(cache.directory)) == ["k0", "k2", "k3"]
+
+    def test_unchanged_route_is_served_from_cache(self, tmp_path, monkeypatch):
+        cache = ExportCache(tmp_path / "cache")
+        monkeypatch.setattr(exporter, 'export_cache', cache)
+        first, second = str(tmp_path / "first.xlsx"), str(tmp_path / "second.xlsx")
+        exporter.TariffExporter.export_tariff_excel(GRID_INFO, _route(), {}, None, first)
+        exporter.TariffExporter.export_tariff_excel(GRID_INFO, _route(), {}, None, second)
+        assert (cache.hits, cache.misses) == (1, 1)
+        with open(first, 'rb') as a, open(second, 'rb') as b:
+            assert a.read() == b.read()
+
+        exporter.TariffExporter.export_tariff_excel(GRID_INFO, _route(4.0), {}, None, second)
+        assert cache.misses == 2
@@ -0,0 +1,75 @@
+"""
+Тесты кэша матриц тарифов
+"""
+from datetime import date, timedelta
+
+from core.fare_cache import FareCache
+from core.fare_engine import fare_matrix_kopecks
+from core.sqlite_database import SQLiteDatabase
+from models import RouteSequence
+
+
+def _route(route_id, stops, cost_per_km=2.0):
+    sequence = RouteSequence(route_id)
+    for position in range(stops):
+        sequence.append(position + 1, position + 1, f"Пункт {position}", position + 1,
+                        position * 10.0, 1.0, cost_per_km, 10.0)
+    return sequence
+
+
+class TestFareCache:
+    def test_matrix_is_reused_until_route_changes(self):
+        cache = FareCache()
+        sequence = _route(1, 10)
+        matrix = cache.matrix(sequence)
+        assert cache.matrix(sequence) is matrix
+        assert list(matrix) == list(fare_matrix_kopecks(sequence))
+
+        # Изменённые параметры дают новую матрицу даже без invalidate()
+        changed = _route(1, 10, cost_per_km=3.0)
+        assert cache.matrix(changed) is not matrix
+        assert cache.invalidate([1]) == 1
+        assert cache.size_bytes == 0
+
+    def test_unsaved_route_is_not_cached(self):
+        cache = FareCache()
+        sequence = _route(None, 10)
+        assert list(cache.matrix(sequence)) == list(fare_matrix_kopecks(sequence))
+        assert cache.size_bytes == 0
+
+    def test_eviction_by_size(self):
+        sequences = [_route(route_id, 20) for route_id in range(1, 4)]
+        matrix_bytes = len(fare_matrix_kopecks(sequences[0])) * 4
+        cache = FareCache(max_bytes=2 * matrix_bytes)
+        for sequence in sequences:
+            cache.matrix(sequence)
+        cache.matrix(sequences[1])
+        assert cache.size_bytes == 2 * matrix_bytes
+        assert cache.invalidate() == 2
+
+    def test_past_versions_survive_invalidate(self):
+        cache = FareCache()
+        past = date.today() - timedelta(days=30)
+        old = cache.matrix(_route(1, 10), as_of=past)
+        cache.matrix(_route(1, 10, cost_per_km=3.0))
+        assert cache.invalidate([1]) == 1
+        assert cache.matrix(_route(1, 10), as_of=past) is old
+
+    def test_network_rebuilt_after_data_change(self, tmp_path):
+        """Граф сети перестраивается после изменений своего и другого подключения"""
+        db = SQLiteDatabase(str(tmp_path / "tariffs.db"))
+        other = SQLiteDatabase(str(tmp_path / "tariffs.db"))
+        cache = FareCache()
+        route_id = db.add_route("101", "Курган — Варгаши")
+        for name, distance in [("Курган", 0.0), ("Варгаши", 45.0)]:
+            db.add_point_to_route(route_id, db.add_point(name), distance, 1.0, 3.5, 10.0)
+        network = cache.network(db)
+        assert cache.network(db) is network
+
+        db.add_route("102", "Курган — Кетово")
+        rebuilt = cache.network(db)
+        assert rebuilt is not network
+        other.delete_point(other.add_point("Кетово"))
+        assert cache.network(db) is not rebuilt
+        other.close()
+        db.close()
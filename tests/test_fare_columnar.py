@@ -0,0 +1,66 @@
+"""
+Тесты колоночной выгрузки тарифов (нужен pyarrow)
+"""
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.parquet as pq  # noqa: E402
+
+from core import fare_engine  # noqa: E402
+from core.fare_columnar import export_fares_columnar  # noqa: E402
+from core.fare_engine import fare_matrix_kopecks  # noqa: E402
+from models import RouteSequence  # noqa: E402
+
+
+def _expected_rows(db):
+    rows = []
+    for sequence in RouteSequence.group_rows(db.iter_route_sequences()):
+        fares = fare_matrix_kopecks(sequence)
+        names, distances = sequence.point_names, sequence.distances
+        k = 0
+        for i in range(1, len(sequence)):
+            for j in range(i):
+                rows.append((sequence.route_id, names[j], names[i], distances[i] - distances[j],
+                             fares[k], fares[k + 1], fares[k + 2]))
+                k += 3
+    return rows
+
+
+class TestFareColumnar:
+    def test_parquet_matches_fare_engine(self, network_db, tmp_path):
+        filename = str(tmp_path / "fares.parquet")
+        result = export_fares_columnar(network_db, filename, row_group_rows=100)
+        table = pq.read_table(filename)
+
+        assert pa.types.is_dictionary(table.schema.field('from_point').type)
+        assert result.row_groups == pq.ParquetFile(filename).num_row_groups > 1
+        columns = table.to_pydict()
+        rows = list(zip(columns['route_id'], columns['from_point'], columns['to_point'],
+                        columns['distance'], columns['passenger'], columns['child'],
+                        columns['baggage']))
+        assert rows == _expected_rows(network_db)
+        assert columns['benefit'] == columns['child']
+        assert result.pairs == table.num_rows
+
+    def test_benefit_differs_from_child(self, network_db, tmp_path, monkeypatch):
+        """Льготный тариф считается от пассажирского, как детский в fare_engine"""
+        monkeypatch.setattr(fare_engine, 'BENEFIT_FARE_PERCENT', 35)
+        filename = str(tmp_path / "fares.parquet")
+        export_fares_columnar(network_db, filename)
+        columns = pq.read_table(filename).to_pydict()
+        assert columns['benefit'] == [round(value / 100 * 0.35 * 100)
+                                      for value in columns['passenger']]
+        assert columns['benefit'] != columns['child']
+
+    def test_arrow_file_plain_names(self, network_db, tmp_path):
+        filename = str(tmp_path / "fares.arrow")
+        export_fares_columnar(network_db, filename, dictionary_names=False)
+        with pa.memory_map(filename) as source:
+            table = pa.ipc.open_file(source).read_all()
+        assert table.schema.field('to_point').type == pa.string()
+        assert table.num_rows == len(_expected_rows(network_db))
+        assert table.schema.metadata[b'round_up'] == b'false'
+
+    def test_unknown_extension(self, network_db, tmp_path):
+        with pytest.raises(ValueError):
+            export_fares_columnar(network_db, str(tmp_path / "fares.xlsx"))
@@ -0,0 +1,32 @@
+"""
+Тесты выгрузки тарифов пар остановок в CSV
+"""
+import csv
+
+from core.fare_engine import iter_fare_matrix
+from core.fare_export import FARE_CSV_HEADERS, export_fares_csv
+from models import RouteSequence
+
+
+class TestFareExport:
+    def test_route_list_matches_fare_engine(self, network_db, tmp_path):
+        filename = str(tmp_path / "fares.csv")
+        sequences = list(RouteSequence.group_rows(network_db.iter_route_sequences()))[:2]
+        result = export_fares_csv(network_db, filename, [s.route_id for s in sequences])
+        assert not result.server_side
+
+        with open(filename, encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.reader(f, delimiter=';'))
+        assert rows[0] == FARE_CSV_HEADERS
+        expected = []
+        numbers = {row[0]: row[1] for row in network_db.iter_routes()}
+        for sequence in sequences:
+            names = sequence.point_names
+            for i, j, passenger, child, baggage in iter_fare_matrix(sequence):
+                # Суммы в копейках, как в файле для терминалов
+                kopecks = [round(value * 100) for value in (passenger, child, baggage)]
+                expected.append([numbers[sequence.route_id], names[j], names[i],
+                                 f"{sequence.distances[i] - sequence.distances[j]:.3f}"]
+                                + [f"{value / 100:.2f}" for value in kopecks])
+        assert rows[1:] == expected
+        assert result.pairs == len(expected)
@@ -0,0 +1,68 @@
+"""
+Тесты двоичного файла тарифов для терминалов
+"""
+import pytest
+
+from core.fare_engine import iter_fare_matrix
+from core.fare_matrix_file import (FareMatrixError, FareMatrixReader, publish_network,
+                                   publish_sequences, read_network)
+from models import RouteSequence
+from tools.datagen import NetworkSpec
+
+
+@pytest.fixture
+def network_spec():
+    return NetworkSpec(points=200, routes=12, min_stops=2, max_stops=40, seed=7)
+
+
+class TestFareMatrixFile:
+    def test_roundtrip_matches_fare_engine(self, network_db, tmp_path):
+        filename = str(tmp_path / "tariffs.tfmx")
+        result = publish_network(network_db, filename)
+        sequences = list(RouteSequence.group_rows(network_db.iter_route_sequences()))
+        assert result.routes == len(sequences)
+
+        with FareMatrixReader(filename) as reader:
+            assert reader.route(-1) is None
+            for sequence in sequences:
+                assert list(reader.stops(sequence.route_id)) == list(sequence.point_ids)
+                for i, j, passenger, child, baggage in iter_fare_matrix(sequence):
+                    expected = (round(passenger * 100), round(child * 100), round(baggage * 100))
+                    assert reader.fare(sequence.route_id, i, j) == expected
+                    assert reader.fare(sequence.route_id, j, i) == expected
+                assert reader.fare(sequence.route_id, 0, 0) == (0, 0, 0)
+
+    def test_checksum_detects_corruption(self, network_db, tmp_path):
+        filename = tmp_path / "tariffs.tfmx"
+        publish_network(network_db, str(filename))
+        data = bytearray(filename.read_bytes())
+        data[-40] ^= 0xFF
+        filename.write_bytes(bytes(data))
+        with pytest.raises(FareMatrixError):
+            FareMatrixReader(str(filename))
+
+    def test_publish_without_database(self, network_db, tmp_path):
+        """Расчёт и запись файла идут по прочитанным заранее маршрутам, без обращения к БД"""
+        route_numbers, sequences = read_network(network_db)
+        network_db.close()
+        filename = str(tmp_path / "tariffs.tfmx")
+        result = publish_sequences(filename, sequences, route_numbers)
+        with FareMatrixReader(filename) as reader:
+            assert reader.route_ids() == sorted(route_numbers) and result.routes == 12
+            assert {reader.route_number(route_id) for route_id in route_numbers} == \
+                set(route_numbers.values())
+
+    def test_cancel_keeps_previous_file(self, network_db, tmp_path):
+        filename = tmp_path / "tariffs.tfmx"
+        publish_network(network_db, str(filename))
+        previous = filename.read_bytes()
+        calls = []
+
+        def on_route(done, total):
+            calls.append((done, total))
+            return done < 3
+
+        assert publish_network(network_db, str(filename), round_up=True, on_route=on_route) is None
+        assert calls == [(1, 12), (2, 12), (3, 12)]
+        assert filename.read_bytes() == previous
+        assert not (tmp_path / "tariffs.tfmx.tmp").exists()
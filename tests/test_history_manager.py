@@ -0,0 +1,38 @@
+"""
+Тесты истории действий
+"""
+from ui.history_manager import HistoryManager
+
+
+class TestHistoryManager:
+    def test_transaction_is_one_entry(self):
+        history = HistoryManager()
+        with history.transaction("Импорт пунктов"):
+            for seq_id in range(3):
+                history.record(('insert', seq_id))
+        entry = history.undo()
+        assert entry.description == "Импорт пунктов"
+        assert len(entry.deltas) == 3
+        assert not history.can_undo()
+
+    def test_new_action_clears_redo(self):
+        history = HistoryManager()
+        history.record(('cell', 1, 1, "0", "5"), "Изменение")
+        history.undo()
+        assert history.can_redo()
+        history.record(('cell', 1, 1, "0", "7"), "Изменение")
+        assert not history.can_redo()
+
+    def test_suspended_does_not_record(self):
+        history = HistoryManager()
+        with history.suspended():
+            history.record(('cell', 1, 1, "0", "5"))
+        assert not history.can_undo()
+
+    def test_memory_budget_drops_oldest(self):
+        history = HistoryManager(max_bytes=4096)
+        for value in range(200):
+            history.record(('cell', value, 1, "0", str(value)))
+        assert history.memory_usage <= 4096
+        assert 0 < len(history.undo_stack) < 200
+        assert history.undo_stack[-1].deltas[0][1] == 199
@@ -0,0 +1,37 @@
+"""
+Тесты журнала несохранённых правок
+"""
+from core.journal import RouteJournal
+
+
+class TestRouteJournal:
+    def test_replay_keeps_last_value_per_cell(self, tmp_path):
+        journal = RouteJournal(7, directory=tmp_path)
+        journal.append(10, 2, "15.0")
+        journal.append(11, 2, "30.0")
+        journal.append(10, 2, "17.5")
+        journal.close()
+
+        reopened = RouteJournal(7, directory=tmp_path)
+        records = reopened.replay()
+        reopened.close()
+        assert [(r['seq_id'], r['col'], r['value']) for r in records] == \
+            [(11, 2, "30.0"), (10, 2, "17.5")]
+
+    def test_torn_line_is_skipped(self, tmp_path):
+        journal = RouteJournal(7, directory=tmp_path)
+        journal.append(10, 2, "15.0")
+        journal.sync()
+        with open(journal.path, 'a', encoding='utf-8') as f:
+            f.write('{"seq_id": 11, "col"')
+        assert [r['seq_id'] for r in journal.replay()] == [10]
+        journal.close()
+
+    def test_compact_empties_journal(self, tmp_path):
+        journal = RouteJournal(7, directory=tmp_path)
+        journal.append(10, 2, "15.0")
+        journal.compact()
+        journal.append(11, 3, "1.0")
+        assert [r['seq_id'] for r in journal.replay()] == [11]
+        journal.close(compact=True)
+        assert journal.path.stat().st_size == 0
@@ -0,0 +1,30 @@
+"""
+Тесты контроля задержек интерфейса
+"""
+from ui.decorators import track_latency
+from ui.latency_monitor import LatencyHistogram, latency_monitor
+
+
+class TestLatencyHistogram:
+    def test_buckets_and_percentile(self):
+        histogram = LatencyHistogram()
+        for duration in (5, 10, 40, 300, 7000):
+            histogram.add(duration)
+        assert histogram.counts == [2, 1, 0, 0, 1, 0, 0, 0, 1]
+        assert histogram.max_ms == 7000
+        assert histogram.percentile(0.5) == 50
+        assert histogram.percentile(1.0) == 7000
+
+
+class TestTrackLatency:
+    def test_slot_is_measured_and_signal_args_dropped(self):
+        class Dialog:
+            @track_latency("Dialog.sort")
+            def sort(self):
+                return "ok"
+
+        latency_monitor.reset()
+        # clicked(bool) передаёт флаг checked
+        assert Dialog().sort(False) == "ok"
+        histograms, _ = latency_monitor.snapshot()
+        assert histograms["Dialog.sort"].total == 1
@@ -0,0 +1,51 @@
+"""
+Тесты асинхронного логирования
+"""
+import json
+import logging
+
+import pytest
+
+from utils import logger as app_logger
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    root = logging.getLogger()
+    saved = root.handlers[:], root.level
+    app_logger.setup_logging({'level': 'INFO', 'console_level': 'CRITICAL',
+                              'levels': {'tests.verbose': 'DEBUG'}}, log_dir=tmp_path)
+    yield tmp_path
+    app_logger.shutdown_logging()
+    root.handlers[:], level = saved
+    root.setLevel(level)
+    logging.getLogger('tests.verbose').setLevel(logging.NOTSET)
+
+
+def read_records(log_dir):
+    app_logger.shutdown_logging()
+    with open(log_dir / 'app.log', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+class TestLogging:
+    def test_subsystem_levels_and_json(self, log_dir):
+        logging.getLogger('tests.quiet').debug("не пишется")
+        logging.getLogger('tests.verbose').debug("строка %d", 5)
+        records = read_records(log_dir)
+        assert [(r['logger'], r['message']) for r in records] == [('tests.verbose', "строка 5")]
+        assert records[0]['level'] == 'DEBUG'
+
+    def test_timing_fields(self, log_dir):
+        with app_logger.log_timing(logging.getLogger('tests.verbose'), "Импорт", rows=3) as fields:
+            fields['imported'] = 2
+        record = read_records(log_dir)[0]
+        assert record['rows'] == 3 and record['imported'] == 2
+        assert record['elapsed_ms'] >= 0
+
+    def test_exception_is_serialized(self, log_dir):
+        try:
+            raise ValueError("сбой")
+        except ValueError:
+            logging.getLogger('tests.verbose').exception("Ошибка")
+        assert 'ValueError: сбой' in read_records(log_dir)[0]['exc']
@@ -0,0 +1,65 @@
+"""
+Тесты для доменной модели и расчёта матрицы тарифов
+"""
+from collections import namedtuple
+
+import pytest
+
+from models import Point, RouteSequence
+from core import fare_engine
+
+Row = namedtuple('Row', 'id route_id point_id point_name sequence_number '
+                        'distance_km rounding cost_per_km baggage_percent')
+
+
+def make_rows(route_id=1, count=4):
+    return [Row(route_id * 100 + i, route_id, i + 1, f"Пункт {i}", i + 1,
+                i * 10.0, 1.0, 5.0, 20.0) for i in range(count)]
+
+
+class TestRouteSequence:
+    def test_from_rows_namedtuple(self):
+        """Колонки заполняются из namedtuple-строк"""
+        seq = RouteSequence.from_rows(make_rows())
+        assert len(seq) == 4
+        assert seq.route_id == 1
+        assert list(seq.distances) == [0.0, 10.0, 20.0, 30.0]
+        assert seq.cost_per_km == 5.0
+
+    def test_from_rows_dict(self):
+        """Строки-словари (RealDictCursor) тоже поддерживаются"""
+        rows = [row._asdict() for row in make_rows()]
+        seq = RouteSequence.from_rows(rows)
+        assert seq[1]['point_name'] == "Пункт 1"
+        assert seq[-1].distance_km == 30.0
+
+    def test_group_rows(self):
+        """Поток строк разбивается на маршруты"""
+        rows = make_rows(1, 3) + make_rows(2, 2)
+        groups = list(RouteSequence.group_rows(rows))
+        assert [g.route_id for g in groups] == [1, 2]
+        assert [len(g) for g in groups] == [3, 2]
+
+    def test_index_of(self):
+        seq = RouteSequence.from_rows(make_rows())
+        assert seq.index_of(102) == 2
+        assert seq.index_of(999) == -1
+
+    def test_point_dict_access(self):
+        point = Point.from_row({'id': 1, 'name': 'Курган'})
+        assert point['name'] == 'Курган'
+        with pytest.raises(KeyError):
+            point['missing']
+
+
+class TestFareMatrix:
+    def test_matches_calculate_tariffs(self):
+        """Матрица совпадает с поштучным расчётом"""
+        seq = RouteSequence.from_rows(make_rows())
+        matrix = fare_engine.fare_matrix(seq)
+        expected = fare_engine.calculate_tariffs(30.0 - 10.0, 5.0, 20.0, 1.0)
+        passenger, child, baggage = matrix[3][1]
+        assert passenger == expected['passenger'] == 100.0
+        assert child == 50.0
+        assert baggage == expected['baggage'] == 20.0
+        assert [len(row) for row in matrix] == [0, 1, 2, 3]
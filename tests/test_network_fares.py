@@ -0,0 +1,50 @@
+"""
+Тесты поиска поездок по сети маршрутов
+"""
+import pytest
+
+from core.network_fares import BY_DISTANCE, BY_FARE, FareNetwork
+from models import RouteSequence
+
+
+def _route(route_id, stops, cost_per_km):
+    sequence = RouteSequence(route_id)
+    for position, (point_id, distance) in enumerate(stops, 1):
+        sequence.append(position, point_id, f"Пункт {point_id}", position, distance,
+                        0.0, cost_per_km, 10.0)
+    return sequence
+
+
+@pytest.fixture
+def network():
+    # 1-2-3 и 3-4-5 с пересадкой в 3, плюс длинный дешёвый маршрут 1-5
+    return FareNetwork([
+        _route(1, [(1, 0), (2, 10), (3, 20)], 2.0),
+        _route(2, [(3, 0), (4, 5), (5, 30)], 1.0),
+        _route(3, [(1, 0), (5, 100)], 0.5),
+        _route(4, [(6, 0), (7, 5)], 1.0),
+    ])
+
+
+class TestFareNetwork:
+    def test_shortest_journey_transfers(self, network):
+        journey = network.journey(1, 5, BY_DISTANCE)
+        assert [(leg.route_id, leg.from_point, leg.to_point) for leg in journey.legs] == \
+            [(1, 1, 3), (2, 3, 5)]
+        assert journey.distance_km == 50.0
+        assert journey.transfers == 1
+        assert journey.passenger == 70.0
+
+    def test_cheapest_journey_and_cost(self, network):
+        journey = network.journey(5, 1, BY_FARE)
+        assert [leg.route_id for leg in journey.legs] == [3]
+        assert journey.passenger == 50.0
+        assert network.cost(1, 5, BY_FARE) == 50.0
+        network.precompute(BY_DISTANCE)
+        assert network.cost(2, 4, BY_DISTANCE) == 15.0
+
+    def test_unreachable(self, network):
+        assert network.journey(1, 7) is None
+        assert network.cost(6, 1) is None
+        with pytest.raises(KeyError):
+            network.journey(1, 999)
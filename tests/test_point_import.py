@@ -0,0 +1,50 @@
+"""
+Тесты импорта пунктов через COPY (разбор файла; SQL - в test_database)
+"""
+import io
+import re
+from unittest.mock import MagicMock
+
+import pytest
+
+from core.point_import import (DISTANCE_COLUMN, NAME_COLUMN, SKIP_NAMES,
+                               import_points_csv, import_points_rows)
+
+PARAMS = {'rounding': 0.0, 'cost_per_km': 2.5, 'baggage_percent': 0.0}
+
+
+@pytest.fixture
+def db():
+    database = MagicMock()
+    database.copy_route_points.side_effect = \
+        lambda route_id, source, *args: (len(source.read().splitlines()), 1, [])
+    return database
+
+
+class TestPointImport:
+    def test_csv_columns_found_by_header(self, db):
+        source = io.StringIO(f"№ п/п;{NAME_COLUMN};{DISTANCE_COLUMN}\n1;Курган;0\n2;Варгаши;45,5\n")
+        result = import_points_csv(db, 3, source, PARAMS)
+
+        assert (result.rows, result.imported, result.errors) == (2, 1, [])
+        route_id, _, columns, name_column, distance_column, params, delimiter, skip = \
+            db.copy_route_points.call_args[0]
+        assert (route_id, columns, name_column, distance_column) == (3, 3, 1, 2)
+        assert (params, delimiter, skip) == (PARAMS, ';', SKIP_NAMES)
+
+    def test_excel_rows_go_through_csv(self, db):
+        rows = [{NAME_COLUMN: 'Курган; центр', DISTANCE_COLUMN: '12.5', 'Прочее': 'x'}]
+        captured = {}
+
+        def copy_route_points(route_id, source, *args):
+            captured['text'] = source.read()
+            return 1, 1, []
+
+        db.copy_route_points.side_effect = copy_route_points
+        import_points_rows(db, 3, rows, PARAMS)
+        assert captured['text'] == '"Курган; центр";12.5\n'
+
+    def test_missing_columns(self, db):
+        with pytest.raises(ValueError, match=re.escape(DISTANCE_COLUMN)):
+            import_points_csv(db, 3, io.StringIO(f"{NAME_COLUMN};Км\nКурган;1\n"), PARAMS)
+        db.copy_route_points.assert_not_called()
@@ -0,0 +1,38 @@
+"""
+Тесты профилировщика
+"""
+import json
+
+from utils.profiler import ProfileSession
+
+
+def busy_loop():
+    total = 0
+    for i in range(50000):
+        total += i * i
+    return total
+
+
+class TestProfileSession:
+    def test_sampling_writes_flame_graph_files(self, tmp_path):
+        session = ProfileSession('sampling', directory=tmp_path, interval=0.001)
+        session.start()
+        for _ in range(10):
+            busy_loop()
+        output = session.stop()
+
+        collapsed = (output / 'stacks.collapsed').read_text(encoding='utf-8')
+        assert 'busy_loop' in collapsed
+        speedscope = json.loads((output / 'speedscope.json').read_text(encoding='utf-8'))
+        assert any(frame['name'] == 'busy_loop' for frame in speedscope['shared']['frames'])
+        summary = (output / 'summary.txt').read_text(encoding='utf-8')
+        assert 'busy_loop' in summary and 'Память' in summary
+
+    def test_cprofile_writes_stats(self, tmp_path):
+        session = ProfileSession('cprofile', directory=tmp_path, trace_memory=False)
+        session.start()
+        busy_loop()
+        output = session.stop()
+        assert (output / 'profile.prof').exists()
+        assert 'busy_loop' in (output / 'summary.txt').read_text(encoding='utf-8')
+        assert not session.is_running
@@ -0,0 +1,168 @@
+"""
+Тесты для локального хранилища SQLite
+"""
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+from core.database import DatabaseError
+from core.migrations import SQLITE_MIGRATIONS
+from core.sqlite_database import SCHEMA, SQLiteDatabase
+from models import SORT_KEY_GAP
+
+
+class TestSQLiteDatabase:
+    def test_wal_mode(self, db):
+        """База открывается в режиме WAL"""
+        assert db.conn.execute("PRAGMA journal_mode").fetchone()["journal_mode"] == "wal"
+
+    def test_migrate_sequence_numbers_without_drop_column(self, tmp_path):
+        """Файл версии 1 (номера пунктов) переходит на ключи порядка пересборкой таблицы"""
+        path = tmp_path / "old.db"
+        conn = sqlite3.connect(path)
+        conn.executescript(SCHEMA)
+        conn.executescript(f"BEGIN; {SQLITE_MIGRATIONS[0][2]} PRAGMA user_version = 1; COMMIT;")
+        conn.executescript("""
+            INSERT INTO points (id, name) VALUES (1, 'Курган'), (2, 'Варгаши');
+            INSERT INTO routes (id, route_number, route_name) VALUES (1, '101', 'Курган — Варгаши');
+            INSERT INTO route_sequence (route_id, point_id, sequence_number, distance_km)
+            VALUES (1, 2, 2, 45), (1, 1, 1, 0);
+        """)
+        conn.close()
+
+        database = SQLiteDatabase(path)
+        try:
+            columns = [row['name'] for row in
+                       database.conn.execute("PRAGMA table_info(route_sequence)").fetchall()]
+            assert 'sequence_number' not in columns
+            sequence = database.get_route_sequence(1)
+            assert [row['point_name'] for row in sequence] == ["Курган", "Варгаши"]
+            assert database.conn.execute(
+                "SELECT sort_key FROM route_sequence ORDER BY sort_key"
+            ).fetchall() == [{'sort_key': SORT_KEY_GAP}, {'sort_key': 2 * SORT_KEY_GAP}]
+            assert database.get_all_routes()[0]['points_count'] == 2
+            database.update_route_point(sequence[0]['id'], 0.0, 1.0, 3.5, 0.0)
+            assert database.conn.execute("SELECT row_version FROM route_sequence WHERE id = ?",
+                                         (sequence[0]['id'],)).fetchone()['row_version'] == 2
+        finally:
+            database.close()
+
+    def test_add_point_duplicate_case_insensitive(self, db):
+        """Дубликат с другим регистром (кириллица) отклоняется"""
+        db.add_point("Курган")
+        with pytest.raises(DatabaseError, match="уже существует"):
+            db.add_point("  курган ")
+
+    def test_search_points_cyrillic(self, db):
+        db.add_point("Курган")
+        db.add_point("Варгаши")
+        assert [p["name"] for p in db.search_points("КУР")] == ["Курган"]
+
+    def test_route_sequence(self, db, route):
+        sequence = db.get_route_sequence(route)
+        assert [p["point_name"] for p in sequence] == ["Курган", "Варгаши", "Мокроусово"]
+        assert [p["sequence_number"] for p in sequence] == [1, 2, 3]
+        assert db.get_all_routes()[0]["points_count"] == 3
+
+    def test_route_aggregates_follow_sequence(self, db, route):
+        """Агрегаты маршрута обновляются триггерами при изменении пунктов"""
+        listed = db.get_all_routes()[0]
+        assert (listed["points_count"], listed["total_distance_km"], listed["cost_per_km"]) == \
+            (3, 120.0, 3.5)
+
+        sequence = db.get_route_sequence(route)
+        db.update_route_point(sequence[0]["id"], 0.0, 1.0, 4.0, 10.0)
+        db.remove_point_from_route(sequence[2]["id"])
+        listed = db.get_all_routes()[0]
+        assert (listed["points_count"], listed["total_distance_km"], listed["cost_per_km"]) == \
+            (2, 45.0, 4.0)
+
+    def test_point_already_in_route(self, db, route):
+        point_id = db.get_route_sequence(route)[0]["point_id"]
+        with pytest.raises(DatabaseError, match="уже добавлен"):
+            db.add_point_to_route(route, point_id, 10.0)
+
+    def test_remove_and_reorder(self, db, route):
+        sequence = db.get_route_sequence(route)
+        db.reorder_route_sequence(route, [sequence[2]["id"], sequence[0]["id"], sequence[1]["id"]])
+        assert [p["point_name"] for p in db.get_route_sequence(route)] == [
+            "Мокроусово", "Курган", "Варгаши"]
+
+        db.remove_point_from_route(sequence[2]["id"])
+        remaining = db.get_route_sequence(route)
+        assert [p["point_name"] for p in remaining] == ["Курган", "Варгаши"]
+        assert [p["sequence_number"] for p in remaining] == [1, 2]
+
+    def test_update_route_sequence_number(self, db, route):
+        last = db.get_route_sequence(route)[2]
+        assert db.update_route_sequence_number(last["id"], 1)
+        assert [p["point_name"] for p in db.get_route_sequence(route)] == [
+            "Мокроусово", "Курган", "Варгаши"]
+
+    def test_insert_point_at_touches_one_row(self, db, route):
+        """Вставка в середину не меняет ключи остальных пунктов"""
+        keys_before = {p["id"]: p["sort_key"] for p in db.get_route_sequence(route)}
+        db.insert_point_at(route, 2, db.add_point("Лебяжье"), 20.0)
+        sequence = db.get_route_sequence(route)
+        assert [p["point_name"] for p in sequence] == \
+            ["Курган", "Лебяжье", "Варгаши", "Мокроусово"]
+        assert [p["sequence_number"] for p in sequence] == [1, 2, 3, 4]
+        assert all(keys_before[p["id"]] == p["sort_key"]
+                   for p in sequence if p["id"] in keys_before)
+
+    def test_rebalance_when_gap_exhausted(self, db, route):
+        """Когда промежуток исчерпан, маршрут перебалансируется, порядок сохраняется"""
+        for i in range(12):
+            db.insert_point_at(route, 2, db.add_point(f"Пункт {i}"))
+        names = [p["point_name"] for p in db.get_route_sequence(route)]
+        assert names[:3] == ["Курган", "Пункт 11", "Пункт 10"]
+        assert names[-2:] == ["Варгаши", "Мокроусово"]
+        assert db.get_crowded_routes() == []
+
+    def test_iterators(self, db, route):
+        """Потоковые итераторы отдают namedtuple"""
+        assert [p.name for p in db.iter_points(itersize=1)] == ["Варгаши", "Курган", "Мокроусово"]
+        assert next(db.iter_routes()).points_count == 3
+        stops = list(db.iter_route_sequences([route]))
+        assert [s.distance_km for s in stops] == [0.0, 45.0, 120.0]
+
+    def test_delete_route_cascades(self, db, route):
+        assert db.delete_route(route)
+        assert db.get_route_sequence(route) == []
+
+    def test_update_tariff_parameters_by_filter(self, db, route):
+        other = db.add_route("202", "Шадринск — Далматово")
+        db.add_point_to_route(other, db.add_point("Шадринск"), 0.0, 1.0, 2.0, 5.0)
+
+        result = db.update_tariff_parameters(cost_per_km=4.0, search="варгаш")
+        assert (result.routes_matched, result.rows_matched, result.rows_updated) == (1, 3, 3)
+        assert result.route_ids == [route]
+        assert db.get_route_by_id(route)['cost_per_km'] == 4.0
+        assert db.get_route_by_id(other)['cost_per_km'] == 2.0
+
+        # Совпадающие значения не перезаписываются
+        result = db.update_tariff_parameters(cost_per_km=4.0, max_cost_per_km=10.0)
+        assert (result.routes_matched, result.rows_updated) == (2, 1)
+        assert result.route_ids == [other]
+
+    def test_tariff_as_of_date(self, db, route):
+        """Изменение тарифа закрывает прежнюю версию, она доступна на прошлую дату"""
+        today = date.today()
+        past = date(2020, 1, 1)
+        # Версии пунктов маршрута «созданы» в прошлом
+        db.conn.execute("UPDATE route_sequence_versions SET valid_from = ?", (past.isoformat(),))
+        db.update_tariff_parameters(cost_per_km=4.0, route_ids=[route])
+        stale = db.get_route_sequence(route)[1]['id']
+        db.remove_point_from_route(stale)
+
+        old = db.get_route_sequence_model(route, as_of=today - timedelta(days=1))
+        assert list(old.point_names) == ["Курган", "Варгаши", "Мокроусово"]
+        assert old.cost_per_km == 3.5
+        current = db.get_route_sequence_model(route, as_of=today)
+        assert list(current.point_names) == ["Курган", "Мокроусово"]
+        assert current.cost_per_km == 4.0
+        assert len(db.get_route_sequence_model(route, as_of=past - timedelta(days=1))) == 0
+        assert db.get_tariff_dates(route) == [past, today]
+        assert db.get_tariff_versions() == {route: today}
+        assert db.get_tariff_versions(today - timedelta(days=1)) == {route: past}
@@ -0,0 +1,174 @@
+"""
+Тесты синхронизации локального кэша с сервером
+"""
+from datetime import date
+
+import pytest
+
+from core.database import DatabaseError
+from core.sqlite_database import SQLiteDatabase
+from core.sync import SYNC_COLUMNS, SyncedDatabase
+
+
+class ServerStandIn(SQLiteDatabase):
+    """Сервер на SQLite: выгрузка изменений после отметки и журнал удалений"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        # Номер записи журнала - отметка изменений (как xid у PostgreSQL)
+        self.conn.execute("CREATE TABLE change_log (id INTEGER PRIMARY KEY, "
+                          "table_name TEXT, row_id INTEGER, deleted INTEGER NOT NULL)")
+        for table in SYNC_COLUMNS:
+            for event, row, deleted in [('INSERT', 'NEW', 0), ('UPDATE', 'NEW', 0),
+                                        ('DELETE', 'OLD', 1)]:
+                self.conn.execute(f"""
+                    CREATE TRIGGER {table}_log_{event.lower()} AFTER {event} ON {table}
+                    BEGIN
+                        INSERT INTO change_log (table_name, row_id, deleted)
+                        VALUES ('{table}', {row}.id, {deleted});
+                    END
+                """)
+        self.conn.commit()
+
+    def get_changes_since(self, watermark=None):
+        since = -1 if watermark is None else int(watermark)
+        last = self.conn.execute("SELECT COALESCE(MAX(id), 0) AS id FROM change_log").fetchone()
+        changes = {'watermark': str(last['id'])}
+        for table, columns in SYNC_COLUMNS.items():
+            rows = self.conn.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE id IN "
+                f"(SELECT row_id FROM change_log WHERE table_name = ? AND id > ?)", (table, since)
+            ).fetchall()
+            changes[table] = [tuple(row.values()) for row in rows]
+        deleted = self.conn.execute("SELECT table_name, row_id FROM change_log "
+                                    "WHERE deleted AND id > ? ORDER BY id", (since,)).fetchall()
+        changes['deleted'] = [] if watermark is None else [tuple(row.values()) for row in deleted]
+        return changes
+
+
+@pytest.fixture
+def server(tmp_path):
+    database = ServerStandIn(tmp_path / "server.db")
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    database = SyncedDatabase(None, path=str(tmp_path / "cache.db"))
+    yield database
+    database.local.close()
+
+
+class TestSync:
+    def test_offline_writes_use_temp_ids(self, cache):
+        """Без сервера записи попадают в кэш с временными ID и в очередь"""
+        point_id = cache.add_point("Курган")
+        assert point_id < 0
+        assert cache.get_all_points() == [{'id': point_id, 'name': "Курган"}]
+        assert cache.engine.pending_count() == 1
+        assert cache.sync()['online'] is False
+
+    def test_push_maps_temp_ids(self, cache, server):
+        """Связанные новые записи отправляются пачкой с настоящими ID"""
+        route_id = cache.add_route("101", "Курган — Варгаши")
+        for name, distance in [("Курган", 0.0), ("Варгаши", 45.0)]:
+            cache.add_point_to_route(route_id, cache.add_point(name), distance, 1.0, 3.5, 10.0)
+
+        cache.engine.remote = server
+        result = cache.sync()
+        assert result['pushed'] == 5 and result['rejected'] == 0
+        assert cache.engine.pending_count() == 0
+
+        server_route = server.get_all_routes()[0]
+        assert [row['point_name'] for row in server.get_route_sequence(server_route['id'])] == \
+            ["Курган", "Варгаши"]
+        # Кэш содержит строки с ID сервера
+        assert [route['id'] for route in cache.get_all_routes()] == [server_route['id']]
+        assert len(cache.get_route_sequence(server_route['id'])) == 2
+
+    def test_rejected_operation_does_not_block_queue(self, cache, server):
+        """Отклонённая операция переносится в sync_rejected, остальные применяются"""
+        server.add_point("Курган")
+        cache.add_point("Курган")
+        cache.add_point("Варгаши")
+
+        cache.engine.remote = server
+        result = cache.sync()
+        assert result['pushed'] == 1 and result['rejected'] == 1
+        assert sorted(p['name'] for p in cache.get_all_points()) == ["Варгаши", "Курган"]
+        rejected = cache.local.conn.execute("SELECT operation FROM sync_rejected").fetchall()
+        assert rejected == [{'operation': 'add_point'}]
+
+    def test_pull_applies_deletions(self, cache, server):
+        point_id = server.add_point("Курган")
+        server.add_point("Варгаши")
+        cache.engine.remote = server
+        cache.sync()
+        assert len(cache.get_all_points()) == 2
+
+        server.delete_point(point_id)
+        assert cache.sync()['pulled'] > 0
+        assert [p['name'] for p in cache.get_all_points()] == ["Варгаши"]
+
+    def test_rejected_delete_restores_row(self, cache, server):
+        """Отклонённое удаление возвращает строку в кэш: после него выгрузка полная"""
+        server.add_point("Курган")
+        point_id = server.add_point("Варгаши")
+        cache.engine.remote = server
+        cache.sync()
+
+        route_id = server.add_route("101", "Курган — Варгаши")
+        server.add_point_to_route(route_id, point_id, 0.0, 1.0, 3.5, 10.0)
+        cache.delete_point(point_id)
+        assert [p['name'] for p in cache.get_all_points()] == ["Курган"]
+
+        result = cache.sync()
+        assert result['rejected'] == 1
+        assert sorted(p['name'] for p in cache.get_all_points()) == ["Варгаши", "Курган"]
+        assert [row['point_name'] for row in cache.get_route_sequence(route_id)] == ["Варгаши"]
+        # Следующие выгрузки снова по отметке
+        server.add_point("Мишкино")
+        assert cache.sync()['pulled'] == 1
+
+    def test_writes_during_exchange_stay_queued(self, cache, server):
+        """Запись во время сетевого обмена не теряется и ссылается на ID сервера"""
+        route_id = cache.add_route("101", "Курган — Варгаши")
+        cache.engine.remote = server
+        exchange = cache.exchange(*cache.prepare_sync())
+
+        point_id = cache.add_point("Курган")
+        cache.add_point_to_route(route_id, point_id, 0.0, 1.0, 3.5, 10.0)
+        result = cache.apply_sync(exchange)
+        assert result['pushed'] == 1 and result['pulled'] == 0
+        server_route_id = server.get_all_routes()[0]['id']
+        assert [route['id'] for route in cache.get_all_routes()] == [server_route_id]
+        assert [row['point_name']
+                for row in cache.get_route_sequence(server_route_id)] == ["Курган"]
+        assert cache.engine.pending_count() == 2
+
+        assert cache.sync()['pushed'] == 2
+        assert [row['point_name']
+                for row in server.get_route_sequence(server_route_id)] == ["Курган"]
+        assert [row['point_name']
+                for row in cache.get_route_sequence(server_route_id)] == ["Курган"]
+
+    def test_tariff_history_read_from_server(self, cache, server):
+        """Тарифы на дату берутся с сервера, а не из версий, проставленных кэшем"""
+        route_id = server.add_route("101", "Курган — Варгаши")
+        for name, distance in [("Курган", 0.0), ("Варгаши", 45.0)]:
+            server.add_point_to_route(route_id, server.add_point(name), distance, 1.0, 3.5, 10.0)
+        server.conn.execute("UPDATE route_sequence_versions SET valid_from = '2020-01-01'")
+        server.conn.commit()
+        with pytest.raises(DatabaseError):
+            cache.get_tariff_dates(route_id)
+
+        cache.engine.remote = server
+        cache.sync()
+        as_of = date(2021, 1, 1)
+        assert cache.local.get_route_sequence_model(route_id, as_of).point_names == []
+        assert cache.get_route_sequence_model(route_id, as_of).point_names == ["Курган", "Варгаши"]
+        assert [row.point_name for row in cache.iter_route_sequences(as_of=as_of)] == \
+            ["Курган", "Варгаши"]
+        assert cache.get_tariff_dates(route_id) == [date(2020, 1, 1)]
+        assert cache.get_tariff_versions(as_of) == {route_id: date(2020, 1, 1)}
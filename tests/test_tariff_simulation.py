@@ -0,0 +1,82 @@
+"""
+Тесты моделирования изменения тарифа
+"""
+import sys
+
+import pytest
+
+from core.fare_engine import iter_fare_matrix
+from core.tariff_simulation import (TariffPolicy, _fares_numpy, _fares_python, apply_policy,
+                                    simulate_policy)
+from models import RouteSequence
+from tools.datagen import NetworkSpec
+
+
+@pytest.fixture
+def network_spec():
+    return NetworkSpec(points=100, routes=5, min_stops=3, max_stops=20, seed=3)
+
+
+def _revenue(db, round_up=False):
+    return {sequence.route_id: round(sum(round(passenger * 100) for _, _, passenger, _, _
+                                         in iter_fare_matrix(sequence, round_up)) / 100, 2)
+            for sequence in RouteSequence.group_rows(db.iter_route_sequences())}
+
+
+class TestTariffSimulation:
+    def test_report_matches_fares_after_apply(self, network_db):
+        before = _revenue(network_db)
+        policy = TariffPolicy(cost_per_km=3.0, rounding=5.0)
+        report = simulate_policy(network_db, policy, top=5)
+        assert {route.route_id: route.old_revenue for route in report.routes} == before
+        assert len(report.top_pairs) == 5
+        assert abs(report.top_pairs[0].delta) >= abs(report.top_pairs[-1].delta)
+
+        result = apply_policy(network_db, policy)
+        sequences = RouteSequence.group_rows(network_db.iter_route_sequences())
+        assert result.rows_matched == sum(len(sequence) for sequence in sequences)
+        assert result.route_ids == sorted(route.route_id for route in report.routes)
+        assert _revenue(network_db) == {route.route_id: route.new_revenue
+                                        for route in report.routes}
+
+    def test_weights_and_route_filter(self, network_db):
+        sequence = next(RouteSequence.group_rows(network_db.iter_route_sequences()))
+        key = (sequence.route_id, sequence.point_ids[1], sequence.point_ids[0])
+        first_fare = next(iter_fare_matrix(sequence))[2]
+        policy = TariffPolicy(cost_per_km=10.0)
+        plain = simulate_policy(network_db, policy, [sequence.route_id])
+        weighted = simulate_policy(network_db, policy, [sequence.route_id], weights={key: 101})
+        assert [route.route_id for route in plain.routes] == [sequence.route_id]
+        assert weighted.routes[0].old_revenue == \
+            pytest.approx(plain.routes[0].old_revenue + 100 * first_fare)
+
+    @pytest.mark.parametrize("round_up", [False, True])
+    def test_numpy_matches_python(self, network_db, round_up):
+        """Векторный расчёт совпадает с построчным до копейки"""
+        np = pytest.importorskip("numpy")
+        sequences = list(RouteSequence.group_rows(network_db.iter_route_sequences()))
+        for policy in (TariffPolicy(cost_per_km=2.52, rounding=0.5, round_up=round_up),
+                       TariffPolicy(cost_per_km=3.33, rounding=0.0, round_up=not round_up),
+                       TariffPolicy(rounding=5.0, round_up=round_up)):
+            old, new, bounds = _fares_numpy(np, sequences, policy, round_up)
+            python = _fares_python(sequences, policy, round_up)
+            assert [(old[start:end].tolist(), new[start:end].tolist())
+                    for start, end in zip(bounds[:-1], bounds[1:])] == \
+                [(list(old), list(new)) for old, new in python]
+        assert simulate_policy(network_db, TariffPolicy(cost_per_km=3.0)).vectorized
+
+    def test_numpy_report_matches_python(self, network_db, monkeypatch):
+        """Итоги маршрутов и крупнейшие пары совпадают с расчётом без NumPy"""
+        pytest.importorskip("numpy")
+        sequences = list(RouteSequence.group_rows(network_db.iter_route_sequences()))
+        weights = {(sequence.route_id, sequence.point_ids[i], sequence.point_ids[0]): 3 + i
+                   for sequence in sequences for i in range(1, len(sequence.point_ids), 2)}
+        weights[(sequences[0].route_id, sequences[0].point_ids[0], sequences[0].point_ids[1])] = 7
+        policy = TariffPolicy(cost_per_km=3.0, rounding=5.0)
+        vectorized = simulate_policy(network_db, policy, weights=weights, top=12)
+
+        monkeypatch.setitem(sys.modules, 'numpy', None)
+        python = simulate_policy(network_db, policy, weights=weights, top=12)
+        assert vectorized.vectorized and not python.vectorized
+        assert vectorized.routes == python.routes
+        assert vectorized.top_pairs == python.top_pairs
@@ -0,0 +1,30 @@
+"""
+Тесты пакетного сохранения правок маршрута
+"""
+import pytest
+
+from core.database import ConcurrencyError
+from core.unit_of_work import RouteEditUnit
+
+
+class TestRouteEditUnit:
+    def test_only_changed_rows_are_flushed(self, db, route):
+        unit = RouteEditUnit(db, db.get_route_sequence_model(route))
+        assert unit.register(1, 50.0, 1.0, 3.5, 10.0) is True
+        assert unit.register(2, 120.0, 1.0, 3.5, 10.0) is False
+        assert unit.flush()['rows'] == 1
+        assert [s.distance_km for s in db.get_route_sequence_model(route)] == [0.0, 50.0, 120.0]
+
+    def test_conflict_saves_nothing(self, db, route):
+        """Строка, изменённая после чтения, отменяет всё сохранение"""
+        unit = RouteEditUnit(db, db.get_route_sequence_model(route))
+        unit.register(1, 50.0, 1.0, 3.5, 10.0)
+        unit.register(2, 130.0, 1.0, 3.5, 10.0)
+
+        stale = db.get_route_sequence_model(route)
+        db.update_route_point(stale.ids[2], 125.0, 1.0, 3.5, 10.0)
+
+        with pytest.raises(ConcurrencyError) as error:
+            unit.flush()
+        assert error.value.conflict_ids == [stale.ids[2]]
+        assert [s.distance_km for s in db.get_route_sequence_model(route)] == [0.0, 45.0, 125.0]
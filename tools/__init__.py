@@ -0,0 +1,3 @@
+"""
+Служебные утилиты: генерация тестовых данных, нагрузочные тесты
+"""
@@ -0,0 +1,187 @@
+"""
+datagen.py
+Генератор синтетической сети маршрутов для нагрузочных тестов и бенчмарков
+
+Сеть детерминирована: одинаковые параметры и seed дают одинаковые
+названия пунктов, маршруты, расстояния и параметры тарифа. Данные
+пишутся пачками напрямую в таблицы (PostgreSQL или SQLite), триггеры
+поддерживают агрегаты маршрутов как при обычной работе.
+
+Запуск из командной строки (заполнить локальную SQLite):
+    python -m tools.datagen --sqlite bench.db --points 100000 --routes 2000
+"""
+import argparse
+import random
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+from models import SORT_KEY_GAP
+
+# Слоги и окончания для правдоподобных названий пунктов
+_ROOTS = ("Бел", "Вар", "Глин", "Дуб", "Ель", "Жур", "Звен", "Иль", "Кам", "Лип",
+          "Мох", "Нов", "Озер", "Пес", "Рыб", "Сос", "Тал", "Чер", "Шум", "Ясн",
+          "Берез", "Гор", "Крас", "Луг", "Моск", "Реч", "Сух", "Топ", "Холм", "Ключ")
+_MIDDLES = ("", "ов", "ин", "ан", "ен", "ош", "як", "ец")
+_ENDINGS = ("ка", "ово", "ево", "ино", "ное", "ский", "поль", "ица", "ищи", "ье", "ск")
+_PREFIXES = ("", "", "", "Новое ", "Старое ", "Большое ", "Малое ", "Верхнее ", "Нижнее ")
+
+# Варианты кратности округления и диапазоны параметров тарифа
+_ROUNDINGS = (0.0, 1.0, 1.0, 5.0, 10.0)
+_COST_RANGE = (2.5, 6.5)
+_BAGGAGE_RANGE = (5.0, 25.0)
+# Расстояние между соседними остановками, км
+_HOP_RANGE = (1.5, 25.0)
+
+BATCH_SIZE = 5000
+
+
+@dataclass
+class NetworkSpec:
+    """Параметры синтетической сети"""
+    points: int = 10000
+    routes: int = 200
+    min_stops: int = 5
+    max_stops: int = 400
+    seed: int = 42
+
+
+@dataclass
+class Network:
+    """Результат генерации: ID созданных записей"""
+    point_ids: List[int]
+    route_ids: List[int]
+    stops: int
+
+
+def point_names(count: int, rng: random.Random) -> List[str]:
+    """Уникальные названия пунктов"""
+    names: List[str] = []
+    seen = set()
+    while len(names) < count:
+        name = (rng.choice(_PREFIXES) + rng.choice(_ROOTS) + rng.choice(_MIDDLES)
+                + rng.choice(_ENDINGS)).strip()
+        if name.lower() in seen:
+            name = f"{name} {len(names) + 1}"
+        seen.add(name.lower())
+        names.append(name)
+    return names
+
+
+def route_lengths(spec: NetworkSpec, rng: random.Random) -> List[int]:
+    """Число остановок маршрутов: в основном короткие, изредка до max_stops"""
+    mode = spec.min_stops + (spec.max_stops - spec.min_stops) * 0.05
+    max_stops = min(spec.max_stops, spec.points)
+    return [max(spec.min_stops,
+                min(max_stops, int(rng.triangular(spec.min_stops, spec.max_stops, mode))))
+            for _ in range(spec.routes)]
+
+
+def route_stops(point_count: int, stops: int, rng: random.Random) -> List[Tuple[int, float]]:
+    """Индексы пунктов маршрута и расстояния от начала, км"""
+    indexes = rng.sample(range(point_count), stops)
+    distance, result = 0.0, []
+    for position, index in enumerate(indexes):
+        if position:
+            distance += round(rng.uniform(*_HOP_RANGE), 1)
+        result.append((index, round(distance, 1)))
+    return result
+
+
+def _insert_many(db, table: str, columns: Sequence[str], rows: List[tuple]) -> None:
+    """Пакетная вставка в таблицу без фиксации (вызывающий код делает commit)"""
+    if not rows:
+        return
+    names = ', '.join(columns)
+    if db.backend == 'postgresql':
+        from psycopg2.extras import execute_values
+        with db.conn.cursor() as cur:
+            for start in range(0, len(rows), BATCH_SIZE):
+                execute_values(cur, f"INSERT INTO {table} ({names}) VALUES %s",
+                               rows[start:start + BATCH_SIZE], page_size=BATCH_SIZE)
+    else:
+        placeholders = ', '.join('?' * len(columns))
+        db.conn.executemany(f"INSERT INTO {table} ({names}) VALUES ({placeholders})", rows)
+
+
+def _select_ids(db, query: str) -> List[tuple]:
+    if db.backend == 'postgresql':
+        with db.conn.cursor() as cur:
+            cur.execute(query)
+            return cur.fetchall()
+    return [tuple(row.values()) for row in db.conn.execute(query).fetchall()]
+
+
+def generate_network(db, spec: NetworkSpec = NetworkSpec()) -> Network:
+    """
+    Заполнить пустую БД синтетической сетью одной транзакцией.
+
+    Args:
+        db: Database или SQLiteDatabase
+        spec: Размеры сети и seed
+
+    Returns:
+        Network: ID пунктов и маршрутов в порядке генерации
+    """
+    rng = random.Random(spec.seed)
+    names = point_names(spec.points, rng)
+    lengths = route_lengths(spec, rng)
+    db._ensure_connection()
+    try:
+        _insert_many(db, 'points', ('name',), [(name,) for name in names])
+        by_name = dict(_select_ids(db, "SELECT name, id FROM points"))
+        point_ids = [by_name[name] for name in names]
+
+        width = len(str(spec.routes))
+        numbers = [f"S{index + 1:0{width}d}" for index in range(spec.routes)]
+        _insert_many(db, 'routes', ('route_number', 'route_name'), [
+            (number, f"{names[rng.randrange(len(names))]} — {names[rng.randrange(len(names))]}")
+            for number in numbers
+        ])
+        by_number = dict(_select_ids(db, "SELECT route_number, id FROM routes"))
+        route_ids = [by_number[number] for number in numbers]
+
+        sequence_rows = []
+        for route_id, stops in zip(route_ids, lengths):
+            cost = round(rng.uniform(*_COST_RANGE), 2)
+            rounding = rng.choice(_ROUNDINGS)
+            baggage = round(rng.uniform(*_BAGGAGE_RANGE), 1)
+            for position, (index, distance) in enumerate(route_stops(len(point_ids), stops, rng)):
+                sequence_rows.append((route_id, point_ids[index], (position + 1) * SORT_KEY_GAP,
+                                      distance, rounding, cost, baggage))
+        _insert_many(db, 'route_sequence',
+                     ('route_id', 'point_id', 'sort_key', 'distance_km', 'rounding',
+                      'cost_per_km', 'baggage_percent'),
+                     sequence_rows)
+        db.conn.commit()
+    except Exception:
+        db.conn.rollback()
+        raise
+    return Network(point_ids, route_ids, len(sequence_rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заполнить БД синтетической сетью маршрутов")
+    parser.add_argument('--sqlite',
+                        help="Путь к файлу SQLite (без ключа - PostgreSQL из config.json)")
+    parser.add_argument('--points', type=int, default=NetworkSpec.points)
+    parser.add_argument('--routes', type=int, default=NetworkSpec.routes)
+    parser.add_argument('--min-stops', type=int, default=NetworkSpec.min_stops)
+    parser.add_argument('--max-stops', type=int, default=NetworkSpec.max_stops)
+    parser.add_argument('--seed', type=int, default=NetworkSpec.seed)
+    args = parser.parse_args()
+
+    if args.sqlite:
+        from core.sqlite_database import SQLiteDatabase
+        db = SQLiteDatabase(args.sqlite)
+    else:
+        from core.database import Database
+        db = Database()
+    spec = NetworkSpec(args.points, args.routes, args.min_stops, args.max_stops, args.seed)
+    network = generate_network(db, spec)
+    db.close()
+    print(f"Создано пунктов: {len(network.point_ids)}, маршрутов: {len(network.route_ids)}, "
+          f"остановок: {network.stops}")
+
+
+if __name__ == '__main__':
+    main()
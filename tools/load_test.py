@@ -0,0 +1,407 @@
+"""
+load_test.py
+Нагрузочный тест общей БД: N одновременных клиентов без интерфейса
+
+Каждый клиент - отдельный процесс со своим подключением через класс
+Database (как у настоящего приложения). Клиенты выполняют смесь действий
+диспетчеров:
+
+- browse  - список маршрутов и последовательность случайного маршрута;
+- search  - поиск пунктов по началу названия;
+- edit    - правка расстояния через RouteEditUnit (проверка row_version);
+- reorder - перестановка соседних пунктов и сохранение порядка маршрута;
+- import  - добавление пачки пунктов в маршрут одной транзакцией
+            и их удаление (размер маршрута не растёт).
+
+Главный процесс во время теста опрашивает pg_locks и pg_stat_activity
+(ожидания блокировок) и сравнивает счётчик deadlocks из pg_stat_database
+до и после теста.
+
+Тест меняет данные, поэтому БД задаётся только явно (--dsn, настройки из
+config.json не используются), и в имени БД должна быть пометка test, bench
+или load; другую БД можно выбрать только с ключом --i-know.
+
+Пример:
+    python -m tools.load_test --dsn "host=db-test dbname=tariffs_test user=load" --prepare
+    python -m tools.load_test --dsn "dbname=tariffs_load" \
+        --mix browse=40,search=30,edit=15,reorder=10,import=5 --json report.json
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_MIX = {'browse': 40, 'search': 25, 'edit': 15, 'reorder': 10, 'import': 10}
+
+# Пунктов за одну операцию импорта
+IMPORT_SIZE = 10
+
+# Период опроса блокировок, секунды
+LOCK_SAMPLE_INTERVAL = 0.1
+
+# Пометки в имени БД, на которой можно менять данные без --i-know
+TEST_DATABASE_MARKERS = ('test', 'bench', 'load')
+
+# Результат операции: (действие, задержка в мс, вид ошибки или None)
+Sample = Tuple[str, float, Optional[str]]
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    """Разобрать смесь вида "browse=40,search=25" """
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Неизвестное действие: {name}")
+        mix[name] = int(weight)
+    return mix
+
+
+def is_test_database(dsn: str) -> bool:
+    """Есть ли в имени БД из строки подключения пометка тестовой (TEST_DATABASE_MARKERS)"""
+    from psycopg2.extensions import parse_dsn
+    dbname = parse_dsn(dsn).get('dbname', '').lower()
+    return any(marker in dbname for marker in TEST_DATABASE_MARKERS)
+
+
+def check_test_database(dsn: Optional[str], allow_any: bool = False) -> None:
+    """
+    Проверить, что PostgreSQL для нагрузки задан явно и это тестовая БД.
+
+    Raises:
+        ValueError: Если dsn не задан или в имени БД нет пометки (и не allow_any)
+    """
+    if not dsn:
+        raise ValueError("Укажите тестовую БД PostgreSQL ключом --dsn "
+                         "(настройки из config.json не используются)")
+    if not allow_any and not is_test_database(dsn):
+        from psycopg2.extensions import parse_dsn
+        dbname = parse_dsn(dsn).get('dbname', '')
+        raise ValueError(f"БД '{dbname}' не похожа на тестовую (в имени нет "
+                         f"{'/'.join(TEST_DATABASE_MARKERS)}); тест меняет данные. "
+                         f"Чтобы всё равно запустить его, добавьте --i-know")
+
+
+def classify_error(error: Exception) -> str:
+    """Вид ошибки для отчёта"""
+    from core.database import ConcurrencyError
+    if isinstance(error, ConcurrencyError):
+        return 'conflict'
+    text = str(error).lower()
+    if 'deadlock' in text:
+        return 'deadlock'
+    if 'lock timeout' in text or 'lock_timeout' in text or 'database is locked' in text:
+        return 'lock_timeout'
+    if 'could not serialize' in text:
+        return 'serialization'
+    if 'уже' in text or 'unique' in text or 'duplicate' in text:
+        return 'integrity'
+    return 'error'
+
+
+class Client:
+    """Один клиент: подключение к БД и набор действий"""
+
+    def __init__(self, db, rng: random.Random) -> None:
+        self.db = db
+        self.rng = rng
+        points = db.get_all_points()
+        self.route_ids = [route['id'] for route in db.get_all_routes()]
+        self.point_ids = [point['id'] for point in points]
+        self.prefixes = sorted({point['name'][:3] for point in points})
+
+    def _random_route(self):
+        return self.db.get_route_sequence_model(self.rng.choice(self.route_ids))
+
+    def browse(self) -> None:
+        self.db.get_all_routes()
+        self._random_route()
+
+    def search(self) -> None:
+        self.db.search_points(self.rng.choice(self.prefixes))
+
+    def edit(self) -> None:
+        from core.unit_of_work import RouteEditUnit
+        sequence = self._random_route()
+        if len(sequence) < 2:
+            return
+        index = self.rng.randrange(1, len(sequence))
+        unit = RouteEditUnit(self.db, sequence)
+        unit.register(index, sequence.distances[index] + self.rng.choice((-0.1, 0.1)),
+                      sequence.roundings[index], sequence.costs[index],
+                      sequence.baggage_percents[index])
+        unit.flush()
+
+    def reorder(self) -> None:
+        sequence = self._random_route()
+        if len(sequence) < 3:
+            return
+        order = list(sequence.ids)
+        index = self.rng.randrange(1, len(order) - 1)
+        order[index], order[index + 1] = order[index + 1], order[index]
+        self.db.reorder_route_sequence(sequence.route_id, order)
+
+    def import_points(self) -> None:
+        sequence = self._random_route()
+        in_route = set(sequence.point_ids)
+        candidates = [p for p in self.rng.sample(self.point_ids, IMPORT_SIZE * 2)
+                      if p not in in_route]
+        last = sequence.distances[-1] if len(sequence) else 0.0
+        added = []
+        with self.db.batch():
+            for offset, point_id in enumerate(candidates[:IMPORT_SIZE], 1):
+                added.append(self.db.add_point_to_route(
+                    sequence.route_id, point_id, last + offset,
+                    sequence.rounding, sequence.cost_per_km, sequence.baggage_percent))
+        with self.db.batch():
+            for seq_id in added:
+                self.db.remove_point_from_route(seq_id)
+
+
+ACTIONS = {
+    'browse': Client.browse,
+    'search': Client.search,
+    'edit': Client.edit,
+    'reorder': Client.reorder,
+    'import': Client.import_points,
+}
+
+
+def _open_database(sqlite_path: Optional[str], dsn: Optional[str] = None):
+    if sqlite_path:
+        from core.sqlite_database import SQLiteDatabase
+        return SQLiteDatabase(sqlite_path)
+    from core.database import Database
+    return Database(dsn)
+
+
+def run_client(index: int, duration: float, mix: Dict[str, int], seed: int,
+               sqlite_path: Optional[str] = None, start_at: float = 0.0,
+               dsn: Optional[str] = None) -> List[Sample]:
+    """Цикл одного клиента (выполняется в отдельном процессе)"""
+    import logging
+    # Ошибки учитываются в отчёте, логи клиентов только мешают
+    logging.disable(logging.ERROR)
+    rng = random.Random(seed * 1000 + index)
+    db = _open_database(sqlite_path, dsn)
+    client = Client(db, rng)
+    names, weights = zip(*mix.items())
+    samples: List[Sample] = []
+    # Клиенты начинают одновременно, после подключения всех процессов
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        error = None
+        try:
+            ACTIONS[name](client)
+        except Exception as e:
+            error = classify_error(e)
+            try:
+                db.conn.rollback()
+            except Exception:
+                pass
+        samples.append((name, (time.perf_counter() - started) * 1000, error))
+    db.close()
+    return samples
+
+
+class LockSampler(threading.Thread):
+    """Опрос ожиданий блокировок PostgreSQL во время теста"""
+
+    QUERY = """
+        SELECT
+            (SELECT count(*) FROM pg_locks WHERE NOT granted) AS waiting_locks,
+            (SELECT count(*) FROM pg_stat_activity
+             WHERE wait_event_type = 'Lock' AND datname = current_database()) AS waiting_backends
+    """
+
+    def __init__(self, db) -> None:
+        super().__init__(name="lock-sampler", daemon=True)
+        self.db = db
+        self.samples: List[Tuple[int, int]] = []
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(LOCK_SAMPLE_INTERVAL):
+            with self.db.conn.cursor() as cur:
+                cur.execute(self.QUERY)
+                self.samples.append(cur.fetchone())
+            self.db.conn.rollback()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+def deadlock_count(db) -> int:
+    with db.conn.cursor() as cur:
+        cur.execute("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+        count = cur.fetchone()[0]
+    db.conn.rollback()
+    return count
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def build_report(samples: List[Sample], elapsed: float, clients: int,
+                 lock_samples: List[Tuple[int, int]], deadlocks: Optional[int]) -> Dict:
+    """Сводка: пропускная способность, перцентили задержек, ошибки, блокировки"""
+    latencies = defaultdict(list)
+    errors: Dict[str, Counter[str]] = defaultdict(Counter)
+    for name, latency, error in samples:
+        latencies[name].append(latency)
+        if error:
+            errors[name][error] += 1
+    operations = {}
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        operations[name] = {
+            'count': len(values),
+            'ops_per_sec': round(len(values) / elapsed, 2),
+            'p50_ms': round(percentile(values, 0.50), 2),
+            'p95_ms': round(percentile(values, 0.95), 2),
+            'p99_ms': round(percentile(values, 0.99), 2),
+            'max_ms': round(values[-1], 2),
+            'errors': dict(errors[name]),
+        }
+    total_errors: Counter[str] = Counter()
+    for counter in errors.values():
+        total_errors.update(counter)
+    report = {
+        'clients': clients,
+        'elapsed_sec': round(elapsed, 2),
+        'operations_total': len(samples),
+        'ops_per_sec': round(len(samples) / elapsed, 2),
+        'errors': dict(total_errors),
+        'operations': operations,
+    }
+    if deadlocks is not None:
+        report['deadlocks'] = deadlocks
+    if lock_samples:
+        waiting = [backends for _, backends in lock_samples]
+        report['lock_waits'] = {
+            'samples': len(waiting),
+            'share_with_waits': round(sum(1 for w in waiting if w) / len(waiting), 3),
+            'avg_waiting_backends': round(sum(waiting) / len(waiting), 2),
+            'max_waiting_backends': max(waiting),
+            'max_waiting_locks': max(locks for locks, _ in lock_samples),
+        }
+    return report
+
+
+def format_report(report: Dict) -> str:
+    lines = [
+        f"Клиентов: {report['clients']}, длительность {report['elapsed_sec']} с, "
+        f"операций: {report['operations_total']} ({report['ops_per_sec']}/с)",
+        "",
+        f"{'Действие':<10}{'Кол-во':>8}{'Оп/с':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+        f"{'Макс':>10}  Ошибки",
+    ]
+    for name, op in report['operations'].items():
+        errors = ', '.join(f"{kind}={count}" for kind, count in op['errors'].items()) or '-'
+        lines.append(f"{name:<10}{op['count']:>8}{op['ops_per_sec']:>9}{op['p50_ms']:>9}"
+                     f"{op['p95_ms']:>9}{op['p99_ms']:>9}{op['max_ms']:>10}  {errors}")
+    lines.append("")
+    if 'deadlocks' in report:
+        lines.append(f"Взаимоблокировок (pg_stat_database): {report['deadlocks']}")
+    if 'lock_waits' in report:
+        waits = report['lock_waits']
+        lines.append(f"Ожидания блокировок: в {waits['share_with_waits']:.1%} замеров, "
+                     f"в среднем {waits['avg_waiting_backends']} сеансов, "
+                     f"максимум {waits['max_waiting_backends']} сеансов / "
+                     f"{waits['max_waiting_locks']} блокировок")
+    if report['errors']:
+        lines.append("Ошибки: " + ', '.join(f"{k}={v}" for k, v in report['errors'].items()))
+    return '\n'.join(lines)
+
+
+def run_load_test(clients: int, duration: float, mix: Dict[str, int], seed: int = 42,
+                  sqlite_path: Optional[str] = None, dsn: Optional[str] = None,
+                  allow_any_database: bool = False) -> Dict:
+    """
+    Запустить клиентов и собрать отчёт.
+
+    Без sqlite_path нагрузка идёт на PostgreSQL dsn (см. check_test_database).
+    """
+    if not sqlite_path:
+        check_test_database(dsn, allow_any_database)
+    monitor_db = None if sqlite_path else _open_database(None, dsn)
+    deadlocks_before = deadlock_count(monitor_db) if monitor_db else None
+    sampler = LockSampler(monitor_db) if monitor_db else None
+
+    start_at = time.time() + 1.0 + clients * 0.05
+    with ProcessPoolExecutor(max_workers=clients) as pool:
+        futures = [pool.submit(run_client, index, duration, mix, seed, sqlite_path, start_at, dsn)
+                   for index in range(clients)]
+        time.sleep(max(0.0, start_at - time.time()))
+        if sampler:
+            sampler.start()
+        started = time.monotonic()
+        samples: List[Sample] = []
+        for future in futures:
+            samples.extend(future.result())
+        elapsed = time.monotonic() - started
+
+    deadlocks = None
+    if monitor_db is not None and sampler is not None and deadlocks_before is not None:
+        sampler.stop()
+        deadlocks = deadlock_count(monitor_db) - deadlocks_before
+        monitor_db.close()
+    return build_report(samples, elapsed, clients, sampler.samples if sampler else [], deadlocks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест общей БД тарифов")
+    parser.add_argument('--clients', type=int, default=16, help="Число одновременных клиентов")
+    parser.add_argument('--duration', type=float, default=30, help="Длительность, секунды")
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help="Доли действий, например "
+                             "browse=40,search=25,edit=15,reorder=10,import=10")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--prepare', action='store_true',
+                        help="Заполнить пустую БД синтетической сетью (tools.datagen)")
+    parser.add_argument('--points', type=int, default=10000)
+    parser.add_argument('--routes', type=int, default=200)
+    parser.add_argument('--sqlite', help="Проверить сценарий на файле SQLite вместо PostgreSQL")
+    parser.add_argument('--dsn', help="Строка подключения к тестовой БД PostgreSQL")
+    parser.add_argument('--i-know', action='store_true',
+                        help="Разрешить БД без пометки test/bench/load в имени (данные изменятся)")
+    parser.add_argument('--json', help="Записать отчёт в JSON-файл")
+    args = parser.parse_args()
+    if not args.sqlite:
+        try:
+            check_test_database(args.dsn, args.i_know)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.prepare:
+        from tools.datagen import NetworkSpec, generate_network
+        db = _open_database(args.sqlite, args.dsn)
+        if not db.get_all_points():
+            generate_network(db, NetworkSpec(points=args.points, routes=args.routes,
+                                             seed=args.seed))
+        db.close()
+
+    report = run_load_test(args.clients, args.duration, args.mix, args.seed, args.sqlite,
+                           args.dsn, args.i_know)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+migrate.py
+Обновление схемы общей БД PostgreSQL (выполняет администратор)
+
+Клиенты приложения DDL не выполняют и не подключаются к серверу со
+схемой старее своей версии. Миграции из core.migrations применяются
+этой командой от пользователя с правами на изменение схемы (для
+миграции 4 - и на CREATE EXTENSION btree_gist).
+
+Запуск:
+    python -m tools.migrate                      # сервер из config.json
+    python -m tools.migrate --dsn "host=... dbname=... user=admin"
+    python -m tools.migrate --check              # только показать недостающие
+"""
+import argparse
+import sys
+
+from core import migrations
+from core.database import Database, DatabaseError
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Миграции схемы общей БД тарифов")
+    parser.add_argument('--dsn', help="Строка подключения (по умолчанию - config.json)")
+    parser.add_argument('--check', action='store_true',
+                        help="Не применять, только вывести недостающие миграции")
+    args = parser.parse_args(argv)
+
+    try:
+        db = Database(args.dsn, check_schema=False)
+    except DatabaseError as e:
+        print(e, file=sys.stderr)
+        return 2
+    try:
+        pending = migrations.pending_postgres_migrations(db.conn)
+        if args.check or not pending:
+            print(f"Недостающие миграции: {', '.join(map(str, pending))}" if pending
+                  else "Схема актуальна")
+            return 1 if pending else 0
+        applied = db.apply_migrations()
+        print(f"Применены миграции: {', '.join(map(str, applied)) or 'нет'}")
+        return 0
+    except DatabaseError as e:
+        print(e, file=sys.stderr)
+        return 2
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Диалог массового изменения параметров тарифа для группы маршрутов"""
+from PyQt5.QtWidgets import (QVBoxLayout, QHBoxLayout, QGridLayout, QGroupBox, QLabel,
+                             QPushButton, QCheckBox, QDoubleSpinBox, QLineEdit, QRadioButton)
+
+from core.fare_cache import fare_cache
+from .base_dialog import BaseDialog
+
+
+class BulkTariffDialog(BaseDialog):
+    def __init__(self, db, search="", selected_route_id=None, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.selected_route_id = selected_route_id
+        self.tariff_update = None
+        self.setWindowTitle("Изменение тарифа маршрутов")
+        self.setup_ui(search)
+
+    def setup_ui(self, search):
+        layout = QVBoxLayout()
+
+        # Отбор маршрутов
+        filter_group = QGroupBox("Маршруты")
+        filter_layout = QGridLayout()
+        self.filter_radio = QRadioButton("По отбору")
+        self.filter_radio.setChecked(True)
+        filter_layout.addWidget(self.filter_radio, 0, 0, 1, 2)
+        self.selected_radio = QRadioButton("Только выделенный маршрут")
+        self.selected_radio.setEnabled(self.selected_route_id is not None)
+        filter_layout.addWidget(self.selected_radio, 0, 2, 1, 2)
+
+        filter_layout.addWidget(QLabel("Номер или название содержит:"), 1, 0)
+        self.search_input = QLineEdit(search)
+        filter_layout.addWidget(self.search_input, 1, 1, 1, 3)
+        self.min_cost_check, self.min_cost_spin = self._parameter(
+            filter_layout, 2, 0, "Стоимость км от", 1000, 2)
+        self.max_cost_check, self.max_cost_spin = self._parameter(
+            filter_layout, 2, 2, "до", 1000, 2)
+        self.filter_radio.toggled.connect(self._update_filter_state)
+        filter_group.setLayout(filter_layout)
+        layout.addWidget(filter_group)
+
+        # Новые значения: неотмеченные параметры не меняются
+        values_group = QGroupBox("Новые значения")
+        values_layout = QGridLayout()
+        self.cost_check, self.cost_spin = self._parameter(
+            values_layout, 0, 0, "Стоимость км, руб.", 1000, 2)
+        self.baggage_check, self.baggage_spin = self._parameter(
+            values_layout, 1, 0, "Багаж, %", 100, 1)
+        self.rounding_check, self.rounding_spin = self._parameter(
+            values_layout, 2, 0, "Округление, руб.", 100, 2)
+        values_group.setLayout(values_layout)
+        layout.addWidget(values_group)
+
+        btn_layout = QHBoxLayout()
+        btn_layout.addStretch()
+        apply_btn = QPushButton("Применить")
+        apply_btn.clicked.connect(self.apply)
+        btn_layout.addWidget(apply_btn)
+        cancel_btn = QPushButton("Отмена")
+        cancel_btn.clicked.connect(self.reject)
+        btn_layout.addWidget(cancel_btn)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+
+    def _parameter(self, grid, row, col, title, maximum, decimals):
+        check = QCheckBox(title)
+        spin = QDoubleSpinBox()
+        spin.setRange(0, maximum)
+        spin.setDecimals(decimals)
+        spin.setEnabled(False)
+        check.toggled.connect(spin.setEnabled)
+        grid.addWidget(check, row, col)
+        grid.addWidget(spin, row, col + 1)
+        return check, spin
+
+    def _update_filter_state(self, by_filter):
+        for widget in (self.search_input, self.min_cost_check, self.max_cost_check):
+            widget.setEnabled(by_filter)
+        self.min_cost_spin.setEnabled(by_filter and self.min_cost_check.isChecked())
+        self.max_cost_spin.setEnabled(by_filter and self.max_cost_check.isChecked())
+
+    @staticmethod
+    def _value(check, spin):
+        return spin.value() if check.isEnabled() and check.isChecked() else None
+
+    def apply(self):
+        values = (self._value(self.cost_check, self.cost_spin),
+                  self._value(self.baggage_check, self.baggage_spin),
+                  self._value(self.rounding_check, self.rounding_spin))
+        if all(value is None for value in values):
+            self.show_warning("Внимание", "Отметьте хотя бы один параметр тарифа")
+            return
+        if self.selected_radio.isChecked():
+            route_filter = {'route_ids': [self.selected_route_id]}
+        else:
+            route_filter = {'search': self.search_input.text().strip() or None,
+                            'min_cost_per_km': self._value(self.min_cost_check, self.min_cost_spin),
+                            'max_cost_per_km': self._value(self.max_cost_check, self.max_cost_spin)}
+            if all(value is None for value in route_filter.values()) and not self.show_question(
+                    "Подтверждение", "Отбор не задан. Изменить тариф всех маршрутов?"):
+                return
+
+        try:
+            self.tariff_update = self.db.update_tariff_parameters(*values, **route_filter)
+        except Exception as e:
+            self.show_error("Ошибка", f"Не удалось изменить тариф: {e}")
+            return
+        fare_cache.invalidate(self.tariff_update.route_ids)
+        self.show_info(
+            "Успешно",
+            f"Отобрано маршрутов: {self.tariff_update.routes_matched}, "
+            f"пунктов: {self.tariff_update.rows_matched}\n"
+            f"Изменено пунктов: {self.tariff_update.rows_updated} "
+            f"в маршрутах: {len(self.tariff_update.route_ids)}"
+        )
+        self.accept()
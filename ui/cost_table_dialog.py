@@ -0,0 +1,229 @@
+"""
+Таблица стоимости маршрута: матрица «откуда / куда» с ленивым расчётом
+
+Ячейки считаются только для видимой области: QTableView запрашивает
+данные видимых ячеек, модель считает их блоками BLOCK_SIZE x BLOCK_SIZE
+и хранит последние MAX_BLOCKS блоков. Названия пунктов - в заголовках
+строк и столбцов, которые не прокручиваются вместе с ячейками.
+Печать - постраничная, в отдельном потоке (ui.print_engine), предпросмотр
+рисует только показываемую страницу (ui.cost_table_preview).
+"""
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from PyQt5.QtWidgets import (QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTableView,
+                             QHeaderView, QFileDialog, QProgressDialog)
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QFont, QFontMetrics
+
+from models import RouteSequence
+from utils.cost_tiles import CostTableTiles, Fares, cost_cells
+from utils.exporter import TariffExporter
+from .base_dialog import BaseDialog
+from .decorators import track_latency
+from .cost_table_preview import CostTablePreviewDialog
+from .print_engine import CostTablePrintJob
+
+# Размер блока ячеек и число блоков в кэше модели
+BLOCK_SIZE = 32
+MAX_BLOCKS = 256
+
+
+class CostMatrixModel(QAbstractTableModel):
+    """Строка - пункт прибытия, столбец - пункт отправления (ячейки ниже диагонали)"""
+
+    def __init__(self, sequence: RouteSequence, round_up: bool = False, parent=None):
+        super().__init__(parent)
+        self.sequence = sequence
+        self.round_up = round_up
+        self._blocks: 'OrderedDict[Tuple[int, int], List[List[Optional[Fares]]]]' = OrderedDict()
+        self.blocks_computed = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.sequence)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.sequence)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return self.sequence.point_names[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        if column >= row:
+            return "" if role == Qt.DisplayRole else None
+        passenger, child, baggage = self.cell(row, column)
+        if role == Qt.ToolTipRole:
+            names = self.sequence.point_names
+            return (f"{names[column]} → {names[row]}\n"
+                    f"Пассажирский: {passenger:.2f}\nДетский: {child:.2f}\nБагаж: {baggage:.2f}")
+        return f"{passenger:.2f}\n{child:.2f}\n{baggage:.2f}"
+
+    def cell(self, row: int, column: int) -> Optional[Fares]:
+        """Тарифы поездки из пункта column в пункт row (None над диагональю)"""
+        key = (row // BLOCK_SIZE, column // BLOCK_SIZE)
+        block = self._blocks.get(key)
+        if block is None:
+            block = self._compute_block(*key)
+            self._blocks[key] = block
+            if len(self._blocks) > MAX_BLOCKS:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(key)
+        return block[row % BLOCK_SIZE][column % BLOCK_SIZE]
+
+    def _compute_block(self, block_row: int, block_column: int) -> List[List[Optional[Fares]]]:
+        count = len(self.sequence)
+        rows = range(block_row * BLOCK_SIZE, min((block_row + 1) * BLOCK_SIZE, count))
+        columns = range(block_column * BLOCK_SIZE, min((block_column + 1) * BLOCK_SIZE, count))
+        self.blocks_computed += 1
+        return cost_cells(self.sequence, rows, columns, self.round_up)
+
+
+class CostTableDialog(BaseDialog):
+    def __init__(self, sequence: RouteSequence, route_number, route_name, round_up=False,
+                 parent=None):
+        super().__init__(parent)
+        self.sequence = sequence
+        self.route_number = route_number
+        self.route_name = route_name
+        self.round_up = round_up
+        self.tiles = CostTableTiles(sequence, round_up)
+        self._print_job: Optional[CostTablePrintJob] = None
+        self.setWindowTitle("Таблица стоимости")
+        self.resize(900, 600)
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+
+        title = QLabel(f"Таблица стоимости по маршруту {self.route_number} — {self.route_name}\n"
+                       f"Стоимость 1 п-км: {self.sequence.cost_per_km:.2f}. "
+                       f"В ячейке: пассажирский, детский, багаж")
+        layout.addWidget(title)
+
+        self.model = CostMatrixModel(self.sequence, self.round_up, self)
+        self.view = QTableView()
+        font = QFont("Courier New", 9)
+        self.view.setFont(font)
+        self.view.setModel(self.model)
+        self.view.setWordWrap(False)
+        self.view.setCornerButtonEnabled(False)
+        # Фиксированные размеры: без измерения содержимого всех строк и столбцов
+        metrics = QFontMetrics(font)
+        for header, size in ((self.view.horizontalHeader(), metrics.horizontalAdvance("0" * 10)),
+                             (self.view.verticalHeader(), metrics.lineSpacing() * 3 + 6)):
+            header.setSectionResizeMode(QHeaderView.Fixed)
+            header.setDefaultSectionSize(size)
+        self.view.verticalHeader().setMaximumWidth(metrics.horizontalAdvance("0" * 24))
+        layout.addWidget(self.view)
+
+        btn_layout = QHBoxLayout()
+        save_btn = QPushButton("💾 Сохранить в TXT")
+        save_btn.clicked.connect(self.save_txt)
+        btn_layout.addWidget(save_btn)
+        preview_btn = QPushButton("👁 Предпросмотр")
+        preview_btn.clicked.connect(self.preview_table)
+        btn_layout.addWidget(preview_btn)
+        print_btn = QPushButton("🖨️ Печать")
+        print_btn.clicked.connect(self.print_table)
+        btn_layout.addWidget(print_btn)
+        ok_btn = QPushButton("OK")
+        ok_btn.clicked.connect(self.accept)
+        btn_layout.addWidget(ok_btn)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+
+    def write_text(self, out):
+        TariffExporter.write_cost_table_text(out, self.sequence, self.route_number,
+                                             self.route_name, self.round_up)
+
+    @track_latency()
+    def save_txt(self):
+        """Сохранить таблицу стоимости в TXT"""
+        current_date = datetime.now().strftime("%Y%m%d_%H%M%S")
+        default_filename = f"Таблица_стоимости_маршрут_{self.route_number}_{current_date}.txt"
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Сохранить таблицу стоимости", default_filename,
+            "Текстовые файлы (*.txt);;Все файлы (*.*)"
+        )
+        if not filename:
+            return
+        if not filename.endswith('.txt'):
+            filename += '.txt'
+        try:
+            with open(filename, 'w', encoding='utf-8') as f:
+                self.write_text(f)
+        except OSError as e:
+            self.show_error("Ошибка", f"Не удалось сохранить таблицу: {e}")
+            return
+        self.show_info("Успешно", f"Таблица сохранена в:\n{filename}")
+
+    def print_title(self) -> List[str]:
+        """Заголовок страниц печати"""
+        return [f"Таблица стоимости по маршруту {self.route_number} — {self.route_name}",
+                f"Стоимость 1 п-км: {self.sequence.cost_per_km:.2f}. "
+                f"В ячейке: пассажирский, детский, багаж"]
+
+    def _make_printer(self):
+        from PyQt5.QtPrintSupport import QPrinter
+        printer = QPrinter(QPrinter.HighResolution)
+        printer.setPageSize(QPrinter.A4)
+        printer.setOrientation(QPrinter.Portrait)
+        printer.setPageMargins(5, 5, 5, 5, QPrinter.Millimeter)
+        return printer
+
+    def preview_table(self):
+        """Предпросмотр печати таблицы стоимости (страницы рисуются по мере просмотра)"""
+        preview = CostTablePreviewDialog(self._make_printer(), self.tiles, self.print_title(), self)
+        if preview.exec_():
+            self.print_table()
+
+    def print_table(self):
+        """Напечатать таблицу стоимости (страницы рисуются в отдельном потоке)"""
+        from PyQt5.QtPrintSupport import QPrintDialog
+        if self._print_job is not None and self._print_job.isRunning():
+            self.show_warning("Печать", "Таблица уже печатается")
+            return
+        printer = self._make_printer()
+        dialog = QPrintDialog(printer, self)
+        if dialog.exec_() != QPrintDialog.Accepted:
+            return
+
+        progress = QProgressDialog("Печать таблицы стоимости...", "Отмена", 0, 0, self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+        job = CostTablePrintJob(printer, self.tiles, self.print_title(), self)
+        job.progress.connect(lambda done, total: (progress.setMaximum(total),
+                                                  progress.setValue(done)))
+        progress.canceled.connect(job.requestInterruption)
+        job.finished.connect(lambda: self._print_finished(job, progress))
+        self._print_job = job
+        job.start()
+
+    def _print_finished(self, job: CostTablePrintJob, progress: QProgressDialog):
+        progress.close()
+        if job.error:
+            self.show_error("Ошибка", f"Не удалось напечатать таблицу: {job.error}")
+        elif job.cancelled:
+            self.show_info("Печать", "Печать отменена")
+        else:
+            self.show_info("Успешно", "Таблица отправлена на печать")
+
+    def done(self, result):
+        # Незавершённую печать отменяем до закрытия окна
+        if self._print_job is not None and self._print_job.isRunning():
+            self._print_job.requestInterruption()
+            self._print_job.wait()
+        super().done(result)
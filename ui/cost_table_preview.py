@@ -0,0 +1,106 @@
+"""
+Предпросмотр печати таблицы стоимости
+
+QPrintPreviewDialog перед показом рисует все страницы документа в
+GUI-потоке, что на длинном маршруте - сотни страниц. Здесь разбиение
+на страницы считается сразу (без тарифов), а рисуется только
+показываемая страница: вёрсткой печати (ui.print_engine) в единицах
+принтера, уменьшенной до разрешения предпросмотра; ячейки - из кэша плиток.
+"""
+from typing import List
+
+from PyQt5.QtWidgets import (QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QScrollArea,
+                             QSpinBox)
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QFont, QImage, QPainter, QPixmap
+from PyQt5.QtPrintSupport import QPrinter
+
+from utils.cost_tiles import CostTableTiles
+from .base_dialog import BaseDialog
+from .print_engine import (PRINT_FONT_FAMILY, PRINT_FONT_SIZE, draw_page, layout_pages,
+                           page_header)
+
+# Разрешение изображения страницы в предпросмотре
+PREVIEW_DPI = 96
+
+
+class CostTablePreviewDialog(BaseDialog):
+    """Постраничный предпросмотр; «Печать» закрывает окно с результатом Accepted"""
+
+    def __init__(self, printer: QPrinter, tiles: CostTableTiles, title: List[str], parent=None):
+        super().__init__(parent)
+        self.tiles = tiles
+        self.title = title
+        self.pages_rendered = 0
+        # Вёрстка - в единицах принтера (как при печати), изображение - уменьшенная копия
+        resolution = printer.resolution()
+        page = printer.pageRect()
+        self._scale = PREVIEW_DPI / resolution
+        self._image = QImage(round(page.width() * self._scale), round(page.height() * self._scale),
+                             QImage.Format_RGB32)
+        dots_per_meter = round(resolution / 0.0254)
+        self._image.setDotsPerMeterX(dots_per_meter)
+        self._image.setDotsPerMeterY(dots_per_meter)
+        painter = QPainter(self._image)
+        try:
+            self.pages, self._geometry = layout_pages(painter, page, tiles, title)
+        finally:
+            painter.end()
+        self.setWindowTitle("Предпросмотр печати")
+        self.resize(self._image.width() + 60, 700)
+        self.setup_ui()
+        self.show_page(1)
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+
+        self.page_label = QLabel()
+        self.page_label.setAlignment(Qt.AlignCenter)
+        scroll = QScrollArea()
+        scroll.setAlignment(Qt.AlignCenter)
+        scroll.setWidget(self.page_label)
+        scroll.setWidgetResizable(True)
+        layout.addWidget(scroll)
+
+        btn_layout = QHBoxLayout()
+        self.prev_btn = QPushButton("◀")
+        self.prev_btn.clicked.connect(lambda: self.show_page(self.page_spin.value() - 1))
+        btn_layout.addWidget(self.prev_btn)
+        self.page_spin = QSpinBox()
+        self.page_spin.setRange(1, len(self.pages))
+        self.page_spin.setSuffix(f" из {len(self.pages)}")
+        self.page_spin.valueChanged.connect(self.show_page)
+        btn_layout.addWidget(self.page_spin)
+        self.next_btn = QPushButton("▶")
+        self.next_btn.clicked.connect(lambda: self.show_page(self.page_spin.value() + 1))
+        btn_layout.addWidget(self.next_btn)
+        btn_layout.addStretch()
+        print_btn = QPushButton("🖨️ Печать")
+        print_btn.clicked.connect(self.accept)
+        btn_layout.addWidget(print_btn)
+        close_btn = QPushButton("Закрыть")
+        close_btn.clicked.connect(self.reject)
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+
+    def show_page(self, number: int):
+        """Нарисовать и показать страницу number (с 1)"""
+        number = max(1, min(number, len(self.pages)))
+        if self.page_spin.value() != number:
+            # valueChanged вызовет show_page ещё раз уже с этим номером
+            self.page_spin.setValue(number)
+            return
+        self._image.fill(Qt.GlobalColor.white)
+        painter = QPainter(self._image)
+        try:
+            painter.scale(self._scale, self._scale)
+            painter.setFont(QFont(PRINT_FONT_FAMILY, PRINT_FONT_SIZE))
+            draw_page(painter, self.tiles, self.pages[number - 1],
+                      page_header(self.title, number, len(self.pages)), self._geometry)
+        finally:
+            painter.end()
+        self.pages_rendered += 1
+        self.page_label.setPixmap(QPixmap.fromImage(self._image))
+        self.prev_btn.setEnabled(number > 1)
+        self.next_btn.setEnabled(number < len(self.pages))
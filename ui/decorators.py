@@ -1,6 +1,7 @@
 """
 Декораторы для обработки ошибок и повторяющихся операций
 """
+import inspect
 from functools import wraps
 from PyQt5.QtWidgets import QMessageBox
 import traceback
@@ -100,4 +101,33 @@ def retry_on_failure(max_retries=3, delay=1000):
             
             raise last_error
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
+
+
+def track_latency(name=None):
+    """
+    Декоратор для измерения длительности слота в мониторе задержек.
+    
+    Сигналы Qt передают слоту свои аргументы (clicked - флаг checked);
+    лишние позиционные аргументы отбрасываются, как это делает Qt
+    для неотмеченного метода.
+    """
+    def decorator(func):
+        from .latency_monitor import latency_monitor
+        
+        slot_name = name or func.__qualname__
+        parameters = inspect.signature(func).parameters.values()
+        if any(p.kind == p.VAR_POSITIONAL for p in parameters):
+            max_args = None
+        else:
+            max_args = sum(p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)
+                           for p in parameters) - 1
+        
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if max_args is not None:
+                args = args[:max_args]
+            with latency_monitor.track(slot_name):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
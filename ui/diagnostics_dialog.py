@@ -0,0 +1,111 @@
+"""Диалог диагностики: задержки интерфейса по слотам и последние зависания"""
+from datetime import datetime
+import time
+
+from PyQt5.QtWidgets import (QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
+                             QTableWidget, QTableWidgetItem, QHeaderView,
+                             QListWidget, QTextEdit, QSplitter)
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QFont
+from .base_dialog import BaseDialog
+from .latency_monitor import latency_monitor, BUCKETS_MS
+
+
+class DiagnosticsDialog(BaseDialog):
+    def __init__(self, parent=None, monitor=None):
+        super().__init__(parent)
+        self.monitor = monitor or latency_monitor
+        self.setWindowTitle("Диагностика интерфейса")
+        self.resize(900, 600)
+        self._stalls = []
+        self.setup_ui()
+        self.load_stats()
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+
+        self.summary_label = QLabel()
+        self.summary_label.setStyleSheet("font-size: 14px; font-weight: bold;")
+        layout.addWidget(self.summary_label)
+
+        splitter = QSplitter(Qt.Vertical)
+
+        # Гистограммы длительности по слотам
+        bucket_headers = [f"≤{limit}" for limit in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"]
+        self.table = QTableWidget()
+        self.table.setColumnCount(5 + len(bucket_headers))
+        self.table.setHorizontalHeaderLabels(
+            ["Слот", "Вызовов", "Среднее, мс", "p95, мс", "Макс, мс"] + bucket_headers
+        )
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        splitter.addWidget(self.table)
+
+        # Последние зависания и стек главного потока
+        stalls_widget = QSplitter(Qt.Horizontal)
+        self.stalls_list = QListWidget()
+        self.stalls_list.currentRowChanged.connect(self._show_stack)
+        stalls_widget.addWidget(self.stalls_list)
+        self.stack_text = QTextEdit()
+        self.stack_text.setReadOnly(True)
+        self.stack_text.setFont(QFont("Courier New", 9))
+        stalls_widget.addWidget(self.stack_text)
+        stalls_widget.setSizes([300, 600])
+        splitter.addWidget(stalls_widget)
+        layout.addWidget(splitter)
+
+        btn_layout = QHBoxLayout()
+        refresh_btn = QPushButton("🔄 Обновить")
+        refresh_btn.clicked.connect(self.load_stats)
+        btn_layout.addWidget(refresh_btn)
+
+        reset_btn = QPushButton("Сбросить")
+        reset_btn.clicked.connect(self._reset)
+        btn_layout.addWidget(reset_btn)
+        btn_layout.addStretch()
+
+        close_btn = QPushButton("Закрыть")
+        close_btn.clicked.connect(self.accept)
+        btn_layout.addWidget(close_btn)
+
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+
+    def load_stats(self):
+        histograms, self._stalls = self.monitor.snapshot()
+        state = "включён" if self.monitor.is_running else "выключен"
+        self.summary_label.setText(
+            f"Контроль {state}: пульс {self.monitor.heartbeat_ms} мс, "
+            f"порог зависания {self.monitor.threshold_ms} мс, зависаний: {len(self._stalls)}"
+        )
+
+        rows = sorted(histograms.items(), key=lambda item: item[1].max_ms, reverse=True)
+        self.table.setRowCount(len(rows))
+        for row, (slot, histogram) in enumerate(rows):
+            values = [histogram.total, f"{histogram.mean_ms:.1f}",
+                      f"{histogram.percentile(0.95):.0f}", f"{histogram.max_ms:.1f}"]
+            values += histogram.counts
+            self.table.setItem(row, 0, QTableWidgetItem(slot))
+            for col, value in enumerate(values, 1):
+                item = QTableWidgetItem(str(value))
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, col, item)
+
+        self.stalls_list.clear()
+        now_wall, now_mono = time.time(), time.monotonic()
+        for stall in reversed(self._stalls):
+            started = datetime.fromtimestamp(now_wall - (now_mono - stall.started))
+            duration = f"{stall.duration_ms:.0f} мс" if stall.duration_ms else "продолжается"
+            self.stalls_list.addItem(f"{started:%H:%M:%S} {duration} - {stall.slot}")
+        self.stack_text.clear()
+        if self._stalls:
+            self.stalls_list.setCurrentRow(0)
+
+    def _show_stack(self, row):
+        if 0 <= row < len(self._stalls):
+            self.stack_text.setPlainText(self._stalls[-1 - row].stack)
+
+    def _reset(self):
+        self.monitor.reset()
+        self.load_stats()
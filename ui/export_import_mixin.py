@@ -3,12 +3,20 @@
 """
 import os
 import csv
-from datetime import datetime
+import logging
+from datetime import date, datetime
 from PyQt5.QtWidgets import QMessageBox, QFileDialog, QProgressDialog
 from PyQt5.QtCore import Qt
 
 from .services import ExportService, ImportService
 from .utils import NumberUtils, StringUtils, DateTimeUtils, ValidationUtils
+from .decorators import track_latency
+from core.point_import import SKIP_NAMES, import_points_csv, import_points_rows
+from utils.export_cache import export_cache
+from utils.exporter import EXPORTER_VERSION
+from utils.logger import log_timing
+
+logger = logging.getLogger(__name__)
 
 class ExportImportMixin:
     """Миксин с методами экспорта и импорта для RouteGridDialog"""
@@ -70,10 +78,22 @@ class ExportImportMixin:
             # Экспортируем в зависимости от формата
             if file_ext == '.csv':
                 self._export_to_csv(filename, data, headers)
-            elif file_ext == '.xlsx':
-                self._export_to_excel(filename, data, headers)
-            elif file_ext == '.pdf':
-                self._export_to_pdf(filename, data, headers)
+                return
+            if file_ext not in ('.xlsx', '.pdf'):
+                return
+            
+            # Неизменённый маршрут берётся из кэша выгрузок (дата формирования - часть ключа)
+            cache_key = export_cache.key('route', file_ext, EXPORTER_VERSION, self.route_number,
+                                         self.route_name, headers, data, date.today())
+            if export_cache.fetch(cache_key, filename):
+                QMessageBox.information(self, "Успешно", f"Маршрут экспортирован в:\n{filename}")
+                return
+            if file_ext == '.xlsx':
+                saved = self._export_to_excel(filename, data, headers)
+            else:
+                saved = self._export_to_pdf(filename, data, headers)
+            if saved:
+                export_cache.store(cache_key, filename)
                 
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось экспортировать: {str(e)}")
@@ -96,6 +116,7 @@ class ExportImportMixin:
                 f"Маршрут №{self.route_number}"
             )
             QMessageBox.information(self, "Успешно", f"Маршрут экспортирован в Excel")
+            return True
         except Exception as e:
             raise Exception(f"Ошибка экспорта в Excel: {e}")
     
@@ -139,7 +160,7 @@ class ExportImportMixin:
                 fontSize=10
             )
             elements.append(Paragraph(
-                f"Дата формирования: {datetime.now().strftime('%d.%m.%Y %H:%M')}",
+                f"Дата формирования: {datetime.now().strftime('%d.%m.%Y')}",
                 date_style
             ))
             elements.append(Spacer(1, 0.5*cm))
@@ -214,6 +235,7 @@ class ExportImportMixin:
             doc.build(elements)
             
             QMessageBox.information(self, "Успешно", f"PDF сохранен в:\n{filename}")
+            return True
             
         except ImportError:
             QMessageBox.critical(
@@ -221,11 +243,13 @@ class ExportImportMixin:
                 "Библиотека reportlab не установлена.\n"
                 "Установите: pip install reportlab"
             )
+            return False
         except Exception as e:
             raise Exception(f"Ошибка создания PDF: {e}")
     
     # ==================== ИМПОРТ ====================
     
+    @track_latency()
     def import_from_file(self):
         """Импорт пунктов из Excel или CSV файла"""
         try:
@@ -245,8 +269,12 @@ class ExportImportMixin:
             # Получаем глобальные параметры
             global_params = self._get_global_parameters()
             
-            # Получаем все существующие пункты
-            all_points = {p['name'].lower(): p['id'] for p in self.db.get_all_points()}
+            if self.db.backend == 'postgresql':
+                self._import_via_copy(filename, global_params, progress)
+                return
+            
+            # Получаем все существующие пункты (потоково, без списка словарей)
+            all_points = {p.name.lower(): p.id for p in self.db.iter_points()}
             
             progress.setValue(30)
             
@@ -266,26 +294,32 @@ class ExportImportMixin:
             
             progress.setValue(40)
             
-            for idx, row_data in enumerate(data):
-                if progress.wasCanceled():
-                    break
-                
-                point_name = row_data.get('Пункт назначения', '')
-                distance_value = row_data.get('Расстояние (км)', '')
-                
-                if not point_name or not distance_value:
-                    continue
-                
-                result = self._process_import_row(
-                    point_name, distance_value, idx + 2, all_points, global_params
-                )
-                
-                if result['success']:
-                    imported_count += 1
-                elif result['error']:
-                    errors.append(result['error'])
-                
-                progress.setValue(40 + int(50 * idx / len(data)))
+            with log_timing(logger, f"Импорт из {os.path.basename(filename)}",
+                            route_id=self.route_id, rows=len(data)) as fields:
+                for idx, row_data in enumerate(data):
+                    if progress.wasCanceled():
+                        break
+                    
+                    point_name = row_data.get('Пункт назначения', '')
+                    distance_value = row_data.get('Расстояние (км)', '')
+                    
+                    if not point_name or not distance_value:
+                        continue
+                    
+                    result = self._process_import_row(
+                        point_name, distance_value, idx + 2, all_points, global_params
+                    )
+                    logger.debug("Импорт строки %d: %r, %r км - %s", idx + 2, point_name,
+                                 distance_value, result['error'] or "ok")
+                    
+                    if result['success']:
+                        imported_count += 1
+                    elif result['error']:
+                        errors.append(result['error'])
+                    
+                    progress.setValue(40 + int(50 * idx / len(data)))
+                fields['imported'] = imported_count
+                fields['errors'] = len(errors)
             
             progress.setValue(100)
             
@@ -301,6 +335,28 @@ class ExportImportMixin:
             import traceback
             traceback.print_exc()
     
+    def _import_via_copy(self, filename, global_params, progress):
+        """Импорт через COPY во временную таблицу и проверки на сервере (PostgreSQL)"""
+        with log_timing(logger, f"Импорт из {os.path.basename(filename)} через COPY",
+                        route_id=self.route_id) as fields:
+            if os.path.splitext(filename)[1].lower() in ['.xlsx', '.xls']:
+                data = ImportService.import_from_excel(filename)
+                progress.setValue(40)
+                result = import_points_rows(self.db, self.route_id, data, global_params)
+            else:
+                delimiter = ImportService.detect_delimiter(filename)
+                with open(filename, 'r', encoding='utf-8-sig', newline='') as source:
+                    result = import_points_csv(self.db, self.route_id, source, global_params,
+                                               delimiter)
+            fields['rows'] = result.rows
+            fields['imported'] = result.imported
+            fields['errors'] = len(result.errors)
+        
+        progress.setValue(100)
+        self.load_points()
+        self.load_route_sequence()
+        self._show_import_result(result.imported, result.errors)
+    
     def _process_import_row(self, point_name, distance_value, row_num, all_points, global_params):
         """Обработка одной строки импорта"""
         result = {'success': False, 'error': None}
@@ -311,7 +367,7 @@ class ExportImportMixin:
                 return result
             
             # Пропускаем заголовки
-            if point_name.lower() in ['пункт назначения', 'название пункта', 'point name']:
+            if point_name.lower() in SKIP_NAMES:
                 return result
             
             # Преобразуем расстояние
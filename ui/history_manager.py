@@ -1,50 +1,137 @@
 """
 Менеджер истории действий (Undo/Redo)
+
+История хранит компактные изменения (дельты) - кортежи вида
+(вид, ключ..., старое значение, новое значение), а не копии данных.
+Несколько дельт объединяются в транзакцию: массовая операция
+(сортировка, импорт) отменяется одним шагом. Объём истории
+ограничен и числом записей, и оценкой занимаемой памяти в байтах.
 """
-from typing import List, Dict, Any, Optional
+import sys
+import time
 from collections import deque
+from contextlib import contextmanager
 from dataclasses import dataclass, field
+from typing import Any, Deque, List, Optional, Tuple
+
+# Ограничение памяти истории по умолчанию
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024
+
+Delta = Tuple[Any, ...]
+
+
+def _deep_size(obj: Any) -> int:
+    """Оценка памяти дельты: кортежи учитываются вместе с содержимым"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (tuple, list)):
+        size += sum(_deep_size(item) for item in obj)
+    return size
 
 
 @dataclass
 class HistoryEntry:
-    """Запись в истории"""
-    action: str  # 'add', 'edit', 'delete', 'sort'
-    data: Dict[str, Any]
-    timestamp: float = field(default_factory=lambda: __import__('time').time())
-    description: str = ""
+    """Запись в истории: одна или несколько дельт, отменяемых вместе"""
+    description: str
+    deltas: Tuple[Delta, ...]
+    size: int = 0
+    timestamp: float = field(default_factory=time.time)
 
 
 class HistoryManager:
     """Менеджер для управления историей действий"""
-    
-    def __init__(self, max_size: int = 50):
-        self.undo_stack: deque = deque(maxlen=max_size)
-        self.redo_stack: deque = deque(maxlen=max_size)
+
+    def __init__(self, max_size: int = 500, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.undo_stack: Deque[HistoryEntry] = deque()
+        self.redo_stack: Deque[HistoryEntry] = deque()
         self.max_size = max_size
-    
-    def add_action(self, action: str, data: Dict[str, Any], description: str = "") -> None:
-        """Добавить действие в историю"""
-        entry = HistoryEntry(action=action, data=data, description=description)
+        self.max_bytes = max_bytes
+        self.memory_usage = 0
+        self._group: Optional[List[Delta]] = None
+        self._group_description = ""
+        self._group_depth = 0
+        self._suspended = 0
+
+    def record(self, delta: Delta, description: str = "") -> None:
+        """
+        Записать изменение.
+
+        Внутри transaction() дельта добавляется в текущую транзакцию,
+        иначе становится отдельной записью истории.
+        """
+        if self._suspended:
+            return
+        if self._group is not None:
+            self._group.append(delta)
+            return
+        self._push(HistoryEntry(description, (delta,)))
+
+    @contextmanager
+    def transaction(self, description: str):
+        """
+        Объединить изменения внутри блока в одну запись истории.
+
+        Вложенные транзакции входят во внешнюю. Если в блоке произошла
+        ошибка, накопленные дельты всё равно записываются: изменения
+        уже применены и должны оставаться отменяемыми.
+        """
+        if self._group is None:
+            self._group = []
+            self._group_description = description
+        self._group_depth += 1
+        try:
+            yield self
+        finally:
+            self._group_depth -= 1
+            if self._group_depth == 0:
+                deltas, self._group = self._group, None
+                if deltas:
+                    self._push(HistoryEntry(self._group_description, tuple(deltas)))
+
+    @contextmanager
+    def suspended(self):
+        """Не записывать изменения внутри блока (применение undo/redo)"""
+        self._suspended += 1
+        try:
+            yield
+        finally:
+            self._suspended -= 1
+
+    @property
+    def is_suspended(self) -> bool:
+        return self._suspended > 0
+
+    def _push(self, entry: HistoryEntry) -> None:
+        entry.size = _deep_size(entry.deltas) + sys.getsizeof(entry.description)
         self.undo_stack.append(entry)
-        self.redo_stack.clear()  # Очищаем redo при новом действии
-    
+        self.memory_usage += entry.size
+        # Новое действие делает повтор отменённых невозможным
+        for dropped in self.redo_stack:
+            self.memory_usage -= dropped.size
+        self.redo_stack.clear()
+        self._trim()
+
+    def _trim(self) -> None:
+        """Удалить самые старые записи сверх лимитов (последняя запись сохраняется)"""
+        while len(self.undo_stack) > 1 and (
+                len(self.undo_stack) > self.max_size or self.memory_usage > self.max_bytes):
+            self.memory_usage -= self.undo_stack.popleft().size
+
     def can_undo(self) -> bool:
         """Можно ли отменить действие"""
         return len(self.undo_stack) > 0
-    
+
     def can_redo(self) -> bool:
         """Можно ли повторить действие"""
         return len(self.redo_stack) > 0
-    
+
     def undo(self) -> Optional[HistoryEntry]:
-        """Отменить последнее действие"""
+        """Отменить последнее действие (дельты записи применяются в обратном порядке)"""
         if not self.can_undo():
             return None
         entry = self.undo_stack.pop()
         self.redo_stack.append(entry)
         return entry
-    
+
     def redo(self) -> Optional[HistoryEntry]:
         """Повторить отменённое действие"""
         if not self.can_redo():
@@ -52,64 +139,55 @@ class HistoryManager:
         entry = self.redo_stack.pop()
         self.undo_stack.append(entry)
         return entry
-    
+
     def clear(self) -> None:
         """Очистить историю"""
         self.undo_stack.clear()
         self.redo_stack.clear()
-    
+        self.memory_usage = 0
+
     def get_undo_description(self) -> str:
         """Получить описание последнего действия для отмены"""
         if not self.can_undo():
             return ""
         return self.undo_stack[-1].description
-    
+
     def get_redo_description(self) -> str:
         """Получить описание следующего действия для повтора"""
         if not self.can_redo():
             return ""
         return self.redo_stack[-1].description
-    
-    def get_undo_description(self):
-        """Получить описание действия для отмены"""
-        if not self.can_undo():
-            return ""
-        return self.undo_stack[-1].description
-    
-    def get_redo_description(self):
-        """Получить описание действия для повтора"""
-        if not self.can_redo():
-            return ""
-        return self.redo_stack[-1].description
 
 
 class HistoryMixin:
     """Миксин для добавления истории в классы"""
-    
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.history = HistoryManager()
-    
-    def _add_to_history(self, action: str, data: Dict[str, Any], description: str = "") -> None:
-        """Добавить действие в историю"""
-        self.history.add_action(action, data, description)
-    
+
+    def _add_to_history(self, delta: Delta, description: str = "") -> None:
+        """Добавить изменение в историю"""
+        self.history.record(delta, description)
+
     def _undo(self) -> bool:
         """Отменить последнее действие"""
         entry = self.history.undo()
         if entry:
-            self._apply_history_entry(entry, undo=True)
+            with self.history.suspended():
+                self._apply_history_entry(entry, undo=True)
             return True
         return False
-    
+
     def _redo(self) -> bool:
         """Повторить отменённое действие"""
         entry = self.history.redo()
         if entry:
-            self._apply_history_entry(entry, undo=False)
+            with self.history.suspended():
+                self._apply_history_entry(entry, undo=False)
             return True
         return False
-    
+
     def _apply_history_entry(self, entry: HistoryEntry, undo: bool) -> None:
         """Применить запись истории (должен быть переопределён)"""
-        raise NotImplementedError("Метод _apply_history_entry должен быть реализован в классе-наследнике")
\ No newline at end of file
+        raise NotImplementedError("Метод _apply_history_entry должен быть реализован в классе-наследнике")
@@ -0,0 +1,123 @@
+"""Диалог поиска поездки между пунктами с пересадками"""
+from PyQt5.QtWidgets import (QVBoxLayout, QHBoxLayout, QFormLayout, QLabel, QPushButton,
+                             QComboBox, QCheckBox, QRadioButton, QTableWidget,
+                             QTableWidgetItem, QHeaderView, QApplication)
+from PyQt5.QtCore import Qt
+
+from core.fare_cache import fare_cache
+from core.network_fares import BY_FARE, BY_DISTANCE
+from .base_dialog import BaseDialog
+from .decorators import track_latency
+
+
+class JourneyDialog(BaseDialog):
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.setWindowTitle("Поездка с пересадками")
+        self.resize(700, 450)
+        self.setup_ui()
+        self.load_points()
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+
+        form = QFormLayout()
+        self.from_combo = self._point_combo()
+        form.addRow("Откуда:", self.from_combo)
+        self.to_combo = self._point_combo()
+        form.addRow("Куда:", self.to_combo)
+        layout.addLayout(form)
+
+        options = QHBoxLayout()
+        self.by_fare_radio = QRadioButton("Самая дешёвая")
+        self.by_fare_radio.setChecked(True)
+        options.addWidget(self.by_fare_radio)
+        self.by_distance_radio = QRadioButton("Самая короткая")
+        options.addWidget(self.by_distance_radio)
+        self.round_up_check = QCheckBox("Округление вверх")
+        options.addWidget(self.round_up_check)
+        options.addStretch()
+        find_btn = QPushButton("🔍 Найти")
+        find_btn.clicked.connect(self.find_journey)
+        options.addWidget(find_btn)
+        layout.addLayout(options)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(5)
+        self.table.setHorizontalHeaderLabels(["Маршрут", "Откуда", "Куда", "Км", "Тариф"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        self.summary_label = QLabel()
+        self.summary_label.setStyleSheet("font-size: 14px; font-weight: bold;")
+        layout.addWidget(self.summary_label)
+
+        btn_layout = QHBoxLayout()
+        btn_layout.addStretch()
+        close_btn = QPushButton("Закрыть")
+        close_btn.clicked.connect(self.accept)
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+
+    def _point_combo(self):
+        combo = QComboBox()
+        combo.setEditable(True)
+        combo.setInsertPolicy(QComboBox.NoInsert)
+        combo.completer().setFilterMode(Qt.MatchContains)
+        combo.completer().setCaseSensitivity(Qt.CaseInsensitive)
+        return combo
+
+    def load_points(self):
+        try:
+            points = self.db.get_all_points()
+            self._route_numbers = {row[0]: row[1] for row in self.db.iter_routes()}
+        except Exception as e:
+            self.show_error("Ошибка", f"Не удалось загрузить пункты: {e}")
+            return
+        self._point_names = {point['id']: point['name'] for point in points}
+        for combo in (self.from_combo, self.to_combo):
+            combo.clear()
+            for point in points:
+                combo.addItem(point['name'], point['id'])
+
+    @track_latency()
+    def find_journey(self):
+        from_point, to_point = self.from_combo.currentData(), self.to_combo.currentData()
+        if from_point is None or to_point is None:
+            self.show_warning("Внимание", "Выберите пункты отправления и назначения")
+            return
+
+        by = BY_FARE if self.by_fare_radio.isChecked() else BY_DISTANCE
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            network = fare_cache.network(self.db, self.round_up_check.isChecked())
+            journey = network.journey(from_point, to_point, by)
+        except KeyError:
+            journey = None
+        except Exception as e:
+            QApplication.restoreOverrideCursor()
+            self.show_error("Ошибка", f"Не удалось найти поездку: {e}")
+            return
+        QApplication.restoreOverrideCursor()
+
+        self.table.setRowCount(0)
+        if journey is None:
+            self.summary_label.setText("Пункт назначения недостижим по маршрутам сети")
+            return
+        self.table.setRowCount(len(journey.legs))
+        for row, leg in enumerate(journey.legs):
+            values = [self._route_numbers.get(leg.route_id, str(leg.route_id)),
+                      self._point_names.get(leg.from_point, str(leg.from_point)),
+                      self._point_names.get(leg.to_point, str(leg.to_point)),
+                      f"{leg.distance_km:.1f}", f"{leg.passenger:.2f}"]
+            for col, value in enumerate(values):
+                self.table.setItem(row, col, QTableWidgetItem(value))
+        self.summary_label.setText(
+            f"Итого: {journey.distance_km:.1f} км, тариф {journey.passenger:.2f} руб., "
+            f"багаж {journey.baggage:.2f} руб., пересадок: {journey.transfers}"
+        )
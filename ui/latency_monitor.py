@@ -0,0 +1,210 @@
+"""
+Контроль задержек цикла событий Qt
+
+Таймер-пульс в главном потоке отмечает время каждого срабатывания.
+Фоновый поток-наблюдатель проверяет отметку: если цикл событий не
+отвечает дольше порога, в лог пишется стек главного потока - видно,
+какой код заблокировал интерфейс.
+
+Слоты, отмеченные декоратором track_latency, измеряются при каждом
+вызове; длительности копятся в гистограммах по именам слотов и
+показываются в диалоге диагностики.
+"""
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+from PyQt5.QtCore import QObject, QTimer
+
+from core.config import PERFORMANCE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы корзин гистограммы, мс (последняя корзина - всё, что больше)
+BUCKETS_MS = (16, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Имя гистограммы для задержек цикла событий вне отмеченных слотов
+EVENT_LOOP = "Цикл событий"
+
+
+@dataclass
+class LatencyHistogram:
+    """Гистограмма длительностей одного слота"""
+    counts: List[int] = field(default_factory=lambda: [0] * (len(BUCKETS_MS) + 1))
+    total: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+    def add(self, duration_ms: float) -> None:
+        index = 0
+        while index < len(BUCKETS_MS) and duration_ms > BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.total if self.total else 0.0
+
+    def percentile(self, fraction: float) -> float:
+        """Оценка перцентиля сверху - граница корзины"""
+        if not self.total:
+            return 0.0
+        threshold = fraction * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                return BUCKETS_MS[index] if index < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+
+@dataclass
+class Stall:
+    """Зависание интерфейса, замеченное наблюдателем"""
+    started: float
+    slot: str
+    stack: str
+    duration_ms: float = 0.0
+
+
+class LatencyMonitor(QObject):
+    """Пульс цикла событий и поток-наблюдатель"""
+
+    def __init__(self, heartbeat_ms: int = 50, threshold_ms: int = 200,
+                 parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+        self.heartbeat_ms = heartbeat_ms
+        self.threshold_ms = threshold_ms
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.stalls: Deque[Stall] = deque(maxlen=20)
+        self._active_slots: List[str] = []
+        self._tracked_since_beat = False
+        self._lock = threading.Lock()
+        self._last_beat = time.monotonic()
+        self._current_stall: Optional[Stall] = None
+        self._gui_thread_id = threading.get_ident()
+        self._timer: Optional[QTimer] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    @property
+    def is_running(self) -> bool:
+        return self._watcher is not None
+
+    def start(self) -> None:
+        """Запустить контроль (вызывается из главного потока)"""
+        if self.is_running:
+            return
+        self._gui_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._beat)
+        self._timer.start(self.heartbeat_ms)
+        self._stop_event.clear()
+        self._watcher = threading.Thread(target=self._watch, name="latency-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self) -> None:
+        """Остановить контроль"""
+        if self._timer is None or self._watcher is None:
+            return
+        self._timer.stop()
+        self._stop_event.set()
+        self._watcher.join()
+        self._watcher = None
+
+    def reset(self) -> None:
+        """Очистить накопленную статистику"""
+        with self._lock:
+            self.histograms.clear()
+            self.stalls.clear()
+
+    def record(self, slot: str, duration_ms: float) -> None:
+        """Добавить длительность в гистограмму слота"""
+        with self._lock:
+            self.histograms.setdefault(slot, LatencyHistogram()).add(duration_ms)
+
+    @contextmanager
+    def track(self, slot: str):
+        """Измерить выполнение слота и приписать ему зависания внутри блока"""
+        self._active_slots.append(slot)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._active_slots.pop()
+            self._tracked_since_beat = True
+            self.record(slot, (time.perf_counter() - started) * 1000)
+
+    def snapshot(self) -> Tuple[Dict[str, LatencyHistogram], List[Stall]]:
+        """Копия статистики для отображения"""
+        with self._lock:
+            histograms = {name: LatencyHistogram(list(h.counts), h.total, h.total_ms, h.max_ms)
+                          for name, h in self.histograms.items()}
+            return histograms, list(self.stalls)
+
+    def _beat(self) -> None:
+        """Пульс в главном потоке: задержка сверх периода таймера - зависание"""
+        now = time.monotonic()
+        lag_ms = (now - self._last_beat) * 1000 - self.heartbeat_ms
+        self._last_beat = now
+        stall = self._current_stall
+        if stall is not None:
+            self._current_stall = None
+            stall.duration_ms = (now - stall.started) * 1000
+            logger.warning(f"Интерфейс не отвечал {stall.duration_ms:.0f} мс ({stall.slot})",
+                           extra={'elapsed_ms': round(stall.duration_ms, 3), 'slot': stall.slot})
+        # Время отмеченных слотов уже учтено в их собственных гистограммах
+        tracked = self._tracked_since_beat or self._active_slots
+        self._tracked_since_beat = False
+        if tracked or lag_ms < BUCKETS_MS[0]:
+            return
+        self.record(stall.slot if stall else EVENT_LOOP, lag_ms)
+
+    def _watch(self) -> None:
+        """Поток-наблюдатель: снимает стек главного потока при зависании"""
+        interval = self.heartbeat_ms / 1000
+        while not self._stop_event.wait(interval):
+            last_beat = self._last_beat
+            blocked_ms = (time.monotonic() - last_beat) * 1000
+            if blocked_ms < self.threshold_ms or self._current_stall is not None:
+                continue
+            frame = sys._current_frames().get(self._gui_thread_id)
+            if frame is None or last_beat != self._last_beat:
+                continue
+            frames = traceback.extract_stack(frame)
+            slot = self._active_slots[-1] if self._active_slots else _entry_point(frames)
+            stack = ''.join(traceback.format_list(frames))
+            stall = Stall(started=last_beat, slot=slot, stack=stack)
+            with self._lock:
+                self.stalls.append(stall)
+            self._current_stall = stall
+            logger.warning(f"Интерфейс не отвечает более {blocked_ms:.0f} мс ({slot}), "
+                           f"стек главного потока:\n{stack}")
+
+
+def _entry_point(frames: traceback.StackSummary) -> str:
+    """Имя кода, вызванного циклом событий: кадр после последнего вызова exec_()"""
+    index = 0
+    for position, frame in enumerate(frames[:-1]):
+        if frame.line and ('exec_(' in frame.line or '.exec(' in frame.line):
+            index = position + 1
+    if not frames:
+        return "?"
+    frame = frames[index]
+    return f"{frame.name} ({frame.filename.rsplit('/', 1)[-1]}:{frame.lineno})"
+
+
+latency_monitor = LatencyMonitor(
+    heartbeat_ms=int(PERFORMANCE_CONFIG.get('heartbeat_ms', 50)),
+    threshold_ms=int(PERFORMANCE_CONFIG.get('stall_threshold_ms', 200)),
+)
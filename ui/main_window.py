@@ -7,15 +7,21 @@ from PyQt5.QtGui import QIcon, QKeySequence
 from PyQt5.QtCore import Qt, QTimer
 from .routes_tab import RoutesTab
 from .points_tab import PointsTab
-from core.config import CURRENT_THEME  # Измененный импорт
+from core.config import CURRENT_THEME, DB_CONFIG, PERFORMANCE_CONFIG  # Измененный импорт
+from core.database import DatabaseError
 from PyQt5.QtWidgets import QAction
 from .theme_manager import theme_manager   
 from utils.updater import UpdateManager
+from utils.profiler import ProfileSession
+from .latency_monitor import latency_monitor
+from .sync_worker import SyncWorker
 
 class MainWindow(QMainWindow):
-    def __init__(self, db):
+    def __init__(self, db, profile_session=None):
         super().__init__()
         self.db = db
+        # Сеанс профилирования (запущен флагом --profile или кнопкой)
+        self.profile_session = profile_session
         self.setWindowTitle("Система формирования тарифов")
         self.resize(1100, 750)
         
@@ -60,6 +66,69 @@ class MainWindow(QMainWindow):
         
         # Проверка обновлений при запуске (тихо)
         QTimer.singleShot(3000, lambda: self.updater.check_for_updates(silent=True))
+        
+        # Контроль зависаний интерфейса
+        latency_monitor.start()
+        
+        # Перебалансировка ключей порядка пунктов, если промежутки исчерпаны
+        QTimer.singleShot(10000, self._rebalance_routes)
+        
+        # Фоновая синхронизация локального кэша с сервером
+        self.sync_worker = None
+        if hasattr(self.db, 'sync'):
+            self.sync_timer = QTimer(self)
+            self.sync_timer.timeout.connect(self._on_sync_timer)
+            self.sync_timer.start(max(int(DB_CONFIG.get('sync_interval_sec', 60)), 5) * 1000)
+    
+    def _rebalance_routes(self):
+        """Разложить ключи порядка пунктов в маршрутах, где не осталось места для вставки"""
+        try:
+            for route_id in self.db.get_crowded_routes():
+                self.db.rebalance_route(route_id)
+        except DatabaseError as e:
+            self.statusBar.showMessage(f"Ошибка обслуживания маршрутов: {e}", 5000)
+    
+    def _on_sync_timer(self):
+        self._start_sync()
+    
+    def _start_sync(self):
+        """Начать обмен кэша с сервером в фоне (если он ещё не идёт)"""
+        if self.sync_worker is not None and self.sync_worker.isRunning():
+            return
+        try:
+            ops, since = self.db.prepare_sync()
+        except DatabaseError as e:
+            self.statusBar.showMessage(f"Ошибка синхронизации: {e}", 5000)
+            return
+        self.sync_worker = SyncWorker(self.db, ops, since, self)
+        self.sync_worker.exchanged.connect(self._apply_sync)
+        self.sync_worker.failed.connect(
+            lambda error: self.statusBar.showMessage(f"Ошибка синхронизации: {error}", 5000))
+        self.sync_worker.start()
+    
+    def _apply_sync(self, exchange):
+        """Применить результат обмена к кэшу; при изменениях сервера обновить вкладку"""
+        try:
+            result = self.db.apply_sync(exchange)
+        except DatabaseError as e:
+            self.statusBar.showMessage(f"Ошибка синхронизации: {e}", 5000)
+            return
+        if not result['online']:
+            self.statusBar.showMessage("Нет связи с сервером, изменения сохранены локально", 5000)
+        elif result['rejected']:
+            self.statusBar.showMessage(
+                f"Сервер отклонил изменений: {result['rejected']}", 5000)
+        if result['pulled']:
+            current_widget = self.tabs.currentWidget()
+            if hasattr(current_widget, 'load_data'):
+                current_widget.load_data()
+    
+    def closeEvent(self, event):
+        # Дождаться обмена с сервером, иначе поток переживёт подключение к БД
+        if self.sync_worker is not None:
+            self.sync_worker.wait()
+        self.routes_tab.stop_publishing()
+        super().closeEvent(event)
     
     def _create_toolbar(self):
         toolbar = QToolBar("Основные действия")
@@ -91,6 +160,30 @@ class MainWindow(QMainWindow):
         update_action.triggered.connect(lambda: self.updater.check_for_updates(silent=False))
         toolbar.addAction(update_action)
         
+        # Кнопка профилирования
+        self.profile_action = QAction("⏱ Профилирование", self)
+        self.profile_action.setCheckable(True)
+        self.profile_action.setChecked(bool(self.profile_session
+                                            and self.profile_session.is_running))
+        self.profile_action.setToolTip("Записать профиль действий для заявки")
+        self.profile_action.toggled.connect(self._toggle_profiling)
+        toolbar.addAction(self.profile_action)
+        
+        # Поиск поездки по сети маршрутов
+        journey_action = QAction("🧭 Поездка с пересадками", self)
+        journey_action.triggered.connect(self._open_journey)
+        toolbar.addAction(journey_action)
+        
+        # Моделирование изменения тарифа по всей сети
+        simulation_action = QAction("📊 Моделирование тарифа", self)
+        simulation_action.triggered.connect(self._open_tariff_simulation)
+        toolbar.addAction(simulation_action)
+        
+        # Кнопка диагностики задержек интерфейса
+        diagnostics_action = QAction("🩺 Диагностика", self)
+        diagnostics_action.triggered.connect(self._open_diagnostics)
+        toolbar.addAction(diagnostics_action)
+        
         toolbar.addSeparator()
 
         # Добавить горячие клавиши для вкладок
@@ -127,6 +220,42 @@ class MainWindow(QMainWindow):
             current.search_input.setFocus()
             current.search_input.selectAll()
 
+    def _toggle_profiling(self, checked):
+        """Запустить или остановить профилирование"""
+        if checked:
+            mode = PERFORMANCE_CONFIG.get('profiler_mode', 'sampling')
+            self.profile_session = ProfileSession(mode)
+            self.profile_session.start()
+            self.statusBar.showMessage("Профилирование запущено: выполните медленное действие "
+                                       "и нажмите кнопку ещё раз")
+            return
+        if not (self.profile_session and self.profile_session.is_running):
+            return
+        try:
+            output = self.profile_session.stop()
+        except OSError as e:
+            self.show_error(f"Не удалось записать профиль: {e}")
+            return
+        self.statusBar.showMessage(f"Профиль записан: {output}", 10000)
+        QMessageBox.information(self, "Профилирование",
+                                f"Профиль записан в папку:\n{output}\n\n"
+                                f"Приложите её к заявке.")
+    
+    def _open_journey(self):
+        from .journey_dialog import JourneyDialog
+        JourneyDialog(self.db, self).exec_()
+    
+    def _open_tariff_simulation(self):
+        from .tariff_simulation_dialog import TariffSimulationDialog
+        dialog = TariffSimulationDialog(self.db, self)
+        dialog.exec_()
+        if dialog.applied:
+            self._refresh_current_tab()
+    
+    def _open_diagnostics(self):
+        from .diagnostics_dialog import DiagnosticsDialog
+        DiagnosticsDialog(self).exec_()
+    
     def _open_settings(self):
         from .settings_dialog import SettingsDialog
         dialog = SettingsDialog(self)
@@ -135,6 +264,8 @@ class MainWindow(QMainWindow):
                 "Настройки сохранены. Перезапустите приложение для применения изменений.")
         
     def _refresh_current_tab(self):
+        if hasattr(self.db, 'sync'):
+            self._start_sync()
         current_widget = self.tabs.currentWidget()
         if hasattr(current_widget, 'load_data'):
             current_widget.load_data()
@@ -0,0 +1,156 @@
+"""
+Постраничная печать таблицы стоимости маршрута
+
+Матрица делится на плитки по размеру страницы (utils.cost_tiles): на
+каждой странице - заголовок, названия своих пунктов отправления (столбцы)
+и прибытия (строки) и ячейки плитки. Страницы рисуются по одной, тексты
+ячеек берутся из общего кэша плиток, поэтому предпросмотр и повторная
+печать маршрута не пересчитывают тарифы.
+
+CostTablePrintJob рисует страницы в отдельном потоке (QPainter допускает
+печать на QPrinter вне GUI-потока) и сообщает о ходе печати сигналом
+progress; прерывание потока отменяет печать. Предпросмотр
+(ui.cost_table_preview) рисует той же вёрсткой только показываемую страницу.
+"""
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from PyQt5.QtCore import Qt, QThread, QRect, pyqtSignal
+from PyQt5.QtGui import QPainter, QFont
+from PyQt5.QtPrintSupport import QPrinter
+
+from utils.cost_tiles import CostTableTiles, Tile
+
+# Шрифт печати
+PRINT_FONT_FAMILY = "Courier New"
+PRINT_FONT_SIZE = 7
+
+# Вызывается после каждой страницы: (готово, всего) -> продолжать ли печать
+PageCallback = Callable[[int, int], bool]
+
+
+def render_cost_table(printer: QPrinter, tiles: CostTableTiles, title: List[str],
+                      on_page: Optional[PageCallback] = None) -> bool:
+    """
+    Напечатать таблицу стоимости постранично.
+
+    Returns:
+        bool: False, если печать отменена из on_page (задание прервано)
+
+    Raises:
+        RuntimeError: Если принтер не удалось открыть
+    """
+    painter = QPainter()
+    if not painter.begin(printer):
+        raise RuntimeError("Не удалось открыть принтер")
+    try:
+        pages, geometry = layout_pages(painter, printer.pageRect(), tiles, title)
+        total = len(pages)
+        for number, tile in enumerate(pages, 1):
+            if number > 1 and not printer.newPage():
+                raise RuntimeError("Не удалось начать новую страницу")
+            draw_page(painter, tiles, tile, page_header(title, number, total), geometry)
+            if on_page is not None and not on_page(number, total):
+                printer.abort()
+                return False
+        return True
+    finally:
+        painter.end()
+
+
+def layout_pages(painter: QPainter, page: QRect, tiles: CostTableTiles,
+                 title: List[str]) -> Tuple[Sequence[Optional[Tile]], tuple]:
+    """
+    Установить шрифт печати и разбить таблицу на страницы размера page.
+
+    Returns:
+        tuple: (плитки страниц - [None] для пустой таблицы, размеры для draw_page)
+    """
+    painter.setFont(QFont(PRINT_FONT_FAMILY, PRINT_FONT_SIZE))
+    metrics = painter.fontMetrics()
+    line = metrics.lineSpacing()
+    padding = metrics.horizontalAdvance(" ")
+    # Размеры ячеек и заголовков - в единицах устройства
+    cell_width = metrics.horizontalAdvance("00000.00") + 2 * padding
+    cell_height = 3 * line + padding
+    name_width = metrics.horizontalAdvance("0" * 20) + 2 * padding
+    header_height = line + padding
+    title_height = (len(title) + 2) * line
+    pages = tiles.paginate((page.height() - title_height - header_height) // cell_height,
+                           (page.width() - name_width) // cell_width)
+    geometry = (line, padding, cell_width, cell_height, name_width, header_height, title_height)
+    return pages or [None], geometry
+
+
+def page_header(title: List[str], number: int, total: int) -> List[str]:
+    return title + [f"Страница {number} из {total}"]
+
+
+def draw_page(painter: QPainter, tiles: CostTableTiles, tile: Optional[Tile],
+              header: List[str], geometry) -> None:
+    line, padding, cell_width, cell_height, name_width, header_height, title_height = geometry
+    metrics = painter.fontMetrics()
+    for index, text in enumerate(header):
+        painter.drawText(0, (index + 1) * line, text)
+    if tile is None:
+        return
+
+    names = tiles.names
+    top = title_height + header_height
+    right = name_width + len(tile.columns) * cell_width
+    bottom = top + len(tile.rows) * cell_height
+    # Названия пунктов отправления (столбцы) и прибытия (строки)
+    for offset, column in enumerate(tile.columns):
+        rect = QRect(name_width + offset * cell_width, title_height, cell_width, header_height)
+        painter.drawText(rect.adjusted(padding, 0, -padding, 0), Qt.AlignmentFlag.AlignCenter,
+                         metrics.elidedText(names[column], Qt.TextElideMode.ElideRight,
+                                            cell_width - 2 * padding))
+    for offset, row in enumerate(tile.rows):
+        rect = QRect(0, top + offset * cell_height, name_width, cell_height)
+        painter.drawText(rect.adjusted(padding, 0, -padding, 0),
+                         Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
+                         metrics.elidedText(names[row], Qt.TextElideMode.ElideRight,
+                                            name_width - 2 * padding))
+
+    for offset, cells in enumerate(tiles.cells(tile)):
+        y = top + offset * cell_height
+        for column_offset, text in enumerate(cells):
+            if text:
+                rect = QRect(name_width + column_offset * cell_width, y, cell_width, cell_height)
+                painter.drawText(rect.adjusted(padding, 0, -padding, 0),
+                                 Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter,
+                                 text)
+
+    # Сетка
+    for offset in range(len(tile.columns) + 1):
+        x = name_width + offset * cell_width
+        painter.drawLine(x, title_height, x, bottom)
+    painter.drawLine(0, top, 0, bottom)
+    for offset in range(len(tile.rows) + 1):
+        y = top + offset * cell_height
+        painter.drawLine(0, y, right, y)
+    painter.drawLine(name_width, title_height, right, title_height)
+
+
+class CostTablePrintJob(QThread):
+    """Поток печати таблицы стоимости"""
+    progress = pyqtSignal(int, int)  # страниц готово, всего
+
+    def __init__(self, printer: QPrinter, tiles: CostTableTiles, title: List[str], parent=None):
+        super().__init__(parent)
+        self.printer = printer
+        self.tiles = tiles
+        self.title = title
+        self.cancelled = False
+        self.error: Optional[str] = None
+
+    def run(self):
+        """Печать страниц в отдельном потоке"""
+        try:
+            self.cancelled = not render_cost_table(self.printer, self.tiles, self.title,
+                                                   self._page_done)
+        except Exception as e:
+            self.error = str(e)
+
+    def _page_done(self, done: int, total: int) -> bool:
+        self.progress.emit(done, total)
+        return not self.isInterruptionRequested()
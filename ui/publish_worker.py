@@ -0,0 +1,44 @@
+"""
+Публикация тарифов сети для терминалов в отдельном потоке
+
+Маршруты читаются из БД в GUI-потоке (подключение принадлежит ему, см.
+ui.sync_worker), а расчёт матриц и запись файла
+(core.fare_matrix_file.publish_sequences), занимающие на большой сети
+секунды, выполняются в этом потоке без обращения к БД. Ход публикации
+сообщается сигналом progress; прерывание потока отменяет публикацию,
+прежний файл при этом не меняется.
+"""
+from typing import Dict, List, Optional
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from core.fare_matrix_file import PublishResult, publish_sequences
+from models import RouteSequence
+
+
+class PublishWorker(QThread):
+    """Поток публикации тарифов сети"""
+    progress = pyqtSignal(int, int)  # маршрутов готово, всего
+
+    def __init__(self, sequences: List[RouteSequence], route_numbers: Dict[int, str],
+                 filename: str, parent=None):
+        super().__init__(parent)
+        self.sequences = sequences
+        self.route_numbers = route_numbers
+        self.filename = filename
+        self.result: Optional[PublishResult] = None
+        self.cancelled = False
+        self.error: Optional[str] = None
+
+    def run(self):
+        """Публикация в отдельном потоке"""
+        try:
+            self.result = publish_sequences(self.filename, self.sequences, self.route_numbers,
+                                            on_route=self._route_done)
+            self.cancelled = self.result is None
+        except Exception as e:
+            self.error = str(e)
+
+    def _route_done(self, done: int, total: int) -> bool:
+        self.progress.emit(done, total)
+        return not self.isInterruptionRequested()
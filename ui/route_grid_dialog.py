@@ -4,7 +4,7 @@
 from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTableWidget,
                              QTableWidgetItem, QPushButton, QMessageBox, 
                              QComboBox, QHeaderView, QLabel, QWidget, 
-                             QAbstractItemView, QTextEdit, QCheckBox, QLineEdit)
+                             QAbstractItemView, QCheckBox, QLineEdit)
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont, QColor, QRegExpValidator
 from PyQt5.QtCore import QRegExp
@@ -12,10 +12,18 @@ from PyQt5.QtCore import QRegExp
 from .export_import_mixin import ExportImportMixin
 from .validation_mixin import ValidationMixin
 from .point_dialog import PointAddDialog
+from .cost_table_dialog import CostTableDialog
 from .services import PointService
 from .constants import TABLE_HEADERS, REGEX
 from .theme_manager import theme_manager
-from PyQt5.QtCore import QTimer
+from .history_manager import HistoryManager, DEFAULT_MAX_BYTES
+from .decorators import track_latency
+from core import fare_engine
+from core.config import PERFORMANCE_CONFIG
+from core.database import ConcurrencyError
+from core.journal import RouteJournal, DEFAULT_FSYNC_INTERVAL
+from core.unit_of_work import RouteEditUnit
+from models import RouteSequence
 
 class RouteGridDialog(QDialog, ExportImportMixin, ValidationMixin):
     def __init__(self, db, route_id, route_number, route_name, parent=None):
@@ -25,7 +33,7 @@ class RouteGridDialog(QDialog, ExportImportMixin, ValidationMixin):
         self.route_id = route_id
         self.route_number = route_number
         self.route_name = route_name
-        self.original_data = []
+        self.original_data = RouteSequence(route_id)
         
         self.setWindowTitle(f"Маршрут №{route_number} — {route_name}")
         self.setModal(True)
@@ -282,6 +290,7 @@ class RouteGridDialog(QDialog, ExportImportMixin, ValidationMixin):
             if index >= 0:
                 self.points_combo.setCurrentIndex(index)
     
+    @track_latency()
     def _sort_by_distance(self):
         """Сортировка пунктов по расстоянию"""
         try:
@@ -290,62 +299,41 @@ class RouteGridDialog(QDialog, ExportImportMixin, ValidationMixin):
                 QMessageBox.information(self, "Информация", "Недостаточно пунктов для сортировки")
                 return
             
-            data = []
+            # Текущее состояние таблицы: строка N таблицы соответствует пункту N в original_data
+            orig = self.original_data
+            edited = RouteSequence(self.route_id)
             for row in range(rows):
-                point_name = self.sequence_table.item(row, 1).text()
-                distance = float(self.sequence_table.item(row, 2).text())
-                rounding = float(self.sequence_table.item(row, 3).text())
-                cost = float(self.sequence_table.item(row, 4).text())
-                baggage = float(self.sequence_table.item(row, 5).text())
-                passenger = self.sequence_table.item(row, 6).text()
-                baggage_tariff = self.sequence_table.item(row, 7).text()
-                
-                # Находим соответствующий ID
-                seq_id = None
-                for orig in self.original_data:
-                    if (orig['point_name'] == point_name and 
-                        abs(orig['distance_km'] - distance) < 0.1):
-                        seq_id = orig['id']
-                        break
-                
-                data.append({
-                    'id': seq_id,
-                    'point_name': point_name,
-                    'distance': distance,
-                    'rounding': rounding,
-                    'cost': cost,
-                    'baggage': baggage,
-                    'passenger': passenger,
-                    'baggage_tariff': baggage_tariff
-                })
-            
-            # Сортировка по расстоянию
-            data.sort(key=lambda x: x['distance'])
-            
-            # Обновляем параметры в БД
-            for item in data:
-                if item['id']:
-                    for orig in self.original_data:
-                        if orig['id'] == item['id']:
-                            if (abs(orig['distance_km'] - item['distance']) > 0.01 or
-                                abs(orig['rounding'] - item['rounding']) > 0.01 or
-                                abs(orig['cost_per_km'] - item['cost']) > 0.01 or
-                                abs(orig['baggage_percent'] - item['baggage']) > 0.01):
-                                
-                                self.db.update_route_point(
-                                    item['id'], item['distance'],
-                                    item['rounding'], item['cost'], item['baggage']
-                                )
-                            break
+                known = row < len(orig)
+                edited.append(
+                    orig.ids[row] if known else None,
+                    orig.point_ids[row] if known else 0,
+                    self.sequence_table.item(row, 1).text(),
+                    row + 1,
+                    float(self.sequence_table.item(row, 2).text()),
+                    float(self.sequence_table.item(row, 3).text()),
+                    float(self.sequence_table.item(row, 4).text()),
+                    float(self.sequence_table.item(row, 5).text())
+                )
             
-            # Обновляем порядок
-            new_order_ids = [d['id'] for d in data if d['id']]
-            if new_order_ids:
-                self.db.reorder_route_sequence(self.route_id, new_order_ids)
+            # Параметры и новый порядок сохраняются одной транзакцией
+            unit = RouteEditUnit(self.db, orig)
+            for row in range(min(len(edited), len(orig))):
+                unit.register(row, edited.distances[row], edited.roundings[row],
+                              edited.costs[row], edited.baggage_percents[row])
+            
+            # Сортировка по расстоянию и обновление порядка
+            order = sorted(range(len(edited)), key=lambda i: edited.distances[i])
+            new_order_ids = [edited.ids[i] for i in order if edited.ids[i]]
+            with self.db.batch():
+                unit.flush()
+                if new_order_ids:
+                    self.db.reorder_route_sequence(self.route_id, new_order_ids)
+            if hasattr(self, 'modified_rows'):
+                self.modified_rows.clear()
+            self._changes_saved()
             
             # Обновляем данные
-            self.original_data = self.db.get_route_sequence(self.route_id)
-            self._refresh_table(data)
+            self.load_route_sequence()
             self._calculate_preview()
             
             QMessageBox.information(self, "Сортировка выполнена", 
@@ -356,23 +344,31 @@ class RouteGridDialog(QDialog, ExportImportMixin, ValidationMixin):
             import traceback
             traceback.print_exc()
     
-    def _refresh_table(self, data):
-        """Обновить таблицу с данными"""
+    def _refresh_table(self, sequence):
+        """Обновить таблицу данными последовательности маршрута"""
+        # Параметры тарифа для всего маршрута берутся из первого пункта
+        global_rounding = sequence.rounding
+        global_cost_per_km = sequence.cost_per_km
+        global_baggage_percent = sequence.baggage_percent
+        fares = fare_engine.stop_fares(sequence, self.rounding_checkbox.isChecked())
+        
         self.sequence_table.setUpdatesEnabled(False)
         try:
-            self.sequence_table.setRowCount(len(data))
-            for row, d in enumerate(data):
+            self.sequence_table.setRowCount(len(sequence))
+            for row in range(len(sequence)):
+                distance = sequence.distances[row]
+                
                 # № п/п (нередактируемый)
                 self.sequence_table.setItem(row, 0, self._create_item(str(row + 1), align=Qt.AlignCenter, editable=False))
                 
                 # Пункт назначения (РЕДАКТИРУЕМЫЙ)
-                point_item = self._create_item(d['point_name'], align=Qt.AlignLeft | Qt.AlignVCenter, editable=True)
+                point_item = self._create_item(sequence.point_names[row], align=Qt.AlignLeft | Qt.AlignVCenter, editable=True)
                 point_item.setToolTip("Название пункта")
                 self.sequence_table.setItem(row, 1, point_item)
                 
                 # Расстояние (РЕДАКТИРУЕМЫЙ)
-                dist_item = self._create_item(f"{d['distance']:.1f}", align=Qt.AlignRight | Qt.AlignVCenter, editable=True)
-                if row == 0 and abs(d['distance']) < 0.01:
+                dist_item = self._create_item(f"{distance:.1f}", align=Qt.AlignRight | Qt.AlignVCenter, editable=True)
+                if row == 0 and abs(distance) < 0.01:
                     dist_item.setToolTip("Первый пункт - расстояние всегда 0 км")
                     dist_item.setFlags(dist_item.flags() & ~Qt.ItemIsEditable)  # Первый пункт нередактируемый
                 else:
@@ -380,7 +376,7 @@ class RouteGridDialog(QDialog, ExportImportMixin, ValidationMixin):
                 self.sequence_table.setItem(row, 2, dist_item)
                 
                 # Округление (РЕДАКТИРУЕМЫЙ только для первого пункта)
-                rounding_item = self._create_item(f"{d['rounding']:.1f}", align=Qt.AlignRight | Qt.AlignVCenter, editable=(row == 0))
+                rounding_item = self._create_item(f"{global_rounding:.1f}", align=Qt.AlignRight | Qt.AlignVCenter, editable=(row == 0))
                 if row == 0:
                     rounding_item.setToolTip("Округление для ВСЕГО маршрута")
                 else:
@@ -388,7 +384,7 @@ class RouteGridDialog(QDialog, ExportImportMixin, ValidationMixin):
                 self.sequence_table.setItem(row, 3, rounding_item)
                 
                 # Стоимость за км (РЕДАКТИРУЕМЫЙ только для первого пункта)
-                cost_item = self._create_item(f"{d['cost']:.2f}", align=Qt.AlignRight | Qt.AlignVCenter, editable=(row == 0))
+                cost_item = self._create_item(f"{global_cost_per_km:.2f}", align=Qt.AlignRight | Qt.AlignVCenter, editable=(row == 0))
                 if row == 0:
                     cost_item.setToolTip("Стоимость за км для ВСЕГО маршрута")
                 else:
@@ -396,7 +392,7 @@ class RouteGridDialog(QDialog, ExportImportMixin, ValidationMixin):
                 self.sequence_table.setItem(row, 4, cost_item)
                 
                 # Багаж % (РЕДАКТИРУЕМЫЙ только для первого пункта)
-                baggage_item = self._create_item(f"{d['baggage']:.1f}", align=Qt.AlignRight | Qt.AlignVCenter, editable=(row == 0))
+                baggage_item = self._create_item(f"{global_baggage_percent:.1f}", align=Qt.AlignRight | Qt.AlignVCenter, editable=(row == 0))
                 if row == 0:
                     baggage_item.setToolTip("Процент багажа для ВСЕГО маршрута")
                 else:
@@ -404,11 +400,11 @@ class RouteGridDialog(QDialog, ExportImportMixin, ValidationMixin):
                 self.sequence_table.setItem(row, 5, baggage_item)
                 
                 # Тарифы (нередактируемые)
-                passenger_item = self._create_item(d['passenger'], align=Qt.AlignRight | Qt.AlignVCenter,
+                passenger_item = self._create_item(f"{fares[row]['passenger']:.2f}", align=Qt.AlignRight | Qt.AlignVCenter,
                                                 bold=True, editable=False)
                 self.sequence_table.setItem(row, 6, passenger_item)
                 
-                baggage_tariff_item = self._create_item(d['baggage_tariff'], align=Qt.AlignRight | Qt.AlignVCenter,
+                baggage_tariff_item = self._create_item(f"{fares[row]['baggage']:.2f}", align=Qt.AlignRight | Qt.AlignVCenter,
                                                         editable=False)
                 self.sequence_table.setItem(row, 7, baggage_tariff_item)
             
@@ -471,57 +467,8 @@ class RouteGridDialog(QDialog, ExportImportMixin, ValidationMixin):
     def load_route_sequence(self):
         """Загрузка последовательности пунктов маршрута"""
         try:
-            points = self.db.get_route_sequence(self.route_id)
-            self.sequence_table.setRowCount(len(points))
-            
-            self.original_data = []
-            
-            # Глобальные параметры из первого пункта
-            global_rounding = 0.0
-            global_cost_per_km = 10.0
-            global_baggage_percent = 0.0
-            
-            if points:
-                global_rounding = float(points[0]['rounding'])
-                global_cost_per_km = float(points[0]['cost_per_km'])
-                global_baggage_percent = float(points[0]['baggage_percent'])
-            
-            data = []
-            for row, p in enumerate(points):
-                self.original_data.append({
-                    'id': p['id'],
-                    'point_id': p['point_id'],
-                    'point_name': p['point_name'],
-                    'sequence_number': p['sequence_number'],
-                    'distance_km': float(p['distance_km']),
-                    'rounding': float(p['rounding']),
-                    'cost_per_km': float(p['cost_per_km']),
-                    'baggage_percent': float(p['baggage_percent'])
-                })
-                
-                rounding_val = p['rounding'] if p['sequence_number'] == 1 else global_rounding
-                cost_val = p['cost_per_km'] if p['sequence_number'] == 1 else global_cost_per_km
-                baggage_val = p['baggage_percent'] if p['sequence_number'] == 1 else global_baggage_percent
-                
-                tariffs = self.db.calculate_tariffs(
-                    p['distance_km'],
-                    global_cost_per_km,
-                    global_baggage_percent,
-                    global_rounding,
-                    self.rounding_checkbox.isChecked()
-                )
-                
-                data.append({
-                    'point_name': p['point_name'],
-                    'distance': p['distance_km'],
-                    'rounding': rounding_val,
-                    'cost': cost_val,
-                    'baggage': baggage_val,
-                    'passenger': f"{tariffs['passenger']:.2f}",
-                    'baggage_tariff': f"{tariffs['baggage']:.2f}"
-                })
-            
-            self._refresh_table(data)
+            self.original_data = self.db.get_route_sequence_model(self.route_id)
+            self._refresh_table(self.original_data)
             
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить маршрут: {e}")
@@ -588,7 +535,7 @@ class RouteGridDialog(QDialog, ExportImportMixin, ValidationMixin):
             return None
         row = selected[0].row()
         if row < len(self.original_data):
-            return self.original_data[row]['id']
+            return self.original_data.ids[row]
         return None
     
     def _delete_point(self):
@@ -653,188 +600,72 @@ class RouteGridDialog(QDialog, ExportImportMixin, ValidationMixin):
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось выполнить расчёт: {str(e)}")
     
+    @track_latency()
     def _save_changes(self):
-        """Сохранение изменений"""
+        """Сохранение изменений одной транзакцией"""
+        orig = self.original_data
+        unit = RouteEditUnit(self.db, orig)
+        for row in range(min(self.sequence_table.rowCount(), len(orig))):
+            try:
+                new_distance = float(self.sequence_table.item(row, 2).text())
+                if row == 0:
+                    new_rounding = float(self.sequence_table.item(row, 3).text())
+                    new_cost = float(self.sequence_table.item(row, 4).text())
+                    new_baggage = float(self.sequence_table.item(row, 5).text())
+                else:
+                    new_rounding = orig.roundings[row]
+                    new_cost = orig.costs[row]
+                    new_baggage = orig.baggage_percents[row]
+            except (ValueError, AttributeError) as e:
+                QMessageBox.warning(self, "Ошибка", f"Некорректные данные в строке {row + 1}")
+                return
+            unit.register(row, new_distance, new_rounding, new_cost, new_baggage)
+        
         try:
-            for row in range(self.sequence_table.rowCount()):
-                if row >= len(self.original_data):
-                    continue
-                
-                orig = self.original_data[row]
-                seq_id = orig['id']
-                
-                try:
-                    new_distance = float(self.sequence_table.item(row, 2).text())
-                    if row == 0:
-                        new_rounding = float(self.sequence_table.item(row, 3).text())
-                        new_cost = float(self.sequence_table.item(row, 4).text())
-                        new_baggage = float(self.sequence_table.item(row, 5).text())
-                    else:
-                        new_rounding = float(orig['rounding'])
-                        new_cost = float(orig['cost_per_km'])
-                        new_baggage = float(orig['baggage_percent'])
-                except (ValueError, AttributeError) as e:
-                    QMessageBox.warning(self, "Ошибка", f"Некорректные данные в строке {row + 1}")
-                    return
-                
-                orig_distance = float(orig['distance_km'])
-                orig_rounding = float(orig['rounding'])
-                orig_cost = float(orig['cost_per_km'])
-                orig_baggage = float(orig['baggage_percent'])
-                
-                if (abs(new_distance - orig_distance) > 0.01 or
-                    (row == 0 and (
-                        abs(new_rounding - orig_rounding) > 0.01 or
-                        abs(new_cost - orig_cost) > 0.01 or
-                        abs(new_baggage - orig_baggage) > 0.01
-                    ))):
-                    
-                    self.db.update_route_point(
-                        seq_id, new_distance, new_rounding, new_cost, new_baggage
-                    )
-            
-            QMessageBox.information(self, "Успешно", "Изменения сохранены")
+            result = unit.flush()
+        except ConcurrencyError:
+            QMessageBox.warning(
+                self, "Конфликт изменений",
+                "Маршрут изменён другим пользователем. Изменения не сохранены, "
+                "данные будут перезагружены."
+            )
             self.load_route_sequence()
-            
+            return
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить изменения: {str(e)}")
             import traceback
             traceback.print_exc()
+            return
+        
+        if hasattr(self, 'modified_rows'):
+            self.modified_rows.clear()
+        self._changes_saved()
+        QMessageBox.information(
+            self, "Успешно",
+            f"Изменения сохранены: строк {result['rows']} за {result['elapsed_ms']:.0f} мс"
+        )
+        self.load_route_sequence()
     
+    def _changes_saved(self):
+        """Вызывается после успешного сохранения правок таблицы"""
+        pass
+    
+    @track_latency()
     def _show_cost_table(self):
         """Показать таблицу стоимости"""
         try:
-            points = self.db.get_route_sequence(self.route_id)
+            points = self.db.get_route_sequence_model(self.route_id)
             if not points:
                 QMessageBox.warning(self, "Внимание", "Маршрут пуст")
                 return
             
-            global_cost_per_km = float(points[0]['cost_per_km'])
-            global_baggage_percent = float(points[0]['baggage_percent'])
-            global_rounding = float(points[0]['rounding'])
-            
-            table_text = self._generate_cost_table_text(points, global_cost_per_km,
-                                                        global_baggage_percent, global_rounding)
-            
-            self._show_cost_table_dialog(table_text)
+            CostTableDialog(points, self.route_number, self.route_name,
+                            self.rounding_checkbox.isChecked(), self).exec_()
             
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось сформировать таблицу: {str(e)}")
             import traceback
             traceback.print_exc()
-    
-    def _generate_cost_table_text(self, points, cost_per_km, baggage_percent, rounding):
-        """Сгенерировать текст таблицы стоимости"""
-        table_text = "Таблица стоимости\n"
-        table_text += "на проезд и провоз ручной клади и багажа\n"
-        table_text += f"в автобусе общего типа по маршруту {self.route_number} — {self.route_name} с __________\n"
-        table_text += f"Стоимость 1 п-км: {cost_per_km:.2f}\n\n"
-        
-        table_text += f"{points[0]['point_name']}\n"
-        
-        for i in range(1, len(points)):
-            line1_parts, line2_parts, line3_parts = [], [], []
-            
-            for j in range(0, i):
-                distance = points[i]['distance_km'] - points[j]['distance_km']
-                tariffs = self.db.calculate_tariffs(
-                    distance, cost_per_km, baggage_percent, rounding,
-                    self.rounding_checkbox.isChecked()
-                )
-                
-                line1_parts.append(f"{tariffs['passenger']:>7.2f}")
-                line2_parts.append(f"{tariffs['passenger'] * 0.5:>7.2f}")
-                line3_parts.append(f"{tariffs['baggage']:>7.2f}")
-            
-            table_text += " ".join(line1_parts) + "\n"
-            table_text += " ".join(line2_parts) + "\n"
-            table_text += " ".join(line3_parts) + "\n"
-            table_text += ("        " * i) + f"{points[i]['point_name']}\n\n"
-        
-        table_text += "Руководитель АТП __________\n"
-        return table_text
-    
-    def _show_cost_table_dialog(self, table_text):
-        """Показать диалог с таблицей стоимости"""
-        from PyQt5.QtPrintSupport import QPrinter, QPrintDialog
-        from PyQt5.QtGui import QTextDocument
-        
-        cost_dialog = QDialog(self)
-        cost_dialog.setWindowTitle("Таблица стоимости")
-        cost_dialog.resize(800, 600)
-        
-        layout = QVBoxLayout()
-        
-        text_edit = QTextEdit()
-        text_edit.setReadOnly(True)
-        text_edit.setFont(QFont("Courier New", 10))
-        text_edit.setLineWrapMode(QTextEdit.NoWrap)
-        text_edit.setText(table_text)
-        layout.addWidget(text_edit)
-        
-        btn_layout = QHBoxLayout()
-        
-        save_btn = QPushButton("💾 Сохранить в TXT")
-        save_btn.clicked.connect(lambda: self._save_cost_table_txt(table_text))
-        btn_layout.addWidget(save_btn)
-        
-        print_btn = QPushButton("🖨️ Печать")
-        print_btn.clicked.connect(lambda: self._print_cost_table(table_text))
-        btn_layout.addWidget(print_btn)
-        
-        ok_btn = QPushButton("OK")
-        ok_btn.clicked.connect(cost_dialog.accept)
-        btn_layout.addWidget(ok_btn)
-        
-        layout.addLayout(btn_layout)
-        cost_dialog.setLayout(layout)
-        cost_dialog.exec_()
-    
-    def _save_cost_table_txt(self, table_text):
-        """Сохранить таблицу стоимости в TXT"""
-        from PyQt5.QtWidgets import QFileDialog
-        from datetime import datetime
-        
-        current_date = datetime.now().strftime("%Y%m%d_%H%M%S")
-        default_filename = f"Таблица_стоимости_маршрут_{self.route_number}_{current_date}.txt"
-        
-        filename, _ = QFileDialog.getSaveFileName(
-            self, "Сохранить таблицу стоимости", default_filename,
-            "Текстовые файлы (*.txt);;Все файлы (*.*)"
-        )
-        
-        if filename:
-            if not filename.endswith('.txt'):
-                filename += '.txt'
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(table_text)
-            QMessageBox.information(self, "Успешно", f"Таблица сохранена в:\n{filename}")
-    
-    def _print_cost_table(self, table_text):
-        """Напечатать таблицу стоимости"""
-        from PyQt5.QtPrintSupport import QPrinter, QPrintDialog
-        from PyQt5.QtGui import QTextDocument, QTextOption
-        
-        printer = QPrinter(QPrinter.HighResolution)
-        printer.setPageSize(QPrinter.A4)
-        printer.setOrientation(QPrinter.Portrait)
-        printer.setPageMargins(5, 5, 5, 5, QPrinter.Millimeter)
-        
-        dialog = QPrintDialog(printer, self)
-        if dialog.exec_() == QPrintDialog.Accepted:
-            doc = QTextDocument()
-            html_text = f"""
-            <html><head><style>
-                body {{ font-family: 'Courier New', monospace; font-size: 10pt; white-space: pre; }}
-                pre {{ font-family: 'Courier New', monospace; font-size: 10pt; margin: 0; padding: 0; }}
-            </style></head><body><pre>{table_text}</pre></body></html>
-            """
-            doc.setHtml(html_text)
-            option = QTextOption()
-            option.setWrapMode(QTextOption.NoWrap)
-            doc.setDefaultTextOption(option)
-            doc.print_(printer)
-            QMessageBox.information(self, "Успешно", "Таблица отправлена на печать")
 
     def update_theme(self):
         """Обновить тему диалога"""
@@ -869,38 +700,90 @@ class RouteGridDialog(QDialog, ExportImportMixin, ValidationMixin):
 class EnhancedRouteGridDialog(RouteGridDialog):
     """Расширенная версия диалога с дополнительными функциями"""
     
+    # Редактируемые колонки, изменения которых попадают в историю
+    HISTORY_COLUMNS = (1, 2, 3, 4, 5)
+    
     def __init__(self, *args, **kwargs):
+        # Несохранённые правки: (ID записи, колонка) -> текст ячейки;
+        # переживают перезагрузку таблицы до сохранения или отказа от них
+        self._pending_edits = {}
         super().__init__(*args, **kwargs)
-        self.changes_history = []
         self.modified_rows = set()
-        self.current_history_position = -1
-        self.max_history_size = 50
+        self.history = HistoryManager(
+            max_bytes=int(PERFORMANCE_CONFIG.get('history_max_bytes', DEFAULT_MAX_BYTES))
+        )
+        # ID записей, пересозданных повтором импорта: старый ID -> новый
+        self._id_aliases = {}
         
         self.sequence_table.itemChanged.connect(self._on_table_item_changed)
         self.setup_shortcuts()
-    
-        self.auto_save_timer = QTimer()
-        self.auto_save_timer.timeout.connect(self._auto_save)
-        self.auto_save_timer.start(30000)  # 30 секунд
         
+        # Несохранённые правки пишутся в журнал в фоне, без диалогов
+        self.journal = None
+        try:
+            self.journal = RouteJournal(
+                self.route_id,
+                fsync_interval=PERFORMANCE_CONFIG.get('journal_fsync_interval_sec', DEFAULT_FSYNC_INTERVAL)
+            )
+        except OSError as e:
+            QMessageBox.warning(self, "Автосохранение",
+                                f"Журнал правок недоступен, автосохранение отключено: {e}")
         self.modified = False
+        self._replay_journal()
     
-    def _auto_save(self):
-        """Автосохранение изменений"""
-        if self.modified:
+    def _replay_journal(self):
+        """Восстановить правки, оставшиеся в журнале после аварийного завершения"""
+        if not self.journal:
+            return
+        records = self.journal.replay()
+        if not records:
+            return
+        reply = QMessageBox.question(
+            self, "Восстановление",
+            f"Найдены несохранённые изменения ({len(records)}) после аварийного "
+            f"завершения. Восстановить?",
+            QMessageBox.Yes | QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            # Явный отказ от восстановления
+            self.journal.compact()
+            return
+        self.journal.compact()
+        # Восстановленные значения проходят обычный путь правки: история, подсветка, журнал
+        with self.history.transaction("Восстановление изменений"):
+            for record in records:
+                row = self.original_data.index_of(record['seq_id'])
+                item = self.sequence_table.item(row, record['col']) if row >= 0 else None
+                if item and item.flags() & Qt.ItemIsEditable:
+                    item.setText(record['value'])
+    
+    def done(self, result):
+        """Закрытие диалога: несохранённые правки сохраняются или отбрасываются по ответу"""
+        if self._pending_edits:
             reply = QMessageBox.question(
-                self, "Автосохранение",
-                "Есть несохраненные изменения. Сохранить?",
-                QMessageBox.Yes | QMessageBox.No
+                self, "Несохранённые изменения",
+                f"Изменено ячеек: {len(self._pending_edits)}. Сохранить изменения?",
+                QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel
             )
-            if reply == QMessageBox.Yes:
+            if reply == QMessageBox.Cancel:
+                return
+            if reply == QMessageBox.Save:
                 self._save_changes()
-            self.modified = False
+                if self._pending_edits:
+                    # Не сохранено (ошибка или конфликт) - диалог остаётся открытым
+                    return
+        # Правки сохранены или от них явно отказались - журнал больше не нужен
+        if self.journal:
+            self.journal.close(compact=True)
+        super().done(result)
+    
+    def _changes_saved(self):
+        """Правки в БД: журнал очищается"""
+        self._pending_edits.clear()
+        self.modified = False
+        if self.journal:
+            self.journal.compact()
     
-    def _on_table_item_changed(self, item):
-        super()._on_table_item_changed(item)
-        self.modified = True
-
     def setup_shortcuts(self):
         """Добавить клавиатурные сокращения"""
         from PyQt5.QtWidgets import QShortcut
@@ -917,33 +800,59 @@ class EnhancedRouteGridDialog(RouteGridDialog):
         """Обновить тему для расширенной версии"""
         super().update_theme()
     
-    def _on_table_item_changed(self, item):
-        """Отслеживание изменений в таблице"""
-        row, col = item.row(), item.column()
-        if col >= 1:
+    def _refresh_table(self, sequence):
+        """
+        Обновить таблицу и запомнить текущие значения редактируемых ячеек.
+        
+        Несохранённые правки ставятся обратно в строки своих записей (журнал
+        их уже содержит); правки удалённых записей отбрасываются.
+        """
+        # Пока таблица заполняется, изменения ячеек не отслеживаются
+        self._cell_text = {}
+        super()._refresh_table(sequence)
+        table = self.sequence_table
+        self._cell_text = {
+            (row, col): table.item(row, col).text()
+            for row in range(table.rowCount()) for col in self.HISTORY_COLUMNS
+        }
+        if not hasattr(self, 'modified_rows'):
+            return
+        self.modified_rows.clear()
+        for key, value in list(self._pending_edits.items()):
+            seq_id, col = key
+            row = sequence.index_of(seq_id)
+            item = table.item(row, col) if row >= 0 else None
+            if item is None or item.text() == value:
+                del self._pending_edits[key]
+                continue
+            # Текст запоминается заранее: повторная установка - не новая правка
+            self._cell_text[(row, col)] = value
+            item.setText(value)
             self.modified_rows.add(row)
+        for row in self.modified_rows:
             self._highlight_modified_row(row)
-            self._add_to_history({
-                'row': row, 'col': col,
-                'old_value': self._get_original_value(row, col),
-                'new_value': item.text()
-            })
+        self.modified = bool(self._pending_edits)
     
-    def _get_original_value(self, row, col):
-        """Получить оригинальное значение"""
+    def _on_table_item_changed(self, item):
+        """Отслеживание изменений в таблице"""
+        row, col = item.row(), item.column()
+        old_value = self._cell_text.get((row, col))
+        new_value = item.text()
+        # Подсветка и служебные обновления не меняют текст - пропускаем
+        if old_value is None or old_value == new_value:
+            return
+        self._cell_text[(row, col)] = new_value
+        self.modified_rows.add(row)
+        self.modified = True
+        self._highlight_modified_row(row)
         if row < len(self.original_data):
-            orig = self.original_data[row]
-            if col == 1:
-                return orig['point_name']
-            elif col == 2:
-                return str(orig['distance_km'])
-            elif col == 3:
-                return str(orig['rounding'])
-            elif col == 4:
-                return str(orig['cost_per_km'])
-            elif col == 5:
-                return str(orig['baggage_percent'])
-        return ""
+            self._pending_edits[(self.original_data.ids[row], col)] = new_value
+            if self.journal:
+                self.journal.append(self.original_data.ids[row], col, new_value)
+            self.history.record(
+                ('cell', self.original_data.ids[row], col, old_value, new_value),
+                f"Изменение: {TABLE_HEADERS['route_sequence'][col]}"
+            )
     
     def _highlight_modified_row(self, row):
         """Подсветка изменённой строки"""
@@ -952,35 +861,93 @@ class EnhancedRouteGridDialog(RouteGridDialog):
             if item:
                 item.setBackground(QColor(255, 255, 200))
     
-    def _add_to_history(self, change):
-        """Добавить изменение в историю"""
-        if self.current_history_position < len(self.changes_history) - 1:
-            self.changes_history = self.changes_history[:self.current_history_position + 1]
-        
-        self.changes_history.append(change)
-        self.current_history_position = len(self.changes_history) - 1
-        
-        if len(self.changes_history) > self.max_history_size:
-            self.changes_history.pop(0)
-            self.current_history_position -= 1
+    def _sort_by_distance(self):
+        """Сортировка по расстоянию (отменяется одним шагом)"""
+        old_order = tuple(self.original_data.ids)
+        super()._sort_by_distance()
+        new_order = tuple(self.original_data.ids)
+        if new_order != old_order:
+            self.modified_rows.clear()
+            self.history.record(('order', old_order, new_order), "Сортировка по расстоянию")
+    
+    def import_from_file(self):
+        """Импорт пунктов; весь импорт - одна запись истории"""
+        known_ids = set(self.original_data.ids)
+        super().import_from_file()
+        seq = self.original_data
+        with self.history.transaction("Импорт пунктов"):
+            for index, seq_id in enumerate(seq.ids):
+                if seq_id not in known_ids:
+                    self.history.record(('insert', seq_id, seq.point_ids[index],
+                                         seq.distances[index], seq.roundings[index],
+                                         seq.costs[index], seq.baggage_percents[index]))
+    
+    def _resolve_id(self, seq_id):
+        """Текущий ID записи с учётом пересоздания при повторе импорта"""
+        return self._id_aliases.get(seq_id, seq_id)
     
     def _undo_change(self):
         """Отмена последнего изменения"""
-        if self.current_history_position >= 0:
-            change = self.changes_history[self.current_history_position]
-            item = self.sequence_table.item(change['row'], change['col'])
-            if item:
-                item.setText(change['old_value'])
-            self.current_history_position -= 1
+        entry = self.history.undo()
+        if entry:
+            self._apply_history_entry(entry, undo=True)
     
     def _redo_change(self):
         """Повтор отменённого изменения"""
-        if self.current_history_position < len(self.changes_history) - 1:
-            self.current_history_position += 1
-            change = self.changes_history[self.current_history_position]
-            item = self.sequence_table.item(change['row'], change['col'])
-            if item:
-                item.setText(change['new_value'])
+        entry = self.history.redo()
+        if entry:
+            self._apply_history_entry(entry, undo=False)
+    
+    def _apply_history_entry(self, entry, undo):
+        """
+        Применить запись истории.
+        
+        Операции с БД (порядок, импорт) выполняются одной транзакцией с одной
+        перезагрузкой таблицы, затем значения ячеек ставятся без перерисовки
+        после каждой ячейки.
+        """
+        deltas = reversed(entry.deltas) if undo else entry.deltas
+        cell_deltas = []
+        db_deltas = []
+        for delta in deltas:
+            (cell_deltas if delta[0] == 'cell' else db_deltas).append(delta)
+        
+        with self.history.suspended():
+            if db_deltas:
+                try:
+                    with self.db.batch():
+                        for delta in db_deltas:
+                            self._apply_db_delta(delta, undo)
+                except Exception as e:
+                    QMessageBox.critical(self, "Ошибка", f"Не удалось отменить действие: {e}")
+                    return
+                self.load_route_sequence()
+            
+            table = self.sequence_table
+            table.setUpdatesEnabled(False)
+            try:
+                for _, seq_id, col, old_value, new_value in cell_deltas:
+                    row = self.original_data.index_of(self._resolve_id(seq_id))
+                    item = table.item(row, col) if row >= 0 else None
+                    if item:
+                        item.setText(old_value if undo else new_value)
+            finally:
+                table.setUpdatesEnabled(True)
+    
+    def _apply_db_delta(self, delta, undo):
+        """Применить дельту, изменяющую маршрут в БД"""
+        kind = delta[0]
+        if kind == 'order':
+            _, old_order, new_order = delta
+            order = old_order if undo else new_order
+            self.db.reorder_route_sequence(self.route_id,
+                                           [self._resolve_id(seq_id) for seq_id in order])
+        elif kind == 'insert':
+            if undo:
+                self.db.remove_point_from_route(self._resolve_id(delta[1]))
+            else:
+                # Псевдоним хранится от исходного ID, записанного в истории
+                self._id_aliases[delta[1]] = self.db.add_point_to_route(self.route_id, *delta[2:])
     
     def _show_search_dialog(self):
         """Показать диалог поиска"""
@@ -1,10 +1,20 @@
 """
 Вкладка управления тарифными сетками
 """
-from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QTableWidget, QMenu, QHeaderView
+import os
+from datetime import datetime
+
+from PyQt5.QtWidgets import (QVBoxLayout, QHBoxLayout, QTableWidget, QMenu, QHeaderView,
+                             QFileDialog, QApplication, QProgressDialog)
 from PyQt5.QtCore import Qt, QPoint
 
+from core import fare_columnar
+from core.fare_cache import fare_cache
+from core.fare_export import export_fares_csv
+from core.fare_matrix_file import read_network
 from .base_tab import BaseTab
+from .decorators import track_latency
+from .publish_worker import PublishWorker
 from .table_mixin import TableMixin
 from .widgets import SearchBox, Button
 from .route_edit_dialog import RouteEditDialog
@@ -14,6 +24,7 @@ class RoutesTab(BaseTab, TableMixin):
     def __init__(self, db):
         super().__init__(db)
         self.grids = []
+        self.publish_worker = None
         self.table_columns = ["ID", "№ маршрута", "Название"]
         self.setup_ui()
         self.load_data()
@@ -36,6 +47,23 @@ class RoutesTab(BaseTab, TableMixin):
         self.delete_btn.clicked.connect(self._delete_grid)
         top_layout.addWidget(self.delete_btn)
         
+        self.tariff_btn = Button("💲 Изменить тариф")
+        self.tariff_btn.setToolTip("Изменить параметры тарифа сразу для группы маршрутов")
+        self.tariff_btn.clicked.connect(self._bulk_update_tariff)
+        top_layout.addWidget(self.tariff_btn)
+        
+        self.publish_btn = Button("📤 Публикация для терминалов")
+        self.publish_btn.setToolTip("Двоичный файл тарифов всей сети для билетных терминалов")
+        self.publish_btn.clicked.connect(self._publish_fare_matrix)
+        top_layout.addWidget(self.publish_btn)
+        
+        self.fares_export_btn = Button("📄 Выгрузить тарифы")
+        self.fares_export_btn.setToolTip("Тарифы всех пар остановок найденных маршрутов "
+                                         "(без поиска - всей сети) в CSV или, для аналитики, "
+                                         "в Parquet/Arrow")
+        self.fares_export_btn.clicked.connect(self._export_fares)
+        top_layout.addWidget(self.fares_export_btn)
+        
         layout.addLayout(top_layout)
         
         # Таблица
@@ -86,6 +114,9 @@ class RoutesTab(BaseTab, TableMixin):
         duplicate_action = menu.addAction("📋 Дублировать маршрут")
         duplicate_action.triggered.connect(lambda: self._duplicate_route(route_id))
         
+        menu.addAction("📅 Тариф на дату...",
+                       lambda: self._export_tariff_as_of(route_id, route_number, route_name))
+        
         menu.addSeparator()
         
         delete_action = menu.addAction("❌ Удалить маршрут")
@@ -99,6 +130,11 @@ class RoutesTab(BaseTab, TableMixin):
         if dialog.exec_():
             self.load_data()
     
+    def _export_tariff_as_of(self, route_id: int, route_number: str, route_name: str):
+        """Выгрузить тарифную сетку маршрута на выбранную дату"""
+        from .tariff_date_dialog import TariffDateDialog
+        TariffDateDialog(self.db, route_id, route_number, route_name, parent=self).exec_()
+    
     def _duplicate_route(self, source_route_id: int):
         """Дублировать маршрут"""
         try:
@@ -138,6 +174,7 @@ class RoutesTab(BaseTab, TableMixin):
         
         try:
             self.db.delete_route(route_id)
+            fare_cache.invalidate([route_id])
             self.load_data()
             self.show_info("Успешно", "Маршрут удалён")
         except Exception as e:
@@ -226,8 +263,115 @@ class RoutesTab(BaseTab, TableMixin):
         
         dialog = EnhancedRouteGridDialog(self.db, route_id, route_number, route_name, parent=self)
         dialog.exec_()
+        # Пункты и тариф маршрута могли измениться в редакторе
+        fare_cache.invalidate([route_id])
         self.load_data()
     
+    def _bulk_update_tariff(self):
+        """Массовое изменение параметров тарифа маршрутов"""
+        from .bulk_tariff_dialog import BulkTariffDialog
+        data = self.get_selected_row_data(self.table, ['id'])
+        selected_id = int(data['id']) if data else None
+        dialog = BulkTariffDialog(self.db, self.search_input.text().strip(), selected_id,
+                                  parent=self)
+        if dialog.exec_():
+            self.load_data()
+    
+    @track_latency()
+    def _publish_fare_matrix(self):
+        """Опубликовать тарифы сети в двоичный файл (в отдельном потоке)"""
+        if self.publish_worker is not None and self.publish_worker.isRunning():
+            self.show_warning("Публикация", "Тарифы уже публикуются")
+            return
+        default_filename = f"tariffs_{datetime.now():%Y%m%d}.tfmx"
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Публикация тарифов", default_filename,
+            "Тарифы для терминалов (*.tfmx);;Все файлы (*.*)"
+        )
+        if not filename:
+            return
+        if not filename.endswith('.tfmx'):
+            filename += '.tfmx'
+        
+        # Чтение из БД - в потоке подключения, в рабочем потоке только расчёт и запись
+        try:
+            route_numbers, sequences = read_network(self.db)
+        except Exception as e:
+            self.show_error("Ошибка", f"Не удалось прочитать маршруты: {e}")
+            return
+        
+        progress = QProgressDialog("Публикация тарифов для терминалов...", "Отмена", 0, 0, self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+        worker = PublishWorker(sequences, route_numbers, filename, self)
+        worker.progress.connect(lambda done, total: (progress.setMaximum(total),
+                                                     progress.setValue(done)))
+        progress.canceled.connect(worker.requestInterruption)
+        worker.finished.connect(lambda: self._publish_finished(worker, progress))
+        self.publish_worker = worker
+        worker.start()
+    
+    def _publish_finished(self, worker: PublishWorker, progress: QProgressDialog):
+        progress.close()
+        if worker.error:
+            self.show_error("Ошибка", f"Не удалось опубликовать тарифы: {worker.error}")
+        elif worker.cancelled:
+            self.show_info("Публикация", "Публикация отменена, прежний файл не изменён")
+        elif worker.result is not None:
+            result = worker.result
+            self.show_info("Успешно",
+                           f"Тарифы опубликованы в:\n{worker.filename}\n\n"
+                           f"Маршрутов: {result.routes}, пар остановок: {result.pairs}\n"
+                           f"Размер: {result.size_bytes / 1024 / 1024:.1f} МБ, "
+                           f"время: {result.elapsed_sec:.1f} с")
+    
+    def stop_publishing(self):
+        """Отменить незавершённую публикацию и дождаться потока"""
+        if self.publish_worker is not None and self.publish_worker.isRunning():
+            self.publish_worker.requestInterruption()
+            self.publish_worker.wait()
+    
+    @track_latency()
+    def _export_fares(self):
+        """Выгрузить тарифы пар остановок найденных маршрутов или всей сети"""
+        route_ids = ([grid['id'] for grid in self.grids]
+                     if self.search_input.text().strip() else None)
+        if route_ids == []:
+            self.show_warning("Внимание", "Нет маршрутов для выгрузки")
+            return
+        default_filename = f"Тарифы_{datetime.now():%Y%m%d}.csv"
+        filters = "CSV файлы (*.csv)"
+        if fare_columnar.is_available():
+            filters += ";;Parquet (*.parquet);;Arrow (*.arrow)"
+        filename, selected = QFileDialog.getSaveFileName(
+            self, "Выгрузка тарифов", default_filename, filters
+        )
+        if not filename:
+            return
+        ext = os.path.splitext(filename)[1].lower()
+        if ext not in ('.csv', *fare_columnar.FORMATS):
+            filename += (".parquet" if "Parquet" in selected
+                         else ".arrow" if "Arrow" in selected else ".csv")
+            ext = os.path.splitext(filename)[1]
+        
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            if ext == '.csv':
+                result = export_fares_csv(self.db, filename, route_ids)
+            else:
+                result = fare_columnar.export_fares_columnar(self.db, filename, route_ids)
+        except Exception as e:
+            QApplication.restoreOverrideCursor()
+            self.show_error("Ошибка", f"Не удалось выгрузить тарифы: {e}")
+            return
+        QApplication.restoreOverrideCursor()
+        routes = "всей сети" if route_ids is None else f"маршрутов: {len(route_ids)}"
+        self.show_info("Успешно",
+                       f"Тарифы {routes} выгружены в:\n{filename}\n\n"
+                       f"Пар остановок: {result.pairs}, время: {result.elapsed_sec:.1f} с")
+    
     def update_theme(self):
         """Обновить тему вкладки маршрутов"""
         # Обновляем стиль таблицы
@@ -238,6 +382,7 @@ class RoutesTab(BaseTab, TableMixin):
             self.search_input.update_theme()
         
         # Обновляем стили кнопок
-        for btn in [self.add_btn, self.delete_btn]:
+        for btn in [self.add_btn, self.delete_btn, self.tariff_btn, self.publish_btn,
+                    self.fares_export_btn]:
             if hasattr(btn, 'update_theme'):
                 btn.update_theme()
@@ -79,16 +79,22 @@ class SettingsDialog(QDialog):
             QMessageBox.warning(self, "Ошибка", f"Не удалось загрузить конфиг: {e}")
     
     def save_config(self):
-        config = {
-            "database": {
-                "host": self.host_input.text(),
-                "port": self.port_input.value(),
-                "dbname": self.dbname_input.text(),
-                "user": self.user_input.text(),
-                "password": self.password_input.text()
-            },
-            "theme": "light"
-        }
+        # Сохраняем остальные разделы и ключи (backend, performance и т.д.)
+        config = {"theme": "light"}
+        if self.config_path.exists():
+            try:
+                with open(self.config_path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            except (OSError, ValueError):
+                pass
+        
+        config.setdefault("database", {}).update({
+            "host": self.host_input.text(),
+            "port": self.port_input.value(),
+            "dbname": self.dbname_input.text(),
+            "user": self.user_input.text(),
+            "password": self.password_input.text()
+        })
         
         try:
             with open(self.config_path, 'w', encoding='utf-8') as f:
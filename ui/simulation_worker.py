@@ -0,0 +1,34 @@
+"""
+Моделирование тарифа сети в отдельном потоке
+
+Маршруты читаются из БД в GUI-потоке (подключение принадлежит ему, см.
+ui.sync_worker), а расчёт тарифов всех пар сети
+(core.tariff_simulation.simulate_sequences), который без NumPy на большой
+сети занимает секунды, выполняется в этом потоке без обращения к БД.
+"""
+from typing import Dict, List, Optional
+
+from PyQt5.QtCore import QThread
+
+from core.tariff_simulation import SimulationReport, TariffPolicy, simulate_sequences
+from models import RouteSequence
+
+
+class SimulationWorker(QThread):
+    """Поток моделирования тарифа"""
+
+    def __init__(self, sequences: List[RouteSequence], route_numbers: Dict[int, str],
+                 policy: TariffPolicy, parent=None):
+        super().__init__(parent)
+        self.sequences = sequences
+        self.route_numbers = route_numbers
+        self.policy = policy
+        self.result: Optional[SimulationReport] = None
+        self.error: Optional[str] = None
+
+    def run(self):
+        """Расчёт в отдельном потоке"""
+        try:
+            self.result = simulate_sequences(self.sequences, self.route_numbers, self.policy)
+        except Exception as e:
+            self.error = str(e)
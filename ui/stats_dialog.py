@@ -4,6 +4,7 @@ from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout,
                              QTableWidgetItem, QHeaderView)
 from PyQt5.QtCore import Qt
 from .base_dialog import BaseDialog
+from .decorators import track_latency
 
 class StatsDialog(BaseDialog):
     def __init__(self, db, parent=None):
@@ -57,39 +58,37 @@ class StatsDialog(BaseDialog):
         layout.addLayout(btn_layout)
         self.setLayout(layout)
     
+    @track_latency()
     def load_stats(self):
         """Загрузить статистику"""
         try:
             # Общая статистика
-            points = self.db.get_all_points()
-            routes = self.db.get_all_routes()
+            points_count = sum(1 for _ in self.db.iter_points())
+            routes = list(self.db.iter_routes())
             
-            self.points_label.setText(f"Пунктов: {len(points)}")
+            self.points_label.setText(f"Пунктов: {points_count}")
             self.routes_label.setText(f"Маршрутов: {len(routes)}")
             
+            # Число пунктов, расстояние и тариф хранятся в самих маршрутах
             total_stops = 0
             self.table.setRowCount(len(routes))
             
             for i, route in enumerate(routes):
-                sequence = self.db.get_route_sequence(route['id'])
-                total_stops += len(sequence)
+                count = route.points_count
+                total_stops += count
                 
                 # Расчет общего расстояния
-                total_distance = 0
-                if len(sequence) > 1:
-                    total_distance = sequence[-1]['distance_km']
+                total_distance = float(route.total_distance_km) if count > 1 else 0
                 
                 # Примерная стоимость
-                cost = 0
-                if sequence:
-                    cost = total_distance * float(sequence[0]['cost_per_km'])
+                cost = total_distance * float(route.cost_per_km)
                 
-                self.table.setItem(i, 0, QTableWidgetItem(f"{route['route_number']} — {route['route_name']}"))
-                self.table.setItem(i, 1, QTableWidgetItem(str(len(sequence))))
+                self.table.setItem(i, 0, QTableWidgetItem(f"{route.route_number} — {route.route_name}"))
+                self.table.setItem(i, 1, QTableWidgetItem(str(count)))
                 self.table.setItem(i, 2, QTableWidgetItem(f"{total_distance:.1f} км"))
                 self.table.setItem(i, 3, QTableWidgetItem(f"{cost:.2f} ₽"))
             
             self.total_points_label.setText(f"Всего остановок: {total_stops}")
             
         except Exception as e:
-            self.show_error("Ошибка", f"Не удалось загрузить статистику: {e}")
\ No newline at end of file
+            self.show_error("Ошибка", f"Не удалось загрузить статистику: {e}")
@@ -0,0 +1,31 @@
+"""
+Фоновый обмен локального кэша с сервером
+
+Снимок очереди снимается и результат применяется к кэшу в GUI-потоке
+(SQLite-подключение кэша принадлежит ему), а сетевая часть - отправка
+очереди и получение изменений сервера - выполняется в этом потоке.
+"""
+from typing import Any, Dict, List, Optional
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from core.database import DatabaseError
+
+
+class SyncWorker(QThread):
+    """Поток сетевого обмена SyncedDatabase с сервером"""
+    exchanged = pyqtSignal(object)  # SyncExchange для SyncedDatabase.apply_sync
+    failed = pyqtSignal(str)
+
+    def __init__(self, db, ops: List[Dict[str, Any]], since: Optional[str], parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.ops = ops
+        self.since = since
+
+    def run(self):
+        """Обмен с сервером в отдельном потоке"""
+        try:
+            self.exchanged.emit(self.db.exchange(self.ops, self.since))
+        except DatabaseError as e:
+            self.failed.emit(str(e))
@@ -0,0 +1,114 @@
+"""Диалог выгрузки тарифной сетки маршрута на выбранную дату"""
+import os
+
+from PyQt5.QtWidgets import (QVBoxLayout, QHBoxLayout, QFormLayout, QLabel, QPushButton,
+                             QCheckBox, QDateEdit, QFileDialog, QApplication)
+from PyQt5.QtCore import Qt, QDate
+
+from core import fare_engine
+from utils.exporter import TariffExporter
+from .base_dialog import BaseDialog
+from .decorators import track_latency
+
+# Сколько последних дат изменения тарифа показывать в подсказке
+RECENT_DATES = 10
+
+
+class TariffDateDialog(BaseDialog):
+    def __init__(self, db, route_id, route_number, route_name, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.route_id = route_id
+        self.route_number = route_number
+        self.route_name = route_name
+        self.setWindowTitle(f"Тариф на дату — маршрут №{route_number}")
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+
+        form = QFormLayout()
+        self.date_edit = QDateEdit(QDate.currentDate())
+        self.date_edit.setCalendarPopup(True)
+        self.date_edit.setDisplayFormat("dd.MM.yyyy")
+        self.date_edit.setMaximumDate(QDate.currentDate())
+        form.addRow("Дата:", self.date_edit)
+        self.round_up_check = QCheckBox("Округление вверх")
+        form.addRow("", self.round_up_check)
+        layout.addLayout(form)
+
+        self.dates_label = QLabel()
+        self.dates_label.setWordWrap(True)
+        layout.addWidget(self.dates_label)
+        self._load_dates()
+
+        btn_layout = QHBoxLayout()
+        btn_layout.addStretch()
+        pdf_btn = QPushButton("📄 PDF")
+        pdf_btn.clicked.connect(lambda: self.export("pdf"))
+        btn_layout.addWidget(pdf_btn)
+        excel_btn = QPushButton("📊 Excel")
+        excel_btn.clicked.connect(lambda: self.export("xlsx"))
+        btn_layout.addWidget(excel_btn)
+        cancel_btn = QPushButton("Отмена")
+        cancel_btn.clicked.connect(self.reject)
+        btn_layout.addWidget(cancel_btn)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+
+    def _load_dates(self):
+        try:
+            dates = self.db.get_tariff_dates(self.route_id)
+        except Exception as e:
+            self.dates_label.setText(f"Не удалось загрузить историю тарифа: {e}")
+            return
+        if not dates:
+            self.dates_label.setText("Тариф маршрута не менялся")
+            return
+        recent = ", ".join(f"{day:%d.%m.%Y}" for day in dates[-RECENT_DATES:])
+        self.dates_label.setText(f"Тариф менялся: {recent}")
+
+    @track_latency()
+    def export(self, ext):
+        as_of = self.date_edit.date().toPyDate()
+        try:
+            sequence = self.db.get_route_sequence_model(self.route_id, as_of)
+        except Exception as e:
+            self.show_error("Ошибка", f"Не удалось загрузить тариф на дату: {e}")
+            return
+        if not sequence:
+            self.show_warning("Внимание", f"На {as_of:%d.%m.%Y} в маршруте нет пунктов")
+            return
+
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Сохранить тарифную сетку",
+            TariffExporter.get_suggested_filename(self.route_number, ext, as_of),
+            "PDF файлы (*.pdf)" if ext == "pdf" else "Excel файлы (*.xlsx)"
+        )
+        if not filename:
+            return
+        if not os.path.splitext(filename)[1]:
+            filename += f".{ext}"
+
+        grid_info = {
+            'grid_number': self.route_number,
+            'grid_name': self.route_name,
+            'passenger_tariff': sequence.cost_per_km,
+            'child_discount_percent': 100 - fare_engine.CHILD_FARE_PERCENT,
+            'benefit_discount_percent': 100 - fare_engine.BENEFIT_FARE_PERCENT,
+            'as_of': as_of,
+            'round_up': self.round_up_check.isChecked(),
+        }
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            if ext == "pdf":
+                TariffExporter.export_tariff_table(grid_info, sequence, {}, None, filename)
+            else:
+                TariffExporter.export_tariff_excel(grid_info, sequence, {}, None, filename)
+        except Exception as e:
+            QApplication.restoreOverrideCursor()
+            self.show_error("Ошибка", f"Не удалось сохранить тарифную сетку: {e}")
+            return
+        QApplication.restoreOverrideCursor()
+        self.show_info("Успешно", f"Тарифная сетка на {as_of:%d.%m.%Y} сохранена в:\n{filename}")
+        self.accept()
@@ -0,0 +1,189 @@
+"""Диалог моделирования изменения тарифа по всей сети"""
+from datetime import datetime
+
+from PyQt5.QtWidgets import (QVBoxLayout, QHBoxLayout, QGridLayout, QLabel, QPushButton,
+                             QCheckBox, QDoubleSpinBox, QTableWidget, QTableWidgetItem,
+                             QHeaderView, QFileDialog)
+from PyQt5.QtCore import Qt
+
+from core.fare_matrix_file import read_network
+from core.tariff_simulation import TariffPolicy, apply_policy
+from .base_dialog import BaseDialog
+from .decorators import track_latency
+from .simulation_worker import SimulationWorker
+
+
+class TariffSimulationDialog(BaseDialog):
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.report = None
+        self.applied = False
+        self.worker = None
+        self.setWindowTitle("Моделирование тарифа")
+        self.resize(900, 600)
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+
+        # Параметры: отмеченные заменяют значения маршрутов, остальные остаются
+        grid = QGridLayout()
+        self.cost_check, self.cost_spin = self._parameter(grid, 0, "Стоимость км, руб.", 0, 1000, 2)
+        self.baggage_check, self.baggage_spin = self._parameter(grid, 1, "Багаж, %", 0, 100, 1)
+        self.rounding_check, self.rounding_spin = self._parameter(grid, 2, "Округление, руб.",
+                                                                  0, 100, 2)
+        self.round_up_check = QCheckBox("Округление вверх")
+        grid.addWidget(self.round_up_check, 3, 0)
+        layout.addLayout(grid)
+
+        calc_layout = QHBoxLayout()
+        self.calc_btn = QPushButton("📊 Рассчитать")
+        self.calc_btn.clicked.connect(self.run_simulation)
+        calc_layout.addWidget(self.calc_btn)
+        calc_layout.addStretch()
+        layout.addLayout(calc_layout)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(7)
+        self.table.setHorizontalHeaderLabels(["Маршрут", "Пар", "Выручка до", "Выручка после",
+                                              "Изменение, %", "Макс. рост", "Макс. снижение"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSortingEnabled(True)
+        layout.addWidget(self.table)
+
+        self.summary_label = QLabel("Задайте параметры и нажмите «Рассчитать»")
+        self.summary_label.setStyleSheet("font-size: 14px; font-weight: bold;")
+        layout.addWidget(self.summary_label)
+
+        btn_layout = QHBoxLayout()
+        self.save_btn = QPushButton("💾 Сохранить отчёт")
+        self.save_btn.clicked.connect(self.save_report)
+        btn_layout.addWidget(self.save_btn)
+        self.apply_btn = QPushButton("✅ Применить к маршрутам")
+        self.apply_btn.clicked.connect(self.apply_report)
+        btn_layout.addWidget(self.apply_btn)
+        btn_layout.addStretch()
+        close_btn = QPushButton("Закрыть")
+        close_btn.clicked.connect(self.accept)
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+        self._set_report(None)
+
+    def _parameter(self, grid, row, title, minimum, maximum, decimals):
+        check = QCheckBox(title)
+        spin = QDoubleSpinBox()
+        spin.setRange(minimum, maximum)
+        spin.setDecimals(decimals)
+        spin.setEnabled(False)
+        check.toggled.connect(spin.setEnabled)
+        grid.addWidget(check, row, 0)
+        grid.addWidget(spin, row, 1)
+        return check, spin
+
+    def policy(self):
+        def value(check, spin):
+            return spin.value() if check.isChecked() else None
+        return TariffPolicy(value(self.cost_check, self.cost_spin),
+                            value(self.baggage_check, self.baggage_spin),
+                            value(self.rounding_check, self.rounding_spin),
+                            self.round_up_check.isChecked())
+
+    def _set_report(self, report):
+        self.report = report
+        self.save_btn.setEnabled(report is not None)
+        self.apply_btn.setEnabled(report is not None)
+
+    @track_latency()
+    def run_simulation(self):
+        """Рассчитать отчёт (в отдельном потоке)"""
+        if self.worker is not None and self.worker.isRunning():
+            return
+        policy = self.policy()
+        if (policy.cost_per_km is None and policy.baggage_percent is None
+                and policy.rounding is None):
+            self.show_warning("Внимание", "Отметьте хотя бы один параметр тарифа")
+            return
+        # Чтение из БД - в потоке подключения, в рабочем потоке только расчёт
+        try:
+            route_numbers, sequences = read_network(self.db)
+        except Exception as e:
+            self.show_error("Ошибка", f"Не удалось прочитать маршруты: {e}")
+            return
+
+        self.calc_btn.setEnabled(False)
+        self._set_report(None)
+        self.summary_label.setText("Расчёт...")
+        worker = SimulationWorker(sequences, route_numbers, policy, self)
+        worker.finished.connect(lambda: self._simulation_finished(worker))
+        self.worker = worker
+        worker.start()
+
+    def _simulation_finished(self, worker):
+        self.calc_btn.setEnabled(True)
+        report = worker.result
+        if worker.error or report is None:
+            self.summary_label.setText("Задайте параметры и нажмите «Рассчитать»")
+            self.show_error("Ошибка", f"Не удалось выполнить расчёт: {worker.error}")
+            return
+
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(report.routes))
+        for row, route in enumerate(report.routes):
+            values = [route.pairs, route.old_revenue, route.new_revenue,
+                      round(route.delta_percent, 2), route.max_increase, route.max_decrease]
+            self.table.setItem(row, 0, QTableWidgetItem(route.route_number))
+            for col, value in enumerate(values, 1):
+                item = QTableWidgetItem()
+                item.setData(Qt.DisplayRole, value)
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, col, item)
+        self.table.setSortingEnabled(True)
+        self.summary_label.setText(
+            f"Маршрутов: {len(report.routes)}, пар: {report.pairs}. "
+            f"Выручка: {report.old_revenue:,.2f} → {report.new_revenue:,.2f} руб. "
+            f"({report.delta_percent:+.2f}%), расчёт {report.elapsed_sec:.1f} с"
+        )
+        self._set_report(report)
+
+    def save_report(self):
+        default_filename = f"Моделирование_тарифа_{datetime.now():%Y%m%d_%H%M%S}.csv"
+        filename, _ = QFileDialog.getSaveFileName(
+            self, "Сохранить отчёт", default_filename, "CSV файлы (*.csv);;Все файлы (*.*)"
+        )
+        if not filename:
+            return
+        try:
+            self.report.write_csv(filename)
+        except OSError as e:
+            self.show_error("Ошибка", f"Не удалось сохранить отчёт: {e}")
+            return
+        self.show_info("Успешно", f"Отчёт сохранён в:\n{filename}")
+
+    def apply_report(self):
+        policy = self.report.policy
+        if not self.show_question(
+            "Подтверждение",
+            f"Записать новые параметры тарифа во все маршруты ({len(self.report.routes)})?\n"
+            f"Изменение выручки: {self.report.delta_percent:+.2f}%"
+        ):
+            return
+        route_ids = [route.route_id for route in self.report.routes]
+        try:
+            result = apply_policy(self.db, policy, route_ids)
+        except Exception as e:
+            self.show_error("Ошибка", f"Не удалось изменить тариф: {e}")
+            return
+        self.applied = True
+        self._set_report(None)
+        self.show_info("Успешно",
+                       f"Изменено пунктов: {result.rows_updated} из {result.rows_matched} "
+                       f"в маршрутах: {len(result.route_ids)}")
+
+    def done(self, result):
+        """Закрыть диалог, дождавшись незавершённого расчёта"""
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.wait()
+        super().done(result)
@@ -0,0 +1,185 @@
+"""
+Разбиение матрицы тарифов на страницы-плитки для печати и PDF
+
+Матрица n x n (строка - пункт, столбец - пункт) делится на плитки по
+rows_per_page строк и columns_per_page столбцов: одна плитка - одна
+страница, на которой повторяются заголовки её строк и столбцов. Страницы
+идут полосами столбцов сверху вниз. В нижнетреугольной таблице стоимости
+плитки целиком над диагональю не печатаются.
+
+Тексты ячеек плиток кэшируются (tile_cache), поэтому повторные
+предпросмотр, печать и выгрузка PDF маршрута не пересчитывают тарифы.
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from core import fare_engine
+from models import RouteSequence
+from utils.export_cache import export_cache
+
+# Тарифы ячейки таблицы стоимости: пассажирский, детский, багаж
+Fares = Tuple[float, float, float]
+
+# Сколько плиток хранит кэш текстов
+MAX_TILES = 512
+
+
+@dataclass(frozen=True)
+class Tile:
+    """Страница матрицы: диапазоны строк и столбцов"""
+    rows: range
+    columns: range
+
+
+def paginate(count: int, rows_per_page: int, columns_per_page: int,
+             lower_triangle: bool = False) -> List[Tile]:
+    """
+    Плитки матрицы count x count в порядке печати.
+
+    lower_triangle - заполнены только ячейки ниже диагонали (столбец < строки),
+    плитки без таких ячеек пропускаются.
+    """
+    rows_per_page, columns_per_page = max(rows_per_page, 1), max(columns_per_page, 1)
+    tiles = []
+    for column_start in range(0, count, columns_per_page):
+        columns = range(column_start, min(column_start + columns_per_page, count))
+        for row_start in range(0, count, rows_per_page):
+            rows = range(row_start, min(row_start + rows_per_page, count))
+            if lower_triangle and columns.start >= rows.stop - 1:
+                continue
+            tiles.append(Tile(rows, columns))
+    return tiles
+
+
+def cost_cells(sequence: RouteSequence, rows: range, columns: range,
+               round_up: bool = False) -> List[List[Optional[Fares]]]:
+    """Тарифы таблицы стоимости для строк rows и столбцов columns (None на диагонали и выше)"""
+    cost, baggage, rounding = sequence.cost_per_km, sequence.baggage_percent, sequence.rounding
+    distances = sequence.distances
+    block = []
+    for row in rows:
+        cells: List[Optional[Fares]] = []
+        for column in columns:
+            if column >= row:
+                cells.append(None)
+                continue
+            tariffs = fare_engine.calculate_tariffs(distances[row] - distances[column], cost,
+                                                    baggage, rounding, round_up)
+            cells.append((tariffs['passenger'],
+                          tariffs['passenger'] * fare_engine.CHILD_FARE_PERCENT / 100,
+                          tariffs['baggage']))
+        block.append(cells)
+    return block
+
+
+class TileCache:
+    """Тексты ячеек плиток с вытеснением давно не использованных"""
+
+    def __init__(self, max_tiles: int = MAX_TILES) -> None:
+        self.max_tiles = max_tiles
+        self._tiles: 'OrderedDict[Tuple, List[List[str]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[List[List[str]]]:
+        with self._lock:
+            cells = self._tiles.get(key)
+            if cells is not None:
+                self._tiles.move_to_end(key)
+            return cells
+
+    def put(self, key: Tuple, cells: List[List[str]]) -> None:
+        with self._lock:
+            self._tiles[key] = cells
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tiles.clear()
+
+
+tile_cache = TileCache()
+
+
+class CostTableTiles:
+    """Таблица стоимости маршрута по плиткам (тексты ячеек из tile_cache)"""
+
+    # Вид таблицы в ключе кэша и заполнение только ниже диагонали
+    kind = 'cost-tiles'
+    lower_triangle = True
+
+    def __init__(self, sequence: RouteSequence, round_up: bool = False) -> None:
+        self.sequence = sequence
+        self.round_up = round_up
+        # Ключ содержимого: плитки одного маршрута в разных окнах общие
+        self.key = export_cache.key(self.kind, sequence, round_up, *self._key_parts())
+
+    def _key_parts(self) -> Tuple:
+        """Параметры вида таблицы, влияющие на тексты ячеек"""
+        return ()
+
+    @property
+    def names(self) -> List[str]:
+        return self.sequence.point_names
+
+    def paginate(self, rows_per_page: int, columns_per_page: int) -> List[Tile]:
+        return paginate(len(self.sequence), rows_per_page, columns_per_page, self.lower_triangle)
+
+    def cells(self, tile: Tile) -> List[List[str]]:
+        """Тексты ячеек плитки: три строки (пассажирский, детский, багаж) или пусто"""
+        key = (self.key, tile.rows.start, tile.rows.stop, tile.columns.start, tile.columns.stop)
+        cells = tile_cache.get(key)
+        if cells is None:
+            cells = self._cell_texts(tile)
+            tile_cache.put(key, cells)
+        return cells
+
+    def _cell_texts(self, tile: Tile) -> List[List[str]]:
+        return [[f"{fares[0]:.2f}\n{fares[1]:.2f}\n{fares[2]:.2f}" if fares else ""
+                 for fares in row]
+                for row in cost_cells(self.sequence, tile.rows, tile.columns, self.round_up)]
+
+
+class FareGridTiles(CostTableTiles):
+    """
+    Матрица тарифной сетки для PDF (TariffExporter.export_tariff_table).
+
+    Заполнена целиком: в ячейке базовый тариф и (детский / льготный), на
+    диагонали и между пунктами на одном расстоянии - "-". Совпадает с
+    TariffExporter.build_tariffs_data, но считается только для нужных плиток.
+    """
+
+    kind = 'grid-tiles'
+    lower_triangle = False
+
+    def __init__(self, sequence: RouteSequence, round_up: bool = False,
+                 child_discount_percent: float = 100 - fare_engine.CHILD_FARE_PERCENT,
+                 benefit_discount_percent: float = 100 - fare_engine.BENEFIT_FARE_PERCENT) -> None:
+        self.child_discount_percent = child_discount_percent
+        self.benefit_discount_percent = benefit_discount_percent
+        super().__init__(sequence, round_up)
+
+    def _key_parts(self) -> Tuple:
+        return self.child_discount_percent, self.benefit_discount_percent
+
+    def _cell_texts(self, tile: Tile) -> List[List[str]]:
+        sequence = self.sequence
+        cost, baggage, rounding = sequence.cost_per_km, sequence.baggage_percent, sequence.rounding
+        distances = sequence.distances
+        child = 1 - self.child_discount_percent / 100
+        benefit = 1 - self.benefit_discount_percent / 100
+        block = []
+        for row in tile.rows:
+            cells = []
+            for column in tile.columns:
+                distance = abs(distances[column] - distances[row])
+                if distance > 0:
+                    base = fare_engine.calculate_tariffs(distance, cost, baggage,
+                                                         rounding, self.round_up)['passenger']
+                    cells.append(f"{base:.2f}\n({base * child:.2f} / {base * benefit:.2f})")
+                else:
+                    cells.append("-")
+            block.append(cells)
+        return block
@@ -0,0 +1,140 @@
+"""
+Кэш выгруженных документов на диске
+
+Готовый PDF/XLSX сохраняется в ~/.tariff_app/cache под ключом - SHA-256
+от всего, что определяет содержимое документа: пунктов и параметров
+тарифа маршрута, шаблона (вида документа и заголовка) и версии
+экспортёра. Повторная выгрузка неизменённого маршрута копирует файл из
+кэша вместо новой вёрстки через ReportLab/openpyxl.
+
+Объём каталога ограничен: при превышении удаляются файлы, к которым
+дольше всего не обращались (время доступа хранится в mtime).
+"""
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from array import array
+from pathlib import Path
+from typing import Any, Optional
+
+from core.config import PERFORMANCE_CONFIG
+from models import RouteSequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path.home() / '.tariff_app' / 'cache'
+
+# Временные файлы записи (не входят в кэш до переименования)
+_TEMP_SUFFIX = '.tmp'
+
+
+def _feed(digest, part: Any) -> None:
+    """Добавить часть ключа в хэш"""
+    if isinstance(part, RouteSequence):
+        for column in (part.point_ids, part.distances, part.roundings, part.costs,
+                       part.baggage_percents):
+            digest.update(column.tobytes())
+        digest.update('\x1f'.join(part.point_names).encode('utf-8'))
+    elif isinstance(part, array):
+        digest.update(part.typecode.encode('ascii') + part.tobytes())
+    else:
+        digest.update(repr(part).encode('utf-8'))
+    # Разделитель: ("ab", "c") и ("a", "bc") дают разные ключи
+    digest.update(b'\x1e')
+
+
+class ExportCache:
+    """Документы по ключу содержимого с вытеснением по объёму"""
+
+    def __init__(self, directory: Optional[Path] = None,
+                 max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.directory = Path(directory) if directory else DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        """Ключ документа по частям (RouteSequence, array, прочее - по repr)"""
+        digest = hashlib.sha256()
+        for part in parts:
+            _feed(digest, part)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key
+
+    def fetch(self, key: str, filename: str) -> bool:
+        """
+        Скопировать документ из кэша в filename.
+
+        Returns:
+            bool: True, если документ был в кэше
+        """
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, filename)
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        except OSError as e:
+            logger.warning(f"Кэш выгрузок недоступен: {e}")
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key: str, filename: str) -> None:
+        """Сохранить готовый документ filename в кэш (ошибки кэша не мешают выгрузке)"""
+        if self.max_bytes <= 0:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            temp = self.directory / f"{key}.{uuid.uuid4().hex}{_TEMP_SUFFIX}"
+            shutil.copyfile(filename, temp)
+            os.replace(temp, self._path(key))
+            self.evict()
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить выгрузку в кэш: {e}")
+
+    def evict(self) -> int:
+        """
+        Удалить давно не использованные документы сверх max_bytes.
+
+        Returns:
+            int: Количество удалённых файлов
+        """
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_file() or entry.name.endswith(_TEMP_SUFFIX):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Файл уже удалил другой процесс
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self) -> None:
+        """Очистить кэш"""
+        if self.directory.exists():
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+export_cache = ExportCache(
+    max_bytes=int(PERFORMANCE_CONFIG.get('export_cache_mb', 256)) * 1024 * 1024
+)
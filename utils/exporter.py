@@ -11,10 +11,24 @@ from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-from datetime import datetime
-from typing import List, Dict
+from openpyxl.utils import get_column_letter
+from datetime import date, datetime
+from typing import List, Dict, Optional, TextIO, Union
 import os
 
+from models import RouteSequence
+from core import fare_engine
+from utils.export_cache import export_cache
+from utils.cost_tiles import FareGridTiles, paginate
+
+# Версия вёрстки документов: меняется при любой правке шаблонов ниже,
+# чтобы кэш выгрузок не отдавал документы старого вида
+EXPORTER_VERSION = 2
+
+# Строк и столбцов матрицы на странице PDF
+PDF_ROWS_PER_PAGE = 13
+PDF_COLUMNS_PER_PAGE = 10
+
 try:
     pdfmetrics.registerFont(TTFont('DejaVu', 'DejaVuSans.ttf'))
     PDF_FONT = 'DejaVu'
@@ -23,41 +37,96 @@ except:
 
 class TariffExporter:
     @staticmethod
-    def export_tariff_table(grid_info: Dict, points: List[Dict], 
-                           matrix: Dict, tariffs_data: List, filename: str):
-        """Экспорт таблицы стоимости в PDF (как в примере из документа)"""
-        c = canvas.Canvas(filename, pagesize=landscape(A4))
-        width, height = landscape(A4)
-        
-        # Заголовок
-        c.setFont(PDF_FONT, 16)
-        c.drawString(30, height - 40, f"Тарифная сетка №{grid_info['grid_number']} — {grid_info['grid_name']}")
-        c.setFont(PDF_FONT, 10)
-        c.drawString(30, height - 60, f"Пассажирский тариф: ₽{grid_info['passenger_tariff']:.2f} за 1 км")
-        c.drawString(30, height - 75, f"Детская скидка: {grid_info['child_discount_percent']}% | Льготная скидка: {grid_info['benefit_discount_percent']}%")
-        c.drawString(30, height - 90, f"Дата формирования: {datetime.now().strftime('%d.%m.%Y')}")
-        
-        # Подготовка данных таблицы
-        n = len(points)
-        table_data = [["Откуда \\ Куда"] + [p['name'] for p in points]]
+    def point_names(points: Union[RouteSequence, List[Dict]]) -> List[str]:
+        """Названия пунктов из последовательности маршрута или списка словарей"""
+        if isinstance(points, RouteSequence):
+            return list(points.point_names)
+        return [p['name'] for p in points]
+    
+    @staticmethod
+    def _require_sequence(points: Union[RouteSequence, List[Dict]]) -> RouteSequence:
+        """Последовательность маршрута для расчёта ячеек, когда tariffs_data не передан"""
+        if not isinstance(points, RouteSequence):
+            raise ValueError("Без tariffs_data пункты передаются как RouteSequence")
+        return points
+    
+    @staticmethod
+    def build_tariffs_data(sequence: RouteSequence, round_up: bool = False,
+                           child_discount_percent: float = 100 - fare_engine.CHILD_FARE_PERCENT,
+                           benefit_discount_percent: float = 100 - fare_engine.BENEFIT_FARE_PERCENT
+                           ) -> List:
+        """
+        Данные таблицы «откуда / куда» для последовательности маршрута.
         
-        for i, row in enumerate(tariffs_data):
-            table_row = [row[0]]  # Название пункта "откуда"
-            for j in range(1, n + 1):
-                cell = row[j]
-                if cell['distance'] > 0:
-                    text = f"{cell['base']:.2f}\n({cell['child']:.2f} / {cell['benefit']:.2f})"
-                else:
-                    text = "-"
-                table_row.append(text)
-            table_data.append(table_row)
+        Returns:
+            list: Строки [название, ячейка_1, ..., ячейка_n], где ячейка - словарь
+                  с ключами distance, base, child, benefit
+        """
+        cost, baggage, rounding = sequence.cost_per_km, sequence.baggage_percent, sequence.rounding
+        distances = sequence.distances
+        tariffs_data = []
+        for i, name in enumerate(sequence.point_names):
+            row: List = [name]
+            for j in range(len(distances)):
+                distance = abs(distances[j] - distances[i])
+                base = fare_engine.calculate_tariffs(distance, cost, baggage,
+                                                     rounding, round_up)['passenger']
+                row.append({
+                    'distance': distance,
+                    'base': base,
+                    'child': base * (1 - child_discount_percent / 100),
+                    'benefit': base * (1 - benefit_discount_percent / 100),
+                })
+            tariffs_data.append(row)
+        return tariffs_data
+    
+    @staticmethod
+    def _cell_text(cell) -> str:
+        """Текст ячейки таблицы стоимости"""
+        if not isinstance(cell, dict):
+            return str(cell)
+        if cell['distance'] > 0:
+            return f"{cell['base']:.2f}\n({cell['child']:.2f} / {cell['benefit']:.2f})"
+        return "-"
+    
+    @staticmethod
+    def _cache_key(kind: str, grid_info: Dict, points: Union[RouteSequence, List[Dict]],
+                   tariffs_data: Optional[List]) -> str:
+        """Ключ документа в кэше выгрузок; без as_of в документ попадает сегодняшняя дата"""
+        return export_cache.key(kind, EXPORTER_VERSION, grid_info, points, tariffs_data,
+                                grid_info.get('as_of') or date.today())
+    
+    @staticmethod
+    def export_tariff_table(grid_info: Dict, points: Union[RouteSequence, List[Dict]], 
+                           matrix: Dict, tariffs_data: Optional[List], filename: str):
+        """
+        Экспорт таблицы стоимости в PDF (как в примере из документа).
         
-        # Создание таблицы
-        col_width = (width - 60) / (n + 1)
-        col_widths = [col_width * 1.5] + [col_width] * n
+        Большая таблица делится на страницы по PDF_ROWS_PER_PAGE строк и
+        PDF_COLUMNS_PER_PAGE столбцов (utils.cost_tiles.paginate) с
+        названиями пунктов на каждой странице.
+        points может быть RouteSequence - тогда tariffs_data можно не передавать:
+        ячейки страниц берутся из кэша плиток (utils.cost_tiles.FareGridTiles)
+        и считаются только для страниц, которых там ещё нет (с округлением
+        вверх, если задан grid_info['round_up']).
+        Неизменённый документ берётся из кэша выгрузок.
+        """
+        cache_key = TariffExporter._cache_key('pdf', grid_info, points, tariffs_data)
+        if export_cache.fetch(cache_key, filename):
+            return filename
+        tiles = None
+        if tariffs_data is None:
+            tiles = FareGridTiles(TariffExporter._require_sequence(points),
+                                  grid_info.get('round_up', False))
+        names = TariffExporter.point_names(points)
+        c = canvas.Canvas(filename, pagesize=landscape(A4))
+        width, height = landscape(A4)
+        as_of = grid_info.get('as_of')
         
-        table = Table(table_data, colWidths=col_widths, repeatRows=1)
-        table.setStyle(TableStyle([
+        # Страница - плитка матрицы: свои строки и столбцы с заголовками
+        pages = paginate(len(names), PDF_ROWS_PER_PAGE, PDF_COLUMNS_PER_PAGE)
+        col_width = (width - 60) / (PDF_COLUMNS_PER_PAGE + 1.5)
+        style = TableStyle([
             ('BACKGROUND', (0, 0), (-1, 0), colors.Color(0.2, 0.2, 0.2)),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
@@ -70,24 +139,61 @@ class TariffExporter:
             ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
             ('LEFTPADDING', (0, 0), (-1, -1), 3),
             ('RIGHTPADDING', (0, 0), (-1, -1), 3),
-        ]))
-        
-        table.wrapOn(c, width - 60, height - 150)
-        table.drawOn(c, 30, height - 450)
+        ])
         
-        # Футер
-        c.setFont(PDF_FONT, 8)
-        c.setFillColor(colors.grey)
-        c.drawString(30, 30, "Таблица стоимости проезда между пунктами тарифной сетки")
-        c.drawString(width - 200, 30, f"Страница 1 из 1")
+        for number, tile in enumerate(pages or [None], 1):
+            # Заголовок
+            c.setFont(PDF_FONT, 16)
+            c.drawString(30, height - 40, f"Тарифная сетка №{grid_info['grid_number']} — "
+                                          f"{grid_info['grid_name']}")
+            c.setFont(PDF_FONT, 10)
+            c.drawString(30, height - 60,
+                         f"Пассажирский тариф: ₽{grid_info['passenger_tariff']:.2f} за 1 км")
+            c.drawString(30, height - 75,
+                         f"Детская скидка: {grid_info['child_discount_percent']}% | "
+                         f"Льготная скидка: {grid_info['benefit_discount_percent']}%")
+            c.drawString(30, height - 90, f"Тариф на дату: {as_of:%d.%m.%Y}" if as_of else
+                         f"Дата формирования: {datetime.now().strftime('%d.%m.%Y')}")
+            
+            if tile is not None:
+                table_data = [["Откуда \\ Куда"] + [names[j] for j in tile.columns]]
+                if tiles is not None:
+                    table_data += [[names[i]] + cells
+                                   for i, cells in zip(tile.rows, tiles.cells(tile))]
+                elif tariffs_data is not None:
+                    for i in tile.rows:
+                        row = tariffs_data[i]
+                        table_data.append([row[0]] + [TariffExporter._cell_text(row[j + 1])
+                                                      for j in tile.columns])
+                table = Table(table_data,
+                              colWidths=[col_width * 1.5] + [col_width] * len(tile.columns))
+                table.setStyle(style)
+                _, table_height = table.wrapOn(c, width - 60, height - 150)
+                table.drawOn(c, 30, height - 105 - table_height)
+            
+            # Футер
+            c.setFont(PDF_FONT, 8)
+            c.setFillColor(colors.grey)
+            c.drawString(30, 30, "Таблица стоимости проезда между пунктами тарифной сетки")
+            c.drawString(width - 200, 30, f"Страница {number} из {max(len(pages), 1)}")
+            c.setFillColor(colors.black)
+            c.showPage()
         
         c.save()
+        export_cache.store(cache_key, filename)
         return filename
     
     @staticmethod
-    def export_tariff_excel(grid_info: Dict, points: List[Dict],
-                           matrix: Dict, tariffs_data: List, filename: str):
-        """Экспорт в Excel с форматированием"""
+    def export_tariff_excel(grid_info: Dict, points: Union[RouteSequence, List[Dict]],
+                           matrix: Dict, tariffs_data: Optional[List], filename: str):
+        """Экспорт в Excel с форматированием (points может быть RouteSequence)"""
+        cache_key = TariffExporter._cache_key('xlsx', grid_info, points, tariffs_data)
+        if export_cache.fetch(cache_key, filename):
+            return filename
+        if tariffs_data is None:
+            tariffs_data = TariffExporter.build_tariffs_data(
+                TariffExporter._require_sequence(points), grid_info.get('round_up', False))
+        names = TariffExporter.point_names(points)
         wb = Workbook()
         ws = wb.active
         ws.title = f"Сетка {grid_info['grid_number']}"
@@ -104,14 +210,15 @@ class TariffExporter:
             f"Детская скидка: {grid_info['child_discount_percent']}%",
             f"Льготная скидка: {grid_info['benefit_discount_percent']}%",
             "",
+            f"Тариф на дату: {grid_info['as_of']:%d.%m.%Y}" if grid_info.get('as_of') else
             f"Дата: {datetime.now().strftime('%d.%m.%Y')}"
         ])
         ws.append([])
         
         # Таблица стоимости
-        n = len(points)
+        n = len(names)
         # Заголовки
-        headers = ["Откуда \\ Куда"] + [p['name'] for p in points]
+        headers = ["Откуда \\ Куда"] + names
         ws.append(headers)
         
         header_fill = PatternFill(start_color="252628", end_color="252628", fill_type="solid")
@@ -125,7 +232,7 @@ class TariffExporter:
         
         # Данные
         for row_data in tariffs_data:
-            ws.append(row_data)
+            ws.append([row_data[0]] + [TariffExporter._cell_text(cell) for cell in row_data[1:]])
         
         # Форматирование
         for row in ws.iter_rows(min_row=5, max_row=ws.max_row, min_col=1, max_col=n+1):
@@ -141,13 +248,44 @@ class TariffExporter:
         
         # Автоширина
         for col in range(1, n + 2):
-            ws.column_dimensions[chr(64 + col)].width = 15 if col == 1 else 12
+            ws.column_dimensions[get_column_letter(col)].width = 15 if col == 1 else 12
         
         wb.save(filename)
+        export_cache.store(cache_key, filename)
         return filename
     
     @staticmethod
-    def get_suggested_filename(grid_number: str, ext: str = "pdf") -> str:
-        timestamp = datetime.now().strftime("%Y%m%d")
+    def write_cost_table_text(out: TextIO, sequence: RouteSequence, route_number: str,
+                              route_name: str, round_up: bool = False) -> None:
+        """
+        Записать текстовую таблицу стоимости маршрута в out построчно.
+        
+        Для остановки i - три строки (пассажирский, детский, багаж) по
+        пунктам отправления 0..i-1 и строка с названием остановки.
+        """
+        cost, baggage, rounding = sequence.cost_per_km, sequence.baggage_percent, sequence.rounding
+        out.write("Таблица стоимости\n"
+                  "на проезд и провоз ручной клади и багажа\n"
+                  f"в автобусе общего типа по маршруту {route_number} — {route_name} с __________\n"
+                  f"Стоимость 1 п-км: {cost:.2f}\n\n")
+        if not len(sequence):
+            out.write("Руководитель АТП __________\n")
+            return
+        names, distances = sequence.point_names, sequence.distances
+        out.write(f"{names[0]}\n")
+        for i in range(1, len(sequence)):
+            tariffs = [fare_engine.calculate_tariffs(distances[i] - distances[j], cost, baggage,
+                                                     rounding, round_up)
+                       for j in range(i)]
+            out.write(" ".join(f"{t['passenger']:>7.2f}" for t in tariffs) + "\n")
+            out.write(" ".join(f"{t['passenger'] * fare_engine.CHILD_FARE_PERCENT / 100:>7.2f}"
+                               for t in tariffs) + "\n")
+            out.write(" ".join(f"{t['baggage']:>7.2f}" for t in tariffs) + "\n")
+            out.write(("        " * i) + f"{names[i]}\n\n")
+        out.write("Руководитель АТП __________\n")
+    
+    @staticmethod
+    def get_suggested_filename(grid_number: str, ext: str = "pdf", as_of=None) -> str:
+        timestamp = (as_of or datetime.now()).strftime("%Y%m%d")
         safe_number = "".join(c if c.isalnum() else "_" for c in grid_number)
         return f"tariff_grid_{safe_number}_{timestamp}.{ext}"
\ No newline at end of file
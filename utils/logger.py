@@ -1,41 +1,165 @@
 """
 Настройка логирования для приложения
+
+Все логгеры пишут в одну очередь (QueueHandler), а файл и консоль
+обслуживает фоновый поток QueueListener. Вызывающий код - интерфейс,
+запросы к БД, импорт - платит только за постановку записи в очередь.
+
+В файл ~/.tariff_app/logs/app.log записи пишутся строками JSON; поля,
+переданные через extra (elapsed_ms, rows и т.п.), попадают в запись
+как есть. Уровни задаются для каждой подсистемы отдельно в разделе
+"logging" файла config.json.
 """
+import atexit
+import json
 import logging
+import queue
 import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
+from typing import Dict, Optional
 
-def setup_logger(name: str = "tariff_app") -> logging.Logger:
-    """Настройка логгера с ротацией файлов"""
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-    
-    # Формат логов
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
-    # Логи в файл с ротацией
-    log_dir = Path.home() / '.tariff_app' / 'logs'
+DEFAULT_LOG_DIR = Path.home() / '.tariff_app' / 'logs'
+
+# Атрибуты LogRecord, которые не относятся к полям extra
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | \
+    {'message', 'asctime'}
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога - одна строка JSON со всеми полями extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc)
+                          .isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'where': f"{record.module}:{record.lineno}",
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _EnqueueHandler(QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке.
+
+    Стандартный prepare() собирает сообщение до постановки в очередь.
+    Записи не покидают процесс, поэтому сообщение собирается уже
+    в потоке QueueListener; в вызывающем потоке форматируется только
+    трассировка исключения, пока она ещё доступна.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(config: Optional[Dict] = None, log_dir: Optional[Path] = None) -> QueueListener:
+    """
+    Настроить логирование всего приложения (повторный вызов ничего не меняет).
+
+    Args:
+        config: Раздел "logging" конфигурации: level - общий уровень,
+                levels - уровни подсистем {"core.database": "DEBUG", ...},
+                console_level - уровень вывода в консоль
+        log_dir: Папка логов (по умолчанию ~/.tariff_app/logs)
+
+    Returns:
+        QueueListener: Фоновый обработчик записей
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    if config is None:
+        from core.config import LOGGING_CONFIG
+        config = LOGGING_CONFIG
+
+    log_dir = Path(log_dir) if log_dir else DEFAULT_LOG_DIR
     log_dir.mkdir(parents=True, exist_ok=True)
-    
+
     file_handler = RotatingFileHandler(
         log_dir / 'app.log',
         maxBytes=10*1024*1024,  # 10 MB
         backupCount=5,
         encoding='utf-8'
     )
-    file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(formatter)
-    
-    # Логи в консоль
+    file_handler.setFormatter(JsonFormatter())
+
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    console_handler.setFormatter(formatter)
-    
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
-    return logger
\ No newline at end of file
+    console_handler.setLevel(config.get('console_level', 'INFO'))
+    console_handler.setFormatter(logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    ))
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_EnqueueHandler(log_queue))
+    root.setLevel(config.get('level', 'INFO'))
+    for name, level in config.get('levels', {}).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """Дописать очередь и остановить фоновый поток логирования"""
+    global _listener
+    if _listener is None:
+        return
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, _EnqueueHandler):
+            root.removeHandler(handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+@contextmanager
+def log_timing(logger: logging.Logger, message: str, level: int = logging.INFO, **fields):
+    """
+    Записать длительность блока в поле elapsed_ms.
+
+    Поля из fields попадают в запись; блок может дополнить их
+    через возвращаемый словарь.
+
+    Пример:
+        with log_timing(logger, "Импорт", file=name) as fields:
+            fields['rows'] = import_rows()
+    """
+    started = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        fields['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        logger.log(level, f"{message}: {fields['elapsed_ms']:.1f} мс", extra=fields, stacklevel=3)
+
+
+def setup_logger(name: str = "tariff_app") -> logging.Logger:
+    """Получить логгер, настроив логирование приложения при первом вызове"""
+    setup_logging()
+    return logging.getLogger(name)
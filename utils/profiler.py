@@ -0,0 +1,227 @@
+"""
+Профилирование действий пользователя
+
+Сеанс запускается кнопкой на панели инструментов или флагом --profile
+и пишет результаты в папку ~/.tariff_app/profiles/profile_<дата>_<время>,
+которую можно приложить к заявке:
+
+- режим "sampling": стек главного потока снимается фоновым потоком
+  с заданным интервалом; результат - stacks.collapsed (формат
+  flamegraph.pl) и speedscope.json (открывается на speedscope.app);
+- режим "cprofile": детерминированный профиль главного потока
+  в profile.prof (pstats, snakeviz);
+- в обоих режимах tracemalloc сравнивает снимки памяти в начале
+  и в конце сеанса; summary.txt содержит top-N функций и выделений памяти.
+"""
+import cProfile
+import io
+import json
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_DIR = Path.home() / '.tariff_app' / 'profiles'
+
+MODES = ('sampling', 'cprofile')
+
+# Интервал снятия стека, секунды
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# Глубина стека, сохраняемая tracemalloc для каждого выделения. Для сводки
+# по строкам достаточно одного кадра; каждый лишний кадр замедляет выделения
+TRACEMALLOC_FRAMES = 1
+
+Frame = Tuple[str, str, int]
+
+
+class _StackSampler(threading.Thread):
+    """Фоновый поток, периодически снимающий стек указанного потока"""
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                # От корня к листу, как в flame graph
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+class ProfileSession:
+    """Сеанс профилирования: start() ... stop() -> папка с результатами"""
+
+    def __init__(self, mode: str = 'sampling', directory: Optional[str] = None,
+                 interval: float = DEFAULT_SAMPLE_INTERVAL, top: int = 30,
+                 trace_memory: bool = True) -> None:
+        """
+        Args:
+            mode: "sampling" или "cprofile"
+            directory: Папка профилей (по умолчанию ~/.tariff_app/profiles)
+            interval: Интервал снятия стека в режиме sampling, секунды
+            top: Сколько строк выводить в summary.txt
+            trace_memory: Снимать снимки памяти tracemalloc
+        """
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим профилирования: {mode}")
+        self.mode = mode
+        self.directory = Path(directory) if directory else DEFAULT_PROFILE_DIR
+        self.interval = interval
+        self.top = top
+        self.trace_memory = trace_memory
+        self.started_at: Optional[float] = None
+        self._profiler: Optional[cProfile.Profile] = None
+        self._sampler: Optional[_StackSampler] = None
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._own_tracemalloc = False
+
+    @property
+    def is_running(self) -> bool:
+        return self.started_at is not None
+
+    def start(self) -> None:
+        """Начать сеанс (профилируется поток, вызвавший start)"""
+        if self.is_running:
+            return
+        if self.trace_memory:
+            self._own_tracemalloc = not tracemalloc.is_tracing()
+            if self._own_tracemalloc:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._snapshot = tracemalloc.take_snapshot()
+        if self.mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._sampler = _StackSampler(threading.get_ident(), self.interval)
+            self._sampler.start()
+        self.started_at = time.perf_counter()
+        logger.info(f"Профилирование запущено ({self.mode})")
+
+    def stop(self) -> Path:
+        """
+        Остановить сеанс и записать результаты.
+
+        Returns:
+            Path: Папка с файлами профиля
+        """
+        started_at = self.started_at
+        if started_at is None:
+            raise RuntimeError("Профилирование не запущено")
+        duration = time.perf_counter() - started_at
+        self.started_at = None
+        if self._profiler:
+            self._profiler.disable()
+        if self._sampler:
+            self._sampler.stop()
+        memory_lines: List[str] = []
+        if self._snapshot is not None:
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__),))
+            diff = snapshot.compare_to(self._snapshot, 'lineno')
+            memory_lines = [str(stat) for stat in diff[:self.top]]
+            current, peak = tracemalloc.get_traced_memory()
+            memory_lines.append(f"Итого отслеживается: {current / 1024:.0f} КБ, "
+                                f"пик {peak / 1024:.0f} КБ")
+            if self._own_tracemalloc:
+                tracemalloc.stop()
+            self._snapshot = None
+
+        output = self.directory / datetime.now().strftime('profile_%Y%m%d_%H%M%S_%f')
+        output.mkdir(parents=True, exist_ok=True)
+        lines = [f"Режим: {self.mode}", f"Длительность: {duration:.2f} с", ""]
+        if self._profiler:
+            self._profiler.dump_stats(str(output / 'profile.prof'))
+            lines += self._cprofile_summary(self._profiler)
+            self._profiler = None
+        if self._sampler:
+            stacks = self._sampler.stacks
+            self._write_collapsed(output / 'stacks.collapsed', stacks)
+            self._write_speedscope(output / 'speedscope.json', stacks, output.name)
+            lines += self._sampling_summary(stacks)
+            self._sampler = None
+        if memory_lines:
+            lines += ["", f"Память: top-{self.top} прироста по строкам", *memory_lines]
+        (output / 'summary.txt').write_text('\n'.join(lines) + '\n', encoding='utf-8')
+        logger.info(f"Профиль записан: {output}", extra={'elapsed_ms': round(duration * 1000, 3)})
+        return output
+
+    def _cprofile_summary(self, profiler: cProfile.Profile) -> List[str]:
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats('cumulative').print_stats(self.top)
+        return [f"Функции: top-{self.top} по суммарному времени", stream.getvalue()]
+
+    def _sampling_summary(self, stacks: Counter) -> List[str]:
+        total = sum(stacks.values())
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        for stack, count in stacks.items():
+            own[stack[-1]] += count
+            for frame in set(stack):
+                inclusive[frame] += count
+        lines = [f"Снято стеков: {total} (интервал {self.interval * 1000:.0f} мс)", "",
+                 f"Функции: top-{self.top} по собственному времени"]
+        lines += [f"{count / total:7.1%}  {_frame_name(frame)}"
+                  for frame, count in own.most_common(self.top)]
+        lines += ["", f"Функции: top-{self.top} по времени с вложенными вызовами"]
+        lines += [f"{count / total:7.1%}  {_frame_name(frame)}"
+                  for frame, count in inclusive.most_common(self.top)]
+        return lines
+
+    @staticmethod
+    def _write_collapsed(path: Path, stacks: Counter) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(';'.join(_frame_name(frame) for frame in stack) + f" {count}\n")
+
+    def _write_speedscope(self, path: Path, stacks: Counter, name: str) -> None:
+        frames: Dict[Frame, int] = {}
+        samples, weights = [], []
+        for stack, count in stacks.items():
+            samples.append([frames.setdefault(frame, len(frames)) for frame in stack])
+            weights.append(count * self.interval)
+        document = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "tariff_app",
+            "shared": {"frames": [{"name": func, "file": file, "line": line}
+                                  for func, file, line in frames]},
+            "profiles": [{
+                "type": "sampled",
+                "name": "MainThread",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(document, f, ensure_ascii=False)
+
+
+def _frame_name(frame: Frame) -> str:
+    func, file, line = frame
+    return f"{func} ({Path(file).name}:{line})"